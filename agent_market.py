@@ -1,79 +1,236 @@
 """
 Agente de análise de mercado usando Gemini via LangChain.
+
+Dependências pesadas (langchain_google_genai, langchain.agents) são importadas
+apenas no primeiro uso, e a API de agente do LangChain é detectada uma única
+vez por processo (ver detect_agent_api).
 """
 import os
 import json
+import asyncio
+import functools
+import importlib
+import threading
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-# Import dinâmico para compatibilidade entre versões do LangChain
-try:
-    from langchain.agents import create_agent  # LangChain 1.0+
-    _LC_AGENT_API = "create_agent"
-except Exception:  # noqa: E722
-    create_agent = None  # type: ignore
-    try:
-        from langchain.agents import create_react_agent, AgentExecutor  # LangChain 0.2.x
-        _LC_AGENT_API = "react"
-    except Exception:  # noqa: E722
-        create_react_agent = None  # type: ignore
-        AgentExecutor = None  # type: ignore
-        try:
-            from langchain.agents import initialize_agent  # LangChain 0.0.x/0.1.x
-            _LC_AGENT_API = "initialize"
-        except Exception:  # noqa: E722
-            initialize_agent = None  # type: ignore
-            _LC_AGENT_API = None
-# Import compatível de Tool entre versões do LangChain
-try:
-    from langchain_core.tools import Tool  # LangChain 0.2+
-except Exception:  # noqa: E722
-    from langchain.tools import Tool  # Fallback para versões antigas
 
-from callbacks import TAOConsoleLogger
-from tools import web_search, calc_cagr, report_refine
+from budget import DEGRADED_PREFIX, BudgetExceeded, BudgetGuard, RunBudget
+from callbacks import get_tao_logger
+from compaction import compact_results
+from pipeline import (
+    PipelineResult, arun_pipeline, astream_pipeline, message_text, run_pipeline, stream_pipeline,
+)
+from prefetch import PrefetchConfig, asearch_prefetch, claim_prefetched, search_prefetch, wait_prefetched
+from streaming import FINAL, TOKEN, TOOL_END, TOOL_START, make_event
+from providers import (
+    GEMINI, aprovider_attempt, aprovider_breaker, aprovider_call, provider_attempt, provider_breaker, provider_call,
+)
+from report_cache import get_report_cache, params_key, results_fingerprint
+from source_store import get_source_store
+from tool_concurrency import limit_tool, resolve_tool_execution
+from tools import (
+    web_search, aweb_search, calc_cagr, calc_cagr_batch_tool, report_refine,
+    multi_search_tool, amulti_search_tool,
+)
 
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
 
-def run_market_agent(topic: str, start_rev: float, end_rev: float, months: float) -> str:
+SYSTEM_PROMPT = "Você é um analista de mercado especializado."
+
+# Prefixo das respostas de erro de run_market_agent/arun_market_agent
+AGENT_ERROR_PREFIX = "Erro ao executar o agente"
+
+# Modos de execução: "agent" (loop de ferramentas do LangChain) ou
+# "pipeline" (fluxo fixo com 2 chamadas ao LLM, ver pipeline.py)
+MODES = ("agent", "pipeline")
+
+# Nome da execução raiz do grafo nos callbacks (ex.: métricas por execução)
+AGENT_RUN_NAME = "market_agent"
+
+
+def resolve_mode(mode: str | None) -> str:
+    """Valida o modo informado (padrão: variável MARKET_AGENT_MODE ou 'agent')."""
+    mode = (mode or os.getenv("MARKET_AGENT_MODE") or "agent").lower()
+    if mode not in MODES:
+        raise ValueError(f"Modo inválido: {mode!r} (use um de {MODES})")
+    return mode
+
+
+# APIs de agente suportadas, em ordem de preferência (None = fallback para o pipeline)
+AGENT_APIS = ("create_agent", "react", "initialize", None)
+
+# Nomes importados de langchain.agents para cada API
+_AGENT_API_IMPORTS = {
+    "create_agent": ("create_agent",),                     # LangChain 1.0+
+    "react": ("create_react_agent", "AgentExecutor"),      # LangChain 0.2.x
+    "initialize": ("initialize_agent",),                   # LangChain 0.0.x/0.1.x
+}
+
+# Valor padrão de `api` em MarketAgent/_build_agent: usa detect_agent_api()
+AUTO_API = "auto"
+
+
+@functools.lru_cache(maxsize=None)
+def _agent_api_objects(api: str) -> tuple | None:
+    """Importa (uma única vez) os objetos de uma API de agente; None se indisponível."""
+    try:
+        module = importlib.import_module("langchain.agents")
+        return tuple(getattr(module, name) for name in _AGENT_API_IMPORTS[api])
+    except Exception:  # noqa: E722
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def _detect_agent_api() -> str | None:
+    for api in AGENT_APIS:
+        if api is not None and _agent_api_objects(api) is not None:
+            return api
+    return None
+
+
+def detect_agent_api() -> str | None:
     """
-    Executa o agente para um tema de mercado (ex.: 'Blockchain em Logística').
-    
-    Args:
-        topic: Tema de mercado para análise
-        start_rev: Valor inicial para cálculo CAGR
-        end_rev: Valor final para cálculo CAGR
-        months: Período em meses para cálculo CAGR
-    
-    Returns:
-        Relatório consolidado em 4 parágrafos
-    
-    Raises:
-        ValueError: Se GEMINI_API_KEY não estiver configurada
+    Retorna a API de agente do LangChain instalado (create_agent, react,
+    initialize ou None para o fallback), detectada no primeiro uso e mantida
+    em cache no processo.
+
+    MARKET_AGENT_API força uma API (create_agent, react, initialize ou
+    fallback) sem detecção.
     """
-    # Validar chave da API
+    forced = os.getenv("MARKET_AGENT_API", "").strip().lower()
+    if forced:
+        if forced == "fallback":
+            return None
+        if forced not in _AGENT_API_IMPORTS:
+            raise ValueError(f"MARKET_AGENT_API inválida: {forced!r} (use um de {AGENT_APIS[:-1]} ou fallback)")
+        return forced
+    return _detect_agent_api()
+
+
+def agent_api_available(api: str | None) -> bool:
+    """Indica se a API de agente informada pode ser usada com o LangChain instalado."""
+    return api is None or (api in _AGENT_API_IMPORTS and _agent_api_objects(api) is not None)
+
+
+@functools.lru_cache(maxsize=1)
+def _limited_llm_class():
+    """Define LimitedChatGoogleGenerativeAI no primeiro uso (importa langchain_google_genai)."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    class LimitedChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+        """
+        ChatGoogleGenerativeAI que respeita o limite de concorrência, o limitador de
+        vazão e o disjuntor do provedor Gemini (ver providers.py) em chamadas
+        síncronas, assíncronas e em streaming.
+        """
+
+        def _generate(self, *args, **kwargs):
+            with provider_call(GEMINI):
+                return super()._generate(*args, **kwargs)
+
+        async def _agenerate(self, *args, **kwargs):
+            async with aprovider_call(GEMINI):
+                return await super()._agenerate(*args, **kwargs)
+
+        def _stream(self, *args, **kwargs):
+            # A vaga cobre a requisição até o primeiro trecho; o restante do stream
+            # segue no ritmo do consumidor, que não deve prender a vaga
+            with provider_breaker(GEMINI):
+                chunks = super()._stream(*args, **kwargs)
+                with provider_attempt(GEMINI):
+                    first = next(chunks, None)
+                if first is None:
+                    return
+                yield first
+                yield from chunks
+
+        async def _astream(self, *args, **kwargs):
+            async with aprovider_breaker(GEMINI):
+                chunks = super()._astream(*args, **kwargs)
+                async with aprovider_attempt(GEMINI):
+                    first = await anext(chunks, None)
+                if first is None:
+                    return
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+
+    return LimitedChatGoogleGenerativeAI
+
+
+def __getattr__(name: str):
+    # Compatibilidade com os nomes antigos, resolvidos sob demanda
+    if name == "LimitedChatGoogleGenerativeAI":
+        return _limited_llm_class()
+    if name == "_LC_AGENT_API":
+        return detect_agent_api()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _require_gemini_key() -> str:
+    """Valida e retorna a GEMINI_API_KEY."""
     gemini_key = os.getenv("GEMINI_API_KEY")
     if not gemini_key:
         raise ValueError(
             "GEMINI_API_KEY não encontrada. "
             "Crie um arquivo .env baseado em .env.example e configure suas chaves."
         )
-    
-    # Instanciar o modelo Gemini
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-flash-lite-latest",
-        temperature=0.2,
-        max_output_tokens=1500,
+    return gemini_key
+
+
+@dataclass(frozen=True)
+class ModelSettings:
+    """Parâmetros do modelo Gemini (também usados como chave do cache de agentes)."""
+    model: str = "gemini-flash-lite-latest"
+    temperature: float = 0.2
+    max_output_tokens: int = 1500
+
+
+def _build_llm(gemini_key: str, settings: ModelSettings | None = None):
+    """Instancia o modelo Gemini (ChatGoogleGenerativeAI com limite de concorrência)."""
+    settings = settings or ModelSettings()
+    return _limited_llm_class()(
+        model=settings.model,
+        temperature=settings.temperature,
+        max_output_tokens=settings.max_output_tokens,
         google_api_key=gemini_key
     )
-    
-    # Construir ferramentas do LangChain
+
+
+def _web_search_tool(q: str) -> str:
+    # Consultas iguais a uma busca antecipada usam o resultado já em curso (prefetch.py)
+    pending = claim_prefetched(q, num=5, time_period="m6")
+    results = pending.result() if pending is not None else web_search(q, num=5, time_period="m6")
+    # Resultados compactados (campos vazios removidos, snippets cortados) para poupar tokens
+    return compact_results(results).payload
+
+
+async def _aweb_search_tool(q: str) -> str:
+    pending = claim_prefetched(q, num=5, time_period="m6")
+    if pending is not None:
+        return compact_results(await wait_prefetched(pending)).payload
+    return compact_results(await aweb_search(q, num=5, time_period="m6")).payload
+
+
+def _build_tools() -> list:
+    """
+    Constrói as ferramentas do LangChain (com variante assíncrona para o web_search),
+    cada uma limitada às suas chamadas simultâneas (ver tool_concurrency.py).
+    """
+    # Import compatível de Tool entre versões do LangChain
+    try:
+        from langchain_core.tools import Tool  # LangChain 0.2+
+    except Exception:  # noqa: E722
+        from langchain.tools import Tool  # Fallback para versões antigas
+
     tools = [
         Tool(
             name="web_search",
-            func=lambda q: json.dumps(web_search(q, num=5, time_period="m6"), ensure_ascii=False, indent=2),
+            func=_web_search_tool,
+            coroutine=_aweb_search_tool,
             description=(
                 "Busca notícias, relatórios e informações recentes na web sobre um tema específico. "
                 "Use quando precisar encontrar fontes atualizadas sobre investimentos, crescimento, "
@@ -82,6 +239,19 @@ def run_market_agent(topic: str, start_rev: float, end_rev: float, months: float
                 "Output: JSON com lista de resultados contendo title, link, snippet e date."
             )
         ),
+        Tool(
+            name="multi_search",
+            func=multi_search_tool,
+            coroutine=amulti_search_tool,
+            description=(
+                "Executa várias buscas em paralelo e devolve os resultados mesclados, sem duplicados "
+                "e ordenados dos mais recentes para os mais antigos. Prefira esta ferramenta a várias "
+                "chamadas seguidas de web_search. "
+                "Input: o tema (gera as variantes tema + investimentos/crescimento/mercado) ou uma "
+                "lista JSON de consultas, ex.: [\"IoT logística investimentos\", \"IoT logística mercado\"]. "
+                "Output: JSON com lista de resultados contendo title, link, snippet e date."
+            )
+        ),
         Tool(
             name="calc_cagr",
             func=lambda js: calc_cagr(**json.loads(js)),
@@ -92,6 +262,15 @@ def run_market_agent(topic: str, start_rev: float, end_rev: float, months: float
                 "Output: CAGR como decimal (ex.: 0.44 para 44%)."
             )
         ),
+        Tool(
+            name="calc_cagr_many",
+            func=calc_cagr_batch_tool,
+            description=(
+                "Calcula vários CAGRs de uma vez (use no lugar de várias chamadas a calc_cagr). "
+                "Input: JSON string com uma lista [{\"start\": float, \"end\": float, \"months\": float}, ...]. "
+                "Output: JSON com a lista de CAGRs como decimais, na mesma ordem (null para linhas inválidas)."
+            )
+        ),
         Tool(
             name="report_refine",
             func=report_refine,
@@ -103,14 +282,18 @@ def run_market_agent(topic: str, start_rev: float, end_rev: float, months: float
             )
         )
     ]
-    
-    # Construir prompt detalhado (usado tanto pelo executor quanto no fallback manual)
-    prompt = f"""
-Você é um analista de mercado especializado. Sua tarefa é produzir um relatório consolidado sobre o tema: "{topic}".
+    return [limit_tool(tool) for tool in tools]
+
+
+# Instruções estáticas do agente, montadas uma única vez: não dependem do tema nem
+# dos parâmetros, então formam um prefixo idêntico em todas as requisições, que o
+# Gemini reaproveita do cache de contexto (ver context_cache.py)
+AGENT_INSTRUCTIONS = f"""
+{SYSTEM_PROMPT} Sua tarefa é produzir um relatório consolidado sobre o TEMA informado ao final, usando os PARÂMETROS DO CAGR informados junto com ele.
 
 INSTRUÇÕES OBRIGATÓRIAS:
 
-1. **Buscar Fontes (últimos 6 meses)**: Use a ferramenta web_search para encontrar notícias ou relatórios publicados nos ÚLTIMOS 6 MESES sobre investimentos, crescimento ou desenvolvimentos relacionados a "{topic}".
+1. **Buscar Fontes (últimos 6 meses)**: Use a ferramenta web_search para encontrar notícias ou relatórios publicados nos ÚLTIMOS 6 MESES sobre investimentos, crescimento ou desenvolvimentos relacionados ao tema.
 
 2. **Selecionar 2 Fontes**: Do resultado da busca, selecione exatamente 2 fontes relevantes que mencionem investimentos, crescimento de mercado ou avanços tecnológicos.
 
@@ -120,16 +303,13 @@ INSTRUÇÕES OBRIGATÓRIAS:
    - Inclua a data em formato DD/Mês/AAAA ou AAAA-MM-DD quando disponível
    - Se a data não estiver disponível, informe "data não informada"
 
-4. **Calcular CAGR**: Use a ferramenta calc_cagr com os seguintes parâmetros:
-   - start: {start_rev}
-   - end: {end_rev}
-   - months: {months}
+4. **Calcular CAGR**: Use a ferramenta calc_cagr com os valores start, end e months dos PARÂMETROS DO CAGR.
    
    O resultado será um decimal (ex.: 0.44). Converta para percentual com 2 casas decimais (ex.: 44,00%).
 
 5. **Consolidar Relatório**: Escreva um relatório em português (PT-BR) com EXATAMENTE 4 parágrafos:
    
-   **Parágrafo 1**: Contexto geral sobre "{topic}", sua relevância e tendências atuais.
+   **Parágrafo 1**: Contexto geral sobre o tema, sua relevância e tendências atuais.
    
    **Parágrafo 2**: Apresente a primeira fonte citando título, link e data. Resuma o que ela diz sobre investimentos/crescimento.
    
@@ -140,132 +320,663 @@ INSTRUÇÕES OBRIGATÓRIAS:
 6. **Não Inventar Dados**: Use apenas informações das fontes encontradas. Não invente números ou datas.
 
 7. **Opcional**: Ao final, você pode usar report_refine para limpar o texto.
+""".strip()
 
-Comece agora a análise.
-"""
-    
-    # Construir agente compatível com a versão instalada do LangChain
-    print(f"🔍 Usando API do LangChain: {_LC_AGENT_API or 'fallback manual'}\n")
-    if _LC_AGENT_API == "create_agent":
+
+def _task_prompt(topic: str, start_rev: float, end_rev: float, months: float) -> str:
+    """Parte variável do prompt (tema e parâmetros), enviada após as instruções estáticas."""
+    return (
+        f'TEMA: "{topic}"\n'
+        f"PARÂMETROS DO CAGR: start={start_rev}, end={end_rev}, months={months}\n\n"
+        "Comece agora a análise."
+    )
+
+
+def _build_prompt(topic: str, start_rev: float, end_rev: float, months: float) -> str:
+    """Prompt completo: instruções estáticas + parte variável (executores sem system prompt)."""
+    return f"{AGENT_INSTRUCTIONS}\n\n{_task_prompt(topic, start_rev, end_rev, months)}"
+
+
+class AgentWrapper:
+    """
+    Encapsula o CompiledStateGraph do create_agent para manter compatibilidade
+    com invoke({"input": ...}) / ainvoke({"input": ...}).
+
+    As chamadas de ferramentas de um mesmo turno do modelo rodam em paralelo
+    (tarefas do mesmo passo do grafo); com tool_execution="sequential", uma
+    de cada vez.
+    """
+
+    def __init__(self, graph, logger, tool_execution: str | None = None):
+        self.graph = graph
+        self.logger = logger
+        self.tool_execution = resolve_tool_execution(tool_execution)
+
+    def _graph_input(self, input_dict):
+        from langchain_core.messages import HumanMessage
+        # O create_agent retorna um StateGraph que aceita {"messages": [...]}
+        return {"messages": [HumanMessage(content=input_dict["input"])]}
+
+    def _config(self, callbacks):
+        # Callbacks extras (ex.: MetricsCollector) recebem os eventos em tempo real
+        config = {"recursion_limit": 50, "run_name": AGENT_RUN_NAME}
+        if self.tool_execution == "sequential":
+            config["max_concurrency"] = 1
+        if callbacks:
+            config["callbacks"] = callbacks
+        return config
+
+    def invoke(self, input_dict, callbacks=None):
+        """
+        Executa o grafo registrando o TAO à medida que cada passo termina
+        (stream_mode="updates"), e não depois da execução completa.
+        """
+        self.logger.on_chain_start({}, input_dict)
+        state = {"output": ""}
+        try:
+            for data in self.graph.stream(
+                self._graph_input(input_dict), config=self._config(callbacks), stream_mode="updates"
+            ):
+                self._to_events("updates", data, state)
+        except Exception as e:
+            self.logger.on_tool_error(e)
+            raise
+        self.logger.on_chain_end({"output": state["output"]})
+        return {"output": state["output"]}
+
+    async def ainvoke(self, input_dict, callbacks=None):
+        """Versão assíncrona de invoke."""
+        self.logger.on_chain_start({}, input_dict)
+        state = {"output": ""}
+        try:
+            async for data in self.graph.astream(
+                self._graph_input(input_dict), config=self._config(callbacks), stream_mode="updates"
+            ):
+                self._to_events("updates", data, state)
+        except Exception as e:
+            self.logger.on_tool_error(e)
+            raise
+        self.logger.on_chain_end({"output": state["output"]})
+        return {"output": state["output"]}
+
+    def _to_events(self, mode, data, state):
+        """
+        Converte um item de graph.stream(stream_mode=["messages", "updates"]) em
+        eventos de streaming, registrando o TAO no logger à medida que ocorre.
+        """
+        from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+        events = []
+        if mode == "messages":
+            chunk, _metadata = data
+            if isinstance(chunk, AIMessageChunk):
+                text = message_text(chunk)
+                if text:
+                    events.append(make_event(TOKEN, text=text))
+            return events
+
+        for update in data.values():
+            for msg in (update or {}).get("messages", []):
+                if isinstance(msg, AIMessage) and msg.tool_calls:
+                    for tool_call in msg.tool_calls:
+                        name = tool_call.get("name", "unknown")
+                        args = str(tool_call.get("args", {}))
+                        self.logger.on_tool_start({"name": name}, args)
+                        events.append(make_event(TOOL_START, name=name, input=args))
+                elif isinstance(msg, AIMessage):
+                    state["output"] = message_text(msg)
+                elif isinstance(msg, ToolMessage):
+                    content = msg.content if isinstance(msg.content, str) else str(msg.content)
+                    self.logger.on_tool_end(content[:500])
+                    events.append(make_event(TOOL_END, name=msg.name or "unknown", output=content))
+        return events
+
+    def stream(self, input_dict, callbacks=None):
+        """Executa o grafo emitindo eventos TAO e tokens assim que são produzidos."""
+        self.logger.on_chain_start({}, input_dict)
+        state = {"output": ""}
+        try:
+            for mode, data in self.graph.stream(
+                self._graph_input(input_dict),
+                config=self._config(callbacks),
+                stream_mode=["messages", "updates"],
+            ):
+                yield from self._to_events(mode, data, state)
+        except Exception as e:
+            self.logger.on_tool_error(e)
+            raise
+        self.logger.on_chain_end({"output": state["output"]})
+        yield make_event(FINAL, output=state["output"])
+
+    async def astream(self, input_dict, callbacks=None):
+        """Versão assíncrona de stream."""
+        self.logger.on_chain_start({}, input_dict)
+        state = {"output": ""}
+        try:
+            async for mode, data in self.graph.astream(
+                self._graph_input(input_dict),
+                config=self._config(callbacks),
+                stream_mode=["messages", "updates"],
+            ):
+                for event in self._to_events(mode, data, state):
+                    yield event
+        except Exception as e:
+            self.logger.on_tool_error(e)
+            raise
+        self.logger.on_chain_end({"output": state["output"]})
+        yield make_event(FINAL, output=state["output"])
+
+
+def _executor_events(step) -> list:
+    """Converte um passo de AgentExecutor.stream em eventos (sem streaming de tokens)."""
+    events = []
+    for action in step.get("actions", []):
+        events.append(make_event(TOOL_START, name=action.tool, input=str(action.tool_input)))
+    for agent_step in step.get("steps", []):
+        events.append(make_event(TOOL_END, name=agent_step.action.tool, output=str(agent_step.observation)))
+    if "output" in step:
+        events.append(make_event(FINAL, output=step["output"]))
+    return events
+
+
+def _build_agent(llm, tools, api: str | None = AUTO_API, tool_execution: str | None = None):
+    """
+    Constrói o agente compatível com a versão instalada do LangChain.
+
+    Args:
+        api: API a usar (padrão: detect_agent_api(); ver AGENT_APIS)
+        tool_execution: "parallel" ou "sequential" (padrão: TOOL_EXECUTION ou "parallel");
+            os executores ReAct já executam uma ação por passo
+
+    Returns:
+        Objeto com invoke/ainvoke({"input": ...}), ou None para o fallback manual
+
+    Raises:
+        ValueError: Se a API pedida não estiver disponível
+    """
+    if api == AUTO_API:
+        api = detect_agent_api()
+    if not agent_api_available(api):
+        raise ValueError(f"API de agente indisponível nesta versão do LangChain: {api!r}")
+    print(f"🔍 Usando API do LangChain: {api or 'fallback manual'}\n")
+    if api == "create_agent":
         # LangChain 1.0+: create_agent retorna um CompiledStateGraph diretamente executável
+        (create_agent,) = _agent_api_objects(api)
         agent_graph = create_agent(
             model=llm,
             tools=tools,
             debug=False,  # Desliga o debug do LangChain
-            system_prompt="Você é um analista de mercado especializado."
+            system_prompt=AGENT_INSTRUCTIONS
         )
-        # Encapsular o graph em um wrapper para manter compatibilidade com invoke({"input": ...})
-        class AgentWrapper:
-            def __init__(self, graph, logger):
-                self.graph = graph
-                self.logger = logger
-            def invoke(self, input_dict):
-                self.logger.on_chain_start({}, input_dict)
-                try:
-                    # O create_agent retorna um StateGraph que aceita {"messages": [...]}
-                    from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-                    
-                    result = self.graph.invoke({"messages": [HumanMessage(content=input_dict["input"])]}, config={"recursion_limit": 50})
-                    
-                    # Extrair tool calls das mensagens para exibir TAO customizado
-                    messages = result.get("messages", [])
-                    for i, msg in enumerate(messages):
-                        if isinstance(msg, AIMessage) and hasattr(msg, 'tool_calls') and msg.tool_calls:
-                            for tool_call in msg.tool_calls:
-                                self.logger.on_tool_start({"name": tool_call.get("name", "unknown")}, str(tool_call.get("args", {})))
-                        
-                        elif isinstance(msg, ToolMessage):
-                            self.logger.on_tool_end(msg.content if isinstance(msg.content, str) else str(msg.content)[:500])
-                    
-                    self.logger.on_chain_end({"output": messages[-1].content if messages and hasattr(messages[-1], 'content') else str(result)})
-                    return {"output": messages[-1].content if messages and hasattr(messages[-1], 'content') else str(result)}
-                except Exception as e:
-                    self.logger.on_tool_error(e)
-                    raise
-        agent = AgentWrapper(agent_graph, TAOConsoleLogger())
-    elif _LC_AGENT_API == "react":
+        return AgentWrapper(agent_graph, get_tao_logger(), tool_execution=tool_execution)
+    elif api == "react":
+        create_react_agent, AgentExecutor = _agent_api_objects(api)
         react_agent = create_react_agent(llm=llm, tools=tools)
-        agent = AgentExecutor(
+        return AgentExecutor(
             agent=react_agent,
             tools=tools,
             verbose=True,
             max_iterations=8,
             early_stopping_method="generate",
-            callbacks=[TAOConsoleLogger()],
+            callbacks=[get_tao_logger()],
             handle_parsing_errors=True
         )
-    elif _LC_AGENT_API == "initialize":
-        agent = initialize_agent(
+    elif api == "initialize":
+        (initialize_agent,) = _agent_api_objects(api)
+        return initialize_agent(
             tools=tools,
             llm=llm,
             agent="zero-shot-react-description",
             verbose=True,
             max_iterations=8,
             early_stopping_method="generate",
-            callbacks=[TAOConsoleLogger()],
+            callbacks=[get_tao_logger()],
             handle_parsing_errors=True
         )
-    else:
-        # Fallback manual: orquestração simples com logs TAO
-        print("⚠️  Modo fallback manual ativado (API de agente não disponível)\n")
-        logger = TAOConsoleLogger()
-        logger.on_chain_start({}, {"input": prompt})
-
-        # Action: web_search
-        logger.on_tool_start({"name": "web_search"}, topic)
+    print("⚠️  Modo fallback manual ativado (API de agente não disponível)\n")
+    return None
+
+
+class MarketAgent:
+    """
+    Agente de análise de mercado reutilizável.
+
+    Constrói o LLM, as ferramentas e o grafo/executor do agente uma única vez;
+    run/arun podem ser chamados repetidamente e de forma concorrente (nenhum
+    estado por execução é guardado na instância).
+    """
+
+    def __init__(
+        self,
+        settings: ModelSettings | None = None,
+        gemini_key: str | None = None,
+        llm=None,
+        api: str | None = AUTO_API,
+        budget: RunBudget | None = None,
+        tool_execution: str | None = None,
+        prefetch: PrefetchConfig | None = None,
+    ):
+        """
+        Args:
+            settings: Parâmetros do modelo Gemini
+            gemini_key: Chave do Gemini (padrão: GEMINI_API_KEY)
+            llm: Chat model já construído, no lugar do Gemini (ex.: replay.ReplayChatModel)
+            api: API de agente (padrão: a detectada; None usa o pipeline)
+            budget: Orçamento padrão de cada execução (padrão: RunBudget.from_env()
+                lido a cada execução)
+            tool_execution: Execução das ferramentas pedidas em um mesmo turno:
+                "parallel" ou "sequential" (padrão: TOOL_EXECUTION ou "parallel")
+            prefetch: Busca antecipada do web_search no modo agente (padrão:
+                PrefetchConfig.from_env() lido a cada execução)
+        """
+        self.settings = settings or ModelSettings()
+        self.budget = budget
+        self.prefetch = prefetch
+        self.llm = llm if llm is not None else _build_llm(gemini_key or _require_gemini_key(), self.settings)
+        self.tools = _build_tools()
+        self.agent = _build_agent(self.llm, self.tools, api=api, tool_execution=tool_execution)
+
+    def run_pipeline(
+        self, topic: str, start_rev: float, end_rev: float, months: float, callbacks: list | None = None
+    ) -> PipelineResult:
+        """Executa o pipeline determinístico e devolve o resultado estruturado (com tokens por etapa)."""
+        prompt = _task_prompt(topic, start_rev, end_rev, months)
+        return run_pipeline(self.llm, topic, start_rev, end_rev, months, task_input=prompt, callbacks=callbacks)
+
+    async def arun_pipeline(
+        self, topic: str, start_rev: float, end_rev: float, months: float, callbacks: list | None = None
+    ) -> PipelineResult:
+        """Versão assíncrona de run_pipeline."""
+        prompt = _task_prompt(topic, start_rev, end_rev, months)
+        return await arun_pipeline(self.llm, topic, start_rev, end_rev, months, task_input=prompt, callbacks=callbacks)
+
+    def _cache_params(self, start_rev: float, end_rev: float, months: float, mode: str) -> str:
+        settings = self.settings
+        variant = f"{mode}|{settings.model}|{settings.temperature}|{settings.max_output_tokens}"
+        return params_key(start_rev, end_rev, months, variant)
+
+    def _sources_fingerprint(self, topic: str, mode: str) -> str | None:
+        """
+        Impressão digital das fontes do tema já disponíveis localmente, sem rede.
+
+        Só existe no modo pipeline com o armazém de fontes ativo: as fontes
+        armazenadas do tema (a busca seguinte seria só o delta). No modo
+        agente, as consultas são escolhidas pelo próprio agente durante a
+        execução e não há o que conferir antes de rodar: retorna None e o
+        cache de relatórios vale só pela validade.
+        """
+        if mode != "pipeline" and self.agent is not None:
+            return None
+        store = get_source_store()
+        results = store.sources(topic) if store is not None else None
+        return results_fingerprint(results) if results else None
+
+    def _cached_report(self, topic: str, params: str, mode: str) -> str | None:
+        """Relatório em cache para o tema e os parâmetros, se as fontes conhecidas não mudaram."""
+        cache = get_report_cache()
+        if cache is None:
+            return None
+        cached = cache.get(topic, params, fingerprint=self._sources_fingerprint(topic, mode))
+        return cached.report if cached is not None else None
+
+    def _store_report(self, topic: str, params: str, mode: str, report: str, guard: BudgetGuard) -> None:
+        cache = get_report_cache()
+        if cache is None:
+            return
+        # Relatórios de erro ou parciais (orçamento esgotado) não são reaproveitados
+        if report.startswith((AGENT_ERROR_PREFIX, DEGRADED_PREFIX)):
+            return
+        # Impressão digital das fontes desta execução: as do armazém (pipeline)
+        # ou as que o agente de fato consultou (ver BudgetGuard.sources)
+        fingerprint = self._sources_fingerprint(topic, mode)
+        if fingerprint is None and guard.sources:
+            fingerprint = results_fingerprint(guard.sources)
+        cache.set(topic, params, report, fingerprint=fingerprint)
+
+    def run(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, use_cache: bool = True,
+        budget: RunBudget | None = None,
+    ) -> str:
+        """Executa uma análise (ver run_market_agent)."""
+        mode = resolve_mode(mode)
+        guard, callbacks = self._guard(callbacks, budget)
+        if not use_cache:
+            return self._run(topic, start_rev, end_rev, months, mode, callbacks, guard)
+        params = self._cache_params(start_rev, end_rev, months, mode)
+        cached = self._cached_report(topic, params, mode)
+        if cached is not None:
+            return cached
+        report = self._run(topic, start_rev, end_rev, months, mode, callbacks, guard)
+        self._store_report(topic, params, mode, report, guard)
+        return report
+
+    async def arun(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, use_cache: bool = True,
+        budget: RunBudget | None = None,
+    ) -> str:
+        """Executa uma análise de forma assíncrona (ver arun_market_agent)."""
+        mode = resolve_mode(mode)
+        guard, callbacks = self._guard(callbacks, budget)
+        if not use_cache:
+            return await self._arun(topic, start_rev, end_rev, months, mode, callbacks, guard)
+        params = self._cache_params(start_rev, end_rev, months, mode)
+        cached = self._cached_report(topic, params, mode)
+        if cached is not None:
+            return cached
+        report = await self._arun(topic, start_rev, end_rev, months, mode, callbacks, guard)
+        self._store_report(topic, params, mode, report, guard)
+        return report
+
+    def _prompt(self, topic, start_rev, end_rev, months) -> str:
+        # O grafo do create_agent já recebe AGENT_INSTRUCTIONS como system prompt
+        if isinstance(self.agent, AgentWrapper) or self.agent is None:
+            return _task_prompt(topic, start_rev, end_rev, months)
+        return _build_prompt(topic, start_rev, end_rev, months)
+
+    def _prefetch_config(self) -> PrefetchConfig:
+        return self.prefetch or PrefetchConfig.from_env()
+
+    def _guard(self, callbacks, budget) -> tuple[BudgetGuard, list]:
+        # Um BudgetGuard por execução, junto aos callbacks do chamador
+        guard = BudgetGuard(budget or self.budget)
+        return guard, [*(callbacks or []), guard]
+
+    @staticmethod
+    def _degraded(guard: BudgetGuard, topic, start_rev, end_rev, months) -> str:
+        print(f"⚠️  Orçamento esgotado ({guard.exceeded}): relatório parcial com {len(guard.sources)} fonte(s)\n")
+        return guard.degraded_report(topic, start_rev, end_rev, months)
+
+    def _run(self, topic, start_rev, end_rev, months, mode, callbacks, guard) -> str:
+        if mode == "pipeline" or self.agent is None:
+            try:
+                return self.run_pipeline(topic, start_rev, end_rev, months, callbacks=callbacks).report
+            except BudgetExceeded:
+                return self._degraded(guard, topic, start_rev, end_rev, months)
+        
+        # Executar o agente (com a busca provável já em curso, se ativada)
+        prompt = self._prompt(topic, start_rev, end_rev, months)
         try:
-            search_results = web_search(f"{topic} investimentos crescimento", num=5, time_period="m6")
-            logger.on_tool_end(json.dumps(search_results, ensure_ascii=False)[:500])
+            with search_prefetch(topic, self._prefetch_config()):
+                if isinstance(self.agent, AgentWrapper):
+                    result = self.agent.invoke({"input": prompt}, callbacks=callbacks)
+                else:
+                    result = self.agent.invoke({"input": prompt}, config={"callbacks": callbacks})
+            return result["output"]
         except Exception as e:
-            logger.on_tool_error(e)
-            raise
+            # O executor/grafo pode embrulhar a exceção; o guard sabe se o orçamento esgotou
+            if guard.exceeded is not None:
+                return self._degraded(guard, topic, start_rev, end_rev, months)
+            return f"{AGENT_ERROR_PREFIX}: {str(e)}"
 
-        # Pedir ao LLM para escolher 2 fontes e resumir
-        selection_prompt = (
-            "Você recebeu resultados de busca em JSON. Selecione exatamente 2 fontes relevantes, "
-            "citando título, link e data, e produza um breve resumo de 2-3 frases para cada. "
-            "Se a data não estiver disponível, escreva 'data não informada'.\n\n"
-            f"RESULTADOS:\n{json.dumps(search_results, ensure_ascii=False, indent=2)}\n\n"
-            "Responda em JSON com o formato: {\"fontes\": [ {\"titulo\": ..., \"link\": ..., \"data\": ..., \"resumo\": ...}, {...} ]}"
-        )
-        selection = llm.invoke(selection_prompt)
+    async def _arun(self, topic, start_rev, end_rev, months, mode, callbacks, guard) -> str:
+        try:
+            # O prazo também interrompe chamadas em curso (no modo síncrono, só entre etapas)
+            return await asyncio.wait_for(
+                self._arun_guarded(topic, start_rev, end_rev, months, mode, callbacks, guard),
+                timeout=guard.remaining_s(),
+            )
+        except asyncio.TimeoutError:
+            guard.exhaust("deadline", f"{guard.budget.deadline_s:g}s")
+            return self._degraded(guard, topic, start_rev, end_rev, months)
 
-        # Action: calc_cagr
-        logger.on_tool_start({"name": "calc_cagr"}, json.dumps({"start": start_rev, "end": end_rev, "months": months}))
+    async def _arun_guarded(self, topic, start_rev, end_rev, months, mode, callbacks, guard) -> str:
+        if mode == "pipeline" or self.agent is None:
+            try:
+                return (await self.arun_pipeline(topic, start_rev, end_rev, months, callbacks=callbacks)).report
+            except BudgetExceeded:
+                return self._degraded(guard, topic, start_rev, end_rev, months)
+        
+        prompt = self._prompt(topic, start_rev, end_rev, months)
         try:
-            cagr_value = calc_cagr(start=start_rev, end=end_rev, months=months)
-            logger.on_tool_end(str(cagr_value))
+            async with asearch_prefetch(topic, self._prefetch_config()):
+                if isinstance(self.agent, AgentWrapper):
+                    result = await self.agent.ainvoke({"input": prompt}, callbacks=callbacks)
+                else:
+                    result = await self.agent.ainvoke({"input": prompt}, config={"callbacks": callbacks})
+            return result["output"]
         except Exception as e:
-            logger.on_tool_error(e)
-            raise
+            if guard.exceeded is not None:
+                return self._degraded(guard, topic, start_rev, end_rev, months)
+            return f"{AGENT_ERROR_PREFIX}: {str(e)}"
 
-        # Escrever relatório final com 4 parágrafos
+    def stream(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, budget: RunBudget | None = None,
+    ):
+        """
+        Executa uma análise emitindo eventos incrementais (ver stream_market_agent).
+        """
+        guard, callbacks = self._guard(callbacks, budget)
+        prompt = self._prompt(topic, start_rev, end_rev, months)
+        if resolve_mode(mode) == "pipeline" or self.agent is None:
+            try:
+                yield from stream_pipeline(self.llm, topic, start_rev, end_rev, months, task_input=prompt, callbacks=callbacks)
+            except BudgetExceeded:
+                yield make_event(FINAL, output=self._degraded(guard, topic, start_rev, end_rev, months))
+            return
+        
         try:
-            data = selection.content if hasattr(selection, "content") else str(selection)
-            final_prompt = (
-                "Com base nas duas fontes selecionadas (JSON a seguir) e no CAGR informado, "
-                "escreva um relatório em português (PT-BR) com EXATAMENTE 4 parágrafos: \n"
-                "Parágrafo 1: contexto geral do tema.\n"
-                "Parágrafo 2: apresente a primeira fonte (título, link, data) e um resumo.\n"
-                "Parágrafo 3: apresente a segunda fonte (título, link, data) e um resumo.\n"
-                "Parágrafo 4: análise de crescimento mencionando o CAGR em formato XX,XX% e conclusão.\n\n"
-                f"FONTES (JSON):\n{data}\n\n"
-                f"CAGR decimal: {cagr_value}. Converta para percentual com 2 casas."
-            )
-            report = llm.invoke(final_prompt)
-            text = report.content if hasattr(report, "content") else str(report)
-            text = report_refine(text)
-            logger.on_chain_end({"output": text})
-            return text
+            with search_prefetch(topic, self._prefetch_config()):
+                if isinstance(self.agent, AgentWrapper):
+                    yield from self.agent.stream({"input": prompt}, callbacks=callbacks)
+                else:
+                    for step in self.agent.stream({"input": prompt}, config={"callbacks": callbacks}):
+                        yield from _executor_events(step)
         except Exception as e:
-            logger.on_tool_error(e)
-            raise
+            if guard.exceeded is not None:
+                output = self._degraded(guard, topic, start_rev, end_rev, months)
+            else:
+                output = f"{AGENT_ERROR_PREFIX}: {str(e)}"
+            yield make_event(FINAL, output=output)
+
+    async def astream(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, budget: RunBudget | None = None,
+    ):
+        """Versão assíncrona de stream (o prazo é verificado entre etapas)."""
+        guard, callbacks = self._guard(callbacks, budget)
+        prompt = self._prompt(topic, start_rev, end_rev, months)
+        if resolve_mode(mode) == "pipeline" or self.agent is None:
+            try:
+                async for event in astream_pipeline(
+                    self.llm, topic, start_rev, end_rev, months, task_input=prompt, callbacks=callbacks
+                ):
+                    yield event
+            except BudgetExceeded:
+                yield make_event(FINAL, output=self._degraded(guard, topic, start_rev, end_rev, months))
+            return
+        
+        try:
+            async with asearch_prefetch(topic, self._prefetch_config()):
+                if isinstance(self.agent, AgentWrapper):
+                    async for event in self.agent.astream({"input": prompt}, callbacks=callbacks):
+                        yield event
+                else:
+                    async for step in self.agent.astream({"input": prompt}, config={"callbacks": callbacks}):
+                        for event in _executor_events(step):
+                            yield event
+        except Exception as e:
+            if guard.exceeded is not None:
+                output = self._degraded(guard, topic, start_rev, end_rev, months)
+            else:
+                output = f"{AGENT_ERROR_PREFIX}: {str(e)}"
+            yield make_event(FINAL, output=output)
+
+
+_agents: dict[tuple[ModelSettings, str], MarketAgent] = {}
+_agents_lock = threading.Lock()
+
+
+def get_market_agent(settings: ModelSettings | None = None) -> MarketAgent:
+    """
+    Retorna o MarketAgent do processo para as configurações informadas,
+    construindo-o apenas na primeira chamada.
     
+    Raises:
+        ValueError: Se GEMINI_API_KEY não estiver configurada
+    """
+    settings = settings or ModelSettings()
+    key = (settings, _require_gemini_key())
+    agent = _agents.get(key)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(key)
+            if agent is None:
+                agent = _agents[key] = MarketAgent(settings, gemini_key=key[1])
+    return agent
+
+
+def _default_runner(settings: ModelSettings | None):
+    # Sem modelo explícito, a cascata de modelos (opcional) decide qual responde
+    if settings is None:
+        from cascade import get_model_cascade
+        cascade = get_model_cascade()
+        if cascade is not None:
+            return cascade
+    return get_market_agent(settings)
+
+
+def clear_market_agents() -> None:
+    """Descarta os agentes memoizados (ex.: após trocar chaves ou versões)."""
+    with _agents_lock:
+        _agents.clear()
+
+
+def run_market_agent(
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    settings: ModelSettings | None = None,
+    mode: str | None = None,
+    callbacks: list | None = None,
+    use_cache: bool = True,
+    budget: RunBudget | None = None,
+) -> str:
+    """
+    Executa o agente para um tema de mercado (ex.: 'Blockchain em Logística').
     
-    # Executar o agente
-    try:
-        result = agent.invoke({"input": prompt})
-        return result["output"]
-    except Exception as e:
-        return f"Erro ao executar o agente: {str(e)}"
+    Args:
+        topic: Tema de mercado para análise
+        start_rev: Valor inicial para cálculo CAGR
+        end_rev: Valor final para cálculo CAGR
+        months: Período em meses para cálculo CAGR
+        settings: Parâmetros do modelo (padrão: ModelSettings(), ou a cascata de
+            modelos de cascade.py se MODEL_CASCADE estiver definido)
+        mode: 'agent' (padrão) ou 'pipeline' (fluxo fixo com 2 chamadas ao LLM);
+            padrão lido de MARKET_AGENT_MODE
+        callbacks: Handlers do LangChain que recebem os eventos em tempo real
+            (ex.: metrics.MetricsCollector para latência e tokens por etapa)
+        use_cache: Consulta/grava o cache de relatórios (report_cache.py); um
+            relatório em cache só é servido se as fontes da busca não mudaram
+        budget: Limites de chamadas ao LLM, ferramentas, tokens e prazo
+            (padrão: RunBudget.from_env()); ao esgotar, devolve um relatório
+            parcial (começa com budget.DEGRADED_PREFIX) com as fontes já obtidas
+    
+    Returns:
+        Relatório consolidado em 4 parágrafos
+    
+    Raises:
+        ValueError: Se GEMINI_API_KEY não estiver configurada
+    """
+    return _default_runner(settings).run(
+        topic, start_rev, end_rev, months, mode=mode, callbacks=callbacks, use_cache=use_cache, budget=budget
+    )
+
+
+async def arun_market_agent(
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    settings: ModelSettings | None = None,
+    mode: str | None = None,
+    callbacks: list | None = None,
+    use_cache: bool = True,
+    budget: RunBudget | None = None,
+) -> str:
+    """
+    Versão assíncrona de run_market_agent.
+    
+    Usa ainvoke do Gemini/do grafo do agente e aweb_search (httpx), permitindo
+    que um único event loop execute várias análises concorrentes.
+    
+    Args:
+        topic: Tema de mercado para análise
+        start_rev: Valor inicial para cálculo CAGR
+        end_rev: Valor final para cálculo CAGR
+        months: Período em meses para cálculo CAGR
+        settings: Parâmetros do modelo (ver run_market_agent)
+        mode: 'agent' (padrão) ou 'pipeline'; padrão lido de MARKET_AGENT_MODE
+        callbacks: Handlers do LangChain (ver run_market_agent)
+        use_cache: Consulta/grava o cache de relatórios (ver run_market_agent)
+        budget: Orçamento da execução (ver run_market_agent); o prazo também
+            interrompe chamadas em curso
+    
+    Returns:
+        Relatório consolidado em 4 parágrafos
+    
+    Raises:
+        ValueError: Se GEMINI_API_KEY não estiver configurada
+    """
+    return await _default_runner(settings).arun(
+        topic, start_rev, end_rev, months, mode=mode, callbacks=callbacks, use_cache=use_cache, budget=budget
+    )
+
 
+def stream_market_agent(
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    settings: ModelSettings | None = None,
+    mode: str | None = None,
+    callbacks: list | None = None,
+    budget: RunBudget | None = None,
+):
+    """
+    Versão em streaming de run_market_agent.
+    
+    Gera eventos (dicionários, ver streaming.py) à medida que a análise avança:
+    tool_start/tool_end para cada ferramenta, token para cada trecho gerado
+    pelo modelo e, por fim, final com o relatório completo.
+    
+    Sem `settings` e com a cascata de modelos ativa (MODEL_CASCADE ou
+    --cascade), transmite pelo primeiro nível da cascata (ver
+    cascade.ModelCascade.stream).
+    
+    Exemplo:
+        for event in stream_market_agent("Blockchain em Logística", 90, 120, 9):
+            if event["type"] == "token":
+                print(event["text"], end="", flush=True)
+    
+    Raises:
+        ValueError: Se GEMINI_API_KEY não estiver configurada
+    """
+    yield from _default_runner(settings).stream(
+        topic, start_rev, end_rev, months, mode=mode, callbacks=callbacks, budget=budget
+    )
+
+
+async def astream_market_agent(
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    settings: ModelSettings | None = None,
+    mode: str | None = None,
+    callbacks: list | None = None,
+    budget: RunBudget | None = None,
+):
+    """
+    Versão assíncrona de stream_market_agent (async iterator de eventos).
+    
+    Raises:
+        ValueError: Se GEMINI_API_KEY não estiver configurada
+    """
+    async for event in _default_runner(settings).astream(
+        topic, start_rev, end_rev, months, mode=mode, callbacks=callbacks, budget=budget
+    ):
+        yield event
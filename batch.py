@@ -0,0 +1,219 @@
+"""
+Modo batch: analisa vários temas concorrentemente em um único processo.
+"""
+import asyncio
+import csv
+import functools
+import json
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from callbacks import correlation_id
+from providers import configure_concurrency
+
+
+REQUIRED_FIELDS = ("topic", "start_rev", "end_rev", "months")
+
+
+@dataclass
+class BatchJob:
+    """Um tema a ser analisado, com os parâmetros do CAGR."""
+    topic: str
+    start_rev: float
+    end_rev: float
+    months: float
+    index: int = 0
+
+
+@dataclass
+class BatchStats:
+    """Métricas agregadas de uma execução batch."""
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    wall_time: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Temas concluídos por minuto."""
+        return (self.total / self.wall_time) * 60 if self.wall_time else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """Percentil (0-100) das latências, por interpolação linear."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        k = (len(ordered) - 1) * pct / 100
+        lower = int(k)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "wall_time_s": round(self.wall_time, 3),
+            "throughput_per_min": round(self.throughput, 2),
+            "latency_mean_s": round(statistics.fmean(self.latencies), 3) if self.latencies else 0.0,
+            "latency_p50_s": round(self.percentile(50), 3),
+            "latency_p95_s": round(self.percentile(95), 3),
+            "latency_max_s": round(max(self.latencies), 3) if self.latencies else 0.0,
+        }
+
+
+def _job_from_record(record: dict[str, Any], index: int) -> BatchJob:
+    missing = [name for name in REQUIRED_FIELDS if record.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"Linha {index + 1}: campos obrigatórios ausentes: {', '.join(missing)}")
+    try:
+        return BatchJob(
+            topic=str(record["topic"]).strip(),
+            start_rev=float(record["start_rev"]),
+            end_rev=float(record["end_rev"]),
+            months=float(record["months"]),
+            index=index,
+        )
+    except (TypeError, ValueError):
+        raise ValueError(f"Linha {index + 1}: start_rev/end_rev/months devem ser numéricos")
+
+
+def load_jobs(path: str) -> list[BatchJob]:
+    """
+    Lê os temas de um arquivo CSV (com cabeçalho) ou JSONL.
+
+    Cada registro precisa de topic, start_rev, end_rev e months.
+
+    Raises:
+        ValueError: Se o formato não for suportado ou algum registro for inválido
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8") as fh:
+        if ext == ".csv":
+            records = list(csv.DictReader(fh))
+        elif ext in (".jsonl", ".ndjson"):
+            records = [json.loads(line) for line in fh if line.strip()]
+        else:
+            raise ValueError(f"Formato de arquivo não suportado: {ext or path} (use .csv ou .jsonl)")
+    return [_job_from_record(record, i) for i, record in enumerate(records)]
+
+
+async def run_batch(
+    jobs: list[BatchJob],
+    output_path: str,
+    workers: int = 4,
+    runner: Callable[..., Awaitable[str]] | None = None,
+    on_result: Callable[[dict[str, Any]], None] | None = None,
+) -> BatchStats:
+    """
+    Executa os temas com um pool limitado de workers assíncronos.
+
+    Cada relatório é gravado em output_path (JSONL) assim que termina.
+
+    Args:
+        jobs: Temas a analisar
+        output_path: Arquivo JSONL de saída
+        workers: Número máximo de análises simultâneas
+        runner: Corrotina (topic, start_rev, end_rev, months) -> relatório;
+            padrão é agent_market.arun_market_agent
+        on_result: Callback opcional chamado com cada registro gravado
+
+    Returns:
+        Estatísticas agregadas da execução
+    """
+    if workers <= 0:
+        raise ValueError("workers deve ser maior que zero.")
+    if runner is None:
+        from agent_market import arun_market_agent as runner
+    from agent_market import AGENT_ERROR_PREFIX
+    from budget import DEGRADED_PREFIX
+
+    queue: asyncio.Queue[BatchJob] = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    stats = BatchStats(total=len(jobs))
+    started = time.perf_counter()
+
+    with open(output_path, "w", encoding="utf-8") as out:
+        async def worker() -> None:
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                t0 = time.perf_counter()
+                record: dict[str, Any] = {
+                    "index": job.index,
+                    "topic": job.topic,
+                    "start_rev": job.start_rev,
+                    "end_rev": job.end_rev,
+                    "months": job.months,
+                }
+                # Correlaciona os eventos do log TAO (modo jsonl) com o job
+                correlation_id.set(f"batch-{job.index}")
+                try:
+                    report = await runner(job.topic, job.start_rev, job.end_rev, job.months)
+                    if report.startswith(AGENT_ERROR_PREFIX):
+                        record.update(status="error", error=report, report=None)
+                    else:
+                        record.update(status="ok", error=None, report=report)
+                    # Relatório parcial: orçamento da execução esgotado (ver budget.py)
+                    record["degraded"] = report.startswith(DEGRADED_PREFIX)
+                except Exception as e:
+                    record.update(status="error", error=f"{type(e).__name__}: {e}", report=None, degraded=False)
+                latency = time.perf_counter() - t0
+                record["latency_s"] = round(latency, 3)
+
+                stats.latencies.append(latency)
+                if record["status"] == "ok":
+                    stats.succeeded += 1
+                else:
+                    stats.failed += 1
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if on_result is not None:
+                    on_result(record)
+
+        await asyncio.gather(*(worker() for _ in range(min(workers, len(jobs)) or 1)))
+
+    stats.wall_time = time.perf_counter() - started
+    return stats
+
+
+def run_batch_file(
+    input_path: str,
+    output_path: str,
+    workers: int = 4,
+    serpapi_concurrency: int | None = None,
+    gemini_concurrency: int | None = None,
+    mode: str | None = None,
+    callbacks: list | None = None,
+) -> BatchStats:
+    """
+    Carrega os temas de input_path, aplica os limites por provedor e executa o batch.
+
+    `mode` ('agent' ou 'pipeline') e `callbacks` (ex.: um MetricsCollector
+    compartilhado) são repassados a arun_market_agent.
+    """
+    from agent_market import arun_market_agent
+
+    jobs = load_jobs(input_path)
+    limits = {}
+    if serpapi_concurrency is not None:
+        limits["serpapi"] = serpapi_concurrency
+    if gemini_concurrency is not None:
+        limits["gemini"] = gemini_concurrency
+    if limits:
+        configure_concurrency(**limits)
+
+    def report_progress(record: dict[str, Any]) -> None:
+        icon = "❌" if record["status"] != "ok" else "⚠️" if record["degraded"] else "✅"
+        print(f"{icon} [{record['index'] + 1}/{len(jobs)}] {record['topic']} ({record['latency_s']:.1f}s)")
+
+    runner = functools.partial(arun_market_agent, mode=mode, callbacks=callbacks)
+    return asyncio.run(run_batch(jobs, output_path, workers=workers, runner=runner, on_result=report_progress))
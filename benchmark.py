@@ -0,0 +1,469 @@
+"""
+Benchmark offline do agente de análise de mercado (sem rede).
+
+Reproduz um fixture gravado (ver replay.py) com latência injetada no SerpAPI e
+no LLM e mede, para cada API de agente (create_agent, react, initialize,
+fallback), a latência ponta a ponta, a vazão com N execuções concorrentes e o
+número de passos do agente (chamadas ao LLM e ferramentas).
+
+Uso:
+    python benchmark.py tests/fixtures/replay_create_agent.json --runs 16 --concurrency 8 \\
+        --search-latency 0.3 --llm-latency 0.8
+    python benchmark.py --record tests/fixtures/novo.json --topic "IoT em Logística"  # requer chaves
+    python benchmark.py --imports  # tempo de importação dos módulos (processos novos)
+    python benchmark.py tests/fixtures/*.json --prompt-tokens  # tokens de prompt cobrados com/sem cache
+    python benchmark.py --serialization  # CPU e memória da serialização dos resultados de busca
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+# Import compatível entre versões do LangChain
+try:
+    from langchain_core.callbacks.base import BaseCallbackHandler  # LangChain 0.2+
+except Exception:  # noqa: E722
+    from langchain.callbacks.base import BaseCallbackHandler  # Fallback versões antigas
+
+from batch import BatchStats
+from compaction import estimate_tokens
+from context_cache import ContextCacheConfig
+from metrics import MetricsCollector
+from replay import Fixture, ReplayChatModel, record_run, replay_environment
+from search_results import SearchResults, loads, to_json, to_pretty_json
+from tools import _normalize_results
+
+
+# Tokens de entrada lidos do cache de contexto custam 25% do preço cheio no Gemini
+CACHED_TOKEN_PRICE = 0.25
+
+
+@dataclass
+class BenchmarkResult:
+    """Resultado do benchmark de uma API de agente."""
+    api: str
+    runs: int = 0
+    concurrency: int = 0
+    succeeded: int = 0
+    latency_p50_s: float = 0.0
+    latency_p95_s: float = 0.0
+    throughput_per_min: float = 0.0
+    llm_calls_per_run: float = 0.0
+    tool_calls_per_run: float = 0.0
+    skipped: str | None = None
+    errors: list[str] = field(default_factory=list)
+
+
+def _api_label(api: str | None) -> str:
+    return api or "fallback"
+
+
+async def _run_many(agent, meta: dict[str, Any], runs: int, concurrency: int, callbacks: list) -> BatchStats:
+    from agent_market import AGENT_ERROR_PREFIX
+    from http_client import aclose_async_client
+
+    stats = BatchStats(total=runs)
+    semaphore = asyncio.Semaphore(concurrency)
+    mode = "pipeline" if meta.get("api") is None else "agent"
+
+    async def one() -> None:
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                report = await agent.arun(
+                    meta["topic"], meta["start_rev"], meta["end_rev"], meta["months"],
+                    mode=mode, callbacks=callbacks, use_cache=False,
+                )
+                ok = not report.startswith(AGENT_ERROR_PREFIX)
+            except Exception:  # noqa: E722
+                ok = False
+            stats.latencies.append(time.perf_counter() - t0)
+            if ok:
+                stats.succeeded += 1
+            else:
+                stats.failed += 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one() for _ in range(runs)))
+    finally:
+        await aclose_async_client()
+    stats.wall_time = time.perf_counter() - started
+    return stats
+
+
+def run_benchmark(
+    fixture: Fixture,
+    api: str | None = "fixture",
+    runs: int = 8,
+    concurrency: int = 4,
+    search_latency: float = 0.0,
+    llm_latency: float = 0.0,
+) -> BenchmarkResult:
+    """
+    Executa o fixture `runs` vezes (até `concurrency` simultâneas) com uma API de agente.
+
+    Args:
+        fixture: Buscas e respostas gravadas
+        api: API de agente; "fixture" usa a API com que o fixture foi gravado
+        runs: Total de execuções
+        concurrency: Execuções simultâneas
+        search_latency: Latência injetada por busca (segundos)
+        llm_latency: Latência injetada por chamada ao LLM (segundos)
+
+    Returns:
+        BenchmarkResult (com `skipped` preenchido se a API não estiver disponível
+        ou não corresponder ao fixture)
+    """
+    from agent_market import MarketAgent, agent_api_available
+
+    if api == "fixture":
+        api = fixture.meta.get("api")
+    result = BenchmarkResult(api=_api_label(api), runs=runs, concurrency=concurrency)
+    if not agent_api_available(api):
+        result.skipped = "API indisponível nesta versão do LangChain"
+        return result
+    if api != fixture.meta.get("api"):
+        result.skipped = f"fixture gravado com {_api_label(fixture.meta.get('api'))}"
+        return result
+
+    metrics = MetricsCollector()
+    with replay_environment(fixture, search_latency=search_latency):
+        llm = ReplayChatModel(fixture=fixture, latency=llm_latency)
+        agent = MarketAgent(llm=llm, api=api)
+        stats = asyncio.run(_run_many(agent, fixture.meta, runs, concurrency, [metrics]))
+
+    summary = stats.summary()
+    run_records = [r for r in metrics.records if r["kind"] == "run"]
+    result.succeeded = summary["succeeded"]
+    result.latency_p50_s = summary["latency_p50_s"]
+    result.latency_p95_s = summary["latency_p95_s"]
+    result.throughput_per_min = summary["throughput_per_min"]
+    if run_records:
+        result.llm_calls_per_run = sum(r["llm_calls"] for r in run_records) / len(run_records)
+        result.tool_calls_per_run = sum(r["tool_calls"] for r in run_records) / len(run_records)
+    result.errors = sorted({r["error"] for r in metrics.records if r.get("error")})[:5]
+    return result
+
+
+def run_suite(fixtures: list[Fixture], **kwargs: Any) -> list[BenchmarkResult]:
+    """
+    Executa o benchmark para cada API de agente (create_agent, react, initialize,
+    fallback) com o fixture gravado para ela; APIs sem fixture ou indisponíveis
+    aparecem como ignoradas.
+    """
+    from agent_market import AGENT_APIS, agent_api_available
+
+    by_api = {f.meta.get("api"): f for f in fixtures}
+    results = []
+    for api in AGENT_APIS:
+        fixture = by_api.get(api)
+        if not agent_api_available(api):
+            results.append(BenchmarkResult(api=_api_label(api), skipped="API indisponível nesta versão do LangChain"))
+            continue
+        if fixture is None:
+            results.append(BenchmarkResult(api=_api_label(api), skipped="sem fixture gravado"))
+            continue
+        results.append(run_benchmark(fixture, api=api, **kwargs))
+    return results
+
+
+class PromptCapture(BaseCallbackHandler):
+    """Callback que guarda as mensagens de entrada de cada chamada ao LLM."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.prompts: list[list] = []
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any) -> None:
+        self.prompts.append(messages[0])
+
+
+def _static_prefix(messages: list, prefixes: tuple[str, ...]) -> str:
+    # Prefixo estático: system prompt do create_agent ou início da primeira mensagem
+    from pipeline import message_text
+
+    first = message_text(messages[0]) if messages else ""
+    return next((p for p in prefixes if first.startswith(p)), "")
+
+
+def measure_prompt_tokens(
+    fixture: Fixture,
+    min_tokens: int = ContextCacheConfig.min_tokens,
+    cached_price: float = CACHED_TOKEN_PRICE,
+) -> list[dict[str, Any]]:
+    """
+    Reproduz o fixture e estima, para cada chamada ao LLM, os tokens de prompt
+    cobrados (em tokens a preço cheio) antes e depois da separação prefixo
+    estático/sufixo.
+
+    Antes, o tema e os parâmetros apareciam já na primeira frase do prompt, e
+    nenhum prefixo se repetia entre execuções: todos os tokens eram cobrados.
+    Depois, o prefixo estático (AGENT_INSTRUCTIONS, SELECTION_INSTRUCTIONS,
+    REPORT_INSTRUCTIONS) pode ser lido do cache de contexto a partir da 2ª
+    execução, mas só se tiver ao menos `min_tokens` tokens (mínimo do Gemini);
+    os tokens lidos do cache custam `cached_price` do preço cheio. Estimativa
+    de ~4 caracteres por token (compaction.estimate_tokens); em produção, use
+    os tokens "cached" reportados pelo Gemini (metrics.py).
+    """
+    from agent_market import AGENT_INSTRUCTIONS, MarketAgent
+    from pipeline import REPORT_INSTRUCTIONS, SELECTION_INSTRUCTIONS, message_text
+
+    prefixes = (AGENT_INSTRUCTIONS, SELECTION_INSTRUCTIONS, REPORT_INSTRUCTIONS)
+    capture = PromptCapture()
+    meta = fixture.meta
+    with replay_environment(fixture):
+        agent = MarketAgent(llm=ReplayChatModel(fixture=fixture), api=meta.get("api"))
+        agent.run(
+            meta["topic"], meta["start_rev"], meta["end_rev"], meta["months"],
+            mode="pipeline" if meta.get("api") is None else "agent", callbacks=[capture], use_cache=False,
+        )
+    rows = []
+    for i, messages in enumerate(capture.prompts, start=1):
+        total = sum(estimate_tokens(message_text(m)) for m in messages)
+        static = estimate_tokens(_static_prefix(messages, prefixes))
+        cached = static if static >= min_tokens else 0
+        rows.append({
+            "api": _api_label(meta.get("api")),
+            "call": i,
+            "prompt_tokens": total,
+            "static_tokens": static,
+            "cached_tokens": cached,
+            "billed_before": total,
+            "billed_after": round(total - cached * (1 - cached_price)),
+        })
+    return rows
+
+
+def _print_prompt_tokens(rows: list[dict[str, Any]]) -> None:
+    print(f"{'API':<14}{'chamada':>8}{'prompt':>9}{'estático':>10}{'em cache':>10}{'cobrados antes':>16}{'depois':>9}")
+    for r in rows:
+        print(
+            f"{r['api']:<14}{r['call']:>8}{r['prompt_tokens']:>9}{r['static_tokens']:>10}{r['cached_tokens']:>10}"
+            f"{r['billed_before']:>16}{r['billed_after']:>9}"
+        )
+    before = sum(r["billed_before"] for r in rows)
+    after = sum(r["billed_after"] for r in rows)
+    saved = 100 * (before - after) / before if before else 0.0
+    print(f"{'total':<22}{'':>29}{before:>16}{after:>9}  (-{saved:.1f}% com cache de contexto)")
+    if not any(r["cached_tokens"] for r in rows):
+        print("ℹ️  Nenhum prefixo estático atinge o mínimo do cache de contexto: nada é cobrado com desconto")
+
+
+def synthetic_serp_response(num: int = 10, snippet_chars: int = 320) -> dict[str, Any]:
+    """Resposta do SerpAPI sintética (títulos e snippets com acentos) para o microbenchmark."""
+    words = "investimentos em logística crescem com automação e rastreabilidade ponta a ponta".split()
+    snippet = " ".join(words[i % len(words)] for i in range(snippet_chars // 6))[:snippet_chars]
+    return {"organic_results": [
+        {
+            "title": f"Relatório {i}: mercado de logística inteligente",
+            "link": f"https://exemplo{i}.com.br/noticias/logistica?id={i}",
+            "snippet": snippet,
+            "date": f"{i + 1} days ago",
+            "position": i + 1,
+            "displayed_link": f"exemplo{i}.com.br › noticias",
+        }
+        for i in range(num)
+    ]}
+
+
+def _legacy_search_flow(raw: dict[str, Any], num: int) -> tuple[str, ...]:
+    # Caminho anterior: cada etapa recodificava a lista de dicionários com o json
+    results = [
+        {"title": item.get("title", ""), "link": item.get("link", ""),
+         "snippet": item.get("snippet", ""), "date": item.get("date", None)}
+        for item in raw["organic_results"][:num]
+    ]
+    stored = json.dumps(results, ensure_ascii=False)                 # cache.set
+    results = json.loads(stored)                                     # cache.get
+    observation = json.dumps(results, ensure_ascii=False)            # callbacks/log TAO
+    event = json.dumps(results, ensure_ascii=False)                  # evento tool_end (streaming)
+    original = json.dumps(results, ensure_ascii=False, indent=2)     # referência da compactação
+    json.loads(observation)                                          # fontes do orçamento (budget.py)
+    return stored, observation, event, original
+
+
+def _current_search_flow(raw: dict[str, Any], num: int) -> tuple[str, ...]:
+    results = _normalize_results(raw, num)
+    stored = to_json(results)                                        # cache.set
+    results = SearchResults.from_json(stored)                        # cache.get (JSON mantido)
+    observation = to_json(results)                                   # callbacks/log TAO
+    event = to_json(results)                                         # evento tool_end (streaming)
+    original = to_pretty_json(results)                               # referência da compactação
+    loads(observation)                                               # fontes do orçamento (budget.py)
+    return stored, observation, event, original
+
+
+def measure_serialization(rounds: int = 2000, num: int = 10) -> dict[str, dict[str, float]]:
+    """
+    Microbenchmark da serialização dos resultados de uma busca ao longo do
+    pipeline (normalização → cache → callbacks → streaming → compactação →
+    orçamento), com json (antes) e com SearchResults/orjson (agora).
+
+    Returns:
+        {"legacy"|"current": {"cpu_us": CPU por busca, "encodes": textos JSON
+        gerados por busca, "encoded_kib": tamanho somado desses textos,
+        "allocated_kib": memória ainda alocada pela busca ao final (tracemalloc)}}
+    """
+    raw = synthetic_serp_response(num)
+    flows = {"legacy": _legacy_search_flow, "current": _current_search_flow}
+    results: dict[str, dict[str, float]] = {}
+    for name, flow in flows.items():
+        outputs = flow(raw, num)  # aquecimento
+        t0 = time.process_time()
+        for _ in range(rounds):
+            flow(raw, num)
+        cpu = (time.process_time() - t0) / rounds
+
+        tracemalloc.start()
+        try:
+            outputs = flow(raw, num)
+            allocated = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        # Etapas que reaproveitam o JSON devolvem o mesmo objeto str
+        encoded = {id(text): text for text in outputs}.values()
+        results[name] = {
+            "cpu_us": cpu * 1e6,
+            "encodes": len(encoded),
+            "encoded_kib": sum(len(text.encode("utf-8")) for text in encoded) / 1024,
+            "allocated_kib": allocated / 1024,
+        }
+    return results
+
+
+def _print_serialization(results: dict[str, dict[str, float]]) -> None:
+    print(f"{'caminho':<10}{'CPU/busca (µs)':>16}{'JSONs gerados':>15}{'JSON (KiB)':>12}{'retido (KiB)':>14}")
+    for name, r in results.items():
+        print(
+            f"{name:<10}{r['cpu_us']:>16.1f}{r['encodes']:>15}{r['encoded_kib']:>12.1f}{r['allocated_kib']:>14.1f}"
+        )
+    legacy, current = results["legacy"], results["current"]
+
+    def cut(key: str) -> str:
+        return f"-{100 * (1 - current[key] / legacy[key]):.1f}%"
+
+    print(f"{'variação':<10}{cut('cpu_us'):>16}{cut('encodes'):>15}{cut('encoded_kib'):>12}{cut('allocated_kib'):>14}")
+
+
+# Módulos medidos pelo benchmark de importação; "agent_market+agente" inclui a
+# detecção da API e a construção do agente (primeiro uso)
+IMPORT_TARGETS = {
+    "main": "import main",
+    "agent_market": "import agent_market",
+    "agent_market+agente": (
+        "import os; os.environ.setdefault('GEMINI_API_KEY', 'x'); "
+        "import agent_market; agent_market.MarketAgent()"
+    ),
+}
+
+_IMPORT_SNIPPET = (
+    "import time, contextlib, io; t = time.perf_counter()\n"
+    "with contextlib.redirect_stdout(io.StringIO()):\n    {code}\n"
+    "print(time.perf_counter() - t)"
+)
+
+
+def measure_import_time(code: str, repeat: int = 5) -> float:
+    """
+    Mediana (segundos) do tempo de execução de `code` em processos Python novos,
+    ou seja, sem módulos já importados (o custo real de uma CLI ou worker novo).
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SNIPPET.format(code=code)],
+            cwd=root, capture_output=True, text=True, check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def _print_results(results: list[BenchmarkResult]) -> None:
+    print(f"{'API':<14}{'ok':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'temas/min':>12}{'LLM/exec':>10}{'tools/exec':>12}")
+    for r in results:
+        if r.skipped:
+            print(f"{r.api:<14}  ignorado: {r.skipped}")
+            continue
+        print(
+            f"{r.api:<14}{f'{r.succeeded}/{r.runs}':>8}{r.latency_p50_s:>10.2f}{r.latency_p95_s:>10.2f}"
+            f"{r.throughput_per_min:>12.1f}{r.llm_calls_per_run:>10.1f}{r.tool_calls_per_run:>12.1f}"
+        )
+        for error in r.errors:
+            print(f"{'':<14}  erro: {error}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline do agente (record/replay)")
+    parser.add_argument("fixtures", nargs="*", help="Fixtures JSON gravados (um por API de agente)")
+    parser.add_argument("--runs", type=int, default=8, help="Execuções por API")
+    parser.add_argument("--concurrency", type=int, default=4, help="Execuções simultâneas")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="Latência injetada por busca (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Latência injetada por chamada ao LLM (s)")
+    parser.add_argument("--json", metavar="ARQUIVO", help="Grava os resultados em JSON (ex.: para comparar no CI)")
+    parser.add_argument("--record", metavar="ARQUIVO", help="Grava um novo fixture com SerpAPI/Gemini reais")
+    parser.add_argument("--topic", default="Blockchain em Logística")
+    parser.add_argument("--start-rev", type=float, default=90.0)
+    parser.add_argument("--end-rev", type=float, default=120.0)
+    parser.add_argument("--months", type=float, default=9.0)
+    parser.add_argument("--mode", choices=("agent", "pipeline"))
+    parser.add_argument("--verbose", action="store_true", help="Mantém o log TAO no console")
+    parser.add_argument("--imports", action="store_true", help="Mede o tempo de importação dos módulos")
+    parser.add_argument(
+        "--serialization", action="store_true",
+        help="Microbenchmark de CPU e memória da serialização dos resultados de busca (json vs. orjson)",
+    )
+    parser.add_argument(
+        "--prompt-tokens", action="store_true",
+        help="Estima os tokens de prompt cobrados antes/depois do prefixo estático (cache de contexto)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        for name, code in IMPORT_TARGETS.items():
+            print(f"{name:<22}{measure_import_time(code):>8.3f}s")
+        return 0
+    if args.serialization:
+        _print_serialization(measure_serialization())
+        return 0
+
+    if not args.verbose:
+        # O log TAO no console distorce as medições com muitas execuções concorrentes
+        os.environ["TAO_LOG_MODE"] = "jsonl"
+        os.environ.setdefault("TAO_LOG_PATH", os.devnull)
+
+    if args.record:
+        record_run(args.record, args.topic, args.start_rev, args.end_rev, args.months, mode=args.mode)
+        print(f"Fixture gravado em: {args.record}")
+        return 0
+    if not args.fixtures:
+        parser.error("informe ao menos um fixture (ou --record)")
+    if args.prompt_tokens:
+        _print_prompt_tokens([row for path in args.fixtures for row in measure_prompt_tokens(Fixture.load(path))])
+        return 0
+
+    results = run_suite(
+        [Fixture.load(path) for path in args.fixtures],
+        runs=args.runs,
+        concurrency=args.concurrency,
+        search_latency=args.search_latency,
+        llm_latency=args.llm_latency,
+    )
+    _print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump([asdict(r) for r in results], fh, ensure_ascii=False, indent=2)
+    return 1 if any(not r.skipped and r.succeeded < r.runs for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
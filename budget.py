@@ -0,0 +1,261 @@
+"""
+Orçamentos por execução: chamadas ao LLM, chamadas de ferramentas, tokens e prazo.
+
+BudgetGuard é um callback do LangChain (um por execução) que conta os eventos
+do agente ou do pipeline e interrompe a execução com BudgetExceeded quando o
+orçamento se esgota. As fontes obtidas pelas buscas até ali ficam guardadas no
+guard, e degraded_report monta com elas um relatório parcial (mesmo formato de
+4 parágrafos) servido no lugar da mensagem de erro.
+"""
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any
+from uuid import UUID
+
+# Import compatível entre versões do LangChain
+try:
+    from langchain_core.callbacks.base import BaseCallbackHandler  # LangChain 0.2+
+except Exception:  # noqa: E722
+    from langchain.callbacks.base import BaseCallbackHandler  # Fallback versões antigas
+
+from cache import _env_float
+from metrics import _usage_from_response
+from report_format import format_cagr
+from search_results import loads
+from tools import calc_cagr
+
+
+# Relatórios montados após o esgotamento do orçamento começam com este prefixo
+DEGRADED_PREFIX = "Relatório parcial"
+
+# Motivos de interrupção (BudgetExceeded.reason) e a descrição usada no relatório
+REASONS = {
+    "llm_calls": "limite de chamadas ao LLM",
+    "tool_calls": "limite de chamadas de ferramentas",
+    "tokens": "limite de tokens",
+    "deadline": "prazo da execução",
+}
+
+# Ferramentas cuja saída é uma lista JSON de resultados de busca
+SEARCH_TOOLS = ("web_search", "multi_search")
+
+
+class BudgetExceeded(RuntimeError):
+    """O orçamento da execução se esgotou (ver REASONS)."""
+
+    def __init__(self, reason: str, detail: str):
+        super().__init__(f"Orçamento esgotado ({REASONS[reason]}): {detail}")
+        self.reason = reason
+
+
+@dataclass(frozen=True)
+class RunBudget:
+    """
+    Limites de uma execução (0 = sem limite).
+
+    Por padrão nenhum limite vale; ative-os com RUN_* (ver from_env) ou
+    passando um RunBudget ao agente.
+
+    Attributes:
+        max_llm_calls: Chamadas ao LLM
+        max_tool_calls: Chamadas de ferramentas
+        max_tokens: Tokens (entrada + saída) somados em todas as chamadas ao LLM
+        deadline_s: Prazo em segundos desde o início da execução
+    """
+    max_llm_calls: int = 0
+    max_tool_calls: int = 0
+    max_tokens: int = 0
+    deadline_s: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "RunBudget":
+        """Lê RUN_MAX_LLM_CALLS, RUN_MAX_TOOL_CALLS, RUN_MAX_TOKENS e RUN_DEADLINE_S."""
+        return cls(
+            max_llm_calls=int(_env_float("RUN_MAX_LLM_CALLS", cls.max_llm_calls)),
+            max_tool_calls=int(_env_float("RUN_MAX_TOOL_CALLS", cls.max_tool_calls)),
+            max_tokens=int(_env_float("RUN_MAX_TOKENS", cls.max_tokens)),
+            deadline_s=_env_float("RUN_DEADLINE_S", cls.deadline_s),
+        )
+
+
+class BudgetStats:
+    """Execuções interrompidas no processo, por motivo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.exhausted: Counter = Counter()
+
+    def record(self, reason: str) -> None:
+        with self._lock:
+            self.exhausted[reason] += 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {reason: self.exhausted[reason] for reason in REASONS}
+
+
+budget_stats = BudgetStats()
+
+
+def _search_results(output: Any) -> list[dict[str, Any]]:
+    # A saída chega como str (pipeline, AgentExecutor) ou ToolMessage (create_agent)
+    text = getattr(output, "content", output)
+    try:
+        data = loads(text) if isinstance(text, str) else text
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(data, list):
+        return []
+    return [item for item in data if isinstance(item, dict) and item.get("link")]
+
+
+class BudgetGuard(BaseCallbackHandler):
+    """
+    Callback que aplica um RunBudget a uma única execução.
+
+    Os limites são verificados antes de cada chamada ao LLM e de cada
+    ferramenta; ao esgotar, lança BudgetExceeded (raise_error=True faz o
+    LangChain propagar a exceção e encerrar o grafo/executor). O prazo também
+    é verificado nessas fronteiras; as versões assíncronas o aplicam ainda
+    com asyncio.wait_for (ver remaining_s), interrompendo chamadas em curso.
+
+    Attributes:
+        exceeded: Motivo da interrupção (chave de REASONS) ou None
+        sources: Resultados de busca vistos até agora, sem links repetidos
+    """
+
+    raise_error = True
+    run_inline = True
+
+    def __init__(self, budget: RunBudget | None = None):
+        self.budget = budget or RunBudget.from_env()
+        self.started = time.monotonic()
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.tokens = 0
+        self.exceeded: str | None = None
+        self.sources: list[dict[str, Any]] = []
+        self._tools: dict[UUID, str] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_s(self) -> float | None:
+        """Segundos até o prazo (None se não houver prazo)."""
+        if not self.budget.deadline_s:
+            return None
+        return max(0.0, self.budget.deadline_s - self.elapsed_s)
+
+    def exhaust(self, reason: str, detail: str) -> BudgetExceeded:
+        """Marca a execução como interrompida e devolve a exceção a lançar."""
+        with self._lock:
+            if self.exceeded is None:
+                self.exceeded = reason
+                budget_stats.record(reason)
+        return BudgetExceeded(reason, detail)
+
+    def _check(self) -> None:
+        budget = self.budget
+        if budget.deadline_s and self.elapsed_s >= budget.deadline_s:
+            raise self.exhaust("deadline", f"{self.elapsed_s:.1f}s de {budget.deadline_s:g}s")
+        if budget.max_tokens and self.tokens >= budget.max_tokens:
+            raise self.exhaust("tokens", f"{self.tokens} de {budget.max_tokens}")
+
+    # ----------------------------------------------------------------- callbacks
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._on_llm_call()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._on_llm_call()
+
+    def _on_llm_call(self) -> None:
+        self._check()
+        with self._lock:
+            limit = self.budget.max_llm_calls
+            if limit and self.llm_calls >= limit:
+                raise self.exhaust("llm_calls", f"{self.llm_calls} de {limit}")
+            self.llm_calls += 1
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = _usage_from_response(response)
+        with self._lock:
+            self.tokens += usage["prompt_tokens"] + usage["completion_tokens"]
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._check()
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        with self._lock:
+            limit = self.budget.max_tool_calls
+            if limit and self.tool_calls >= limit:
+                raise self.exhaust("tool_calls", f"{self.tool_calls} de {limit}")
+            self.tool_calls += 1
+            self._tools[run_id] = name
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            name = self._tools.pop(run_id, None)
+        if name not in SEARCH_TOOLS:
+            return
+        results = _search_results(output)
+        with self._lock:
+            seen = {item["link"] for item in self.sources}
+            self.sources.extend(item for item in results if item["link"] not in seen)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._tools.pop(run_id, None)
+
+    # ------------------------------------------------------------------ relatório
+
+    def degraded_report(self, topic: str, start_rev: float, end_rev: float, months: float) -> str:
+        """Relatório parcial com as fontes obtidas até a interrupção (ver degraded_report)."""
+        with self._lock:
+            sources = list(self.sources)
+        return degraded_report(topic, start_rev, end_rev, months, sources, self.exceeded or "deadline")
+
+
+def degraded_report(
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    sources: list[dict[str, Any]],
+    reason: str,
+) -> str:
+    """
+    Monta, sem chamar o LLM, um relatório de 4 parágrafos com as 2 primeiras
+    fontes disponíveis e o CAGR calculado localmente.
+
+    Args:
+        sources: Resultados de busca ({title, link, snippet, date})
+        reason: Motivo da interrupção (chave de REASONS)
+    """
+    paragraphs = [
+        f"{DEGRADED_PREFIX} sobre \"{topic}\": a análise foi interrompida ao atingir o "
+        f"{REASONS[reason]} e este texto foi montado automaticamente com as fontes obtidas "
+        "até então, sem a redação final do modelo."
+    ]
+    for i in range(2):
+        if i < len(sources):
+            source = sources[i]
+            title = " ".join(str(source.get("title") or "").split()) or "sem título"
+            date = source.get("date") or "data não informada"
+            snippet = " ".join(str(source.get("snippet") or "").split())
+            paragraphs.append(f"Fonte {i + 1}: {title} ({source['link']}), {date}. {snippet}".rstrip())
+        else:
+            paragraphs.append(f"Fonte {i + 1}: não obtida antes da interrupção.")
+    try:
+        cagr = format_cagr(calc_cagr(start=start_rev, end=end_rev, months=months))
+        paragraphs.append(
+            f"Análise de crescimento: o CAGR calculado de {start_rev:g} para {end_rev:g} em "
+            f"{months:g} meses é de {cagr}. Refaça a análise completa para uma conclusão "
+            "sobre o potencial de mercado."
+        )
+    except ValueError as e:
+        paragraphs.append(f"Análise de crescimento: CAGR não calculado ({e}).")
+    return "\n\n".join(paragraphs)
@@ -0,0 +1,296 @@
+"""
+Cache persistente (SQLite) para resultados do web_search.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from search_results import SearchResults, to_json
+
+
+# TTL padrão (segundos) por unidade da janela qdr: do SerpAPI.
+# Janelas curtas mudam rápido; janelas longas toleram resultados mais antigos.
+DEFAULT_TTLS: dict[str, float] = {
+    "h": 15 * 60,          # última hora
+    "d": 2 * 60 * 60,      # último dia
+    "w": 12 * 60 * 60,     # última semana
+    "m": 24 * 60 * 60,     # último(s) mês(es)
+    "y": 3 * 24 * 60 * 60,  # último ano
+    "": 24 * 60 * 60,      # sem filtro temporal
+}
+
+_QDR_RE = re.compile(r"^(?:qdr:)?([hdwmy])(\d*)$")
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Variável {name} deve ser numérica (recebido: {value!r})")
+
+
+def normalize_key(query: str, num: int, time_period: str | None) -> tuple[str, int, str]:
+    """
+    Normaliza a tupla (query, num, time_period) usada como chave do cache.
+
+    A consulta é convertida para minúsculas e tem espaços colapsados, para que
+    variações triviais da mesma busca compartilhem a entrada.
+    """
+    q = " ".join(query.lower().split())
+    tp = (time_period or "").strip().lower()
+    if tp.startswith("qdr:"):
+        tp = tp[4:]
+    return q, int(num), tp
+
+
+def ttl_for_period(time_period: str | None, ttls: dict[str, float] | None = None) -> float:
+    """
+    Retorna o TTL (segundos) associado a uma janela qdr: (ex.: 'd', 'w', 'm6').
+
+    Args:
+        time_period: Janela temporal no formato do SerpAPI, com ou sem prefixo 'qdr:'
+        ttls: Mapa opcional unidade -> TTL; padrão DEFAULT_TTLS
+
+    Returns:
+        TTL em segundos
+    """
+    table = ttls or DEFAULT_TTLS
+    tp = (time_period or "").strip().lower()
+    match = _QDR_RE.match(tp)
+    unit = match.group(1) if match else ""
+    return table.get(unit, table.get("", DEFAULT_TTLS[""]))
+
+
+class SearchCache:
+    """
+    Cache em SQLite com expiração por TTL e despejo LRU limitado por tamanho.
+
+    Chaveado pela tupla normalizada (query, num, time_period). Os contadores
+    de hits/misses/evictions são mantidos em memória para o processo atual.
+
+    Entradas expiradas são mantidas por mais `stale_max_age` segundos: não
+    atendem get(), mas get_stale() as devolve quando o provedor está degradado
+    (ver providers.py).
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_entries: int = 1000,
+        ttls: dict[str, float] | None = None,
+        stale_max_age: float = 0.0,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries deve ser maior que zero.")
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stale_max_age = stale_max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS web_search_cache (
+                query TEXT NOT NULL,
+                num INTEGER NOT NULL,
+                time_period TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (query, num, time_period)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_web_search_cache_access "
+            "ON web_search_cache (last_access)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "SearchCache":
+        """
+        Cria o cache a partir das variáveis de ambiente:
+        SEARCH_CACHE_PATH, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_<H|D|W|M|Y|NONE>
+        e SEARCH_CACHE_STALE_MAX_AGE (padrão: 7 dias).
+        """
+        path = os.getenv("SEARCH_CACHE_PATH", os.path.join(".cache", "web_search.sqlite3"))
+        max_entries = int(_env_float("SEARCH_CACHE_MAX_ENTRIES", 1000))
+        ttls = {}
+        for unit in ("h", "d", "w", "m", "y"):
+            ttls[unit] = _env_float(f"SEARCH_CACHE_TTL_{unit.upper()}", DEFAULT_TTLS[unit])
+        ttls[""] = _env_float("SEARCH_CACHE_TTL_NONE", DEFAULT_TTLS[""])
+        stale_max_age = _env_float("SEARCH_CACHE_STALE_MAX_AGE", 7 * 24 * 60 * 60)
+        return cls(path=path, max_entries=max_entries, ttls=ttls, stale_max_age=stale_max_age)
+
+    def get(self, query: str, num: int, time_period: str | None) -> list[dict[str, Any]] | None:
+        """
+        Busca um resultado no cache.
+
+        Returns:
+            Lista de resultados, ou None se ausente ou expirado
+        """
+        key = normalize_key(query, num, time_period)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM web_search_cache "
+                "WHERE query = ? AND num = ? AND time_period = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, created_at = row
+            ttl = ttl_for_period(key[2], self.ttls)
+            if now - created_at > ttl:
+                if now - created_at > ttl + self.stale_max_age:
+                    self._conn.execute(
+                        "DELETE FROM web_search_cache WHERE query = ? AND num = ? AND time_period = ?",
+                        key,
+                    )
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE web_search_cache SET last_access = ? "
+                "WHERE query = ? AND num = ? AND time_period = ?",
+                (now, *key),
+            )
+            self._conn.commit()
+            self.hits += 1
+        return SearchResults.from_json(payload)
+
+    def get_stale(self, query: str, num: int, time_period: str | None) -> list[dict[str, Any]] | None:
+        """
+        Busca um resultado aceitando entradas expiradas há até `stale_max_age`
+        segundos (fallback quando o provedor está indisponível).
+
+        Returns:
+            Lista de resultados, ou None se ausente ou velha demais
+        """
+        key = normalize_key(query, num, time_period)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM web_search_cache "
+                "WHERE query = ? AND num = ? AND time_period = ?",
+                key,
+            ).fetchone()
+            if row is None or time.time() - row[1] > ttl_for_period(key[2], self.ttls) + self.stale_max_age:
+                return None
+            self.stale_hits += 1
+        return SearchResults.from_json(row[0])
+
+    def peek(self, query: str, num: int, time_period: str | None) -> list[dict[str, Any]] | None:
+        """
+        Como get(), mas sem alterar contadores nem a ordem LRU (consultas
+        internas, ex.: a impressão digital do cache de relatórios).
+
+        Returns:
+            Lista de resultados, ou None se ausente ou expirado
+        """
+        key = normalize_key(query, num, time_period)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM web_search_cache "
+                "WHERE query = ? AND num = ? AND time_period = ?",
+                key,
+            ).fetchone()
+        if row is None or time.time() - row[1] > ttl_for_period(key[2], self.ttls):
+            return None
+        return SearchResults.from_json(row[0])
+
+    def set(self, query: str, num: int, time_period: str | None, results: list[dict[str, Any]]) -> None:
+        """Armazena um resultado e aplica o despejo LRU se o limite for excedido."""
+        key = normalize_key(query, num, time_period)
+        now = time.time()
+        # Lotes do web_search já trazem o JSON serializado (search_results.py)
+        payload = to_json(results)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO web_search_cache "
+                "(query, num, time_period, payload, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, payload, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM web_search_cache").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM web_search_cache WHERE rowid IN ("
+                    "SELECT rowid FROM web_search_cache ORDER BY last_access ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Remove todas as entradas e zera os contadores."""
+        with self._lock:
+            self._conn.execute("DELETE FROM web_search_cache")
+            self._conn.commit()
+            self.hits = self.misses = self.evictions = self.stale_hits = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM web_search_cache").fetchone()[0]
+
+    def stats(self) -> dict[str, Any]:
+        """Retorna os contadores de uso do cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_hits": self.stale_hits,
+            "entries": len(self),
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: SearchCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_search_cache(create: bool = True) -> SearchCache | None:
+    """
+    Retorna o cache padrão do processo (criado sob demanda a partir do ambiente).
+
+    Retorna None se SEARCH_CACHE_DISABLED estiver definido como 1/true. Com create=False,
+    não cria o cache (nem o arquivo SQLite): retorna só o já inicializado.
+    """
+    global _default_cache
+    if os.getenv("SEARCH_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    if _default_cache is None and not create:
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = SearchCache.from_env()
+    return _default_cache
+
+
+def set_search_cache(cache: SearchCache | None) -> None:
+    """Substitui o cache padrão do processo (útil em testes)."""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
@@ -1,7 +1,19 @@
 """
 Callbacks para rastreamento TAO (Thought/Action/Observation).
 """
-from typing import Any, Dict, List
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+import zlib
+from contextvars import ContextVar
+from typing import IO, Any, Dict, List
+
+from cache import _env_float
 # Import compatível entre versões do LangChain
 try:
     from langchain_core.callbacks.base import BaseCallbackHandler  # LangChain 0.2+
@@ -73,3 +85,211 @@ class TAOConsoleLogger(BaseCallbackHandler):
         """Chamado quando o agente finaliza."""
         pass
 
+
+# Modos de log: "console" (TAOConsoleLogger) ou "jsonl" (JSONLEventLogger)
+LOG_MODES = ("console", "jsonl")
+
+# Identificador da execução corrente (definido em on_chain_start) e um
+# identificador de correlação opcional definido pelo chamador (ex.: job do batch)
+_run_id: ContextVar[str | None] = ContextVar("tao_run_id", default=None)
+correlation_id: ContextVar[str | None] = ContextVar("tao_correlation_id", default=None)
+
+_STOP = object()
+
+
+class JSONLEventLogger(BaseCallbackHandler):
+    """
+    Logger TAO para produção: eventos compactos em JSON lines, sem bloquear o agente.
+
+    Os eventos vão para uma fila limitada e são serializados e gravados por uma
+    thread em segundo plano. Se a fila estiver cheia, o evento é descartado
+    (contado em `dropped`) em vez de bloquear quem o emitiu.
+
+    Cada evento traz o run_id da execução (contexto da task/thread, então
+    execuções concorrentes não se misturam) e o correlation_id, se definido.
+    A amostragem é por execução: uma execução amostrada é registrada por
+    inteiro; erros são sempre registrados.
+
+    Formato:
+        {"ts": ..., "event": "run_start"|"tool_start"|"tool_end"|"tool_error"|"run_end",
+         "run_id": "...", "correlation_id": ..., ...}
+    """
+
+    def __init__(
+        self,
+        stream: IO[str] | None = None,
+        max_queue: int = 10000,
+        sample_rate: float = 1.0,
+        max_text: int = 200,
+    ):
+        """
+        Args:
+            stream: Destino das linhas JSON (padrão: sys.stdout)
+            max_queue: Capacidade da fila; eventos excedentes são descartados
+            sample_rate: Fração das execuções registradas (0.0 a 1.0)
+            max_text: Tamanho máximo dos textos de entrada/saída em cada evento
+        """
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate deve estar entre 0 e 1.")
+        self.stream = stream
+        self.sample_rate = sample_rate
+        self.max_text = max_text
+        self.dropped = 0
+        self.written = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        # Arquivo aberto por from_env: fechado em close()
+        self._owned_stream: IO[str] | None = None
+
+    @classmethod
+    def from_env(cls) -> "JSONLEventLogger":
+        """
+        Lê TAO_LOG_PATH (padrão: stdout), TAO_LOG_QUEUE_SIZE e TAO_LOG_SAMPLE_RATE.
+
+        O arquivo de TAO_LOG_PATH é aberto só depois de validar as demais
+        variáveis e é fechado por close().
+        """
+        max_queue = int(_env_float("TAO_LOG_QUEUE_SIZE", 10000))
+        sample_rate = _env_float("TAO_LOG_SAMPLE_RATE", 1.0)
+        path = os.getenv("TAO_LOG_PATH")
+        logger = cls(max_queue=max_queue, sample_rate=sample_rate)
+        if path:
+            logger.stream = logger._owned_stream = open(path, "a", encoding="utf-8", buffering=1)
+        return logger
+
+    # ------------------------------------------------------------------ internos
+
+    def _sampled(self, run_id: str | None) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        if run_id is None or self.sample_rate <= 0.0:
+            return False
+        # Decisão determinística por execução (todos os eventos do mesmo run_id)
+        return zlib.crc32(run_id.encode()) / 0xFFFFFFFF < self.sample_rate
+
+    def _emit(self, event: str, force: bool = False, **fields: Any) -> None:
+        run_id = _run_id.get()
+        if not force and not self._sampled(run_id):
+            return
+        record = {"ts": time.time(), "event": event, "run_id": run_id, "correlation_id": correlation_id.get()}
+        record.update(fields)
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _text(self, value: Any) -> str:
+        text = value if isinstance(value, str) else str(value)
+        return text[:self.max_text]
+
+    def _ensure_writer(self) -> None:
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain, name="tao-jsonl-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _drain(self) -> None:
+        while True:
+            record = self._queue.get()
+            batch = [record]
+            # Agrupa o que já estiver na fila em uma única escrita
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(r is _STOP for r in batch)
+            lines = "".join(
+                json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+                for r in batch if r is not _STOP
+            )
+            if lines:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write(lines)
+                    stream.flush()
+                    self.written += len(batch) - stop
+                except Exception:  # noqa: E722
+                    # Falhas de escrita nunca devem derrubar o processo
+                    self.dropped += len(batch) - stop
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Aguarda (até timeout) a gravação dos eventos já enfileirados."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Grava os eventos pendentes, encerra a thread de escrita e fecha o arquivo aberto por from_env."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                return
+            thread.join(timeout)
+            if thread.is_alive():
+                return
+        stream, self._owned_stream = self._owned_stream, None
+        if stream is not None:
+            stream.close()
+
+    # ----------------------------------------------------------------- callbacks
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any) -> None:
+        """Inicia uma execução (apenas a chain raiz quando usado como callback do LangChain)."""
+        if kwargs.get("parent_run_id") is not None:
+            return
+        run_id = kwargs.get("run_id")
+        _run_id.set(str(run_id) if run_id else uuid.uuid4().hex)
+        self._emit("run_start", input=self._text(inputs.get("input", "")) if isinstance(inputs, dict) else "")
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        self._emit("tool_start", tool=(serialized or {}).get("name", "unknown"), input=self._text(input_str))
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        self._emit("tool_end", output=self._text(output))
+
+    def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._emit("tool_error", force=True, error=f"{type(error).__name__}: {self._text(error)}")
+
+    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any) -> None:
+        if kwargs.get("parent_run_id") is not None:
+            return
+        output = outputs.get("output", "") if isinstance(outputs, dict) else outputs
+        self._emit("run_end", output=self._text(output))
+        _run_id.set(None)
+
+
+_jsonl_logger: JSONLEventLogger | None = None
+_jsonl_lock = threading.Lock()
+
+
+def get_tao_logger(mode: str | None = None):
+    """
+    Retorna o logger TAO para o modo informado (padrão: variável TAO_LOG_MODE ou 'console').
+
+    No modo 'jsonl' o JSONLEventLogger é compartilhado pelo processo (uma única
+    fila e thread de escrita para todos os agentes).
+    """
+    global _jsonl_logger
+    mode = (mode or os.getenv("TAO_LOG_MODE") or "console").lower()
+    if mode not in LOG_MODES:
+        raise ValueError(f"Modo de log inválido: {mode!r} (use um de {LOG_MODES})")
+    if mode == "console":
+        return TAOConsoleLogger()
+    if _jsonl_logger is None:
+        with _jsonl_lock:
+            if _jsonl_logger is None:
+                _jsonl_logger = JSONLEventLogger.from_env()
+    return _jsonl_logger
@@ -0,0 +1,445 @@
+"""
+Cascata de modelos: tenta primeiro o modelo mais barato e só escala se o
+relatório não tiver o formato exigido.
+
+Cada nível da cascata é um MarketAgent (get_market_agent) com outro modelo
+Gemini. A resposta de cada nível passa por report_format.validate_report
+(4 parágrafos, 2 URLs, CAGR XX,XX% igual ao calculado); a primeira válida é
+devolvida. Com race_after_s, o nível seguinte também é disparado quando o
+atual não responde dentro do prazo (hedge), e vence a primeira resposta
+válida, com preferência ao nível mais barato entre as que chegam juntas.
+
+Acertos, escaladas e latência por modelo ficam em cascade_stats (métricas
+market_agent_cascade_*).
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable
+
+from agent_market import AGENT_ERROR_PREFIX, ModelSettings, get_market_agent
+from budget import DEGRADED_PREFIX, RunBudget
+from cache import _env_float
+from metrics import _percentile
+from report_format import ReportCheck, validate_report
+from tools import calc_cagr
+
+
+DEFAULT_MODELS = ("gemini-flash-lite-latest", "gemini-flash-latest")
+
+# Desfecho de cada tentativa (ver CascadeStats)
+RESULTS = ("accepted", "invalid", "error", "cancelled")
+
+# Latências guardadas por modelo para os percentis
+LATENCY_WINDOW = 1000
+
+
+@dataclass(frozen=True)
+class CascadeConfig:
+    """
+    Níveis e modo de disputa da cascata.
+
+    Attributes:
+        models: Modelos do mais barato/rápido ao mais forte
+        race_after_s: None escala só quando a resposta é inválida (sequencial);
+            0 dispara todos os níveis ao mesmo tempo (corrida); > 0 dispara o
+            nível seguinte se não houver resposta válida nesse prazo (hedge)
+        settings: Temperatura e limite de saída usados em todos os níveis
+    """
+    models: tuple[str, ...] = DEFAULT_MODELS
+    race_after_s: float | None = None
+    settings: ModelSettings = field(default_factory=ModelSettings)
+
+    def __post_init__(self):
+        if not self.models:
+            raise ValueError("A cascata precisa de ao menos um modelo.")
+        if self.race_after_s is not None and self.race_after_s < 0:
+            raise ValueError("race_after_s não pode ser negativo.")
+
+    @classmethod
+    def from_env(cls) -> "CascadeConfig":
+        """Lê MODEL_CASCADE (modelos separados por vírgula) e MODEL_CASCADE_RACE_AFTER_S."""
+        models = tuple(m.strip() for m in os.getenv("MODEL_CASCADE", "").split(",") if m.strip())
+        race = os.getenv("MODEL_CASCADE_RACE_AFTER_S", "").strip()
+        return cls(
+            models=models or DEFAULT_MODELS,
+            race_after_s=_env_float("MODEL_CASCADE_RACE_AFTER_S", 0.0) if race else None,
+        )
+
+    def tier_settings(self, model: str) -> ModelSettings:
+        return replace(self.settings, model=model)
+
+
+@dataclass
+class Attempt:
+    """
+    Tentativa de um nível da cascata.
+
+    Attributes:
+        model: Modelo do nível
+        status: 'accepted', 'invalid', 'error' ou 'cancelled' (perdeu a corrida)
+        report: Relatório devolvido (None em erro ou cancelamento)
+        check: Validação do relatório
+        latency_s: Duração da tentativa (até o cancelamento, se cancelada)
+        error: Exceção levantada pelo agente, se houver
+    """
+    model: str
+    status: str
+    report: str | None = None
+    check: ReportCheck | None = None
+    latency_s: float = 0.0
+    error: BaseException | None = None
+
+
+@dataclass
+class CascadeResult:
+    """
+    Resultado de uma execução da cascata.
+
+    Attributes:
+        report: Relatório aceito ou, se nenhum nível passou na validação, o
+            do nível mais forte que respondeu (fora do formato ou, sem
+            nenhum, a mensagem de erro do agente)
+        model: Modelo que produziu o relatório
+        valid: O relatório passou na validação
+        attempts: Tentativas na ordem em que terminaram
+        latency_s: Duração total
+    """
+    report: str
+    model: str
+    valid: bool
+    attempts: list[Attempt] = field(default_factory=list)
+    latency_s: float = 0.0
+
+
+class CascadeStats:
+    """Tentativas por modelo e desfecho, latência por modelo e execuções sem resposta válida."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: dict[str, Counter] = {}
+        self.latencies: dict[str, deque] = {}
+        self.runs = 0
+        self.unresolved = 0
+
+    def record(self, attempt: Attempt) -> None:
+        with self._lock:
+            self.counts.setdefault(attempt.model, Counter())[attempt.status] += 1
+            if attempt.status != "cancelled":
+                self.latencies.setdefault(attempt.model, deque(maxlen=LATENCY_WINDOW)).append(attempt.latency_s)
+
+    def record_run(self, valid: bool) -> None:
+        with self._lock:
+            self.runs += 1
+            self.unresolved += not valid
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """
+        Por modelo: tentativas por desfecho, taxa de acerto (aceitas / concluídas)
+        e p50/p95 da latência das tentativas concluídas.
+        """
+        with self._lock:
+            snapshot = {}
+            for model, counts in self.counts.items():
+                latencies = list(self.latencies.get(model, ()))
+                finished = counts["accepted"] + counts["invalid"] + counts["error"]
+                snapshot[model] = {
+                    "attempts": sum(counts[r] for r in RESULTS),
+                    **{r: counts[r] for r in RESULTS},
+                    "hit_rate": round(counts["accepted"] / finished, 4) if finished else 0.0,
+                    "latency_p50_s": round(_percentile(latencies, 50), 3),
+                    "latency_p95_s": round(_percentile(latencies, 95), 3),
+                }
+            return snapshot
+
+
+cascade_stats = CascadeStats()
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="cascade")
+    return _executor
+
+
+def _expected_cagr(start_rev: float, end_rev: float, months: float) -> float | None:
+    try:
+        return calc_cagr(start_rev, end_rev, months)
+    except ValueError:
+        return None
+
+
+class ModelCascade:
+    """
+    Executa uma análise pelos níveis da cascata até obter um relatório válido.
+
+    Tem a mesma interface de execução do MarketAgent (run/arun devolvem o
+    relatório; stream/astream usam o primeiro nível, sem validação) e pode
+    ser registrado no roteador no lugar dele.
+    """
+
+    def __init__(
+        self,
+        config: CascadeConfig | None = None,
+        agent_factory: Callable[[ModelSettings], Any] = get_market_agent,
+        stats: CascadeStats = cascade_stats,
+    ):
+        """
+        Args:
+            config: Níveis e modo de disputa (padrão: CascadeConfig.from_env())
+            agent_factory: Agente de cada nível a partir do ModelSettings
+                (padrão: get_market_agent, memoizado por modelo)
+            stats: Onde registrar as tentativas
+        """
+        self.config = config or CascadeConfig.from_env()
+        self.agent_factory = agent_factory
+        self.stats = stats
+
+    @property
+    def models(self) -> tuple[str, ...]:
+        return self.config.models
+
+    def agent(self, tier: int = 0):
+        """Agente do nível informado (0 = o mais barato)."""
+        return self.agent_factory(self.config.tier_settings(self.models[tier]))
+
+    # ------------------------------------------------------------------ tentativas
+
+    def _judge(self, model: str, report: str, cagr: float | None, started: float) -> Attempt:
+        latency = time.perf_counter() - started
+        if report.startswith(AGENT_ERROR_PREFIX):
+            return Attempt(model, "error", report=report, latency_s=latency)
+        check = validate_report(report, cagr=cagr)
+        if report.startswith(DEGRADED_PREFIX):
+            # Relatório parcial (orçamento esgotado): formato correto, mas sem a análise do modelo
+            check.valid = False
+            check.problems.append("relatório parcial (orçamento esgotado)")
+        return Attempt(model, "accepted" if check.valid else "invalid", report=report, check=check, latency_s=latency)
+
+    def _attempt(self, tier: int, args: tuple, kwargs: dict, cagr: float | None) -> Attempt:
+        model = self.models[tier]
+        started = time.perf_counter()
+        try:
+            report = self.agent(tier).run(*args, **kwargs)
+        except Exception as e:  # noqa: E722
+            return Attempt(model, "error", latency_s=time.perf_counter() - started, error=e)
+        return self._judge(model, report, cagr, started)
+
+    async def _aattempt(self, tier: int, args: tuple, kwargs: dict, cagr: float | None) -> Attempt:
+        model = self.models[tier]
+        started = time.perf_counter()
+        try:
+            report = await self.agent(tier).arun(*args, **kwargs)
+        except Exception as e:  # noqa: E722
+            return Attempt(model, "error", latency_s=time.perf_counter() - started, error=e)
+        return self._judge(model, report, cagr, started)
+
+    def _hedge_timeout(self, launched: int) -> float | None:
+        # Prazo para disparar o próximo nível; None = só escala após uma resposta inválida
+        if self.config.race_after_s is None or launched >= len(self.models):
+            return None
+        return self.config.race_after_s
+
+    def _log(self, attempt: Attempt, launched: int) -> None:
+        if attempt.status == "accepted":
+            return
+        if attempt.check is not None:
+            reason = "; ".join(attempt.check.problems)
+        else:
+            reason = str(attempt.error) if attempt.error is not None else attempt.report
+        following = f": escalando para {self.models[launched]}" if launched < len(self.models) else ""
+        print(f"⤴️  Cascata: {attempt.model} {'inválido' if attempt.status == 'invalid' else 'falhou'} ({reason}){following}\n")
+
+    def _finish(self, attempts: list[Attempt], started: float) -> CascadeResult:
+        for attempt in attempts:
+            self.stats.record(attempt)
+        accepted = next((a for a in attempts if a.status == "accepted"), None)
+        # Relatórios fora do formato têm preferência sobre mensagens de erro do agente
+        answered = [a for a in attempts if a.status == "invalid"] or [a for a in attempts if a.report is not None]
+        self.stats.record_run(accepted is not None)
+        latency = time.perf_counter() - started
+        if accepted is not None:
+            return CascadeResult(accepted.report, accepted.model, True, attempts, latency)
+        if answered:
+            # Nenhum nível passou na validação: devolve a resposta do nível mais forte que respondeu
+            best = max(answered, key=lambda a: self.models.index(a.model))
+            return CascadeResult(best.report, best.model, False, attempts, latency)
+        raise next(a.error for a in reversed(attempts) if a.error is not None)
+
+    # ------------------------------------------------------------------ execução
+
+    def run_cascade(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, use_cache: bool = True,
+        budget: RunBudget | None = None,
+    ) -> CascadeResult:
+        """
+        Executa a análise pelos níveis da cascata (ver MarketAgent.run).
+
+        Raises:
+            Exception: A do último nível, se todos levantaram exceção
+        """
+        args = (topic, start_rev, end_rev, months)
+        kwargs = {"mode": mode, "callbacks": callbacks, "use_cache": use_cache, "budget": budget}
+        cagr = _expected_cagr(start_rev, end_rev, months)
+        started = time.perf_counter()
+        attempts: list[Attempt] = []
+
+        if self.config.race_after_s is None:
+            for tier in range(len(self.models)):
+                attempt = self._attempt(tier, args, kwargs, cagr)
+                attempts.append(attempt)
+                self._log(attempt, tier + 1)
+                if attempt.status == "accepted":
+                    break
+            return self._finish(attempts, started)
+
+        # Corrida/hedge: cada nível em uma thread (com o contexto do chamador)
+        executor = _get_executor()
+        pending: dict[Future, tuple[int, float]] = {}
+        launched = 0
+        while True:
+            timeout = self._hedge_timeout(launched)
+            if not pending or timeout == 0:
+                if launched >= len(self.models):
+                    break
+                future = executor.submit(contextvars.copy_context().run, self._attempt, launched, args, kwargs, cagr)
+                pending[future] = (launched, time.perf_counter())
+                launched += 1
+                continue
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                future = executor.submit(contextvars.copy_context().run, self._attempt, launched, args, kwargs, cagr)
+                pending[future] = (launched, time.perf_counter())
+                launched += 1
+                continue
+            finished = sorted((f.result() for f in done), key=lambda a: self.models.index(a.model))
+            for future in done:
+                pending.pop(future)
+            attempts.extend(finished)
+            if any(a.status == "accepted" for a in finished):
+                break
+            for attempt in finished:
+                self._log(attempt, launched)
+
+        # Perdedores da corrida: threads já em execução não são interrompidas; o resultado é ignorado
+        now = time.perf_counter()
+        for future, (tier, launched_at) in pending.items():
+            future.cancel()
+            attempts.append(Attempt(self.models[tier], "cancelled", latency_s=now - launched_at))
+        return self._finish(attempts, started)
+
+    async def arun_cascade(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, use_cache: bool = True,
+        budget: RunBudget | None = None,
+    ) -> CascadeResult:
+        """Versão assíncrona de run_cascade; os níveis perdedores são cancelados."""
+        args = (topic, start_rev, end_rev, months)
+        kwargs = {"mode": mode, "callbacks": callbacks, "use_cache": use_cache, "budget": budget}
+        cagr = _expected_cagr(start_rev, end_rev, months)
+        started = time.perf_counter()
+        attempts: list[Attempt] = []
+        pending: dict[asyncio.Task, tuple[int, float]] = {}
+        launched = 0
+        try:
+            while True:
+                timeout = self._hedge_timeout(launched)
+                if not pending or timeout == 0:
+                    if launched >= len(self.models):
+                        break
+                    task = asyncio.ensure_future(self._aattempt(launched, args, kwargs, cagr))
+                    pending[task] = (launched, time.perf_counter())
+                    launched += 1
+                    continue
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    task = asyncio.ensure_future(self._aattempt(launched, args, kwargs, cagr))
+                    pending[task] = (launched, time.perf_counter())
+                    launched += 1
+                    continue
+                finished = sorted((t.result() for t in done), key=lambda a: self.models.index(a.model))
+                for task in done:
+                    pending.pop(task)
+                attempts.extend(finished)
+                if any(a.status == "accepted" for a in finished):
+                    break
+                for attempt in finished:
+                    self._log(attempt, launched)
+        finally:
+            now = time.perf_counter()
+            for task, (tier, launched_at) in pending.items():
+                task.cancel()
+                attempts.append(Attempt(self.models[tier], "cancelled", latency_s=now - launched_at))
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        return self._finish(attempts, started)
+
+    def run(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, use_cache: bool = True,
+        budget: RunBudget | None = None,
+    ) -> str:
+        """Executa a análise pela cascata e devolve o relatório (ver run_cascade)."""
+        return self.run_cascade(
+            topic, start_rev, end_rev, months, mode=mode, callbacks=callbacks, use_cache=use_cache, budget=budget
+        ).report
+
+    async def arun(
+        self, topic: str, start_rev: float, end_rev: float, months: float,
+        mode: str | None = None, callbacks: list | None = None, use_cache: bool = True,
+        budget: RunBudget | None = None,
+    ) -> str:
+        """Versão assíncrona de run."""
+        result = await self.arun_cascade(
+            topic, start_rev, end_rev, months, mode=mode, callbacks=callbacks, use_cache=use_cache, budget=budget
+        )
+        return result.report
+
+    def stream(self, *args, **kwargs):
+        """Streaming pelo primeiro nível (tokens já emitidos não podem ser validados e refeitos)."""
+        return self.agent(0).stream(*args, **kwargs)
+
+    def astream(self, *args, **kwargs):
+        """Versão assíncrona de stream (primeiro nível)."""
+        return self.agent(0).astream(*args, **kwargs)
+
+
+_default_cascade: ModelCascade | None = None
+_default_cascade_lock = threading.Lock()
+
+
+def get_model_cascade() -> ModelCascade | None:
+    """
+    Retorna a cascata de modelos do processo (criada sob demanda a partir do ambiente).
+
+    A cascata é opcional: retorna None, a menos que MODEL_CASCADE esteja
+    definido (ou uma cascata tenha sido definida com set_model_cascade).
+    """
+    global _default_cascade
+    if _default_cascade is not None:
+        return _default_cascade
+    if not os.getenv("MODEL_CASCADE", "").strip():
+        return None
+    with _default_cascade_lock:
+        if _default_cascade is None:
+            _default_cascade = ModelCascade(CascadeConfig.from_env())
+    return _default_cascade
+
+
+def set_model_cascade(cascade: ModelCascade | None) -> None:
+    """Substitui a cascata de modelos do processo (ex.: --cascade na linha de comando, testes)."""
+    global _default_cascade
+    with _default_cascade_lock:
+        _default_cascade = cascade
@@ -0,0 +1,208 @@
+"""
+Compactação de resultados de busca antes de enviá-los ao LLM.
+
+Remove campos vazios, corta snippets a um orçamento de tokens por fonte,
+descarta quase-duplicados e serializa em JSON compacto, respeitando um
+orçamento total de tokens.
+"""
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from search_results import dumps, to_pretty_json
+from tools import canonical_url
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa rápida de tokens (~4 caracteres por token).
+
+    Não depende de tokenizer; serve para orçamento e comparação relativa.
+    """
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Variável {name} deve ser inteira (recebido: {value!r})")
+
+
+@dataclass(frozen=True)
+class CompactionConfig:
+    """
+    Attributes:
+        source_tokens: Orçamento de tokens por fonte (título + snippet)
+        total_tokens: Orçamento total do payload serializado
+        near_duplicate: Similaridade (Jaccard de palavras) a partir da qual
+            um resultado é considerado quase-duplicado
+        enabled: False devolve o JSON original (indent=2), sem compactar
+    """
+    source_tokens: int = 80
+    total_tokens: int = 600
+    near_duplicate: float = 0.8
+    enabled: bool = True
+
+    @classmethod
+    def from_env(cls) -> "CompactionConfig":
+        """Lê SEARCH_COMPACT_SOURCE_TOKENS, SEARCH_COMPACT_TOTAL_TOKENS e SEARCH_COMPACT_DISABLED."""
+        return cls(
+            source_tokens=_env_int("SEARCH_COMPACT_SOURCE_TOKENS", cls.source_tokens),
+            total_tokens=_env_int("SEARCH_COMPACT_TOTAL_TOKENS", cls.total_tokens),
+            enabled=os.getenv("SEARCH_COMPACT_DISABLED", "").lower() not in ("1", "true", "yes"),
+        )
+
+
+@dataclass
+class CompactionResult:
+    """Payload compactado e economia obtida."""
+    payload: str
+    results: list[dict[str, Any]]
+    original_tokens: int
+    compact_tokens: int
+    dropped: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.compact_tokens
+
+
+class CompactionStats:
+    """Totais acumulados de compactação no processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.original_tokens = 0
+        self.compact_tokens = 0
+        self.dropped = 0
+
+    def record(self, result: CompactionResult) -> None:
+        with self._lock:
+            self.calls += 1
+            self.original_tokens += result.original_tokens
+            self.compact_tokens += result.compact_tokens
+            self.dropped += result.dropped
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "original_tokens": self.original_tokens,
+                "compact_tokens": self.compact_tokens,
+                "saved_tokens": self.original_tokens - self.compact_tokens,
+                "dropped": self.dropped,
+            }
+
+
+compaction_stats = CompactionStats()
+
+
+def trim_to_tokens(text: str, max_tokens: int, count: Callable[[str], int] = estimate_tokens) -> str:
+    """
+    Corta o texto no limite de palavra mais próximo do orçamento, terminando com '…'.
+
+    O corte é medido com `count` (busca binária no número de palavras), de modo
+    que um contador injetado (ex.: tokenizador real) define onde o texto para.
+    """
+    text = " ".join(text.split())
+    if count(text) <= max_tokens:
+        return text
+    words = text.split(" ")
+
+    def cut(n: int) -> str:
+        return " ".join(words[:n]).rstrip(" ,.;:") + "…"
+
+    low, high = 0, len(words) - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count(cut(mid)) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return cut(low)
+
+
+def _words(item: dict[str, Any]) -> set[str]:
+    return set(_WORD_RE.findall(f"{item.get('title', '')} {item.get('snippet', '')}".lower()))
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def compact_results(
+    results: list[dict[str, Any]],
+    config: CompactionConfig | None = None,
+    count: Callable[[str], int] = estimate_tokens,
+) -> CompactionResult:
+    """
+    Compacta resultados do web_search para uso em prompts.
+
+    Args:
+        results: Lista de {title, link, snippet, date}
+        config: Orçamentos e limiar de quase-duplicados (padrão: CompactionConfig.from_env())
+        count: Função de contagem de tokens (padrão: estimate_tokens)
+
+    Returns:
+        CompactionResult com o JSON compacto e os tokens antes/depois
+    """
+    config = config or CompactionConfig.from_env()
+    # Lotes do web_search (search_results.py) reaproveitam a serialização já feita
+    original = to_pretty_json(results)
+    original_tokens = count(original)
+    if not config.enabled:
+        return CompactionResult(original, list(results), original_tokens, original_tokens, 0)
+
+    kept: list[dict[str, Any]] = []
+    kept_words: list[set[str]] = []
+    seen_urls: set[str] = set()
+    dropped = 0
+    used = 2  # colchetes da lista
+    for item in results:
+        link = item.get("link") or ""
+        url_key = canonical_url(link) if link else ""
+        words = _words(item)
+        if (url_key and url_key in seen_urls) or any(
+            _jaccard(words, other) >= config.near_duplicate for other in kept_words
+        ):
+            dropped += 1
+            continue
+
+        title = " ".join(str(item.get("title") or "").split())
+        compact: dict[str, Any] = {"title": title}
+        if link:
+            compact["link"] = link
+        if item.get("date"):
+            compact["date"] = item["date"]
+        snippet_budget = config.source_tokens - count(title)
+        snippet = item.get("snippet") or ""
+        if snippet and snippet_budget > 0:
+            compact["snippet"] = trim_to_tokens(snippet, snippet_budget, count)
+
+        cost = count(dumps(compact)) + 1
+        if used + cost > config.total_tokens and kept:
+            dropped += 1
+            continue
+        used += cost
+        kept.append(compact)
+        kept_words.append(words)
+        if url_key:
+            seen_urls.add(url_key)
+
+    payload = dumps(kept)
+    result = CompactionResult(payload, kept, original_tokens, count(payload), dropped)
+    compaction_stats.record(result)
+    return result
@@ -0,0 +1,214 @@
+"""
+Cache de contexto do Gemini para os prefixos estáticos dos prompts.
+
+Os prompts do agente e do pipeline começam com instruções estáticas (mesmo
+texto em toda requisição) e terminam com a parte variável (tema, parâmetros,
+resultados). Assim o Gemini reaproveita o prefixo pelo cache implícito, e os
+tokens lidos do cache aparecem em usage_metadata
+(input_token_details.cache_read, ver metrics.py).
+
+Com GEMINI_CONTEXT_CACHE=1, as instruções do pipeline são também registradas
+como CachedContent explícito (desconto garantido enquanto durar o TTL), e as
+requisições passam a enviar apenas a parte variável. O Gemini só aceita
+conteúdos acima de um mínimo de tokens (GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+1024 nos modelos Flash); abaixo dele, ou se a criação falhar, vale o prompt
+completo. As instruções atuais do pipeline (~85 e ~120 tokens) ficam abaixo
+do mínimo: o cache explícito só passa a valer se elas crescerem (ex.:
+exemplos few-shot), e um aviso é exibido uma vez por prefixo. O grafo do
+create_agent não usa o cache explícito: o Gemini não aceita ferramentas na
+requisição junto com um CachedContent.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from cache import _env_float
+from compaction import estimate_tokens
+
+
+# Renova o CachedContent um pouco antes de expirar
+_EXPIRY_MARGIN_S = 60.0
+
+Creator = Callable[[str, str, str, float], str]
+
+
+@dataclass(frozen=True)
+class ContextCacheConfig:
+    """
+    Attributes:
+        enabled: Registra os prefixos estáticos como CachedContent explícito
+        ttl_s: Validade de cada CachedContent (segundos)
+        min_tokens: Tamanho mínimo (tokens estimados) para tentar o cache explícito
+    """
+    enabled: bool = False
+    ttl_s: float = 3600.0
+    min_tokens: int = 1024
+
+    @classmethod
+    def from_env(cls) -> "ContextCacheConfig":
+        """Lê GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL e GEMINI_CONTEXT_CACHE_MIN_TOKENS."""
+        return cls(
+            enabled=os.getenv("GEMINI_CONTEXT_CACHE", "").lower() in ("1", "true", "yes"),
+            ttl_s=_env_float("GEMINI_CONTEXT_CACHE_TTL", cls.ttl_s),
+            min_tokens=int(_env_float("GEMINI_CONTEXT_CACHE_MIN_TOKENS", cls.min_tokens)),
+        )
+
+
+def _model_name(model: str) -> str:
+    return model if model.startswith("models/") else f"models/{model}"
+
+
+def create_cached_content(api_key: str, model: str, text: str, ttl_s: float) -> str:
+    """
+    Cria um CachedContent com `text` como system instruction e devolve o nome.
+
+    Usa o cliente google.ai.generativelanguage (instalado com langchain-google-genai).
+    """
+    from google.ai.generativelanguage_v1beta import CacheServiceClient
+    from google.ai.generativelanguage_v1beta.types import CachedContent, Content, Part
+    from google.protobuf import duration_pb2
+
+    client = CacheServiceClient(client_options={"api_key": api_key})
+    cached = client.create_cached_content(cached_content=CachedContent(
+        model=_model_name(model),
+        system_instruction=Content(parts=[Part(text=text)]),
+        ttl=duration_pb2.Duration(seconds=int(ttl_s)),
+    ))
+    return cached.name
+
+
+class GeminiContextCache:
+    """
+    Nomes de CachedContent por (modelo, prefixo), criados sob demanda e
+    renovados ao expirar. Falhas de criação (ex.: modelo sem suporte) são
+    lembradas até o fim do TTL, para não repetir a chamada a cada requisição.
+    """
+
+    def __init__(self, config: ContextCacheConfig | None = None, create: Creator = create_cached_content):
+        self.config = config or ContextCacheConfig.from_env()
+        self._create = create
+        self._entries: dict[tuple[str, str], tuple[str | None, float]] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.failures = 0
+        self._too_small: set[tuple[str, str]] = set()
+
+    def _key(self, model: str, text: str) -> tuple[str, str]:
+        return _model_name(model), hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def lookup(self, model: str, text: str) -> tuple[bool, str | None]:
+        """(True, nome ou None) se já há decisão válida para o prefixo; (False, None) se é preciso criar."""
+        tokens = estimate_tokens(text)
+        if tokens < self.config.min_tokens:
+            self._warn_too_small(model, text, tokens)
+            return True, None
+        with self._lock:
+            entry = self._entries.get(self._key(model, text))
+        if entry is not None and entry[1] > time.monotonic():
+            return True, entry[0]
+        return False, None
+
+    def _warn_too_small(self, model: str, text: str, tokens: int) -> None:
+        key = self._key(model, text)
+        with self._lock:
+            if key in self._too_small:
+                return
+            self._too_small.add(key)
+        print(f"⚠️  Prefixo estático com ~{tokens} tokens, abaixo do mínimo do cache de contexto "
+              f"({self.config.min_tokens}); usando o prompt completo")
+
+    def name_for(self, model: str, text: str, api_key: str) -> str | None:
+        """Nome do CachedContent do prefixo (criado se necessário) ou None."""
+        known, name = self.lookup(model, text)
+        if known:
+            return name
+        key = self._key(model, text)
+        with self._lock:
+            # Outra thread pode ter criado enquanto esperávamos o lock
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            expires = time.monotonic() + max(0.0, self.config.ttl_s - _EXPIRY_MARGIN_S)
+            try:
+                name = self._create(api_key, model, text, self.config.ttl_s)
+                self.created += 1
+            except Exception as e:  # noqa: E722
+                print(f"⚠️  Cache de contexto do Gemini indisponível ({type(e).__name__}: {str(e)[:120]}); "
+                      "usando o prompt completo")
+                name = None
+                self.failures += 1
+            self._entries[key] = (name, expires)
+            return name
+
+
+_default_cache: GeminiContextCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> GeminiContextCache | None:
+    """
+    Retorna o cache de contexto do processo, ou None se GEMINI_CONTEXT_CACHE
+    não estiver ativado.
+    """
+    global _default_cache
+    config = ContextCacheConfig.from_env()
+    if not config.enabled:
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = GeminiContextCache(config)
+    return _default_cache
+
+
+def set_context_cache(cache: GeminiContextCache | None) -> None:
+    """Substitui o cache de contexto do processo (útil em testes)."""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
+
+
+def _gemini_target(llm) -> tuple[str, str] | None:
+    # Apenas modelos Gemini (ChatGoogleGenerativeAI) têm modelo e chave próprios
+    model = getattr(llm, "model", None)
+    api_key = getattr(llm, "google_api_key", None)
+    if not isinstance(model, str) or api_key is None:
+        return None
+    secret = api_key.get_secret_value() if hasattr(api_key, "get_secret_value") else str(api_key)
+    return model, secret
+
+
+def cached_content_for(llm, text: str) -> str | None:
+    """Nome do CachedContent para o prefixo `text` no modelo do llm, ou None."""
+    cache = get_context_cache()
+    target = _gemini_target(llm) if cache is not None else None
+    if target is None:
+        return None
+    return cache.name_for(target[0], text, target[1])
+
+
+async def acached_content_for(llm, text: str) -> str | None:
+    """Versão assíncrona de cached_content_for (a criação roda em uma thread)."""
+    cache = get_context_cache()
+    target = _gemini_target(llm) if cache is not None else None
+    if target is None:
+        return None
+    known, name = cache.lookup(target[0], text)
+    if known:
+        return name
+    return await asyncio.to_thread(cache.name_for, target[0], text, target[1])
+
+
+def prompt_parts(instructions: str, variable: str, cached_content: str | None) -> tuple[str, dict[str, Any]]:
+    """
+    Prompt e kwargs da chamada ao LLM: com um CachedContent para as instruções,
+    envia apenas a parte variável; caso contrário, o prompt completo (prefixo
+    estático primeiro).
+    """
+    if cached_content is None:
+        return f"{instructions}\n\n{variable}", {}
+    return variable, {"cached_content": cached_content}
@@ -0,0 +1,295 @@
+"""
+Sessão HTTP compartilhada (keep-alive) com retry e backoff exponencial.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Callable, ContextManager
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Status HTTP transitórios que justificam nova tentativa
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+def _env_number(name: str, default: float, cast: Callable[[str], Any] = float) -> Any:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"Variável {name} deve ser numérica (recebido: {value!r})")
+
+
+@dataclass(frozen=True)
+class RetryConfig:
+    """
+    Parâmetros de retry/backoff e do pool de conexões.
+
+    Attributes:
+        max_retries: Número máximo de novas tentativas (além da primeira)
+        backoff_base: Atraso base em segundos (dobra a cada tentativa)
+        backoff_max: Teto do atraso entre tentativas, inclusive para Retry-After
+        timeout: Timeout por requisição em segundos
+        pool_size: Conexões mantidas por host no pool
+        retry_status: Status HTTP considerados transitórios
+    """
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    timeout: float = 20.0
+    pool_size: int = 10
+    retry_status: frozenset[int] = field(default=RETRYABLE_STATUS)
+
+    @classmethod
+    def from_env(cls) -> "RetryConfig":
+        """
+        Lê HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX, HTTP_TIMEOUT e HTTP_POOL_SIZE.
+        """
+        return cls(
+            max_retries=_env_number("HTTP_MAX_RETRIES", cls.max_retries, int),
+            backoff_base=_env_number("HTTP_BACKOFF_BASE", cls.backoff_base),
+            backoff_max=_env_number("HTTP_BACKOFF_MAX", cls.backoff_max),
+            timeout=_env_number("HTTP_TIMEOUT", cls.timeout),
+            pool_size=_env_number("HTTP_POOL_SIZE", cls.pool_size, int),
+        )
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos de espera.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, config: RetryConfig, retry_after: float | None = None) -> float:
+    """
+    Calcula o atraso antes da tentativa seguinte.
+
+    Usa Retry-After quando informado pelo servidor; caso contrário, backoff
+    exponencial com "full jitter" (uniforme entre 0 e base * 2**attempt).
+    """
+    if retry_after is not None:
+        return min(retry_after, config.backoff_max)
+    ceiling = min(config.backoff_max, config.backoff_base * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+_sessions: dict[RetryConfig, requests.Session] = {}
+_default_config: RetryConfig | None = None
+_session_lock = threading.Lock()
+
+
+def _new_session(config: RetryConfig) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=config.pool_size,
+        pool_maxsize=config.pool_size,
+        max_retries=0,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(config: RetryConfig | None = None) -> requests.Session:
+    """
+    Retorna a sessão HTTP compartilhada para a configuração, criando-a sob demanda.
+
+    Há uma sessão (pool de conexões) por RetryConfig; sem config, usa a
+    configuração padrão do processo (RetryConfig.from_env(), lida uma vez).
+    O retry é feito em request_with_retry (para respeitar Retry-After com
+    jitter), então o adaptador é montado sem retries próprios.
+    """
+    cfg = config or get_retry_config()
+    session = _sessions.get(cfg)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(cfg)
+            if session is None:
+                session = _sessions[cfg] = _new_session(cfg)
+    return session
+
+
+def get_retry_config() -> RetryConfig:
+    """Retorna a configuração padrão da sessão compartilhada (lida do ambiente na primeira chamada)."""
+    global _default_config
+    if _default_config is None:
+        with _session_lock:
+            if _default_config is None:
+                _default_config = RetryConfig.from_env()
+    return _default_config
+
+
+def reset_session() -> None:
+    """Fecha e descarta as sessões compartilhadas (a próxima chamada cria outras)."""
+    global _default_config
+    with _session_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _default_config = None
+
+
+def request_with_retry(
+    method: str,
+    url: str,
+    *,
+    session: requests.Session | None = None,
+    config: RetryConfig | None = None,
+    sleep: Callable[[float], None] = time.sleep,
+    guard: Callable[[], ContextManager] | None = None,
+    **kwargs: Any,
+) -> requests.Response:
+    """
+    Executa uma requisição com retry em status transitórios e erros de conexão.
+
+    Args:
+        method: Método HTTP (ex.: 'GET')
+        url: URL de destino
+        session: Sessão a usar; padrão é a sessão compartilhada
+        config: Parâmetros de retry; padrão é a configuração da sessão compartilhada
+        sleep: Função de espera (injetável em testes)
+        guard: Fábrica de context manager aplicado a cada tentativa (ex.:
+            providers.provider_attempt); o backoff acontece fora dele
+        **kwargs: Repassados para session.request (params, headers...)
+
+    Returns:
+        A última resposta obtida (o chamador decide se chama raise_for_status)
+
+    Raises:
+        requests.ConnectionError / requests.Timeout: se todas as tentativas falharem por rede
+    """
+    if session is None:
+        config = config or get_retry_config()
+        session = get_session(config)
+    config = config or RetryConfig.from_env()
+    kwargs.setdefault("timeout", config.timeout)
+
+    guard = guard or nullcontext
+    attempt = 0
+    while True:
+        try:
+            with guard():
+                resp = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= config.max_retries:
+                raise
+            sleep(backoff_delay(attempt, config))
+            attempt += 1
+            continue
+
+        if resp.status_code not in config.retry_status or attempt >= config.max_retries:
+            return resp
+
+        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        resp.close()
+        sleep(backoff_delay(attempt, config, retry_after))
+        attempt += 1
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[RetryConfig, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client(config: RetryConfig | None = None) -> httpx.AsyncClient:
+    """
+    Retorna o cliente httpx assíncrono do event loop corrente para a configuração.
+
+    Conexões do httpx ficam presas ao loop em que foram abertas, por isso o
+    pool é compartilhado apenas entre corrotinas do mesmo loop (um cliente
+    por loop e RetryConfig).
+    """
+    cfg = config or get_retry_config()
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(cfg)
+    if client is None or client.is_closed:
+        client = clients[cfg] = httpx.AsyncClient(
+            timeout=cfg.timeout,
+            limits=httpx.Limits(
+                max_connections=cfg.pool_size,
+                max_keepalive_connections=cfg.pool_size,
+            ),
+        )
+    return client
+
+
+async def aclose_async_client() -> None:
+    """Fecha os clientes assíncronos do event loop corrente, se existirem."""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def _anullcontext() -> AsyncContextManager:
+    return nullcontext()
+
+
+async def arequest_with_retry(
+    method: str,
+    url: str,
+    *,
+    client: httpx.AsyncClient | None = None,
+    config: RetryConfig | None = None,
+    sleep: Callable[[float], Any] = asyncio.sleep,
+    guard: Callable[[], AsyncContextManager] | None = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """
+    Versão assíncrona de request_with_retry, usando httpx.
+
+    Mesma política de retry: status transitórios e erros de transporte são
+    repetidos com backoff exponencial com jitter, respeitando Retry-After.
+    guard é uma fábrica de async context manager aplicado a cada tentativa
+    (ex.: providers.aprovider_attempt).
+
+    Raises:
+        httpx.TransportError: se todas as tentativas falharem por rede
+    """
+    if client is None:
+        config = config or get_retry_config()
+        client = get_async_client(config)
+    config = config or RetryConfig.from_env()
+
+    guard = guard or _anullcontext
+    attempt = 0
+    while True:
+        try:
+            async with guard():
+                resp = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt >= config.max_retries:
+                raise
+            await sleep(backoff_delay(attempt, config))
+            attempt += 1
+            continue
+
+        if resp.status_code not in config.retry_status or attempt >= config.max_retries:
+            return resp
+
+        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        await resp.aclose()
+        await sleep(backoff_delay(attempt, config, retry_after))
+        attempt += 1
@@ -1,53 +1,283 @@
 """
 Ponto de entrada do sistema de agente de análise de mercado.
 """
+import argparse
 import sys
-from router import pick_domain
-from agent_market import run_market_agent
+from router import registry
 
+# agent_market (LangChain/Gemini) é importado apenas quando uma análise é executada,
+# para que --help e erros de argumentos respondam sem carregar as dependências pesadas
 
-def main():
+
+def _positive_int(value):
+    """Tipo argparse para contagens que precisam ser ≥ 1 (ex.: --workers)."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"inteiro inválido: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"deve ser maior ou igual a 1 (recebido: {number})")
+    return number
+
+
+def parse_args(argv=None):
+    """Lê os argumentos de linha de comando."""
+    parser = argparse.ArgumentParser(description="Agente de Análise de Mercado")
+    parser.add_argument(
+        "--batch", metavar="ARQUIVO",
+        help="CSV/JSONL com topic, start_rev, end_rev e months (um tema por linha)"
+    )
+    parser.add_argument(
+        "--output", default="reports.jsonl",
+        help="JSONL de saída do modo batch (padrão: reports.jsonl)"
+    )
+    parser.add_argument(
+        "--mode", choices=("agent", "pipeline"),
+        help="agent: loop de ferramentas do LangChain; pipeline: fluxo fixo com 2 chamadas ao LLM "
+             "(padrão: MARKET_AGENT_MODE ou agent)"
+    )
+    parser.add_argument(
+        "--topic", default="Blockchain em Logística",
+        help="Tema da análise (padrão: Blockchain em Logística)"
+    )
+    parser.add_argument(
+        "--domain", choices=registry.names,
+        help="Força o domínio de análise (padrão: escolhido pelo roteador a partir do tema)"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Exibe o relatório à medida que é gerado (tokens em tempo real)"
+    )
+    parser.add_argument(
+        "--serve", action="store_true",
+        help="Inicia o serviço HTTP de relatórios (POST /reports, POST /reports/stream)"
+    )
+    parser.add_argument("--host", help="Endereço do serviço HTTP (padrão: SERVICE_HOST ou 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="Porta do serviço HTTP (padrão: SERVICE_PORT ou 8080)")
+    parser.add_argument(
+        "--max-queue", type=int,
+        help="Execuções aguardando um worker no serviço HTTP antes de responder 503 (padrão: SERVICE_MAX_QUEUE ou 16)"
+    )
+    parser.add_argument(
+        "--workers", type=_positive_int,
+        help="Análises simultâneas no modo batch (padrão: 4) ou agentes aquecidos no serviço (padrão: SERVICE_WORKERS ou 4)"
+    )
+    parser.add_argument("--serpapi-concurrency", type=int, help="Máximo de buscas SerpAPI simultâneas")
+    parser.add_argument("--gemini-concurrency", type=int, help="Máximo de chamadas Gemini simultâneas")
+    parser.add_argument(
+        "--cascade", metavar="MODELOS",
+        help="Cascata de modelos separados por vírgula, do mais barato ao mais forte: escala só se o "
+             "relatório não tiver o formato exigido (padrão: MODEL_CASCADE; vazio = desativada)"
+    )
+    parser.add_argument(
+        "--race-after", type=float, metavar="S",
+        help="Com --cascade, dispara o próximo modelo se não houver relatório válido em S segundos "
+             "(0 = todos ao mesmo tempo; padrão: MODEL_CASCADE_RACE_AFTER_S ou só após resposta inválida)"
+    )
+    parser.add_argument(
+        "--metrics", metavar="ARQUIVO",
+        help="Grava latência e tokens por etapa (JSONL; use extensão .prom para o formato Prometheus)"
+    )
+    return parser.parse_args(argv)
+
+
+def print_metrics(collector, path):
+    """Exibe p50/p95 por etapa e grava as métricas em arquivo."""
+    from metrics import write_metrics
+
+    print("\n" + "="*80)
+    print(">>> MÉTRICAS POR ETAPA:")
+    print("="*80)
+    for key, stage in collector.summary().items():
+        tokens = stage["prompt_tokens"] + stage["completion_tokens"]
+        print(
+            f"{key:<32} n={stage['count']:<4} p50 {stage['p50_s']:.2f}s | p95 {stage['p95_s']:.2f}s | "
+            f"total {stage['total_s']:.2f}s | tokens {tokens} (cache {stage['cached_tokens']}) | "
+            f"erros {stage['errors']}"
+        )
+    write_metrics(collector, path)
+    print(f"Métricas gravadas em: {path}")
+    print("="*80 + "\n")
+
+
+def main_batch(args):
+    """
+    Executa o modo batch: vários temas concorrentes, relatórios gravados em JSONL.
+    """
+    from batch import run_batch_file
+
+    print(f"🚀 Iniciando Agente de Análise de Mercado (batch: {args.batch})\n")
+    collector = _metrics_collector(args)
+    try:
+        stats = run_batch_file(
+            args.batch,
+            args.output,
+            workers=4 if args.workers is None else args.workers,
+            serpapi_concurrency=args.serpapi_concurrency,
+            gemini_concurrency=args.gemini_concurrency,
+            mode=args.mode,
+            callbacks=[collector] if collector else None,
+        )
+    except (OSError, ValueError) as e:
+        print(f"\n❌ Erro no arquivo de entrada: {e}")
+        sys.exit(1)
+
+    summary = stats.summary()
+    print("\n" + "="*80)
+    print(">>> RESUMO DO BATCH:")
+    print("="*80)
+    print(f"Temas: {summary['total']} ({summary['succeeded']} ok, {summary['failed']} com erro)")
+    print(f"Tempo total: {summary['wall_time_s']:.2f}s | Vazão: {summary['throughput_per_min']:.2f} temas/min")
+    print(
+        f"Latência: média {summary['latency_mean_s']:.2f}s | p50 {summary['latency_p50_s']:.2f}s | "
+        f"p95 {summary['latency_p95_s']:.2f}s | máx {summary['latency_max_s']:.2f}s"
+    )
+    print(f"Relatórios gravados em: {args.output}")
+    print("="*80 + "\n")
+    print_cascade_stats()
+    if collector:
+        print_metrics(collector, args.metrics)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def main_serve(args):
+    """
+    Executa o serviço HTTP de relatórios com um pool de agentes aquecidos.
+    """
+    from dataclasses import replace
+    from service import ServiceConfig, serve
+
+    overrides = {"host": args.host, "port": args.port, "workers": args.workers, "max_queue": args.max_queue}
+    try:
+        config = replace(ServiceConfig.from_env(), **{k: v for k, v in overrides.items() if v is not None})
+        serve(config)
+    except ValueError as e:
+        print(f"\n❌ Erro de Configuração: {e}")
+        sys.exit(1)
+
+
+def configure_cascade(args):
+    """Ativa a cascata de modelos pedida em --cascade/--race-after (ver cascade.py)."""
+    if not args.cascade:
+        return
+    from cascade import CascadeConfig, ModelCascade, set_model_cascade
+
+    env = CascadeConfig.from_env()
+    models = tuple(m.strip() for m in args.cascade.split(",") if m.strip())
+    race_after = args.race_after if args.race_after is not None else env.race_after_s
+    set_model_cascade(ModelCascade(CascadeConfig(models=models, race_after_s=race_after)))
+
+
+def print_cascade_stats():
+    """Exibe a taxa de acerto e a latência por modelo da cascata, se ela foi usada."""
+    from cascade import cascade_stats
+
+    snapshot = cascade_stats.snapshot()
+    if not snapshot:
+        return
+    print("\n" + "="*80)
+    print(">>> CASCATA DE MODELOS:")
+    print("="*80)
+    for model, stats in snapshot.items():
+        print(
+            f"{model:<32} tentativas {stats['attempts']:<4} aceitas {stats['accepted']} | "
+            f"inválidas {stats['invalid']} | erros {stats['error']} | canceladas {stats['cancelled']} | "
+            f"acerto {stats['hit_rate']:.0%} | p50 {stats['latency_p50_s']:.2f}s | p95 {stats['latency_p95_s']:.2f}s"
+        )
+    print("="*80 + "\n")
+
+
+def _metrics_collector(args):
+    if not args.metrics:
+        return None
+    from metrics import MetricsCollector
+    return MetricsCollector()
+
+
+def stream_report(agent, topic, start_rev, end_rev, months, mode=None, callbacks=None):
+    """
+    Executa o agente do domínio em modo streaming, exibindo os tokens assim que chegam.
+    
+    Returns:
+        Relatório final completo
+    """
+    report = ""
+    streaming = False
+    for event in agent.stream(topic, start_rev, end_rev, months, mode=mode, callbacks=callbacks):
+        if event["type"] == "token":
+            if not streaming:
+                print("\n📝 Gerando relatório:\n")
+                streaming = True
+            print(event["text"], end="", flush=True)
+        elif event["type"] == "tool_start":
+            # Novo passo do agente: o texto anterior era intermediário
+            if streaming:
+                print()
+            streaming = False
+        elif event["type"] == "final":
+            report = event["output"]
+    if streaming:
+        print()
+    return report
+
+
+def main(argv=None):
     """
     Função principal que executa o agente de análise de mercado.
     """
+    args = parse_args(argv)
+    try:
+        configure_cascade(args)
+    except ValueError as e:
+        print(f"\n❌ Erro de Configuração: {e}")
+        sys.exit(1)
+    if args.batch:
+        main_batch(args)
+        return
+    if args.serve:
+        main_serve(args)
+        return
+    
     print("🚀 Iniciando Agente de Análise de Mercado\n")
+    collector = _metrics_collector(args)
+    callbacks = [collector] if collector else None
     
     try:
-        # Caso de uso fixo (pode ser expandido para input do usuário)
-        topic = "Blockchain em Logística"
+        # Caso de uso fixo (tema configurável com --topic)
+        topic = args.topic
         start_rev = 90.0
         end_rev = 120.0
         months = 9.0
         
-        # Construir consulta para roteamento
-        user_query = f"Analisar o potencial de mercado da tecnologia {topic}"
+        # Determinar domínio pelo tema (sem texto fixo que contenha palavras-chave)
+        domain = args.domain or registry.route(topic).domain
+        print(f"📍 Domínio identificado: {registry.get(domain).label}\n")
+        
+        # Executar o agente registrado para o domínio
+        try:
+            agent = registry.agent(domain)
+        except NotImplementedError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
         
-        # Determinar domínio
-        domain = pick_domain(user_query)
-        print(f"📍 Domínio identificado: {domain}\n")
+        print(f"🔍 Analisando: {topic}")
+        print(f"📊 Parâmetros CAGR: start={start_rev}, end={end_rev}, months={months}\n")
         
-        # Executar agente apropriado
-        if domain == "logistica":
-            print(f"🔍 Analisando: {topic}")
-            print(f"📊 Parâmetros CAGR: start={start_rev}, end={end_rev}, months={months}\n")
-            
-            report = run_market_agent(
-                topic=topic,
-                start_rev=start_rev,
-                end_rev=end_rev,
-                months=months
-            )
-            
-            # Exibir relatório final
-            print("\n" + "="*80)
-            print(">>> RELATÓRIO FINAL:")
-            print("="*80)
-            print(report)
-            print("="*80 + "\n")
-            
+        if args.stream:
+            report = stream_report(agent, topic, start_rev, end_rev, months, mode=args.mode, callbacks=callbacks)
         else:
-            print(f"❌ Domínio '{domain}' ainda não implementado.")
-            sys.exit(1)
+            report = agent.run(topic, start_rev, end_rev, months, mode=args.mode, callbacks=callbacks)
+        
+        # Exibir relatório final
+        print("\n" + "="*80)
+        print(">>> RELATÓRIO FINAL:")
+        print("="*80)
+        print(report)
+        print("="*80 + "\n")
+        print_cascade_stats()
+        if collector:
+            print_metrics(collector, args.metrics)
     
     except ValueError as ve:
         print(f"\n❌ Erro de Configuração: {ve}")
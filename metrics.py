@@ -0,0 +1,407 @@
+"""
+Métricas de latência e tokens por etapa (execução, chamadas ao LLM, ferramentas).
+"""
+import json
+import threading
+import time
+from typing import IO, Any
+from uuid import UUID
+
+# Import compatível entre versões do LangChain
+try:
+    from langchain_core.callbacks.base import BaseCallbackHandler  # LangChain 0.2+
+except Exception:  # noqa: E722
+    from langchain.callbacks.base import BaseCallbackHandler  # Fallback versões antigas
+
+
+# Limites (segundos) dos buckets dos histogramas no formato Prometheus
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _usage_from_response(response: Any) -> dict[str, int]:
+    """
+    Extrai tokens de entrada/saída de um LLMResult (usage_metadata ou llm_output).
+
+    cached_tokens é a parte dos tokens de entrada lida do cache de contexto do
+    provedor (cobrada com desconto; ver context_cache.py).
+    """
+    prompt = completion = cached = 0
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += int(usage.get("input_tokens", 0))
+                completion += int(usage.get("output_tokens", 0))
+                cached += int((usage.get("input_token_details") or {}).get("cache_read", 0) or 0)
+    if not (prompt or completion):
+        llm_output = getattr(response, "llm_output", None) or {}
+        usage = llm_output.get("usage_metadata") or llm_output.get("token_usage") or {}
+        prompt = int(usage.get("input_tokens", usage.get("prompt_tokens", 0)) or 0)
+        completion = int(usage.get("output_tokens", usage.get("completion_tokens", 0)) or 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "cached_tokens": cached}
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+class MetricsCollector(BaseCallbackHandler):
+    """
+    Callback que mede o tempo de cada execução, chamada ao LLM e ferramenta.
+
+    Deve ser passado em `callbacks=[...]` (run_market_agent, MarketAgent.run,
+    pipeline) para que os eventos cheguem em tempo real. Cada medição vira um
+    registro JSON (ver records/write_jsonl) e alimenta histogramas exportáveis
+    no formato de texto do Prometheus (prometheus_text).
+
+    Registros:
+        {"kind": "run"|"llm"|"tool", "name", "duration_s", "status", "run_id",
+         "root_run_id", "prompt_tokens", "completion_tokens", "cached_tokens", ...}
+    Execuções ("run") trazem ainda llm_calls e tool_calls.
+    """
+
+    # Executa inline também com gerenciadores assíncronos (o trabalho é mínimo)
+    run_inline = True
+
+    def __init__(self, sink: IO[str] | None = None, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Args:
+            sink: Arquivo opcional onde cada registro é escrito (JSONL) assim que medido
+            buckets: Limites dos histogramas, em segundos
+        """
+        self.sink = sink
+        self.buckets = tuple(sorted(buckets))
+        self.records: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._open: dict[UUID, dict[str, Any]] = {}
+        self._roots: dict[UUID, UUID] = {}
+        self._runs: dict[UUID, dict[str, Any]] = {}
+
+    # ------------------------------------------------------------------ internos
+
+    def _start(self, kind: str, name: str, run_id: UUID, parent_run_id: UUID | None) -> None:
+        with self._lock:
+            root = self._roots.get(parent_run_id, parent_run_id) if parent_run_id else run_id
+            self._roots[run_id] = root
+            self._open[run_id] = {"kind": kind, "name": name, "start": time.perf_counter(), "root": root}
+            if kind != "run" and root in self._runs:
+                self._runs[root][f"{kind}_calls"] += 1
+
+    def _finish(self, run_id: UUID, status: str, **fields: Any) -> dict[str, Any] | None:
+        with self._lock:
+            span = self._open.pop(run_id, None)
+            self._roots.pop(run_id, None)
+            if span is None:
+                return None
+            record = {
+                "ts": time.time(),
+                "kind": span["kind"],
+                "name": span["name"],
+                "duration_s": round(time.perf_counter() - span["start"], 6),
+                "status": status,
+                "run_id": str(run_id),
+                "root_run_id": str(span["root"]),
+                **fields,
+            }
+            if span["kind"] == "llm" and span["root"] in self._runs:
+                totals = self._runs[span["root"]]
+                totals["prompt_tokens"] += fields.get("prompt_tokens", 0)
+                totals["completion_tokens"] += fields.get("completion_tokens", 0)
+                totals["cached_tokens"] += fields.get("cached_tokens", 0)
+            if span["kind"] == "run":
+                record.update(self._runs.pop(run_id, {}))
+            self.records.append(record)
+            if self.sink is not None:
+                self.sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.sink.flush()
+            return record
+
+    # ----------------------------------------------------------------- callbacks
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any) -> None:
+        # Apenas a chain raiz representa uma execução; as internas (nós do grafo) são ignoradas
+        if parent_run_id is not None:
+            with self._lock:
+                self._roots[run_id] = self._roots.get(parent_run_id, parent_run_id)
+            return
+        name = kwargs.get("name") or (serialized or {}).get("name") or "agent"
+        with self._lock:
+            self._runs[run_id] = {"llm_calls": 0, "tool_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                  "cached_tokens": 0}
+        self._start("run", name, run_id, None)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._open:
+            self._finish(run_id, "ok")
+        else:
+            with self._lock:
+                self._roots.pop(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._open:
+            self._finish(run_id, "error", error=f"{type(error).__name__}: {str(error)[:200]}")
+        else:
+            with self._lock:
+                self._roots.pop(run_id, None)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any) -> None:
+        name = (kwargs.get("metadata") or {}).get("ls_model_name") or kwargs.get("name") or "llm"
+        self._start("llm", name, run_id, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any) -> None:
+        name = (kwargs.get("metadata") or {}).get("ls_model_name") or kwargs.get("name") or "llm"
+        self._start("llm", name, run_id, parent_run_id)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "ok", **_usage_from_response(response))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "error", error=f"{type(error).__name__}: {str(error)[:200]}")
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start("tool", name, run_id, parent_run_id)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "error", error=f"{type(error).__name__}: {str(error)[:200]}")
+
+    # ------------------------------------------------------------------ exportação
+
+    def write_jsonl(self, fh: IO[str]) -> None:
+        """Escreve todos os registros medidos até agora, um JSON por linha."""
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """
+        Agrega as medições por "kind:name" (contagem, erros, p50/p95/máx e tokens).
+        """
+        groups: dict[str, list[dict[str, Any]]] = {}
+        with self._lock:
+            for record in self.records:
+                groups.setdefault(f"{record['kind']}:{record['name']}", []).append(record)
+        summary = {}
+        for key, records in sorted(groups.items()):
+            durations = [r["duration_s"] for r in records]
+            summary[key] = {
+                "count": len(records),
+                "errors": sum(1 for r in records if r["status"] != "ok"),
+                "p50_s": round(_percentile(durations, 50), 3),
+                "p95_s": round(_percentile(durations, 95), 3),
+                "max_s": round(max(durations), 3),
+                "total_s": round(sum(durations), 3),
+                "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in records),
+                "completion_tokens": sum(r.get("completion_tokens", 0) for r in records),
+                "cached_tokens": sum(r.get("cached_tokens", 0) for r in records),
+            }
+        return summary
+
+    def prometheus_text(self, prefix: str = "market_agent") -> str:
+        """
+        Exporta histogramas de duração, contadores de tokens/erros e do cache
+        de busca no formato de texto do Prometheus.
+        """
+        with self._lock:
+            records = list(self.records)
+        lines: list[str] = []
+
+        label_for = {"run": "name", "llm": "model", "tool": "tool"}
+        for kind in ("run", "llm", "tool"):
+            metric = f"{prefix}_{kind}_duration_seconds"
+            lines.append(f"# HELP {metric} Duração de cada {kind} em segundos.")
+            lines.append(f"# TYPE {metric} histogram")
+            by_name: dict[str, list[float]] = {}
+            for r in records:
+                if r["kind"] == kind:
+                    by_name.setdefault(r["name"], []).append(r["duration_s"])
+            for name, durations in sorted(by_name.items()):
+                label = f'{label_for[kind]}="{_escape(name)}"'
+                for bound in self.buckets:
+                    count = sum(1 for d in durations if d <= bound)
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {len(durations)}')
+                lines.append(f"{metric}_sum{{{label}}} {sum(durations):.6f}")
+                lines.append(f"{metric}_count{{{label}}} {len(durations)}")
+
+        metric = f"{prefix}_llm_tokens_total"
+        lines.append(f"# HELP {metric} Tokens consumidos nas chamadas ao LLM (cached: entrada lida do cache de contexto).")
+        lines.append(f"# TYPE {metric} counter")
+        for token_type in ("prompt", "completion", "cached"):
+            total = sum(r.get(f"{token_type}_tokens", 0) for r in records if r["kind"] == "llm")
+            lines.append(f'{metric}{{type="{token_type}"}} {total}')
+
+        metric = f"{prefix}_errors_total"
+        lines.append(f"# HELP {metric} Execuções, chamadas ao LLM e ferramentas com erro.")
+        lines.append(f"# TYPE {metric} counter")
+        for kind in ("run", "llm", "tool"):
+            errors = sum(1 for r in records if r["kind"] == kind and r["status"] != "ok")
+            lines.append(f'{metric}{{kind="{kind}"}} {errors}')
+
+        for name, value, help_text, metric_type in _extra_metrics():
+            metric = f"{prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            lines.extend(f"{metric}{labels} {v}" for labels, v in value)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _extra_metrics() -> list[tuple[str, list[tuple[str, Any]], str, str]]:
+    """
+    Métricas globais do processo: caches, armazém de fontes, compactação, buscas
+    antecipadas, execuções interrompidas por orçamento, cascata de modelos e
+    saúde dos provedores (disjuntor e limitador de vazão).
+
+    Só lê caches e armazém já inicializados: exportar métricas não cria
+    arquivos SQLite.
+    """
+    from budget import budget_stats
+    from cache import get_search_cache
+    from cascade import RESULTS, cascade_stats
+    from compaction import compaction_stats
+    from prefetch import prefetch_stats
+    from providers import CIRCUIT_STATES, provider_health_snapshot
+    from report_cache import get_report_cache
+    from source_store import get_source_store
+
+    extra = []
+    cache = get_search_cache(create=False)
+    if cache is not None:
+        stats = cache.stats()
+        extra.append((
+            "search_cache_requests_total",
+            [('{result="hit"}', stats["hits"]), ('{result="miss"}', stats["misses"])],
+            "Consultas ao cache do web_search.",
+            "counter",
+        ))
+        extra.append(("search_cache_evictions_total", [("", stats["evictions"])], "Entradas despejadas (LRU).", "counter"))
+        extra.append((
+            "search_cache_stale_served_total", [("", stats["stale_hits"])],
+            "Buscas atendidas com resultados expirados do cache (SerpAPI degradado).", "counter",
+        ))
+    reports = get_report_cache(create=False)
+    if reports is not None:
+        stats = reports.stats()
+        extra.append((
+            "report_cache_requests_total",
+            [('{result="exact"}', stats["hits"] - stats["similar_hits"]),
+             ('{result="similar"}', stats["similar_hits"]),
+             ('{result="miss"}', stats["misses"])],
+            "Consultas ao cache de relatórios.",
+            "counter",
+        ))
+        extra.append((
+            "report_cache_invalidations_total", [("", stats["invalidations"])],
+            "Relatórios invalidados (validade expirada ou fontes da busca alteradas).", "counter",
+        ))
+    sources = get_source_store(create=False)
+    if sources is not None:
+        stats = sources.stats()
+        extra.append((
+            "source_store_searches_total",
+            [('{window="full"}', stats["full_searches"]), ('{window="delta"}', stats["delta_searches"])],
+            "Buscas do pipeline por janela (completa ou só desde a última execução do tema).",
+            "counter",
+        ))
+        extra.append((
+            "source_store_sources_total",
+            [('{status="new"}', stats["new_sources"]), ('{status="known"}', stats["known_sources"])],
+            "Fontes novas (enviadas ao LLM) e já armazenadas oferecidas à seleção.",
+            "counter",
+        ))
+        extra.append((
+            "source_store_summaries_reused_total", [("", stats["summaries_reused"])],
+            "Resumos de fontes reaproveitados do armazém.", "counter",
+        ))
+    compaction = compaction_stats.snapshot()
+    extra.append((
+        "search_compaction_tokens_saved_total",
+        [("", compaction["saved_tokens"])],
+        "Tokens estimados economizados pela compactação de resultados.",
+        "counter",
+    ))
+    extra.append((
+        "search_prefetch_total",
+        [(f'{{result="{outcome}"}}', count) for outcome, count in prefetch_stats.snapshot().items()],
+        "Buscas antecipadas: usadas pela ferramenta (hit), chamadas sem correspondência (miss) e descartadas.",
+        "counter",
+    ))
+    extra.append((
+        "budget_exhausted_total",
+        [(f'{{reason="{reason}"}}', count) for reason, count in budget_stats.snapshot().items()],
+        "Execuções interrompidas por orçamento esgotado (relatório parcial).",
+        "counter",
+    ))
+    cascade = cascade_stats.snapshot()
+    if cascade:
+        extra.append((
+            "cascade_attempts_total",
+            [(f'{{model="{_escape(model)}",result="{result}"}}', stats[result])
+             for model, stats in cascade.items() for result in RESULTS],
+            "Tentativas da cascata de modelos por modelo e desfecho (aceita, inválida, erro, cancelada).",
+            "counter",
+        ))
+        extra.append((
+            "cascade_latency_seconds",
+            [(f'{{model="{_escape(model)}",quantile="{q}"}}', stats[key])
+             for model, stats in cascade.items()
+             for q, key in (("0.5", "latency_p50_s"), ("0.95", "latency_p95_s"))],
+            "Latência das tentativas concluídas por modelo da cascata (p50/p95).",
+            "gauge",
+        ))
+        extra.append((
+            "cascade_unresolved_total", [("", cascade_stats.unresolved)],
+            "Execuções da cascata sem relatório válido em nenhum nível.", "counter",
+        ))
+    health = provider_health_snapshot()
+    extra.append((
+        "provider_circuit_state",
+        [(f'{{provider="{name}"}}', CIRCUIT_STATES.index(h["state"])) for name, h in health.items()],
+        "Estado do disjuntor por provedor (0 = fechado, 1 = meio-aberto, 2 = aberto).",
+        "gauge",
+    ))
+    extra.append((
+        "provider_circuit_opens_total",
+        [(f'{{provider="{name}"}}', h["opens"]) for name, h in health.items()],
+        "Aberturas do disjuntor por provedor.",
+        "counter",
+    ))
+    extra.append((
+        "provider_rejected_total",
+        [(f'{{provider="{name}"}}', h["rejected"]) for name, h in health.items()],
+        "Chamadas rejeitadas sem contato com o provedor (circuito aberto).",
+        "counter",
+    ))
+    extra.append((
+        "provider_throttled_seconds_total",
+        [(f'{{provider="{name}"}}', h["throttled_s"]) for name, h in health.items()],
+        "Tempo de espera no limitador de vazão por provedor.",
+        "counter",
+    ))
+    return extra
+
+
+def write_metrics(collector: MetricsCollector, path: str) -> None:
+    """
+    Grava as métricas em arquivo: texto do Prometheus se o caminho terminar em
+    .prom, caso contrário um registro JSON por linha.
+    """
+    with open(path, "w", encoding="utf-8") as fh:
+        if path.endswith(".prom"):
+            fh.write(collector.prometheus_text())
+        else:
+            collector.write_jsonl(fh)
@@ -0,0 +1,542 @@
+"""
+Pipeline determinístico (sem loop ReAct): busca → seleção de 2 fontes → CAGR → relatório.
+
+Usa exatamente duas chamadas ao LLM (seleção e relatório final) e valida a
+saída estruturada da seleção antes de escrever o relatório. Com o armazém de
+fontes (source_store.py), a busca cobre só o intervalo desde a última execução
+do tema, a seleção recebe apenas as fontes novas e, sem fontes novas, é feita
+sem o LLM a partir dos resumos armazenados.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterator
+
+from callbacks import TAOConsoleLogger, get_tao_logger
+from compaction import CompactionResult, compact_results
+from context_cache import acached_content_for, cached_content_for, prompt_parts
+from search_results import to_json
+from source_store import FULL_WINDOW, SourceDelta, get_source_store
+from streaming import FINAL, TOKEN, TOOL_END, TOOL_START, make_event
+from tools import aweb_search, calc_cagr, canonical_url, report_refine, web_search
+
+
+NUM_SOURCES = 2
+MISSING_DATE = "data não informada"
+
+# Nome da execução raiz do pipeline nos callbacks (ex.: métricas por execução)
+PIPELINE_RUN_NAME = "market_pipeline"
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+
+class SelectionError(ValueError):
+    """A resposta de seleção de fontes não pôde ser interpretada como JSON válido."""
+
+
+@dataclass
+class PipelineResult:
+    """
+    Resultado do pipeline determinístico.
+
+    Attributes:
+        report: Relatório final (4 parágrafos)
+        sources: As 2 fontes validadas ({titulo, link, data, resumo})
+        cagr: CAGR calculado (decimal)
+        usage: Tokens por etapa ({"selection": {...}, "report": {...}})
+        selection_repaired: True se a seleção do LLM precisou ser completada
+            com resultados da busca (JSON inválido ou links fora dos resultados)
+        compaction: Tokens estimados dos resultados antes/depois da compactação
+    """
+    report: str
+    sources: list[dict[str, str]]
+    cagr: float
+    usage: dict[str, dict[str, int]] = field(default_factory=dict)
+    selection_repaired: bool = False
+    compaction: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(stage.get("total_tokens", 0) for stage in self.usage.values())
+
+
+def search_query(topic: str) -> str:
+    """Consulta usada pelo pipeline para o tema."""
+    return f"{topic} investimentos crescimento"
+
+
+# Instruções estáticas de cada etapa, montadas uma única vez; os dados variáveis
+# (resultados, fontes, CAGR) vão ao final, para que o prefixo seja idêntico em
+# todas as requisições e reaproveitado pelo cache de contexto do Gemini
+SELECTION_INSTRUCTIONS = (
+    "Você receberá resultados de busca em JSON. Selecione exatamente 2 fontes relevantes, "
+    "citando título, link e data, e produza um breve resumo de 2-3 frases para cada. "
+    "Se a data não estiver disponível, escreva 'data não informada'.\n"
+    "Responda em JSON com o formato: {\"fontes\": [ {\"titulo\": ..., \"link\": ..., \"data\": ..., \"resumo\": ...}, {...} ]}"
+)
+
+REPORT_INSTRUCTIONS = (
+    "Com base nas duas fontes selecionadas (JSON ao final) e no CAGR informado, "
+    "escreva um relatório em português (PT-BR) com EXATAMENTE 4 parágrafos: \n"
+    "Parágrafo 1: contexto geral do tema.\n"
+    "Parágrafo 2: apresente a primeira fonte (título, link, data) e um resumo.\n"
+    "Parágrafo 3: apresente a segunda fonte (título, link, data) e um resumo.\n"
+    "Parágrafo 4: análise de crescimento mencionando o CAGR em formato XX,XX% e conclusão.\n"
+    "O CAGR é informado como decimal: converta para percentual com 2 casas."
+)
+
+
+def selection_input(results_json: str) -> str:
+    """Parte variável da etapa de seleção (resultados já serializados)."""
+    return f"RESULTADOS:\n{results_json}"
+
+
+def report_input(data: str, cagr_value: float) -> str:
+    """Parte variável da etapa do relatório (fontes em JSON e CAGR decimal)."""
+    return f"CAGR decimal: {cagr_value}\n\nFONTES (JSON):\n{data}"
+
+
+def selection_prompt(results_json: str) -> str:
+    """Prompt para escolher 2 fontes e resumir (recebe os resultados já serializados)."""
+    return f"{SELECTION_INSTRUCTIONS}\n\n{selection_input(results_json)}"
+
+
+def final_prompt(data: str, cagr_value: float) -> str:
+    """Prompt para escrever o relatório final com 4 parágrafos."""
+    return f"{REPORT_INSTRUCTIONS}\n\n{report_input(data, cagr_value)}"
+
+
+def message_text(message) -> str:
+    """Extrai o texto de uma resposta do LLM (AIMessage ou string)."""
+    content = message.content if hasattr(message, "content") else message
+    if isinstance(content, list):
+        # Respostas multimodais: concatena apenas as partes de texto
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+        )
+    return str(content)
+
+
+def message_usage(message) -> dict[str, int]:
+    """
+    Contagem de tokens (input/output/total) informada pelo provedor, se houver;
+    cached_tokens é a parte da entrada lida do cache de contexto.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    return {
+        "input_tokens": int(usage.get("input_tokens", 0)),
+        "output_tokens": int(usage.get("output_tokens", 0)),
+        "total_tokens": int(usage.get("total_tokens", 0)),
+        "cached_tokens": int((usage.get("input_token_details") or {}).get("cache_read", 0) or 0),
+    }
+
+
+def parse_selection(text: str) -> list[dict[str, Any]]:
+    """
+    Interpreta a resposta JSON da etapa de seleção.
+
+    Aceita blocos ```json e texto ao redor do objeto.
+
+    Raises:
+        SelectionError: Se não houver um objeto JSON com a lista "fontes"
+    """
+    cleaned = _FENCE_RE.sub("", text.strip())
+    start, end = cleaned.find("{"), cleaned.rfind("}")
+    if start == -1 or end <= start:
+        raise SelectionError("Resposta de seleção sem objeto JSON.")
+    try:
+        data = json.loads(cleaned[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise SelectionError(f"JSON inválido na seleção: {e}")
+    sources = data.get("fontes") if isinstance(data, dict) else None
+    if not isinstance(sources, list):
+        raise SelectionError('Resposta de seleção sem a lista "fontes".')
+    return [s for s in sources if isinstance(s, dict)]
+
+
+def validate_selection(
+    sources: list[dict[str, Any]], search_results: list[dict[str, Any]]
+) -> tuple[list[dict[str, str]], bool]:
+    """
+    Valida as fontes escolhidas contra os resultados da busca.
+
+    Mantém apenas fontes cujo link aparece nos resultados (evita URLs
+    inventadas), normaliza os campos e, se faltarem fontes, completa com os
+    primeiros resultados ainda não usados (resumo armazenado ou snippet).
+
+    Returns:
+        (fontes validadas, True se houve reparo)
+    """
+    by_url = {canonical_url(r.get("link") or ""): r for r in search_results if r.get("link")}
+    valid: list[dict[str, str]] = []
+    used: set[str] = set()
+    for source in sources:
+        key = canonical_url(str(source.get("link") or ""))
+        result = by_url.get(key)
+        if result is None or key in used:
+            continue
+        used.add(key)
+        valid.append({
+            "titulo": str(source.get("titulo") or result.get("title") or ""),
+            "link": result["link"],
+            "data": str(source.get("data") or result.get("date") or MISSING_DATE),
+            "resumo": str(source.get("resumo") or result.get("snippet") or ""),
+        })
+        if len(valid) == NUM_SOURCES:
+            break
+
+    repaired = len(valid) < NUM_SOURCES or len(sources) != NUM_SOURCES
+    for key, result in by_url.items():
+        if len(valid) >= NUM_SOURCES:
+            break
+        if key in used:
+            continue
+        used.add(key)
+        valid.append({
+            "titulo": result.get("title", ""),
+            "link": result["link"],
+            "data": result.get("date") or MISSING_DATE,
+            "resumo": result.get("resumo") or result.get("snippet", ""),
+        })
+    return valid, repaired
+
+
+def _select(selection, search_results) -> tuple[list[dict[str, str]], bool]:
+    if selection is None:
+        # Sem fontes novas, a seleção não chama o LLM: usa os resumos armazenados
+        return validate_selection([], search_results)[0], False
+    try:
+        chosen = parse_selection(message_text(selection))
+    except SelectionError:
+        chosen = []
+    return validate_selection(chosen, search_results)
+
+
+def _start_run(callbacks: list | None, topic: str):
+    """
+    Abre a execução raiz nos callbacks informados (sem handlers, é um no-op).
+
+    As chamadas ao LLM recebem run.get_child() e as ferramentas são registradas
+    como filhas, como acontece no grafo do agente.
+    """
+    # Import compatível entre versões do LangChain
+    try:
+        from langchain_core.callbacks import CallbackManager  # LangChain 0.2+
+    except Exception:  # noqa: E722
+        from langchain.callbacks.manager import CallbackManager  # Fallback versões antigas
+
+    manager = CallbackManager.configure(inheritable_callbacks=callbacks)
+    return manager.on_chain_start(None, {"input": topic}, name=PIPELINE_RUN_NAME)
+
+
+def _llm_config(run) -> dict[str, Any]:
+    return {"callbacks": run.get_child()}
+
+
+def _cagr_step(logger: TAOConsoleLogger, run, start_rev: float, end_rev: float, months: float) -> float:
+    # Action: calc_cagr
+    tool_input = json.dumps({"start": start_rev, "end": end_rev, "months": months})
+    logger.on_tool_start({"name": "calc_cagr"}, tool_input)
+    tool_run = run.get_child().on_tool_start({"name": "calc_cagr"}, tool_input)
+    try:
+        cagr_value = calc_cagr(start=start_rev, end=end_rev, months=months)
+        logger.on_tool_end(str(cagr_value))
+        tool_run.on_tool_end(str(cagr_value))
+        return cagr_value
+    except Exception as e:
+        logger.on_tool_error(e)
+        tool_run.on_tool_error(e)
+        raise
+
+
+def _finish(logger, report, sources, cagr_value, selection, repaired, compacted: CompactionResult) -> PipelineResult:
+    text = report_refine(message_text(report))
+    logger.on_chain_end({"output": text})
+    return PipelineResult(
+        report=text,
+        sources=sources,
+        cagr=cagr_value,
+        usage={"selection": message_usage(selection), "report": message_usage(report)},
+        selection_repaired=repaired,
+        compaction={
+            "original_tokens": compacted.original_tokens,
+            "compact_tokens": compacted.compact_tokens,
+            "saved_tokens": compacted.saved_tokens,
+            "dropped": compacted.dropped,
+        },
+    )
+
+
+def _search(logger: TAOConsoleLogger, run, topic: str, time_period: str = FULL_WINDOW) -> list[dict[str, Any]]:
+    # Action: web_search
+    logger.on_tool_start({"name": "web_search"}, topic)
+    tool_run = run.get_child().on_tool_start({"name": "web_search"}, topic)
+    try:
+        search_results = web_search(search_query(topic), num=5, time_period=time_period)
+        # Os callbacks recebem os resultados completos (ex.: fontes do relatório parcial, budget.py)
+        observation = to_json(search_results)
+        logger.on_tool_end(observation[:500])
+        tool_run.on_tool_end(observation)
+        return search_results
+    except Exception as e:
+        logger.on_tool_error(e)
+        tool_run.on_tool_error(e)
+        raise
+
+
+async def _asearch(logger: TAOConsoleLogger, run, topic: str, time_period: str = FULL_WINDOW) -> list[dict[str, Any]]:
+    logger.on_tool_start({"name": "web_search"}, topic)
+    tool_run = run.get_child().on_tool_start({"name": "web_search"}, topic)
+    try:
+        search_results = await aweb_search(search_query(topic), num=5, time_period=time_period)
+        # Os callbacks recebem os resultados completos (ex.: fontes do relatório parcial, budget.py)
+        observation = to_json(search_results)
+        logger.on_tool_end(observation[:500])
+        tool_run.on_tool_end(observation)
+        return search_results
+    except Exception as e:
+        logger.on_tool_error(e)
+        tool_run.on_tool_error(e)
+        raise
+
+
+def _search_window(store, topic: str) -> str:
+    """Janela da busca: completa, ou só o intervalo desde a última execução (source_store.py)."""
+    return store.window(topic) if store is not None else FULL_WINDOW
+
+
+def _delta(store, topic: str, search_results: list[dict[str, Any]]) -> SourceDelta:
+    """
+    Separa os resultados a resumir (novos) dos candidatos já armazenados.
+
+    Sem armazém de fontes, todos os resultados da busca são novos.
+    """
+    if store is None:
+        return SourceDelta(new=search_results)
+    return store.merge(topic, search_results)
+
+
+def _finish_selection(store, topic: str, sources: list[dict[str, str]], delta: SourceDelta) -> None:
+    if store is not None:
+        store.finish_run(topic, sources, delta)
+
+
+def _selection_parts(payload: str, cached_content: str | None) -> tuple[str, dict[str, Any]]:
+    return prompt_parts(SELECTION_INSTRUCTIONS, selection_input(payload), cached_content)
+
+
+def _report_parts(sources: list[dict[str, str]], cagr_value: float, cached_content: str | None) -> tuple[str, dict[str, Any]]:
+    data = json.dumps({"fontes": sources}, ensure_ascii=False)
+    return prompt_parts(REPORT_INSTRUCTIONS, report_input(data, cagr_value), cached_content)
+
+
+def run_pipeline(
+    llm,
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    logger: TAOConsoleLogger | None = None,
+    task_input: str | None = None,
+    callbacks: list | None = None,
+) -> PipelineResult:
+    """
+    Executa o pipeline determinístico com logs TAO.
+
+    Args:
+        llm: Chat model do LangChain
+        topic: Tema de mercado para análise
+        start_rev: Valor inicial para cálculo CAGR
+        end_rev: Valor final para cálculo CAGR
+        months: Período em meses para cálculo CAGR
+        logger: Callback TAO (padrão: get_tao_logger(), ver TAO_LOG_MODE)
+        task_input: Texto exibido no início da execução (padrão: o tema)
+        callbacks: Handlers do LangChain que recebem a execução, as chamadas
+            ao LLM e as ferramentas (ex.: metrics.MetricsCollector)
+
+    Returns:
+        PipelineResult com relatório, fontes, CAGR e tokens por etapa
+    """
+    logger = logger or get_tao_logger()
+    logger.on_chain_start({}, {"input": task_input or topic})
+    run = _start_run(callbacks, topic)
+    try:
+        store = get_source_store()
+        search_results = _search(logger, run, topic, _search_window(store, topic))
+        delta = _delta(store, topic, search_results)
+
+        # Pedir ao LLM para escolher 2 fontes e resumir (com o armazém de fontes, só as novas)
+        compacted = compact_results(delta.new)
+        selection = None
+        if delta.new or store is None:
+            prompt, kwargs = _selection_parts(compacted.payload, cached_content_for(llm, SELECTION_INSTRUCTIONS))
+            selection = llm.invoke(prompt, config=_llm_config(run), **kwargs)
+        sources, repaired = _select(selection, delta.candidates)
+        _finish_selection(store, topic, sources, delta)
+        cagr_value = _cagr_step(logger, run, start_rev, end_rev, months)
+
+        # Escrever relatório final com 4 parágrafos
+        try:
+            prompt, kwargs = _report_parts(sources, cagr_value, cached_content_for(llm, REPORT_INSTRUCTIONS))
+            report = llm.invoke(prompt, config=_llm_config(run), **kwargs)
+            result = _finish(logger, report, sources, cagr_value, selection, repaired, compacted)
+        except Exception as e:
+            logger.on_tool_error(e)
+            raise
+    except BaseException as e:
+        run.on_chain_error(e)
+        raise
+    run.on_chain_end({"output": result.report})
+    return result
+
+
+async def arun_pipeline(
+    llm,
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    logger: TAOConsoleLogger | None = None,
+    task_input: str | None = None,
+    callbacks: list | None = None,
+) -> PipelineResult:
+    """Versão assíncrona de run_pipeline."""
+    logger = logger or get_tao_logger()
+    logger.on_chain_start({}, {"input": task_input or topic})
+    run = _start_run(callbacks, topic)
+    try:
+        store = get_source_store()
+        search_results = await _asearch(logger, run, topic, _search_window(store, topic))
+        delta = _delta(store, topic, search_results)
+
+        compacted = compact_results(delta.new)
+        selection = None
+        if delta.new or store is None:
+            prompt, kwargs = _selection_parts(compacted.payload, await acached_content_for(llm, SELECTION_INSTRUCTIONS))
+            selection = await llm.ainvoke(prompt, config=_llm_config(run), **kwargs)
+        sources, repaired = _select(selection, delta.candidates)
+        _finish_selection(store, topic, sources, delta)
+        cagr_value = _cagr_step(logger, run, start_rev, end_rev, months)
+
+        try:
+            prompt, kwargs = _report_parts(sources, cagr_value, await acached_content_for(llm, REPORT_INSTRUCTIONS))
+            report = await llm.ainvoke(prompt, config=_llm_config(run), **kwargs)
+            result = _finish(logger, report, sources, cagr_value, selection, repaired, compacted)
+        except Exception as e:
+            logger.on_tool_error(e)
+            raise
+    except BaseException as e:
+        run.on_chain_error(e)
+        raise
+    run.on_chain_end({"output": result.report})
+    return result
+
+
+def stream_pipeline(
+    llm,
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    logger: TAOConsoleLogger | None = None,
+    task_input: str | None = None,
+    callbacks: list | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Versão em streaming de run_pipeline (ver streaming.py para o formato dos eventos).
+
+    O relatório final é gerado com llm.stream, e cada trecho é emitido como
+    evento "token" assim que chega. O evento "final" traz o relatório refinado
+    e o PipelineResult em "result".
+    """
+    logger = logger or get_tao_logger()
+    logger.on_chain_start({}, {"input": task_input or topic})
+    run = _start_run(callbacks, topic)
+    try:
+        yield make_event(TOOL_START, name="web_search", input=topic)
+        store = get_source_store()
+        search_results = _search(logger, run, topic, _search_window(store, topic))
+        yield make_event(TOOL_END, name="web_search", output=to_json(search_results))
+        delta = _delta(store, topic, search_results)
+
+        compacted = compact_results(delta.new)
+        selection = None
+        if delta.new or store is None:
+            prompt, kwargs = _selection_parts(compacted.payload, cached_content_for(llm, SELECTION_INSTRUCTIONS))
+            selection = llm.invoke(prompt, config=_llm_config(run), **kwargs)
+        sources, repaired = _select(selection, delta.candidates)
+        _finish_selection(store, topic, sources, delta)
+
+        yield make_event(TOOL_START, name="calc_cagr", input=json.dumps({"start": start_rev, "end": end_rev, "months": months}))
+        cagr_value = _cagr_step(logger, run, start_rev, end_rev, months)
+        yield make_event(TOOL_END, name="calc_cagr", output=str(cagr_value))
+
+        try:
+            prompt, kwargs = _report_parts(sources, cagr_value, cached_content_for(llm, REPORT_INSTRUCTIONS))
+            report = None
+            for chunk in llm.stream(prompt, config=_llm_config(run), **kwargs):
+                report = chunk if report is None else report + chunk
+                text = message_text(chunk)
+                if text:
+                    yield make_event(TOKEN, text=text)
+            result = _finish(logger, report or "", sources, cagr_value, selection, repaired, compacted)
+        except Exception as e:
+            logger.on_tool_error(e)
+            raise
+    except BaseException as e:
+        run.on_chain_error(e)
+        raise
+    run.on_chain_end({"output": result.report})
+    yield make_event(FINAL, output=result.report, result=result)
+
+
+async def astream_pipeline(
+    llm,
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    logger: TAOConsoleLogger | None = None,
+    task_input: str | None = None,
+    callbacks: list | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """Versão assíncrona de stream_pipeline."""
+    logger = logger or get_tao_logger()
+    logger.on_chain_start({}, {"input": task_input or topic})
+    run = _start_run(callbacks, topic)
+    try:
+        yield make_event(TOOL_START, name="web_search", input=topic)
+        store = get_source_store()
+        search_results = await _asearch(logger, run, topic, _search_window(store, topic))
+        yield make_event(TOOL_END, name="web_search", output=to_json(search_results))
+        delta = _delta(store, topic, search_results)
+
+        compacted = compact_results(delta.new)
+        selection = None
+        if delta.new or store is None:
+            prompt, kwargs = _selection_parts(compacted.payload, await acached_content_for(llm, SELECTION_INSTRUCTIONS))
+            selection = await llm.ainvoke(prompt, config=_llm_config(run), **kwargs)
+        sources, repaired = _select(selection, delta.candidates)
+        _finish_selection(store, topic, sources, delta)
+
+        yield make_event(TOOL_START, name="calc_cagr", input=json.dumps({"start": start_rev, "end": end_rev, "months": months}))
+        cagr_value = _cagr_step(logger, run, start_rev, end_rev, months)
+        yield make_event(TOOL_END, name="calc_cagr", output=str(cagr_value))
+
+        try:
+            prompt, kwargs = _report_parts(sources, cagr_value, await acached_content_for(llm, REPORT_INSTRUCTIONS))
+            report = None
+            async for chunk in llm.astream(prompt, config=_llm_config(run), **kwargs):
+                report = chunk if report is None else report + chunk
+                text = message_text(chunk)
+                if text:
+                    yield make_event(TOKEN, text=text)
+            result = _finish(logger, report or "", sources, cagr_value, selection, repaired, compacted)
+        except Exception as e:
+            logger.on_tool_error(e)
+            raise
+    except BaseException as e:
+        run.on_chain_error(e)
+        raise
+    run.on_chain_end({"output": result.report})
+    yield make_event(FINAL, output=result.report, result=result)
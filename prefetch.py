@@ -0,0 +1,240 @@
+"""
+Busca antecipada (especulativa) do web_search no modo agente.
+
+Antes da primeira resposta do LLM, o agente quase sempre pede a mesma busca
+óbvia derivada do tema ("<tema> investimentos crescimento"). Com a busca
+antecipada ativa, essas consultas são disparadas em segundo plano assim que
+a execução começa; quando a chamada da ferramenta web_search coincide com uma
+delas (mesma chave normalizada do cache), o resultado em curso é reaproveitado.
+Buscas antecipadas não usadas são descartadas ao fim da execução e contadas
+nas métricas.
+
+A busca ativa fica em uma ContextVar: execuções concorrentes no mesmo
+MarketAgent não compartilham buscas antecipadas.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, suppress
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator
+
+from cache import _env_float, normalize_key
+from pipeline import search_query
+from tools import aweb_search, query_variants, web_search
+
+
+# Resultados das buscas antecipadas (ver PrefetchStats)
+OUTCOMES = ("hit", "miss", "discarded")
+
+# Intenções do prompt do agente ("investimentos, crescimento ...")
+PREFETCH_INTENTS = ("investimentos", "crescimento")
+
+
+@dataclass(frozen=True)
+class PrefetchConfig:
+    """
+    Busca antecipada por execução do agente.
+
+    Attributes:
+        enabled: Dispara as buscas antecipadas
+        max_queries: Consultas antecipadas por execução (ver prefetch_queries);
+            cada uma consome uma busca do SerpAPI mesmo se não for usada
+        num: Resultados por consulta (como a ferramenta web_search)
+        time_period: Janela qdr: (como a ferramenta web_search)
+    """
+    enabled: bool = False
+    max_queries: int = 1
+    num: int = 5
+    time_period: str = "m6"
+
+    @classmethod
+    def from_env(cls) -> "PrefetchConfig":
+        """Lê SEARCH_PREFETCH (1/true para ativar) e SEARCH_PREFETCH_QUERIES."""
+        return cls(
+            enabled=os.getenv("SEARCH_PREFETCH", "").lower() in ("1", "true", "yes"),
+            max_queries=int(_env_float("SEARCH_PREFETCH_QUERIES", cls.max_queries)),
+        )
+
+
+def prefetch_queries(topic: str, limit: int = 1) -> list[str]:
+    """
+    Consultas prováveis da primeira chamada do web_search, da mais à menos provável.
+
+    A primeira é a consulta do pipeline (search_query); as demais são as
+    variantes tema × intenção do prompt.
+    """
+    queries: list[str] = []
+    seen: set[str] = set()
+    for query in (search_query(topic), *query_variants(topic, PREFETCH_INTENTS)):
+        key = " ".join(query.lower().split())
+        if key not in seen:
+            seen.add(key)
+            queries.append(query)
+    return queries[:max(0, limit)]
+
+
+class PrefetchStats:
+    """Buscas antecipadas no processo: usadas (hit), chamadas sem correspondência (miss) e descartadas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def record(self, outcome: str, n: int = 1) -> None:
+        if n:
+            with self._lock:
+                self.counts[outcome] += n
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {outcome: self.counts[outcome] for outcome in OUTCOMES}
+
+
+prefetch_stats = PrefetchStats()
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="prefetch")
+    return _executor
+
+
+class SearchPrefetch:
+    """
+    Buscas antecipadas de uma execução, chaveadas como o cache do web_search.
+
+    Cada busca é entregue no máximo uma vez (claim); as restantes são
+    canceladas em close() e contadas como descartadas.
+    """
+
+    def __init__(self, pending: dict[tuple, Any], stats: PrefetchStats = prefetch_stats):
+        self._pending = pending
+        self._stats = stats
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, queries: list[str], num: int = 5, time_period: str | None = "m6") -> "SearchPrefetch":
+        """Dispara as buscas em threads (execuções síncronas)."""
+        executor = _get_executor()
+        return cls({
+            normalize_key(q, num, time_period): executor.submit(web_search, q, num=num, time_period=time_period)
+            for q in queries
+        })
+
+    @classmethod
+    def astart(cls, queries: list[str], num: int = 5, time_period: str | None = "m6") -> "SearchPrefetch":
+        """Dispara as buscas como tasks no event loop atual (execuções assíncronas)."""
+        return cls({
+            normalize_key(q, num, time_period): asyncio.ensure_future(aweb_search(q, num=num, time_period=time_period))
+            for q in queries
+        })
+
+    @property
+    def queries(self) -> list[str]:
+        with self._lock:
+            return [key[0] for key in self._pending]
+
+    def claim(self, query: str, num: int, time_period: str | None):
+        """
+        Retira a busca antecipada correspondente à chamada, ou None (contada como miss).
+
+        Returns:
+            concurrent.futures.Future ou asyncio.Future com os resultados
+        """
+        with self._lock:
+            entry = self._pending.pop(normalize_key(query, num, time_period), None)
+        self._stats.record("hit" if entry is not None else "miss")
+        return entry
+
+    def close(self) -> int:
+        """Cancela/descarta as buscas antecipadas não usadas; retorna quantas eram."""
+        with self._lock:
+            leftover = list(self._pending.values())
+            self._pending.clear()
+        for entry in leftover:
+            # Uma busca já em curso (thread) termina em segundo plano, sem uso
+            entry.cancel()
+            if not isinstance(entry, Future):
+                # Evita o aviso "Task exception was never retrieved"
+                entry.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._stats.record("discarded", len(leftover))
+        return len(leftover)
+
+
+_active: contextvars.ContextVar[SearchPrefetch | None] = contextvars.ContextVar("search_prefetch", default=None)
+
+
+def active_prefetch() -> SearchPrefetch | None:
+    """Busca antecipada da execução atual, se houver."""
+    return _active.get()
+
+
+def _reset(token) -> None:
+    # Geradores de streaming podem ser encerrados em outro contexto
+    with suppress(ValueError):
+        _active.reset(token)
+
+
+@contextmanager
+def search_prefetch(topic: str, config: PrefetchConfig | None = None) -> Iterator[SearchPrefetch | None]:
+    """
+    Dispara as buscas antecipadas do tema e as deixa ativas durante o bloco.
+
+    Sem config.enabled (padrão: PrefetchConfig.from_env()), não faz nada e produz None.
+    """
+    config = config or PrefetchConfig.from_env()
+    if not config.enabled or config.max_queries <= 0:
+        yield None
+        return
+    prefetch = SearchPrefetch.start(prefetch_queries(topic, config.max_queries), config.num, config.time_period)
+    token = _active.set(prefetch)
+    try:
+        yield prefetch
+    finally:
+        _reset(token)
+        prefetch.close()
+
+
+@asynccontextmanager
+async def asearch_prefetch(topic: str, config: PrefetchConfig | None = None) -> AsyncIterator[SearchPrefetch | None]:
+    """Versão assíncrona de search_prefetch (buscas como tasks no event loop)."""
+    config = config or PrefetchConfig.from_env()
+    if not config.enabled or config.max_queries <= 0:
+        yield None
+        return
+    prefetch = SearchPrefetch.astart(prefetch_queries(topic, config.max_queries), config.num, config.time_period)
+    token = _active.set(prefetch)
+    try:
+        yield prefetch
+    finally:
+        _reset(token)
+        prefetch.close()
+
+
+def claim_prefetched(query: str, num: int = 5, time_period: str | None = None):
+    """
+    Retira a busca antecipada da execução atual que corresponde à chamada.
+
+    Returns:
+        Future (execuções síncronas) ou Task (assíncronas) com os resultados do
+        web_search, ou None se não houver busca antecipada correspondente
+    """
+    prefetch = _active.get()
+    return prefetch.claim(query, num, time_period) if prefetch is not None else None
+
+
+async def wait_prefetched(entry) -> list[dict[str, Any]]:
+    """Aguarda uma busca antecipada (Future ou Task) sem bloquear o event loop."""
+    if isinstance(entry, Future):
+        return await asyncio.wrap_future(entry)
+    return await entry
@@ -0,0 +1,594 @@
+"""
+Controles compartilhados por provedor externo (SerpAPI, Gemini).
+
+- Concorrência: máximo de chamadas simultâneas (ProviderLimits).
+- Vazão: balde de fichas com QPS e rajada configuráveis (TokenBucket).
+- Saúde: disjuntor que, após falhas seguidas (429, 5xx, timeouts), rejeita
+  as chamadas de imediato por um intervalo e depois deixa passar uma chamada
+  de teste (CircuitBreaker).
+
+provider_call/aprovider_call aplicam os três controles em torno de uma
+chamada ao provedor; em chamadas com retry, provider_breaker envolve a
+chamada inteira e provider_attempt cada requisição. O estado fica em
+provider_health_snapshot() e nas métricas do Prometheus (ver metrics.py).
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator
+
+import httpx
+import requests
+
+from cache import _env_float
+
+
+SERPAPI = "serpapi"
+GEMINI = "gemini"
+
+# Limites padrão de chamadas simultâneas por provedor (0 = sem limite)
+DEFAULT_CONCURRENCY: dict[str, int] = {
+    SERPAPI: 4,
+    GEMINI: 8,
+}
+
+
+class _Slots:
+    """
+    Vagas ocupadas de um provedor por threads.
+
+    O limite é lido a cada aquisição: set_limit vale para as próximas
+    chamadas e as vagas já ocupadas continuam contadas até serem liberadas
+    (um novo limite menor só admite chamadas quando a ocupação cair abaixo dele).
+    """
+
+    def __init__(self, limit: Callable[[], int]):
+        self._limit = limit
+        self._cond = threading.Condition()
+        self.in_use = 0
+
+    def _free(self) -> bool:
+        limit = self._limit()
+        return not limit or self.in_use < limit
+
+    def acquire(self) -> None:
+        with self._cond:
+            self._cond.wait_for(self._free)
+            self.in_use += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+    def wake(self) -> None:
+        """Reavalia as esperas após uma mudança de limite."""
+        with self._cond:
+            self._cond.notify_all()
+
+
+class _AsyncSlots:
+    """Versão de _Slots para corrotinas de um event loop."""
+
+    def __init__(self, limit: Callable[[], int], loop: asyncio.AbstractEventLoop):
+        self._limit = limit
+        self._loop = loop
+        self._waiters: list[asyncio.Future] = []
+        self.in_use = 0
+
+    def _free(self) -> bool:
+        limit = self._limit()
+        return not limit or self.in_use < limit
+
+    async def acquire(self) -> None:
+        while not self._free():
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self._waiters.remove(waiter)
+        self.in_use += 1
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def wake(self) -> None:
+        """Reavalia as esperas após uma mudança de limite (chamável de qualquer thread)."""
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # loop já encerrado
+
+
+class ProviderLimits:
+    """
+    Limita o número de chamadas simultâneas por provedor.
+
+    Mantém as vagas ocupadas por threads (código síncrono) e, para o código
+    assíncrono, por event loop. O limite pode ser alterado a qualquer momento
+    sem perder a conta das vagas ocupadas.
+    """
+
+    def __init__(self, limits: dict[str, int] | None = None):
+        self._lock = threading.Lock()
+        self._limits: dict[str, int] = {}
+        self._thread_slots: dict[str, _Slots] = {}
+        self._async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, _AsyncSlots]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        for name, limit in (limits or {}).items():
+            self.set_limit(name, limit)
+
+    @classmethod
+    def from_env(cls) -> "ProviderLimits":
+        """Lê SERPAPI_MAX_CONCURRENCY e GEMINI_MAX_CONCURRENCY (padrão: DEFAULT_CONCURRENCY)."""
+        limits = {}
+        for name, default in DEFAULT_CONCURRENCY.items():
+            value = os.getenv(f"{name.upper()}_MAX_CONCURRENCY")
+            try:
+                limits[name] = int(value) if value else default
+            except ValueError:
+                raise ValueError(
+                    f"Variável {name.upper()}_MAX_CONCURRENCY deve ser inteira (recebido: {value!r})"
+                )
+        return cls(limits)
+
+    def set_limit(self, name: str, limit: int | None) -> None:
+        """Define o limite de um provedor (None ou 0 remove o limite)."""
+        if limit is not None and limit < 0:
+            raise ValueError("O limite de concorrência não pode ser negativo.")
+        with self._lock:
+            self._limits[name] = limit or 0
+            waiting = [self._thread_slots.get(name)]
+            waiting += [slots.get(name) for slots in self._async_slots.values()]
+        for slots in waiting:
+            if slots is not None:
+                slots.wake()
+
+    def limit(self, name: str) -> int:
+        """Retorna o limite configurado (0 = sem limite)."""
+        return self._limits.get(name, 0)
+
+    def in_use(self, name: str) -> int:
+        """Vagas ocupadas por threads no momento (chamadas síncronas em curso)."""
+        slots = self._thread_slots.get(name)
+        return slots.in_use if slots is not None else 0
+
+    def _slots(self, name: str) -> _Slots:
+        with self._lock:
+            slots = self._thread_slots.get(name)
+            if slots is None:
+                slots = self._thread_slots[name] = _Slots(lambda: self.limit(name))
+            return slots
+
+    def _aslots(self, name: str) -> _AsyncSlots:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            per_loop = self._async_slots.setdefault(loop, {})
+            slots = per_loop.get(name)
+            if slots is None:
+                slots = per_loop[name] = _AsyncSlots(lambda: self.limit(name), loop)
+            return slots
+
+    @contextmanager
+    def slot(self, name: str) -> Iterator[None]:
+        """Ocupa uma vaga do provedor (bloqueando a thread até haver vaga)."""
+        slots = self._slots(name)
+        slots.acquire()
+        try:
+            yield
+        finally:
+            slots.release()
+
+    @asynccontextmanager
+    async def aslot(self, name: str) -> AsyncIterator[None]:
+        """Ocupa uma vaga do provedor no event loop corrente."""
+        slots = self._aslots(name)
+        await slots.acquire()
+        try:
+            yield
+        finally:
+            slots.release()
+
+
+_limits = ProviderLimits.from_env()
+
+
+def get_provider_limits() -> ProviderLimits:
+    """Retorna os limites de concorrência do processo."""
+    return _limits
+
+
+def configure_concurrency(**limits: int | None) -> None:
+    """
+    Ajusta limites de concorrência do processo (ex.: configure_concurrency(serpapi=2, gemini=4)).
+    """
+    for name, limit in limits.items():
+        _limits.set_limit(name, limit)
+
+
+def provider_slot(name: str):
+    """Atalho para get_provider_limits().slot(name)."""
+    return _limits.slot(name)
+
+
+def aprovider_slot(name: str):
+    """Atalho para get_provider_limits().aslot(name)."""
+    return _limits.aslot(name)
+
+
+# Estados do disjuntor; o índice é o valor exportado no Prometheus
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+CIRCUIT_STATES = (CLOSED, HALF_OPEN, OPEN)
+
+
+class ProviderUnavailableError(RuntimeError):
+    """Chamada rejeitada sem contato com o provedor: o disjuntor está aberto."""
+
+    def __init__(self, provider: str, retry_in_s: float):
+        super().__init__(f"Provedor {provider} indisponível (circuito aberto; nova tentativa em {retry_in_s:.0f}s)")
+        self.provider = provider
+        self.retry_in_s = retry_in_s
+
+
+@dataclass(frozen=True)
+class ProviderPolicy:
+    """
+    Attributes:
+        qps: Chamadas por segundo permitidas em regime (0 = sem limite)
+        burst: Chamadas que podem sair de uma vez após um período ocioso
+        failure_threshold: Falhas seguidas que abrem o circuito (0 = sem disjuntor)
+        reset_timeout_s: Tempo com o circuito aberto antes da chamada de teste
+    """
+    qps: float = 0.0
+    burst: int = 1
+    failure_threshold: int = 5
+    reset_timeout_s: float = 30.0
+
+    @classmethod
+    def from_env(cls, name: str, default: "ProviderPolicy | None" = None) -> "ProviderPolicy":
+        """Lê {NOME}_QPS, {NOME}_BURST, {NOME}_BREAKER_FAILURES e {NOME}_BREAKER_RESET_S."""
+        default = default or cls()
+        prefix = name.upper()
+        return cls(
+            qps=_env_float(f"{prefix}_QPS", default.qps),
+            burst=int(_env_float(f"{prefix}_BURST", default.burst)),
+            failure_threshold=int(_env_float(f"{prefix}_BREAKER_FAILURES", default.failure_threshold)),
+            reset_timeout_s=_env_float(f"{prefix}_BREAKER_RESET_S", default.reset_timeout_s),
+        )
+
+
+# Políticas padrão por provedor (plano pago básico da SerpAPI; cota por minuto do Gemini)
+DEFAULT_POLICIES: dict[str, ProviderPolicy] = {
+    SERPAPI: ProviderPolicy(qps=5.0, burst=5),
+    GEMINI: ProviderPolicy(qps=10.0, burst=10),
+}
+
+
+class TokenBucket:
+    """
+    Balde de fichas: `burst` fichas, repostas à taxa de `qps` por segundo.
+
+    Cada chamada reserva uma ficha e espera o tempo até ela existir; as
+    reservas são feitas sob lock, então chamadas concorrentes saem espaçadas
+    em 1/qps, na ordem de chegada.
+    """
+
+    def __init__(self, qps: float, burst: int = 1, clock: Callable[[], float] = time.monotonic):
+        if qps < 0 or burst < 1:
+            raise ValueError("qps não pode ser negativo e burst deve ser pelo menos 1.")
+        self.qps = qps
+        self.burst = burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self.waited_s = 0.0
+
+    def reserve(self) -> float:
+        """Reserva uma ficha e devolve quantos segundos esperar antes de usá-la."""
+        if not self.qps:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.qps)
+            self._updated = now
+            self._tokens -= 1.0
+            wait = -self._tokens / self.qps if self._tokens < 0 else 0.0
+            self.waited_s += wait
+            return wait
+
+    def acquire(self) -> float:
+        """Espera (bloqueando a thread) até haver ficha; devolve o tempo de espera."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self) -> float:
+        """Espera no event loop até haver ficha; devolve o tempo de espera."""
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Disjuntor por provedor: fechado (chamadas normais) → aberto após
+    `failure_threshold` falhas seguidas (chamadas rejeitadas por
+    `reset_timeout_s`) → meio-aberto (uma única chamada de teste; sucesso
+    fecha o circuito, falha o reabre).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout_s: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout_s:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self) -> None:
+        """
+        Raises:
+            ProviderUnavailableError: Se o circuito estiver aberto (ou já houver
+                uma chamada de teste em curso)
+        """
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self.reset_timeout_s - (self._clock() - self._opened_at)
+                if remaining > 0:
+                    self.rejected += 1
+                    raise ProviderUnavailableError(self.name, remaining)
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    raise ProviderUnavailableError(self.name, 0.0)
+                self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (
+                self.failure_threshold and self._failures >= self.failure_threshold and self._state == CLOSED
+            ):
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self.opens += 1
+
+    def release(self) -> None:
+        """Libera a chamada de teste sem resultado (ex.: chamada cancelada)."""
+        with self._lock:
+            self._probing = False
+
+
+def _status_code(exc: BaseException) -> int | None:
+    response = getattr(exc, "response", None)
+    for value in (getattr(response, "status_code", None), getattr(exc, "status_code", None), getattr(exc, "code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+# Erros sem status HTTP que indicam provedor lento ou inacessível
+_TRANSIENT_ERRORS = (
+    TimeoutError,
+    ConnectionError,
+    requests.Timeout,
+    requests.ConnectionError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """
+    Indica se o erro conta contra a saúde do provedor: 429, 5xx, timeouts,
+    falhas de conexão e circuito aberto. Erros do cliente (ex.: 400/401) e
+    erros locais (JSON inválido, validação) não abrem o circuito.
+    """
+    if isinstance(exc, ProviderUnavailableError):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, _TRANSIENT_ERRORS)
+
+
+def _record_outcome(breaker: CircuitBreaker, exc: BaseException | None) -> None:
+    if exc is None:
+        breaker.record_success()
+    elif not isinstance(exc, Exception):
+        # Chamada interrompida (cancelamento, GeneratorExit): sem veredito sobre o provedor
+        breaker.release()
+    elif is_provider_failure(exc):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+class ProviderHealth:
+    """Balde de fichas e disjuntor de cada provedor, compartilhados pelo processo."""
+
+    def __init__(self, policies: dict[str, ProviderPolicy] | None = None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        for name, policy in (policies or {}).items():
+            self.set_policy(name, policy)
+
+    @classmethod
+    def from_env(cls) -> "ProviderHealth":
+        """Políticas de DEFAULT_POLICIES, com os ajustes de ProviderPolicy.from_env."""
+        return cls({name: ProviderPolicy.from_env(name, default) for name, default in DEFAULT_POLICIES.items()})
+
+    def set_policy(self, name: str, policy: ProviderPolicy) -> None:
+        """Define a política de um provedor (zera o balde e o disjuntor)."""
+        with self._lock:
+            self._buckets[name] = TokenBucket(policy.qps, policy.burst, clock=self._clock)
+            self._breakers[name] = CircuitBreaker(
+                name, policy.failure_threshold, policy.reset_timeout_s, clock=self._clock
+            )
+
+    def bucket(self, name: str) -> TokenBucket:
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = TokenBucket(0.0, clock=self._clock)
+            return self._buckets[name]
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, 0, clock=self._clock)
+            return self._breakers[name]
+
+    def snapshot(self) -> dict[str, dict]:
+        """Estado de cada provedor: circuito, falhas, aberturas, rejeições e espera no limitador."""
+        with self._lock:
+            names = list(dict.fromkeys([*self._breakers, *self._buckets]))
+        return {
+            name: {
+                "state": self.breaker(name).state,
+                "opens": self.breaker(name).opens,
+                "rejected": self.breaker(name).rejected,
+                "throttled_s": round(self.bucket(name).waited_s, 6),
+            }
+            for name in names
+        }
+
+
+_health = ProviderHealth.from_env()
+
+
+def get_provider_health() -> ProviderHealth:
+    """Retorna os limitadores de vazão e disjuntores do processo."""
+    return _health
+
+
+def set_provider_health(health: ProviderHealth) -> None:
+    """Substitui os limitadores e disjuntores do processo (útil em testes)."""
+    global _health
+    _health = health
+
+
+def provider_health_snapshot() -> dict[str, dict]:
+    """Atalho para get_provider_health().snapshot()."""
+    return _health.snapshot()
+
+
+@contextmanager
+def provider_breaker(name: str) -> Iterator[None]:
+    """
+    Disjuntor em torno de uma chamada lógica ao provedor (que pode fazer várias
+    requisições com retry, cada uma em provider_attempt). Exceções dentro do
+    bloco contam como falha do provedor conforme is_provider_failure.
+
+    Raises:
+        ProviderUnavailableError: Se o circuito do provedor estiver aberto
+    """
+    breaker = _health.breaker(name)
+    breaker.before_call()
+    try:
+        yield
+    except BaseException as e:
+        _record_outcome(breaker, e)
+        raise
+    _record_outcome(breaker, None)
+
+
+@asynccontextmanager
+async def aprovider_breaker(name: str) -> AsyncIterator[None]:
+    """Versão assíncrona de provider_breaker."""
+    breaker = _health.breaker(name)
+    breaker.before_call()
+    try:
+        yield
+    except BaseException as e:
+        _record_outcome(breaker, e)
+        raise
+    _record_outcome(breaker, None)
+
+
+@contextmanager
+def provider_attempt(name: str) -> Iterator[None]:
+    """
+    Uma requisição ao provedor: ficha do limitador de vazão e vaga de
+    concorrência. Envolve cada tentativa (não o retry inteiro), para que
+    retries também passem pelo limitador e a vaga fique livre durante o
+    backoff; a espera pela ficha acontece antes de ocupar a vaga.
+    """
+    _health.bucket(name).acquire()
+    with _limits.slot(name):
+        yield
+
+
+@asynccontextmanager
+async def aprovider_attempt(name: str) -> AsyncIterator[None]:
+    """Versão assíncrona de provider_attempt."""
+    await _health.bucket(name).aacquire()
+    async with _limits.aslot(name):
+        yield
+
+
+@contextmanager
+def provider_call(name: str) -> Iterator[None]:
+    """
+    Envolve uma chamada síncrona ao provedor feita em uma única requisição:
+    disjuntor (falha rápida), vaga de concorrência e ficha do limitador de vazão.
+
+    Raises:
+        ProviderUnavailableError: Se o circuito do provedor estiver aberto
+    """
+    with provider_breaker(name), provider_attempt(name):
+        yield
+
+
+@asynccontextmanager
+async def aprovider_call(name: str) -> AsyncIterator[None]:
+    """Versão assíncrona de provider_call."""
+    async with aprovider_breaker(name), aprovider_attempt(name):
+        yield
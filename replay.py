@@ -0,0 +1,327 @@
+"""
+Gravação/reprodução (record/replay) de buscas no SerpAPI e respostas do LLM.
+
+Permite executar run_market_agent sem rede: as buscas são servidas por um
+servidor HTTP local no formato do SerpAPI (SerpAPIStubServer) e as respostas
+do Gemini por um chat model que reproduz mensagens gravadas (ReplayChatModel),
+ambos com latência injetada configurável.
+
+Formato do fixture (JSON):
+    {
+      "meta": {"api": "create_agent", "mode": "agent", "topic": ..., "start_rev": ...},
+      "searches": {"<query>|<num>|<time_period>": [{"title", "link", "snippet", "date"}, ...]},
+      "llm": {"<hash das mensagens de entrada>": <mensagem serializada>}
+    }
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator
+from urllib.parse import parse_qs, urlsplit
+
+# Import compatível entre versões do LangChain
+try:
+    from langchain_core.callbacks.base import BaseCallbackHandler  # LangChain 0.2+
+except Exception:  # noqa: E722
+    from langchain.callbacks.base import BaseCallbackHandler  # Fallback versões antigas
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from cache import SearchCache, normalize_key, set_search_cache
+from pipeline import message_text
+from providers import GEMINI, aprovider_slot, provider_slot
+
+
+Latency = float | Callable[[], float]
+
+
+def search_key(query: str, num: int, time_period: str | None) -> str:
+    """Chave de uma busca no fixture (mesma normalização do cache do web_search)."""
+    q, n, tp = normalize_key(query, num, time_period)
+    return f"{q}|{n}|{tp}"
+
+
+def llm_key(messages: list) -> str:
+    """
+    Chave de uma chamada ao LLM: hash do conteúdo das mensagens de entrada.
+
+    Ignora ids e metadados, para que a mesma conversa reproduzida (mesmas
+    buscas e ferramentas) encontre a resposta gravada, inclusive com várias
+    execuções concorrentes compartilhando o mesmo modelo.
+    """
+    parts = []
+    for message in messages:
+        if isinstance(message, str):
+            parts.append(["human", message])
+            continue
+        calls = [[c["name"], c["args"]] for c in getattr(message, "tool_calls", None) or []]
+        parts.append([message.type, message_text(message), calls])
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Fixture:
+    """Buscas e respostas do LLM gravadas para reprodução."""
+    searches: dict[str, list[dict[str, Any]]] = field(default_factory=dict)
+    llm: dict[str, dict[str, Any]] = field(default_factory=dict)
+    meta: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: str) -> "Fixture":
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(searches=data.get("searches", {}), llm=data.get("llm", {}), meta=data.get("meta", {}))
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"meta": self.meta, "searches": self.searches, "llm": self.llm},
+                      fh, ensure_ascii=False, indent=2)
+
+    def response(self, messages: list) -> AIMessage:
+        """
+        Resposta gravada para as mensagens de entrada.
+
+        Raises:
+            KeyError: Se a conversa não foi gravada
+        """
+        key = llm_key(messages)
+        if key not in self.llm:
+            raise KeyError(f"Resposta do LLM não gravada no fixture (chave {key[:12]}).")
+        return messages_from_dict([self.llm[key]])[0]
+
+
+def _delay(latency: Latency) -> float:
+    return latency() if callable(latency) else latency
+
+
+# --------------------------------------------------------------------- gravação
+
+class RecordingSearchCache(SearchCache):
+    """
+    Cache do web_search que nunca devolve entradas (força a chamada real) e
+    grava cada resultado obtido no fixture.
+    """
+
+    def __init__(self, fixture: Fixture):
+        super().__init__(":memory:")
+        self.fixture = fixture
+
+    def get(self, query: str, num: int, time_period: str | None):
+        return None
+
+    def set(self, query: str, num: int, time_period: str | None, results: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self.fixture.searches[search_key(query, num, time_period)] = results
+
+
+class LLMRecorder(BaseCallbackHandler):
+    """Callback que grava no fixture cada resposta do LLM, chaveada pelas mensagens de entrada."""
+
+    run_inline = True
+
+    def __init__(self, fixture: Fixture):
+        self.fixture = fixture
+        self._inputs: dict[Any, list] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any) -> None:
+        with self._lock:
+            self._inputs[run_id] = messages[0]
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        with self._lock:
+            messages = self._inputs.pop(run_id, None)
+        if messages is None:
+            return
+        message = response.generations[0][0].message
+        # Mensagens de streaming (chunks) são gravadas como AIMessage completas
+        message = AIMessage(
+            content=message.content,
+            tool_calls=getattr(message, "tool_calls", None) or [],
+            usage_metadata=getattr(message, "usage_metadata", None),
+        )
+        with self._lock:
+            self.fixture.llm[llm_key(messages)] = message_to_dict(message)
+
+
+def record_run(
+    path: str,
+    topic: str,
+    start_rev: float,
+    end_rev: float,
+    months: float,
+    mode: str | None = None,
+) -> str:
+    """
+    Executa run_market_agent com SerpAPI e Gemini reais e grava o fixture em path.
+
+    Returns:
+        Relatório gerado
+    """
+    from agent_market import detect_agent_api, resolve_mode, run_market_agent
+
+    mode = resolve_mode(mode)
+    fixture = Fixture(meta={
+        "api": detect_agent_api() if mode == "agent" else None,
+        "mode": mode,
+        "topic": topic,
+        "start_rev": start_rev,
+        "end_rev": end_rev,
+        "months": months,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    set_search_cache(RecordingSearchCache(fixture))
+    try:
+        report = run_market_agent(
+            topic, start_rev, end_rev, months, mode=mode,
+            callbacks=[LLMRecorder(fixture)], use_cache=False,
+        )
+    finally:
+        set_search_cache(None)
+    fixture.meta["steps"] = len(fixture.llm)
+    fixture.save(path)
+    return report
+
+
+# ------------------------------------------------------------------- reprodução
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Chat model que reproduz as respostas gravadas em um Fixture, com latência injetada.
+
+    Respeita o limite de concorrência do provedor Gemini (providers.py), como o
+    modelo real.
+    """
+    fixture: Fixture
+    latency: Any = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with provider_slot(GEMINI):
+            time.sleep(_delay(self.latency))
+            return ChatResult(generations=[ChatGeneration(message=self.fixture.response(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        async with aprovider_slot(GEMINI):
+            await asyncio.sleep(_delay(self.latency))
+            return ChatResult(generations=[ChatGeneration(message=self.fixture.response(messages))])
+
+
+class SerpAPIStubServer:
+    """
+    Servidor HTTP local que responde como o SerpAPI a partir do fixture.
+
+    Consultas não gravadas recebem 404. Use como context manager; `url` é o
+    endereço a configurar em SERPAPI_URL.
+    """
+
+    def __init__(self, fixture: Fixture, latency: Latency = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.fixture = fixture
+        self.latency = latency
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+                stub.requests += 1
+                time.sleep(_delay(stub.latency))
+                key = search_key(params.get("q", ""), int(params.get("num", 5)), params.get("tbs"))
+                results = stub.fixture.searches.get(key)
+                if results is None:
+                    body, status = {"error": f"Busca não gravada: {key}"}, 404
+                else:
+                    body, status = {"organic_results": results}, 200
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/search.json"
+
+    def start(self) -> "SerpAPIStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="serpapi-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "SerpAPIStubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+@contextmanager
+def replay_environment(fixture: Fixture, search_latency: Latency = 0.0) -> Iterator[SerpAPIStubServer]:
+    """
+    Aponta o web_search para um SerpAPIStubServer e desativa os caches de busca e
+    de relatórios e o armazém de fontes, restaurando o ambiente ao sair. O servidor local não tem cota:
+    limitadores de vazão e disjuntores (providers.py) ficam desligados durante a
+    reprodução.
+
+    Clientes httpx assíncronos ficam presos ao event loop: feche-os com
+    http_client.aclose_async_client() no loop que os usou.
+    """
+    from http_client import reset_session
+    from providers import ProviderHealth, get_provider_health, set_provider_health
+    from source_store import get_source_store, set_source_store
+
+    overrides = {
+        "SERPAPI_API_KEY": os.getenv("SERPAPI_API_KEY") or "replay",
+        "SEARCH_CACHE_DISABLED": "1",
+        "REPORT_CACHE_DISABLED": "1",
+        "SOURCE_STORE_ENABLED": "0",
+    }
+    saved = {name: os.environ.get(name) for name in (*overrides, "SERPAPI_URL")}
+    saved_health = get_provider_health()
+    saved_store = get_source_store()
+    with SerpAPIStubServer(fixture, latency=search_latency) as server:
+        os.environ.update(overrides, SERPAPI_URL=server.url)
+        set_provider_health(ProviderHealth())
+        set_source_store(None)
+        try:
+            yield server
+        finally:
+            set_provider_health(saved_health)
+            set_source_store(saved_store)
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            # Conexões keep-alive apontam para o servidor encerrado
+            reset_session()
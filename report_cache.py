@@ -0,0 +1,443 @@
+"""
+Cache de relatórios completos (SQLite + índice vetorial local em NumPy).
+
+Chaveado pelo tema normalizado e pelos parâmetros da análise (CAGR, modo e
+modelo). Além da chave exata, um índice de embeddings opcional encontra temas
+parafraseados ("IoT na logística" ≈ "Internet das Coisas em logística").
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+from cache import _env_float
+from tools import canonical_url
+
+
+DEFAULT_MAX_AGE = 24 * 60 * 60   # relatórios valem por 1 dia
+DEFAULT_SIMILARITY = 0.92        # similaridade de cosseno mínima para reaproveitar
+HASH_EMBEDDING_DIM = 256
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+
+Embedder = Callable[[str], Sequence[float]]
+
+
+def normalize_topic(topic: str) -> str:
+    """Tema em minúsculas, sem acentos e com espaços colapsados."""
+    decomposed = unicodedata.normalize("NFKD", topic.lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.split())
+
+
+def params_key(start_rev: float, end_rev: float, months: float, variant: str = "") -> str:
+    """Chave dos parâmetros da análise (CAGR + variante, ex.: modo e modelo)."""
+    return f"{float(start_rev):.6g}|{float(end_rev):.6g}|{float(months):.6g}|{variant}"
+
+
+def results_fingerprint(results: list[dict[str, Any]]) -> str:
+    """
+    Impressão digital dos resultados de busca (URLs canônicas, sem ordem).
+
+    Se a busca passar a devolver outras fontes, a impressão digital muda e os
+    relatórios baseados nos resultados antigos são invalidados.
+    """
+    links = sorted({canonical_url(r["link"]) for r in results if r.get("link")})
+    return hashlib.sha1("\n".join(links).encode("utf-8")).hexdigest()
+
+
+def hashing_embedding(text: str, dim: int = HASH_EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embedding local e determinístico (hashing de palavras e trigramas de caracteres).
+
+    Não captura sinônimos, mas aproxima variações de grafia e de ordem das
+    palavras sem chamadas de rede: "logística em blockchain" ≈ "blockchain
+    em logística" (0,95, acima do DEFAULT_SIMILARITY). Preposições trocadas
+    ("blockchain na logística", ~0,80) só casam com um REPORT_CACHE_SIMILARITY
+    menor, que também aceita temas mais específicos ("logística reversa", ~0,87).
+    """
+    normalized = normalize_topic(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in normalized.split():
+        vector[zlib.crc32(word.encode()) % dim] += 1.0
+    padded = f" {normalized} "
+    for i in range(len(padded) - 2):
+        vector[zlib.crc32(padded[i:i + 3].encode()) % dim] += 0.5
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _embedder_name(embed: Embedder) -> str:
+    if embed is hashing_embedding:
+        return "hash"
+    name = getattr(embed, "__qualname__", None) or type(embed).__qualname__
+    return f"{getattr(embed, '__module__', '')}.{name}"
+
+
+def gemini_embedder(model: str = GEMINI_EMBEDDING_MODEL) -> Embedder:
+    """Embedder remoto via GoogleGenerativeAIEmbeddings (requer GEMINI_API_KEY)."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    embeddings = GoogleGenerativeAIEmbeddings(model=model, google_api_key=os.getenv("GEMINI_API_KEY"))
+    return embeddings.embed_query
+
+
+class VectorIndex:
+    """
+    Índice vetorial em memória (busca exaustiva por similaridade de cosseno).
+
+    Adequado para milhares de entradas: a busca é um único produto
+    matriz-vetor em NumPy.
+    """
+
+    def __init__(self):
+        self._keys: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._matrix: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def dim(self) -> int | None:
+        """Dimensão dos vetores indexados (None se vazio)."""
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    def add(self, key: str, vector: Sequence[float]) -> None:
+        """
+        Adiciona (ou substitui) o vetor de uma chave.
+
+        Raises:
+            ValueError: Se a dimensão diferir da dos vetores já indexados
+        """
+        v = np.asarray(vector, dtype=np.float32)
+        if self.dim is not None and v.shape != (self.dim,):
+            raise ValueError(f"Vetor com dimensão {v.size}, esperada {self.dim}.")
+        norm = np.linalg.norm(v)
+        v = v / norm if norm else v
+        if key in self._positions:
+            self._matrix[self._positions[key]] = v
+            return
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+        self._matrix = v[None, :] if self._matrix is None else np.vstack([self._matrix, v])
+
+    def remove(self, key: str) -> None:
+        pos = self._positions.pop(key, None)
+        if pos is None:
+            return
+        self._keys.pop(pos)
+        self._matrix = np.delete(self._matrix, pos, axis=0)
+        if not self._keys:
+            self._matrix = None
+        for k in self._keys[pos:]:
+            self._positions[k] -= 1
+
+    def search(self, vector: Sequence[float], candidates: set[str] | None = None) -> tuple[str, float] | None:
+        """
+        Retorna (chave, similaridade) mais próxima, restrita a `candidates` se informado
+        (None se o índice estiver vazio ou o vetor tiver outra dimensão).
+        """
+        if self._matrix is None:
+            return None
+        v = np.asarray(vector, dtype=np.float32)
+        if v.shape != (self.dim,):
+            return None
+        norm = np.linalg.norm(v)
+        if not norm:
+            return None
+        scores = self._matrix @ (v / norm)
+        if candidates is not None:
+            mask = np.fromiter((k in candidates for k in self._keys), dtype=bool, count=len(self._keys))
+            if not mask.any():
+                return None
+            scores = np.where(mask, scores, -np.inf)
+        best = int(np.argmax(scores))
+        return self._keys[best], float(scores[best])
+
+
+@dataclass
+class CachedReport:
+    """Relatório servido pelo cache."""
+    report: str
+    topic: str
+    created_at: float
+    match: str          # "exact" ou "similar"
+    score: float = 1.0  # similaridade de cosseno (1.0 para chave exata)
+
+
+class ReportCache:
+    """
+    Cache de relatórios em SQLite com janela de validade, despejo LRU e busca
+    por similaridade opcional (embedding do tema em um VectorIndex).
+
+    A busca por similaridade só compara entradas com os mesmos parâmetros
+    (start_rev/end_rev/months e variante). Entradas cuja impressão digital de
+    busca difere da informada em get() são invalidadas. Cada embedding guarda
+    o nome do embedder que o gerou; ao reabrir com outro embedder (ou outra
+    dimensão), essas entradas valem só pela chave exata até serem regravadas.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_age: float = DEFAULT_MAX_AGE,
+        max_entries: int = 500,
+        embed: Embedder | None = None,
+        similarity: float = DEFAULT_SIMILARITY,
+        embed_name: str | None = None,
+    ):
+        """
+        Args:
+            embed_name: Identifica o embedder nos vetores gravados (padrão:
+                "hash" para hashing_embedding, senão módulo e nome do callable)
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries deve ser maior que zero.")
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.embed = embed
+        self.embed_name = (embed_name or _embedder_name(embed)) if embed is not None else None
+        self.similarity = similarity
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = VectorIndex()
+        self._params: dict[str, str] = {}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_cache (
+                key TEXT PRIMARY KEY,
+                topic TEXT NOT NULL,
+                params TEXT NOT NULL,
+                report TEXT NOT NULL,
+                fingerprint TEXT,
+                embedding BLOB,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                embedder TEXT
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(report_cache)")}
+        if "embedder" not in columns:
+            # Arquivos criados antes da coluna: os vetores antigos ficam sem embedder conhecido
+            self._conn.execute("ALTER TABLE report_cache ADD COLUMN embedder TEXT")
+        self._conn.commit()
+        rows = self._conn.execute("SELECT key, params, embedding, embedder FROM report_cache").fetchall()
+        for key, params, blob, embedder in rows:
+            self._params[key] = params
+            # Vetores de outro embedder não são comparáveis com os do atual
+            if blob is None or embedder is None or embedder != self.embed_name:
+                continue
+            try:
+                self._index.add(key, np.frombuffer(blob, dtype=np.float32))
+            except ValueError:
+                continue
+
+    @classmethod
+    def from_env(cls) -> "ReportCache":
+        """
+        Cria o cache a partir das variáveis de ambiente: REPORT_CACHE_PATH,
+        REPORT_CACHE_MAX_AGE, REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_SIMILARITY e
+        REPORT_CACHE_EMBEDDINGS ('' para só chave exata, 'hash' ou 'gemini').
+        """
+        embeddings = os.getenv("REPORT_CACHE_EMBEDDINGS", "").lower()
+        if embeddings not in ("", "none", "hash", "gemini"):
+            raise ValueError(f"REPORT_CACHE_EMBEDDINGS inválido: {embeddings!r} (use hash ou gemini)")
+        embed = None
+        if embeddings == "hash":
+            embed = hashing_embedding
+        elif embeddings == "gemini":
+            embed = gemini_embedder()
+        return cls(
+            path=os.getenv("REPORT_CACHE_PATH", os.path.join(".cache", "reports.sqlite3")),
+            max_age=_env_float("REPORT_CACHE_MAX_AGE", DEFAULT_MAX_AGE),
+            max_entries=int(_env_float("REPORT_CACHE_MAX_ENTRIES", 500)),
+            embed=embed,
+            similarity=_env_float("REPORT_CACHE_SIMILARITY", DEFAULT_SIMILARITY),
+            embed_name=f"gemini:{GEMINI_EMBEDDING_MODEL}" if embeddings == "gemini" else None,
+        )
+
+    @staticmethod
+    def _key(topic: str, params: str) -> str:
+        return f"{normalize_topic(topic)}|{params}"
+
+    def _delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM report_cache WHERE key = ?", (key,))
+        self._params.pop(key, None)
+        self._index.remove(key)
+
+    def _usable(self, key: str, now: float, fingerprint: str | None) -> tuple | None:
+        row = self._conn.execute(
+            "SELECT topic, report, fingerprint, created_at FROM report_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        stale = now - row[3] > self.max_age
+        changed = fingerprint is not None and row[2] is not None and row[2] != fingerprint
+        if stale or changed:
+            self._delete(key)
+            self.invalidations += 1
+            return None
+        return row
+
+    def get(self, topic: str, params: str, fingerprint: str | None = None) -> CachedReport | None:
+        """
+        Busca um relatório por chave exata e, se houver embedder, por similaridade.
+
+        Args:
+            topic: Tema da análise
+            params: Chave dos parâmetros (ver params_key)
+            fingerprint: Impressão digital atual da busca (ver results_fingerprint);
+                entradas com outra impressão digital são invalidadas
+
+        Returns:
+            CachedReport, ou None se não houver entrada válida
+        """
+        key = self._key(topic, params)
+        now = time.time()
+        match, score = "exact", 1.0
+        with self._lock:
+            row = self._usable(key, now, fingerprint)
+            self._conn.commit()
+            candidates = {k for k, p in self._params.items() if p == params} if row is None else set()
+        if candidates and self.embed is not None:
+            # O embedding (possivelmente remoto) só é calculado se a chave exata falhar
+            vector = self.embed(normalize_topic(topic))
+            with self._lock:
+                found = self._index.search(vector, candidates)
+                if found is not None and found[1] >= self.similarity:
+                    key, score = found
+                    match = "similar"
+                    row = self._usable(key, now, fingerprint)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE report_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            if match == "similar":
+                self.similar_hits += 1
+        return CachedReport(report=row[1], topic=row[0], created_at=row[3], match=match, score=score)
+
+    def set(self, topic: str, params: str, report: str, fingerprint: str | None = None) -> None:
+        """Armazena um relatório e aplica o despejo LRU se o limite for excedido."""
+        key = self._key(topic, params)
+        vector = np.asarray(self.embed(normalize_topic(topic)), dtype=np.float32) if self.embed else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO report_cache "
+                "(key, topic, params, report, fingerprint, embedding, created_at, last_access, embedder) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, topic, params, report, fingerprint,
+                 vector.tobytes() if vector is not None else None, now, now, self.embed_name),
+            )
+            self._params[key] = params
+            if vector is not None:
+                if self._index.dim not in (None, vector.size):
+                    # O embedder mudou de dimensão: os vetores antigos deixam de ser comparáveis
+                    self._index = VectorIndex()
+                self._index.add(key, vector)
+            excess = len(self._params) - self.max_entries
+            if excess > 0:
+                oldest = self._conn.execute(
+                    "SELECT key FROM report_cache ORDER BY last_access ASC LIMIT ?", (excess,)
+                ).fetchall()
+                for (old_key,) in oldest:
+                    self._delete(old_key)
+                self.evictions += len(oldest)
+            self._conn.commit()
+
+    def invalidate(self, topic: str | None = None) -> int:
+        """
+        Remove as entradas de um tema (normalizado), ou todas se topic for None.
+
+        Returns:
+            Número de entradas removidas
+        """
+        with self._lock:
+            if topic is None:
+                keys = list(self._params)
+            else:
+                prefix = normalize_topic(topic) + "|"
+                keys = [k for k in self._params if k.startswith(prefix)]
+            for key in keys:
+                self._delete(key)
+            self._conn.commit()
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove todas as entradas e zera os contadores."""
+        self.invalidate()
+        with self._lock:
+            self.hits = self.similar_hits = self.misses = self.invalidations = self.evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._params)
+
+    def stats(self) -> dict[str, Any]:
+        """Retorna os contadores de uso do cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: ReportCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_report_cache(create: bool = True) -> ReportCache | None:
+    """
+    Retorna o cache de relatórios do processo (criado sob demanda a partir do ambiente).
+
+    Retorna None se REPORT_CACHE_DISABLED estiver definido como 1/true. Com create=False,
+    não cria o cache (nem o arquivo SQLite): retorna só o já inicializado.
+    """
+    global _default_cache
+    if os.getenv("REPORT_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    if _default_cache is None and not create:
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ReportCache.from_env()
+    return _default_cache
+
+
+def set_report_cache(cache: ReportCache | None) -> None:
+    """Substitui o cache de relatórios do processo (útil em testes)."""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
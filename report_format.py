@@ -0,0 +1,115 @@
+"""
+Validação do formato do relatório final (independente do modelo que o escreveu).
+
+O relatório exigido pelas instruções do agente e do pipeline tem EXATAMENTE 4
+parágrafos, cita 2 fontes com o link completo e menciona o CAGR em formato
+XX,XX%. validate_report confere essa estrutura sem chamar o LLM; é usado pela
+cascata de modelos (cascade.py) para decidir se a resposta de um modelo mais
+barato pode ser aceita, e pode ser usado sozinho (testes, batch, replay).
+"""
+import re
+from dataclasses import dataclass, field
+
+from tools import canonical_url
+
+
+REQUIRED_PARAGRAPHS = 4
+REQUIRED_URLS = 2
+
+# Parágrafos separados por linha em branco
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+
+# URL até espaço, aspas ou delimitadores de Markdown; pontuação final é removida
+_URL = re.compile(r"https?://[^\s<>()\[\]\"'`]+")
+_URL_TRAILING = ".,;:!?*_"
+
+# Percentual com vírgula decimal e 2 casas (ex.: 44,00% ou -3,10 %)
+_CAGR = re.compile(r"(?<![\d.,])-?\d+,\d{2}\s?%")
+
+
+def format_cagr(value: float) -> str:
+    """CAGR decimal no formato do relatório (ex.: 0.4422 -> '44,22%')."""
+    return f"{value * 100:.2f}".replace(".", ",") + "%"
+
+
+def report_paragraphs(text: str) -> list[str]:
+    """Parágrafos não vazios do relatório (blocos separados por linha em branco)."""
+    return [p.strip() for p in _PARAGRAPH_SPLIT.split(text.strip()) if p.strip()]
+
+
+def report_urls(text: str) -> list[str]:
+    """URLs citadas no relatório, sem repetições (comparadas pela URL canônica), na ordem do texto."""
+    urls: list[str] = []
+    seen: set[str] = set()
+    for match in _URL.finditer(text):
+        url = match.group(0).rstrip(_URL_TRAILING)
+        key = canonical_url(url)
+        if key not in seen:
+            seen.add(key)
+            urls.append(url)
+    return urls
+
+
+def report_cagr_values(text: str) -> list[str]:
+    """Percentuais no formato XX,XX% citados no relatório (espaços antes do % removidos)."""
+    return [m.group(0).replace(" ", "") for m in _CAGR.finditer(text)]
+
+
+@dataclass
+class ReportCheck:
+    """
+    Resultado de validate_report.
+
+    Attributes:
+        valid: O relatório cumpre todas as regras
+        problems: Descrição de cada regra violada (vazia se válido)
+        paragraphs: Número de parágrafos encontrados
+        urls: URLs distintas citadas
+        cagr_values: Percentuais XX,XX% encontrados
+    """
+    valid: bool
+    problems: list[str] = field(default_factory=list)
+    paragraphs: int = 0
+    urls: list[str] = field(default_factory=list)
+    cagr_values: list[str] = field(default_factory=list)
+
+
+def validate_report(
+    text: str | None,
+    cagr: float | None = None,
+    paragraphs: int = REQUIRED_PARAGRAPHS,
+    min_urls: int = REQUIRED_URLS,
+) -> ReportCheck:
+    """
+    Confere a estrutura do relatório final.
+
+    Args:
+        text: Relatório a validar
+        cagr: CAGR esperado (decimal, ex.: calc_cagr(...)); se informado, o
+            valor formatado (ver format_cagr) precisa aparecer no texto
+        paragraphs: Número exato de parágrafos exigido
+        min_urls: Mínimo de URLs distintas citadas
+
+    Returns:
+        ReportCheck com o veredito e os problemas encontrados
+    """
+    text = text or ""
+    found_paragraphs = report_paragraphs(text)
+    urls = report_urls(text)
+    values = report_cagr_values(text)
+    problems = []
+    if len(found_paragraphs) != paragraphs:
+        problems.append(f"{len(found_paragraphs)} parágrafo(s), esperados {paragraphs}")
+    if len(urls) < min_urls:
+        problems.append(f"{len(urls)} URL(s) citada(s), esperadas ao menos {min_urls}")
+    if not values:
+        problems.append("CAGR no formato XX,XX% ausente")
+    elif cagr is not None and format_cagr(cagr) not in values:
+        problems.append(f"CAGR {format_cagr(cagr)} ausente (encontrado: {', '.join(values)})")
+    return ReportCheck(
+        valid=not problems,
+        problems=problems,
+        paragraphs=len(found_paragraphs),
+        urls=urls,
+        cagr_values=values,
+    )
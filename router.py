@@ -1,31 +1,253 @@
 """
 Roteador para múltiplos domínios de análise.
-Preparado para expansão futura.
+
+Cada domínio se registra em um DomainRegistry com suas palavras-chave/sinônimos
+e a fábrica do seu agente. As palavras-chave de todos os domínios são
+compiladas em uma única expressão regular em forma de trie (prefixos comuns
+fatorados), aplicada sobre a consulta normalizada (minúsculas, sem acentos):
+o roteamento percorre a consulta uma vez, qualquer que seja o número de
+domínios e palavras-chave.
 """
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+
+DEFAULT_DOMAIN = "logistica"
+
+
+def normalize_text(text: str) -> str:
+    """Texto em minúsculas, sem acentos e com espaços colapsados."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.split())
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Alternativa regex equivalente a (w1|w2|...), fatorada como trie.
+
+    Em cada posição da consulta o motor de regex segue um único ramo por
+    caractere, em vez de testar cada palavra-chave.
+    """
+    trie: dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: dict[str, Any]) -> str:
+        ends_here = "" in node
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        # Quantificador guloso: prefere a palavra-chave mais longa
+        return group + "?" if ends_here else group
+
+    return emit(trie)
+
+
+@dataclass(frozen=True)
+class Domain:
+    """
+    Domínio de análise registrado no roteador.
+
+    Attributes:
+        name: Identificador do domínio (ex.: 'logistica')
+        keywords: Palavras-chave e sinônimos (qualquer caixa/acentuação)
+        factory: Função sem argumentos que devolve o agente do domínio, com
+            run(topic, start_rev, end_rev, months, mode=..., callbacks=...) e
+            stream(...) (ex.: agent_market.MarketAgent); None = não implementado
+        label: Nome exibido ao usuário
+    """
+    name: str
+    keywords: tuple[str, ...]
+    factory: Callable[[], Any] | None = None
+    label: str = ""
+
+
+@dataclass(frozen=True)
+class RouteMatch:
+    """Resultado do roteamento: domínio escolhido, pontuação e palavras-chave encontradas."""
+    domain: str
+    score: float
+    matches: tuple[str, ...] = ()
+
+
+class DomainRegistry:
+    """
+    Registro de domínios com índice de palavras-chave pré-compilado.
+
+    A pontuação de um domínio é a soma das palavras-chave encontradas na
+    consulta, cada uma pesando o seu número de palavras (frases específicas,
+    como "cadeia de suprimentos", valem mais que termos isolados). Empates
+    ficam com o domínio registrado primeiro; sem nenhuma palavra-chave, vale
+    o domínio padrão.
+    """
+
+    def __init__(self, default: str = DEFAULT_DOMAIN):
+        self.default = default
+        self._domains: dict[str, Domain] = {}
+        self._lock = threading.Lock()
+        self._pattern: re.Pattern | None = None
+        self._keyword_domains: dict[str, tuple[str, ...]] = {}
+
+    def register(
+        self,
+        name: str,
+        keywords: Iterable[str],
+        factory: Callable[[], Any] | None = None,
+        label: str = "",
+    ) -> Domain:
+        """
+        Registra (ou substitui) um domínio; o índice é recompilado no próximo roteamento.
+
+        Raises:
+            ValueError: Se nenhuma palavra-chave válida for informada
+        """
+        normalized = tuple(dict.fromkeys(k for k in (normalize_text(k) for k in keywords) if k))
+        if not normalized:
+            raise ValueError(f"Domínio '{name}' sem palavras-chave.")
+        domain = Domain(name=name, keywords=normalized, factory=factory, label=label or name)
+        with self._lock:
+            self._domains[name] = domain
+            self._pattern = None
+        return domain
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._domains.pop(name, None)
+            self._pattern = None
+
+    def get(self, name: str) -> Domain:
+        """
+        Raises:
+            KeyError: Se o domínio não estiver registrado
+        """
+        domain = self._domains.get(name)
+        if domain is None:
+            raise KeyError(f"Domínio não registrado: {name}")
+        return domain
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._domains)
+
+    def _index(self) -> tuple[re.Pattern | None, dict[str, tuple[str, ...]]]:
+        with self._lock:
+            if self._pattern is None and self._domains:
+                owners: dict[str, list[str]] = {}
+                for domain in self._domains.values():
+                    for keyword in domain.keywords:
+                        owners.setdefault(keyword, []).append(domain.name)
+                self._keyword_domains = {k: tuple(v) for k, v in owners.items()}
+                # Limites de palavra nas duas pontas; plural simples ("s") opcional
+                self._pattern = re.compile(rf"(?<!\w)({_trie_pattern(owners)})s?(?!\w)")
+            return self._pattern, self._keyword_domains
+
+    def route(self, user_query: str) -> RouteMatch:
+        """Pontua os domínios para a consulta e devolve o melhor (ou o padrão)."""
+        pattern, keyword_domains = self._index()
+        if pattern is None:
+            return RouteMatch(self.default, 0.0)
+        scores: dict[str, float] = {}
+        matches: list[str] = []
+        for match in pattern.finditer(normalize_text(user_query)):
+            keyword = match.group(1)
+            matches.append(keyword)
+            for name in keyword_domains[keyword]:
+                scores[name] = scores.get(name, 0.0) + len(keyword.split())
+        if not scores:
+            return RouteMatch(self.default, 0.0, tuple(matches))
+        order = {name: i for i, name in enumerate(self._domains)}
+        best = min(scores, key=lambda name: (-scores[name], order.get(name, len(order))))
+        return RouteMatch(best, scores[best], tuple(matches))
+
+    def agent(self, name: str) -> Any:
+        """
+        Instancia (ou obtém) o agente do domínio pela fábrica registrada.
+
+        Raises:
+            KeyError: Se o domínio não estiver registrado
+            NotImplementedError: Se o domínio não tiver fábrica de agente
+        """
+        domain = self.get(name)
+        if domain.factory is None:
+            raise NotImplementedError(f"Domínio '{name}' ainda não implementado.")
+        return domain.factory()
+
+
+def market_agent_factory() -> Any:
+    """
+    Agente de análise de mercado (agent_market.py), importado apenas no primeiro uso;
+    a cascata de modelos (cascade.py), se MODEL_CASCADE estiver definido.
+    """
+    from agent_market import get_market_agent
+    from cascade import get_model_cascade
+    return get_model_cascade() or get_market_agent()
+
+
+registry = DomainRegistry()
+
+registry.register(
+    "logistica",
+    [
+        "logística", "logistica", "supply chain", "cadeia de suprimentos", "cadeia de abastecimento",
+        "transporte", "frete", "armazém", "armazenagem", "centro de distribuição", "estoque",
+        "last mile", "última milha", "entrega", "rastreamento de cargas", "carga", "frota",
+        "porto", "intermodal", "WMS", "TMS", "fulfillment",
+    ],
+    factory=market_agent_factory,
+    label="Logística",
+)
+registry.register(
+    "financas",
+    [
+        "finanças", "financas", "financeiro", "mercado financeiro", "banco", "bancário", "fintech",
+        "pagamento", "pagamentos instantâneos", "Pix", "crédito", "seguro", "insurtech",
+        "investimento em ações", "bolsa de valores", "criptomoeda", "cripto", "DeFi",
+        "open finance", "open banking", "câmbio", "tesouraria", "renda fixa",
+    ],
+    factory=market_agent_factory,
+    label="Finanças",
+)
+registry.register(
+    "saude",
+    [
+        "saúde", "saude", "healthtech", "hospital", "clínica", "telemedicina", "medicamento",
+        "farmacêutica", "fármaco", "diagnóstico", "prontuário eletrônico", "dispositivo médico",
+        "biotecnologia", "genômica", "plano de saúde", "paciente", "vacina",
+    ],
+    factory=market_agent_factory,
+    label="Saúde",
+)
+registry.register(
+    "tecnologia",
+    [
+        "tecnologia", "software", "SaaS", "nuvem", "cloud", "computação em nuvem",
+        "inteligência artificial", "IA", "machine learning", "aprendizado de máquina",
+        "semicondutor", "chip", "data center", "cibersegurança", "5G", "IoT",
+        "internet das coisas", "computação quântica", "robótica", "edge computing",
+    ],
+    factory=market_agent_factory,
+    label="Tecnologia",
+)
 
 
 def pick_domain(user_query: str) -> str:
     """
     Seleciona o domínio apropriado baseado na consulta do usuário.
-    
+
     Args:
         user_query: Consulta ou objetivo do usuário
-    
-    Returns:
-        Nome do domínio (ex.: 'logistica', 'financas', 'tecnologia')
-    """
-    q = user_query.lower()
-    
-    # Regras simples de roteamento
-    if "logística" in q or "logistica" in q or "supply chain" in q:
-        return "logistica"
-    
-    # Futuras expansões:
-    # if "finanças" in q or "financas" in q:
-    #     return "financas"
-    # if "saúde" in q or "saude" in q:
-    #     return "saude"
-    
-    # Default: logística
-    return "logistica"
 
+    Returns:
+        Nome do domínio (ex.: 'logistica', 'financas', 'tecnologia'); padrão 'logistica'
+    """
+    return registry.route(user_query).domain
@@ -0,0 +1,83 @@
+"""
+Lote de resultados do web_search com o JSON serializado uma única vez.
+
+Os mesmos resultados passam pelo cache (SQLite), pelos callbacks/logs e pelo
+prompt (compaction.py). SearchResults é a lista normalizada de
+{title, link, snippet, date} que guarda a própria serialização (orjson):
+o web_search a cria ao normalizar a resposta do SerpAPI, o cache grava e lê o
+JSON sem recodificar e o pipeline reaproveita o mesmo texto como observação
+da ferramenta.
+"""
+import json
+from typing import Any, Iterable
+
+# orjson é dependência do LangChain (langsmith); sem ele, usa o json da biblioteca padrão
+try:
+    import orjson
+except ImportError:  # noqa: E722
+    orjson = None
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """
+    JSON compacto (separadores "," e ":") ou com indentação de 2 espaços,
+    sem escapar caracteres não ASCII (igual a json.dumps(ensure_ascii=False)).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(text: str | bytes) -> Any:
+    """Interpreta JSON (str ou bytes)."""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+class SearchResults(list):
+    """
+    Resultados normalizados do web_search com o JSON memorizado.
+
+    É uma lista de dicionários (compatível com todo o código que já consome
+    os resultados); `json` e `pretty` são calculados no primeiro acesso e
+    reaproveitados. Trate o lote como imutável: alterações depois da
+    serialização não são refletidas no JSON memorizado.
+    """
+
+    __slots__ = ("_json", "_pretty")
+
+    def __init__(self, items: Iterable[dict[str, Any]] = (), payload: str | None = None):
+        super().__init__(items)
+        self._json = payload
+        self._pretty: str | None = None
+
+    @classmethod
+    def from_json(cls, payload: str | bytes) -> "SearchResults":
+        """Lote a partir do JSON gravado (ex.: cache), mantendo o texto como serialização."""
+        text = payload.decode("utf-8") if isinstance(payload, bytes) else payload
+        return cls(loads(text), payload=text)
+
+    @property
+    def json(self) -> str:
+        """JSON compacto (cache, logs e observação da ferramenta)."""
+        if self._json is None:
+            self._json = dumps(self)
+        return self._json
+
+    @property
+    def pretty(self) -> str:
+        """JSON com indentação de 2 espaços (referência de tokens da compactação)."""
+        if self._pretty is None:
+            self._pretty = dumps(self, indent=True)
+        return self._pretty
+
+
+def to_json(results: list[dict[str, Any]]) -> str:
+    """JSON compacto dos resultados, reaproveitando a serialização de um SearchResults."""
+    return results.json if isinstance(results, SearchResults) else dumps(results)
+
+
+def to_pretty_json(results: list[dict[str, Any]]) -> str:
+    """JSON indentado dos resultados, reaproveitando a serialização de um SearchResults."""
+    return results.pretty if isinstance(results, SearchResults) else dumps(results, indent=True)
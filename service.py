@@ -0,0 +1,491 @@
+"""
+Serviço HTTP local de relatórios de mercado (processo de longa duração).
+
+- Pool aquecido: cada worker tem o seu MarketAgent (cliente Gemini e grafo do
+  agente já construídos), criado na inicialização e reutilizado entre requisições.
+- Single-flight: requisições idênticas (tema normalizado + parâmetros + modo)
+  que chegam enquanto a primeira está em andamento não disparam outra
+  execução; todas recebem o mesmo relatório (ou os mesmos eventos). Com e sem
+  streaming se juntam à mesma execução; quem pede streaming e entra em uma
+  execução sem streaming recebe só o evento final.
+- Controle de admissão: no máximo `workers` execuções em andamento e
+  `max_queue` aguardando; além disso, a requisição é rejeitada com 503.
+
+Endpoints:
+    POST /reports         {"topic", "start_rev", "end_rev", "months", "mode"?} → JSON com o relatório
+    POST /reports/stream  mesmo corpo → eventos de streaming (streaming.py), um JSON por linha
+    GET  /healthz         estado do pool
+    GET  /metrics         métricas no formato de texto do Prometheus
+
+Uso:
+    python main.py --serve --port 8080 --workers 4 --max-queue 16
+"""
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator
+
+from agent_market import AGENT_ERROR_PREFIX, resolve_mode
+from budget import DEGRADED_PREFIX
+from report_cache import normalize_topic, params_key
+from streaming import FINAL, make_event
+
+
+REQUIRED_FIELDS = ("topic", "start_rev", "end_rev", "months")
+
+
+class ServiceOverloaded(RuntimeError):
+    """Pool e fila de admissão cheios: a requisição deve ser repetida mais tarde."""
+
+
+class AgentFailed(RuntimeError):
+    """O agente terminou com um relatório de erro (AGENT_ERROR_PREFIX) em vez de lançar."""
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    """
+    Attributes:
+        host: Endereço de escuta
+        port: Porta (0 = porta livre escolhida pelo sistema)
+        workers: Execuções simultâneas (e agentes aquecidos no pool)
+        max_queue: Execuções aguardando um worker antes de rejeitar novas
+        request_timeout_s: Espera máxima de uma requisição pelo relatório (prazo
+            total, também no streaming)
+    """
+    host: str = "127.0.0.1"
+    port: int = 8080
+    workers: int = 4
+    max_queue: int = 16
+    request_timeout_s: float = 300.0
+
+    @classmethod
+    def from_env(cls) -> "ServiceConfig":
+        """Lê SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS, SERVICE_MAX_QUEUE e SERVICE_REQUEST_TIMEOUT_S."""
+        from cache import _env_float
+
+        return cls(
+            host=os.getenv("SERVICE_HOST") or cls.host,
+            port=int(_env_float("SERVICE_PORT", cls.port)),
+            workers=int(_env_float("SERVICE_WORKERS", cls.workers)),
+            max_queue=int(_env_float("SERVICE_MAX_QUEUE", cls.max_queue)),
+            request_timeout_s=_env_float("SERVICE_REQUEST_TIMEOUT_S", cls.request_timeout_s),
+        )
+
+
+@dataclass(frozen=True)
+class ReportRequest:
+    """Tema e parâmetros do CAGR de uma requisição."""
+    topic: str
+    start_rev: float
+    end_rev: float
+    months: float
+    mode: str
+
+    @classmethod
+    def from_json(cls, data: Any) -> "ReportRequest":
+        """
+        Raises:
+            ValueError: Se faltarem campos, os parâmetros não forem numéricos ou o modo for inválido
+        """
+        if not isinstance(data, dict):
+            raise ValueError("O corpo deve ser um objeto JSON.")
+        # Textos só com espaços contam como ausentes
+        data = {k: v.strip() if isinstance(v, str) else v for k, v in data.items()}
+        missing = [name for name in REQUIRED_FIELDS if data.get(name) in (None, "")]
+        if missing:
+            raise ValueError(f"Campos obrigatórios ausentes: {', '.join(missing)}")
+        try:
+            start_rev, end_rev, months = (float(data[k]) for k in ("start_rev", "end_rev", "months"))
+        except (TypeError, ValueError):
+            raise ValueError("start_rev/end_rev/months devem ser numéricos")
+        return cls(str(data["topic"]), start_rev, end_rev, months, resolve_mode(data.get("mode")))
+
+    def key(self) -> str:
+        """Chave do single-flight: tema normalizado, parâmetros e modo (com ou sem streaming)."""
+        return f"{normalize_topic(self.topic)}|{params_key(self.start_rev, self.end_rev, self.months, self.mode)}"
+
+
+class Flight:
+    """
+    Uma execução em andamento, compartilhada pelas requisições idênticas.
+
+    Os eventos ficam guardados até o fim da execução, para que quem chega
+    depois receba o fluxo completo.
+    """
+
+    def __init__(self):
+        self.events: list[dict[str, Any]] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._cond = threading.Condition()
+
+    def publish(self, event: dict[str, Any]) -> None:
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def iter_events(self, timeout: float | None = None) -> Iterator[dict[str, Any]]:
+        """
+        Eventos desde o início, à medida que são publicados.
+
+        Raises:
+            TimeoutError: Se a execução não terminar dentro de `timeout` segundos
+                (prazo total, não por evento)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        index = 0
+        while True:
+            with self._cond:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                # Eventos chegando sem parar não estendem o prazo
+                expired = remaining is not None and remaining <= 0 and not self.done
+                if expired or not self._cond.wait_for(lambda: len(self.events) > index or self.done, remaining):
+                    raise TimeoutError("Tempo esgotado aguardando o relatório.")
+                pending = self.events[index:]
+                finished = self.done and index + len(pending) == len(self.events)
+                error = self.error
+            yield from pending
+            index += len(pending)
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+    def result(self, timeout: float | None = None) -> str:
+        """Relatório do evento final (esperando o fim da execução)."""
+        output = ""
+        for event in self.iter_events(timeout):
+            if event["type"] == FINAL:
+                output = event["output"]
+        return output
+
+
+class SingleFlight:
+    """Mapa chave → Flight das execuções em andamento."""
+
+    def __init__(self):
+        self._flights: dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str, start: Callable[[Flight], None]) -> tuple[Flight, bool]:
+        """
+        Devolve (flight, True) se já houver execução para a chave; senão cria
+        uma, chama start(flight) e devolve (flight, False).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, True
+            flight = self._flights[key] = Flight()
+        try:
+            start(flight)
+        except BaseException as e:
+            self.forget(key)
+            # Quem entrou nesse intervalo recebe o mesmo erro
+            flight.finish(e)
+            raise
+        return flight, False
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+
+def _default_agent_factory():
+    from agent_market import MarketAgent
+    return MarketAgent()
+
+
+def _wire_event(event: dict[str, Any]) -> dict[str, Any]:
+    # O evento final do pipeline traz o PipelineResult, que não é serializável
+    return {k: v for k, v in event.items() if k != "result"}
+
+
+def _raise_agent_error(report: str) -> None:
+    # MarketAgent devolve falhas como texto; para o serviço, são erros da execução
+    if report.startswith(AGENT_ERROR_PREFIX):
+        raise AgentFailed(report)
+
+
+class ReportService:
+    """Pool de agentes aquecidos com single-flight e fila de admissão limitada."""
+
+    def __init__(self, config: ServiceConfig | None = None, agent_factory: Callable[[], Any] | None = None):
+        """
+        Args:
+            config: Parâmetros do serviço (padrão: ServiceConfig.from_env())
+            agent_factory: Cria um agente com run(...)/stream(...) como
+                agent_market.MarketAgent (padrão: MarketAgent() com o Gemini)
+        """
+        self.config = config or ServiceConfig.from_env()
+        if self.config.workers < 1 or self.config.max_queue < 0:
+            raise ValueError("workers deve ser pelo menos 1 e max_queue não pode ser negativo.")
+        factory = agent_factory or _default_agent_factory
+        self._agents: queue.Queue = queue.Queue()
+        for _ in range(self.config.workers):
+            self._agents.put(factory())
+        self._executor = ThreadPoolExecutor(max_workers=self.config.workers, thread_name_prefix="report-worker")
+        self._admission = threading.BoundedSemaphore(self.config.workers + self.config.max_queue)
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, request: ReportRequest, stream: bool = False) -> tuple[Flight, bool]:
+        """
+        Inicia (ou reaproveita) a execução da requisição.
+
+        Returns:
+            (flight, coalesced): coalesced=True se a requisição se juntou a uma execução em andamento
+
+        Raises:
+            ServiceOverloaded: Se o pool e a fila de admissão estiverem cheios
+        """
+        key = request.key()
+
+        def start(flight: Flight) -> None:
+            if not self._admission.acquire(blocking=False):
+                with self._lock:
+                    self.rejected += 1
+                raise ServiceOverloaded(
+                    f"Serviço ocupado ({self.config.workers} em execução, {self.config.max_queue} na fila)."
+                )
+            with self._lock:
+                self.queued += 1
+                self.executions += 1
+            try:
+                self._executor.submit(self._execute, key, request, stream, flight)
+            except RuntimeError:
+                # Pool encerrado (shutdown)
+                with self._lock:
+                    self.queued -= 1
+                    self.executions -= 1
+                self._admission.release()
+                raise
+
+        flight, coalesced = self._flights.join(key, start)
+        if coalesced:
+            with self._lock:
+                self.coalesced += 1
+        return flight, coalesced
+
+    def _execute(self, key: str, request: ReportRequest, stream: bool, flight: Flight) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        agent = self._agents.get()
+        error = None
+        try:
+            args = (request.topic, request.start_rev, request.end_rev, request.months)
+            if stream:
+                for event in agent.stream(*args, mode=request.mode):
+                    if event["type"] == FINAL:
+                        _raise_agent_error(event.get("output") or "")
+                    flight.publish(_wire_event(event))
+            else:
+                report = agent.run(*args, mode=request.mode)
+                _raise_agent_error(report)
+                flight.publish(make_event(FINAL, output=report))
+        except Exception as e:
+            error = e
+            with self._lock:
+                self.failed += 1
+        finally:
+            self._agents.put(agent)
+            self._flights.forget(key)
+            with self._lock:
+                self.running -= 1
+            self._admission.release()
+            flight.finish(error)
+
+    def run(self, request: ReportRequest) -> tuple[str, bool]:
+        """Relatório da requisição e se ela foi coalescida (bloqueia até o fim)."""
+        flight, coalesced = self.submit(request)
+        return flight.result(self.config.request_timeout_s), coalesced
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.config.workers,
+                "max_queue": self.config.max_queue,
+                "running": self.running,
+                "queued": self.queued,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "failed": self.failed,
+            }
+
+    def prometheus_text(self, prefix: str = "market_agent") -> str:
+        """Estado do serviço + métricas globais do processo (caches, provedores...)."""
+        from metrics import MetricsCollector
+
+        stats = self.stats()
+        lines = [
+            f"# HELP {prefix}_service_requests_total Requisições por resultado.",
+            f"# TYPE {prefix}_service_requests_total counter",
+            f'{prefix}_service_requests_total{{result="executed"}} {stats["executions"]}',
+            f'{prefix}_service_requests_total{{result="coalesced"}} {stats["coalesced"]}',
+            f'{prefix}_service_requests_total{{result="rejected"}} {stats["rejected"]}',
+            f'{prefix}_service_requests_total{{result="failed"}} {stats["failed"]}',
+        ]
+        for name in ("running", "queued"):
+            lines.append(f"# HELP {prefix}_service_{name} Execuções {name} no momento.")
+            lines.append(f"# TYPE {prefix}_service_{name} gauge")
+            lines.append(f"{prefix}_service_{name} {stats[name]}")
+        return "\n".join(lines) + "\n" + MetricsCollector().prometheus_text(prefix)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """Traduz HTTP ↔ ReportService (ver endpoints no topo do módulo)."""
+
+    server_version = "MarketAgentService/1.0"
+
+    @property
+    def service(self) -> ReportService:
+        return self.server.service
+
+    def log_message(self, format, *args):  # noqa: A002
+        if not getattr(self.server, "quiet", False):
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_request(self) -> ReportRequest:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            data = json.loads(self.rfile.read(length) or b"null")
+        except json.JSONDecodeError:
+            raise ValueError("Corpo JSON inválido.")
+        return ReportRequest.from_json(data)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok", **self.service.stats()})
+        elif self.path == "/metrics":
+            payload = self.service.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self._send_json(404, {"error": f"Rota não encontrada: {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/reports", "/reports/stream"):
+            self._send_json(404, {"error": f"Rota não encontrada: {self.path}"})
+            return
+        stream = self.path == "/reports/stream"
+        t0 = time.perf_counter()
+        try:
+            request = self._read_request()
+            flight, coalesced = self.service.submit(request, stream=stream)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except ServiceOverloaded as e:
+            self._send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+
+        timeout = self.service.config.request_timeout_s
+        if stream:
+            self._stream(flight, coalesced, timeout)
+            return
+        try:
+            report = flight.result(timeout)
+        except TimeoutError as e:
+            self._send_json(504, {"error": str(e)})
+            return
+        except AgentFailed as e:
+            self._send_json(502, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, {
+            "report": report,
+            "coalesced": coalesced,
+            "degraded": report.startswith(DEGRADED_PREFIX),
+            "latency_s": round(time.perf_counter() - t0, 3),
+        })
+
+    def _stream(self, flight: Flight, coalesced: bool, timeout: float) -> None:
+        # HTTP/1.0: o fim do corpo é o fechamento da conexão, sem chunked encoding
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("X-Coalesced", "1" if coalesced else "0")
+        self.end_headers()
+        try:
+            for event in flight.iter_events(timeout):
+                self.wfile.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        except Exception as e:
+            message = str(e) if isinstance(e, AgentFailed) else f"{type(e).__name__}: {e}"
+            error = make_event(FINAL, output="", error=message)
+            self.wfile.write(json.dumps(error, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class ReportServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer ligado a um ReportService."""
+
+    daemon_threads = True
+
+    def __init__(self, service: ReportService, quiet: bool = False):
+        self.service = service
+        self.quiet = quiet
+        super().__init__((service.config.host, service.config.port), ReportRequestHandler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(config: ServiceConfig | None = None, agent_factory: Callable[[], Any] | None = None) -> None:
+    """Aquece o pool e atende requisições até Ctrl+C."""
+    config = config or ServiceConfig.from_env()
+    print(f"🔥 Aquecendo {config.workers} agente(s)...")
+    service = ReportService(config, agent_factory)
+    server = ReportServer(service)
+    print(f"🚀 Serviço de relatórios em {server.url} (fila máxima: {config.max_queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️  Encerrando o serviço...")
+    finally:
+        server.server_close()
+        service.shutdown()
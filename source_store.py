@@ -0,0 +1,341 @@
+"""
+Armazém local de fontes por tema (SQLite), para atualizações incrementais.
+
+Guarda os resultados normalizados do web_search de cada tema (indexados pela
+URL canônica e pelo hash do conteúdo) e os resumos produzidos pelo LLM na
+etapa de seleção do pipeline. Nas execuções seguintes do mesmo tema:
+
+- a busca cobre só a janela desde a última execução (ex.: qdr:w em vez de m6);
+- apenas fontes novas (ou com conteúdo alterado) são enviadas ao LLM;
+- fontes já resumidas reaproveitam o resumo armazenado.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from cache import _env_float
+from report_cache import normalize_topic
+from tools import canonical_url
+
+
+FULL_WINDOW = "m6"
+DEFAULT_MAX_AGE = 183 * 24 * 60 * 60   # fontes valem pela janela completa (6 meses)
+DEFAULT_MAX_KNOWN = 10                 # fontes armazenadas oferecidas como candidatas
+
+# Janelas qdr: do SerpAPI por tempo decorrido desde a última execução do tema
+DELTA_WINDOWS = (
+    (24 * 60 * 60, "d"),
+    (7 * 24 * 60 * 60, "w"),
+    (31 * 24 * 60 * 60, "m"),
+)
+
+
+def delta_window(elapsed: float | None, max_age: float = DEFAULT_MAX_AGE) -> str:
+    """
+    Menor janela temporal que cobre o intervalo desde a última execução.
+
+    Args:
+        elapsed: Segundos desde a última execução (None se o tema nunca rodou)
+        max_age: Acima deste intervalo a busca volta à janela completa
+
+    Returns:
+        Janela qdr: ('d', 'w', 'm' ou FULL_WINDOW)
+    """
+    if elapsed is None or elapsed < 0 or elapsed > max_age:
+        return FULL_WINDOW
+    for limit, window in DELTA_WINDOWS:
+        if elapsed <= limit:
+            return window
+    return FULL_WINDOW
+
+
+def content_hash(result: dict[str, Any]) -> str:
+    """Hash do conteúdo de um resultado (título e snippet com espaços colapsados)."""
+    text = "\n".join(" ".join(str(result.get(k) or "").split()) for k in ("title", "snippet"))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SourceDelta:
+    """
+    Resultado de SourceStore.merge.
+
+    Attributes:
+        new: Resultados ainda não vistos no tema (ou com conteúdo alterado),
+            a serem resumidos pelo LLM
+        known: Fontes armazenadas do tema, com o resumo em "resumo" quando
+            houver (as resumidas primeiro, depois as mais recentes)
+    """
+    new: list[dict[str, Any]] = field(default_factory=list)
+    known: list[dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def candidates(self) -> list[dict[str, Any]]:
+        return self.new + self.known
+
+
+class SourceStore:
+    """
+    Fontes e resumos por tema em SQLite.
+
+    O tema é normalizado (ver report_cache.normalize_topic); fontes sem
+    aparecer em buscas há mais de max_age são descartadas.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_age: float = DEFAULT_MAX_AGE,
+        max_known: int = DEFAULT_MAX_KNOWN,
+        clock: Callable[[], float] = time.time,
+    ):
+        if max_known < 0:
+            raise ValueError("max_known não pode ser negativo.")
+        self.path = path
+        self.max_age = max_age
+        self.max_known = max_known
+        self._clock = clock
+        self.full_searches = 0
+        self.delta_searches = 0
+        self.new_sources = 0
+        self.known_sources = 0
+        self.summaries_stored = 0
+        self.summaries_reused = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                topic TEXT NOT NULL,
+                url TEXT NOT NULL,
+                link TEXT NOT NULL,
+                title TEXT,
+                snippet TEXT,
+                date TEXT,
+                content_hash TEXT NOT NULL,
+                summary TEXT,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (topic, url)
+            );
+            CREATE INDEX IF NOT EXISTS sources_content_hash ON sources (content_hash);
+            CREATE TABLE IF NOT EXISTS topic_runs (
+                topic TEXT PRIMARY KEY,
+                last_run REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "SourceStore":
+        """
+        Cria o armazém a partir das variáveis de ambiente: SOURCE_STORE_PATH,
+        SOURCE_STORE_MAX_AGE e SOURCE_STORE_MAX_KNOWN.
+        """
+        return cls(
+            path=os.getenv("SOURCE_STORE_PATH", os.path.join(".cache", "sources.sqlite3")),
+            max_age=_env_float("SOURCE_STORE_MAX_AGE", DEFAULT_MAX_AGE),
+            max_known=int(_env_float("SOURCE_STORE_MAX_KNOWN", DEFAULT_MAX_KNOWN)),
+        )
+
+    def last_run(self, topic: str) -> float | None:
+        """Momento (epoch) da última execução registrada do tema, ou None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_run FROM topic_runs WHERE topic = ?", (normalize_topic(topic),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def window(self, topic: str) -> str:
+        """Janela qdr: da próxima busca do tema (ver delta_window)."""
+        last = self.last_run(topic)
+        window = delta_window(None if last is None else self._clock() - last, self.max_age)
+        with self._lock:
+            if window == FULL_WINDOW:
+                self.full_searches += 1
+            else:
+                self.delta_searches += 1
+        return window
+
+    def merge(self, topic: str, results: list[dict[str, Any]]) -> SourceDelta:
+        """
+        Grava os resultados de uma busca do tema e separa os novos dos já conhecidos.
+
+        Resultados com URL já armazenada e mesmo hash de conteúdo são
+        conhecidos; se o conteúdo mudou, o resumo antigo é descartado e o
+        resultado volta a ser novo.
+        """
+        key = normalize_topic(topic)
+        now = self._clock()
+        delta = SourceDelta()
+        seen: set[str] = set()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sources WHERE topic = ? AND last_seen < ?", (key, now - self.max_age)
+            )
+            for result in results:
+                link = result.get("link")
+                url = canonical_url(link or "")
+                if not link or url in seen:
+                    continue
+                seen.add(url)
+                digest = content_hash(result)
+                row = self._conn.execute(
+                    "SELECT content_hash FROM sources WHERE topic = ? AND url = ?", (key, url)
+                ).fetchone()
+                if row is not None and row[0] == digest:
+                    self._conn.execute(
+                        "UPDATE sources SET last_seen = ?, date = COALESCE(?, date) WHERE topic = ? AND url = ?",
+                        (now, result.get("date"), key, url),
+                    )
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sources "
+                    "(topic, url, link, title, snippet, date, content_hash, summary, first_seen, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)",
+                    (key, url, link, result.get("title"), result.get("snippet"), result.get("date"),
+                     digest, now, now),
+                )
+                delta.new.append(result)
+
+            placeholders = ",".join("?" * len(delta.new))
+            new_urls = [canonical_url(r["link"]) for r in delta.new]
+            rows = self._conn.execute(
+                "SELECT link, title, snippet, date, summary FROM sources "
+                f"WHERE topic = ? AND url NOT IN ({placeholders}) "
+                "ORDER BY summary IS NULL, last_seen DESC, first_seen DESC LIMIT ?",
+                (key, *new_urls, self.max_known),
+            ).fetchall()
+            self._conn.commit()
+            for link, title, snippet, date, summary in rows:
+                source = {"title": title or "", "link": link, "snippet": snippet or "", "date": date}
+                if summary:
+                    source["resumo"] = summary
+                delta.known.append(source)
+            self.new_sources += len(delta.new)
+            self.known_sources += len(delta.known)
+        return delta
+
+    def finish_run(self, topic: str, sources: list[dict[str, str]], delta: SourceDelta) -> None:
+        """
+        Registra a execução do tema: grava os resumos das fontes novas
+        escolhidas e atualiza o momento da última execução.
+
+        Args:
+            sources: Fontes do relatório ({titulo, link, data, resumo})
+            delta: Resultado de merge() nesta execução
+        """
+        key = normalize_topic(topic)
+        new = {canonical_url(r["link"]): r for r in delta.new}
+        known = {canonical_url(r["link"]): r for r in delta.known}
+        with self._lock:
+            for source in sources:
+                url = canonical_url(source.get("link") or "")
+                summary = source.get("resumo") or ""
+                if url in known and summary and summary == known[url].get("resumo"):
+                    self.summaries_reused += 1
+                elif url in new and summary and summary != new[url].get("snippet"):
+                    self._conn.execute(
+                        "UPDATE sources SET summary = ? WHERE topic = ? AND url = ?", (summary, key, url)
+                    )
+                    self.summaries_stored += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO topic_runs (topic, last_run) VALUES (?, ?)", (key, self._clock())
+            )
+            self._conn.commit()
+
+    def summaries(self, topic: str) -> dict[str, str]:
+        """Resumos armazenados do tema, por URL canônica."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, summary FROM sources WHERE topic = ? AND summary IS NOT NULL",
+                (normalize_topic(topic),),
+            ).fetchall()
+        return dict(rows)
+
+    def sources(self, topic: str) -> list[dict[str, Any]]:
+        """Fontes armazenadas do tema ({title, link, snippet, date}), das mais recentes às mais antigas."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT link, title, snippet, date FROM sources WHERE topic = ? "
+                "ORDER BY last_seen DESC, first_seen DESC",
+                (normalize_topic(topic),),
+            ).fetchall()
+        return [{"title": title or "", "link": link, "snippet": snippet or "", "date": date}
+                for link, title, snippet, date in rows]
+
+    def forget(self, topic: str | None = None) -> int:
+        """
+        Remove as fontes e o histórico de um tema, ou de todos se topic for None.
+
+        Returns:
+            Número de fontes removidas
+        """
+        with self._lock:
+            if topic is None:
+                removed = self._conn.execute("DELETE FROM sources").rowcount
+                self._conn.execute("DELETE FROM topic_runs")
+            else:
+                key = normalize_topic(topic)
+                removed = self._conn.execute("DELETE FROM sources WHERE topic = ?", (key,)).rowcount
+                self._conn.execute("DELETE FROM topic_runs WHERE topic = ?", (key,))
+            self._conn.commit()
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+
+    def stats(self) -> dict[str, Any]:
+        """Retorna os contadores de uso do armazém."""
+        return {
+            "full_searches": self.full_searches,
+            "delta_searches": self.delta_searches,
+            "new_sources": self.new_sources,
+            "known_sources": self.known_sources,
+            "summaries_stored": self.summaries_stored,
+            "summaries_reused": self.summaries_reused,
+            "sources": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: SourceStore | None = None
+_default_store_lock = threading.Lock()
+
+
+def get_source_store(create: bool = True) -> SourceStore | None:
+    """
+    Retorna o armazém de fontes do processo (criado sob demanda a partir do ambiente).
+
+    O modo incremental é opcional: retorna None, a menos que SOURCE_STORE_ENABLED
+    esteja definido como 1/true (ou um armazém tenha sido definido com set_source_store).
+    Com create=False, retorna só o armazém já inicializado.
+    """
+    global _default_store
+    if _default_store is not None or not create:
+        return _default_store
+    if os.getenv("SOURCE_STORE_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SourceStore.from_env()
+    return _default_store
+
+
+def set_source_store(store: SourceStore | None) -> None:
+    """Substitui o armazém de fontes do processo (útil em testes)."""
+    global _default_store
+    with _default_store_lock:
+        _default_store = store
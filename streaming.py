@@ -0,0 +1,49 @@
+"""
+Eventos de streaming do agente (TAO + tokens do relatório).
+
+Cada evento é um dicionário com a chave "type":
+
+- tool_start: {"name", "input"} — uma ferramenta foi acionada
+- tool_end: {"name", "output"} — a ferramenta terminou (saída truncada)
+- token: {"text"} — trecho do relatório/resposta gerado pelo modelo
+- final: {"output"} — relatório final completo; no modo pipeline também
+  traz "result" (PipelineResult, não serializável — remova antes de enviar)
+"""
+from typing import Any, AsyncIterable, Iterable
+
+
+TOOL_START = "tool_start"
+TOOL_END = "tool_end"
+TOKEN = "token"
+FINAL = "final"
+
+# Tamanho máximo das entradas/saídas de ferramentas incluídas nos eventos
+MAX_EVENT_TEXT = 500
+
+
+def make_event(kind: str, **fields: Any) -> dict[str, Any]:
+    """Cria um evento de streaming, truncando input/output longos."""
+    for key in ("input", "output"):
+        value = fields.get(key)
+        if kind in (TOOL_START, TOOL_END) and value is not None:
+            text = value if isinstance(value, str) else str(value)
+            fields[key] = text[:MAX_EVENT_TEXT]
+    return {"type": kind, **fields}
+
+
+def collect_report(events: Iterable[dict[str, Any]]) -> str:
+    """Consome os eventos e devolve o relatório do evento final."""
+    output = ""
+    for event in events:
+        if event["type"] == FINAL:
+            output = event["output"]
+    return output
+
+
+async def acollect_report(events: AsyncIterable[dict[str, Any]]) -> str:
+    """Versão assíncrona de collect_report."""
+    output = ""
+    async for event in events:
+        if event["type"] == FINAL:
+            output = event["output"]
+    return output
@@ -0,0 +1,21 @@
+"""
+Configuração compartilhada dos testes.
+"""
+import sys
+import os
+
+# Adicionar diretório pai ao path para importar os módulos do projeto
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_storage(tmp_path_factory):
+    """Caches e armazém de fontes padrão do processo gravam em diretório temporário, não no repositório."""
+    root = tmp_path_factory.mktemp("storage")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("SEARCH_CACHE_PATH", str(root / "web_search.sqlite3"))
+        mp.setenv("REPORT_CACHE_PATH", str(root / "reports.sqlite3"))
+        mp.setenv("SOURCE_STORE_PATH", str(root / "sources.sqlite3"))
+        yield root
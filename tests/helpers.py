@@ -0,0 +1,53 @@
+"""
+Dublês compartilhados pelos testes (logger mudo, relógio manual e LLMs roteirizados).
+"""
+from langchain_core.messages import AIMessage
+
+
+class SilentLogger:
+    """Logger que descarta todas as chamadas."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class FakeClock:
+    """Relógio manual: os testes avançam clock.now."""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeLLM:
+    """
+    Devolve respostas pré-definidas e guarda os prompts e kwargs recebidos.
+
+    Cada resposta é o texto ou um par (texto, tokens de entrada); no par, a
+    mensagem leva usage_metadata.
+    """
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+        self.calls = []
+
+    def invoke(self, prompt, config=None, **kwargs):
+        self.prompts.append(prompt)
+        self.calls.append((prompt, kwargs))
+        reply = self.replies.pop(0)
+        if isinstance(reply, str):
+            return AIMessage(content=reply)
+        text, tokens = reply
+        return AIMessage(
+            content=text,
+            usage_metadata={"input_tokens": tokens, "output_tokens": 10, "total_tokens": tokens + 10},
+        )
+
+
+class FakeGemini(FakeLLM):
+    """FakeLLM com modelo e chave, como ChatGoogleGenerativeAI."""
+    model = "models/gemini-flash-lite-latest"
+    google_api_key = "chave"
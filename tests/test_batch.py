@@ -0,0 +1,143 @@
+"""
+Testes para o modo batch (sem chamadas externas).
+"""
+import sys
+import os
+import asyncio
+import json
+import threading
+
+# Adicionar diretório pai ao path para importar batch
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from batch import BatchJob, BatchStats, load_jobs, run_batch
+from providers import ProviderLimits
+
+
+def test_load_jobs_csv_and_jsonl(tmp_path):
+    """CSV com cabeçalho e JSONL produzem os mesmos jobs."""
+    csv_path = tmp_path / "topics.csv"
+    csv_path.write_text("topic,start_rev,end_rev,months\nIoT,100,120,6\n", encoding="utf-8")
+    jsonl_path = tmp_path / "topics.jsonl"
+    jsonl_path.write_text(
+        json.dumps({"topic": "IoT", "start_rev": 100, "end_rev": 120, "months": 6}) + "\n\n",
+        encoding="utf-8",
+    )
+    assert load_jobs(str(csv_path)) == load_jobs(str(jsonl_path)) == [BatchJob("IoT", 100.0, 120.0, 6.0, 0)]
+    print("✅ test_load_jobs_csv_and_jsonl: PASSOU")
+
+
+def test_load_jobs_invalid(tmp_path):
+    """Registros sem campos obrigatórios geram ValueError."""
+    path = tmp_path / "topics.jsonl"
+    path.write_text(json.dumps({"topic": "IoT", "start_rev": 100}) + "\n", encoding="utf-8")
+    try:
+        load_jobs(str(path))
+        assert False, "Deveria ter lançado ValueError"
+    except ValueError as e:
+        assert "end_rev" in str(e)
+    print("✅ test_load_jobs_invalid: PASSOU")
+
+
+def test_run_batch_bounded_and_streamed(tmp_path):
+    """Respeita o número de workers e grava um registro por tema."""
+    running = 0
+    peak = 0
+
+    async def fake_runner(topic, start_rev, end_rev, months):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if topic == "falha":
+            raise RuntimeError("boom")
+        return f"relatório de {topic}"
+
+    jobs = [BatchJob(f"t{i}", 1, 2, 12, i) for i in range(6)] + [BatchJob("falha", 1, 2, 12, 6)]
+    out = tmp_path / "out.jsonl"
+    stats = asyncio.run(run_batch(jobs, str(out), workers=2, runner=fake_runner))
+
+    records = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert peak == 2
+    assert len(records) == 7
+    assert stats.succeeded == 6 and stats.failed == 1
+    assert {r["status"] for r in records if r["topic"] == "falha"} == {"error"}
+    print("✅ test_run_batch_bounded_and_streamed: PASSOU")
+
+
+def test_batch_stats_percentiles():
+    """Percentis por interpolação linear."""
+    stats = BatchStats(total=4, wall_time=2.0, latencies=[1.0, 2.0, 3.0, 4.0])
+    assert stats.percentile(50) == 2.5
+    assert stats.percentile(100) == 4.0
+    assert stats.throughput == 120.0
+    print("✅ test_batch_stats_percentiles: PASSOU")
+
+
+def test_provider_async_slot_limit():
+    """aslot limita chamadas simultâneas por provedor."""
+    limits = ProviderLimits({"serpapi": 2})
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with limits.aslot("serpapi"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(5)))
+
+    asyncio.run(run())
+    assert peak == 2
+    print("✅ test_provider_async_slot_limit: PASSOU")
+
+
+def test_provider_limit_resize_keeps_held_slots():
+    """set_limit com vagas ocupadas não as perde: o novo limite conta as já em uso."""
+    limits = ProviderLimits({"serpapi": 2})
+    entered = threading.Semaphore(0)
+    release = threading.Event()
+
+    def hold():
+        with limits.slot("serpapi"):
+            entered.release()
+            release.wait(5)
+
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert entered.acquire(timeout=2) and entered.acquire(timeout=2)
+    assert not entered.acquire(timeout=0.1) and limits.in_use("serpapi") == 2
+
+    # Aumentar o limite admite só a diferença (e não mais `limit` vagas novas)
+    limits.set_limit("serpapi", 3)
+    assert entered.acquire(timeout=2)
+    assert not entered.acquire(timeout=0.1) and limits.in_use("serpapi") == 3
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert limits.in_use("serpapi") == 0
+    print("✅ test_provider_limit_resize_keeps_held_slots: PASSOU")
+
+
+
+def test_workers_argument_must_be_positive(capsys):
+    """--workers 0 ou negativo é rejeitado pelo argparse, não confundido com erro no arquivo."""
+    import main
+
+    assert main.parse_args(["--batch", "temas.csv", "--workers", "2"]).workers == 2
+    assert main.parse_args(["--batch", "temas.csv"]).workers is None
+    for value in ("0", "-3", "dois"):
+        try:
+            main.parse_args(["--batch", "temas.csv", "--workers", value])
+            assert False, "Deveria ter encerrado com erro de argumento"
+        except SystemExit as e:
+            assert e.code == 2
+        assert "--workers" in capsys.readouterr().err
+    print("✅ test_workers_argument_must_be_positive: PASSOU")
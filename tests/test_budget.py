@@ -0,0 +1,162 @@
+"""
+Testes para os orçamentos por execução (modelo e busca simulados).
+"""
+import sys
+import os
+import re
+import json
+import time
+import asyncio
+import itertools
+
+# Adicionar diretório pai ao path para importar budget
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import agent_market
+import pipeline
+from agent_market import MarketAgent
+from budget import DEGRADED_PREFIX, BudgetGuard, RunBudget, budget_stats, degraded_report
+from metrics import MetricsCollector
+
+
+RESULTS = [
+    {"title": "Investimento A", "link": "https://a.com/1", "snippet": "aporte de US$ 10 mi", "date": "2025-01-10"},
+    {"title": "Mercado B", "link": "https://b.com/2", "snippet": "crescimento de 30%", "date": None},
+]
+
+
+class LoopingChatModel(BaseChatModel):
+    """Chat model confuso: pede web_search indefinidamente."""
+    delay: float = 0.0
+    tokens: int = 100
+
+    @property
+    def _llm_type(self) -> str:
+        return "looping"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _reply(self):
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": "web_search", "args": {"__arg1": "tema"}, "id": str(next(_ids))}],
+            usage_metadata={"input_tokens": self.tokens, "output_tokens": 0, "total_tokens": self.tokens},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._reply())])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._reply())])
+
+
+_ids = itertools.count()
+
+
+def _assert_report_format(report):
+    paragraphs = report.split("\n\n")
+    assert len(paragraphs) == 4
+    assert re.search(r"\d+,\d{2}%", paragraphs[3])
+
+
+def test_llm_call_budget_returns_degraded_report(monkeypatch):
+    """Ao esgotar as chamadas ao LLM, o relatório parcial cita as fontes já obtidas."""
+    monkeypatch.setattr(agent_market, "web_search", lambda q, num=5, time_period=None: RESULTS)
+    agent = MarketAgent(llm=LoopingChatModel(), api="create_agent", budget=RunBudget(max_llm_calls=3))
+    metrics = MetricsCollector()
+    before = budget_stats.snapshot()["llm_calls"]
+
+    report = agent.run("IoT", 100, 120, 6, mode="agent", callbacks=[metrics], use_cache=False)
+
+    assert report.startswith(DEGRADED_PREFIX)
+    assert "limite de chamadas ao LLM" in report
+    assert "https://a.com/1" in report and "https://b.com/2" in report
+    assert "2025-01-10" in report and "data não informada" in report
+    _assert_report_format(report)
+    assert sum(1 for r in metrics.records if r["kind"] == "llm") == 3
+    assert metrics.records[-1]["status"] == "error"
+    assert budget_stats.snapshot()["llm_calls"] == before + 1
+    print("✅ test_llm_call_budget_returns_degraded_report: PASSOU")
+
+
+def test_tool_call_budget(monkeypatch):
+    """O limite de ferramentas interrompe antes da chamada excedente."""
+    calls = []
+    monkeypatch.setattr(agent_market, "web_search", lambda q, num=5, time_period=None: calls.append(q) or RESULTS)
+    agent = MarketAgent(llm=LoopingChatModel(), api="create_agent", budget=RunBudget(max_tool_calls=2))
+
+    report = agent.run("IoT", 100, 120, 6, mode="agent", use_cache=False)
+
+    assert report.startswith(DEGRADED_PREFIX)
+    assert "limite de chamadas de ferramentas" in report
+    assert len(calls) == 2
+    print("✅ test_tool_call_budget: PASSOU")
+
+
+def test_token_budget_in_pipeline(monkeypatch):
+    """No pipeline, o limite de tokens impede a chamada do relatório final."""
+    monkeypatch.setattr(pipeline, "web_search", lambda q, num=5, time_period=None: RESULTS)
+    selection = json.dumps({"fontes": [{"titulo": "A", "link": "https://a.com/1", "resumo": "ra"}]})
+
+    class SelectionModel(LoopingChatModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            usage = {"input_tokens": 900, "output_tokens": 200, "total_tokens": 1100}
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=selection, usage_metadata=usage))])
+
+    agent = MarketAgent(llm=SelectionModel(), api=None, budget=RunBudget(max_tokens=1000))
+    report = agent.run("IoT", 100, 120, 6, mode="pipeline", use_cache=False)
+
+    assert report.startswith(DEGRADED_PREFIX)
+    assert "limite de tokens" in report
+    assert "https://a.com/1" in report
+    print("✅ test_token_budget_in_pipeline: PASSOU")
+
+
+def test_async_deadline_interrupts_running_call(monkeypatch):
+    """Na versão assíncrona, o prazo interrompe uma chamada ao LLM em curso."""
+    monkeypatch.setattr(agent_market, "web_search", lambda q, num=5, time_period=None: RESULTS)
+    agent = MarketAgent(llm=LoopingChatModel(delay=5.0), api="create_agent", budget=RunBudget(deadline_s=0.2))
+
+    t0 = time.perf_counter()
+    report = asyncio.run(agent.arun("IoT", 100, 120, 6, mode="agent", use_cache=False))
+
+    assert time.perf_counter() - t0 < 2.0
+    assert report.startswith(DEGRADED_PREFIX)
+    assert "prazo da execução" in report
+    assert "Fonte 1: não obtida" in report
+    print("✅ test_async_deadline_interrupts_running_call: PASSOU")
+
+
+def test_budget_from_env(monkeypatch):
+    """Sem RUN_* nenhum limite vale; limites lidos do ambiente; 0 desativa o limite."""
+    for name in ("RUN_MAX_LLM_CALLS", "RUN_MAX_TOOL_CALLS", "RUN_MAX_TOKENS", "RUN_DEADLINE_S"):
+        monkeypatch.delenv(name, raising=False)
+    assert RunBudget.from_env() == RunBudget() == RunBudget(0, 0, 0, 0.0)
+    guard = BudgetGuard(RunBudget())
+    for _ in range(100):
+        guard._on_llm_call()
+    assert guard.exceeded is None
+
+    monkeypatch.setenv("RUN_MAX_LLM_CALLS", "4")
+    monkeypatch.setenv("RUN_DEADLINE_S", "0")
+    budget = RunBudget.from_env()
+    assert budget.max_llm_calls == 4
+    assert budget.deadline_s == 0
+    assert budget.max_tool_calls == RunBudget.max_tool_calls
+    print("✅ test_budget_from_env: PASSOU")
+
+
+def test_degraded_report_invalid_cagr():
+    """Sem fontes e com CAGR inválido, o relatório parcial mantém os 4 parágrafos."""
+    report = degraded_report("IoT", 0, 120, 6, [], "deadline")
+    paragraphs = report.split("\n\n")
+    assert len(paragraphs) == 4
+    assert "CAGR não calculado" in paragraphs[3]
+    print("✅ test_degraded_report_invalid_cagr: PASSOU")
@@ -0,0 +1,93 @@
+"""
+Testes para a função vetorizada calc_cagr_many.
+"""
+import sys
+import os
+import json
+
+# Adicionar diretório pai ao path para importar tools
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from tools import calc_cagr, calc_cagr_batch_tool, calc_cagr_many
+
+
+def test_matches_scalar():
+    """Resultados batem com calc_cagr elemento a elemento."""
+    start = [100, 90, 50]
+    end = [120, 120, 40]
+    months = [6, 9, 24]
+    result = calc_cagr_many(start, end, months)
+    expected = [calc_cagr(s, e, m) for s, e, m in zip(start, end, months)]
+    assert np.allclose(result, expected)
+    print("✅ test_matches_scalar: PASSOU")
+
+
+def test_broadcasting():
+    """Escalares são repetidos para o tamanho dos arrays."""
+    result = calc_cagr_many(100, [120, 144], 12)
+    assert np.allclose(result, [0.2, 0.44])
+    print("✅ test_broadcasting: PASSOU")
+
+
+def test_invalid_nan_and_mask():
+    """Linhas inválidas viram NaN ou ficam mascaradas."""
+    start = [100, 0, 100, 100]
+    end = [120, 120, -1, 120]
+    months = [6, 6, 6, 0]
+    nan_result = calc_cagr_many(start, end, months)
+    assert not np.isnan(nan_result[0]) and np.isnan(nan_result[1:]).all()
+
+    masked = calc_cagr_many(start, end, months, invalid="mask")
+    assert list(masked.mask) == [False, True, True, True]
+    print("✅ test_invalid_nan_and_mask: PASSOU")
+
+
+def test_invalid_rows_match_scalar():
+    """As linhas inválidas do vetorizado são exatamente as que calc_cagr rejeita."""
+    rows = [(100, 120, 6), (0, 120, 6), (100, -1, 6), (100, 0, 6), (100, 120, 0), (-5, 120, 6)]
+    result = calc_cagr_many(*zip(*rows))
+    for (start, end, months), value in zip(rows, result):
+        try:
+            expected = calc_cagr(start, end, months)
+        except ValueError:
+            assert np.isnan(value), (start, end, months)
+        else:
+            assert np.isclose(value, expected), (start, end, months)
+    print("✅ test_invalid_rows_match_scalar: PASSOU")
+
+
+def test_invalid_raise():
+    """invalid='raise' informa os índices inválidos."""
+    try:
+        calc_cagr_many([100, -5], [120, 120], [6, 6], invalid="raise")
+        assert False, "Deveria ter lançado ValueError"
+    except ValueError as e:
+        assert "índices 1" in str(e)
+    print("✅ test_invalid_raise: PASSOU")
+
+
+def test_batch_tool_json():
+    """A ferramenta do agente aceita uma lista JSON e devolve null para inválidos."""
+    payload = json.dumps([{"start": 100, "end": 120, "months": 6}, {"start": 0, "end": 1, "months": 6}])
+    values = json.loads(calc_cagr_batch_tool(payload))
+    assert abs(values[0] - 0.44) < 1e-9 and values[1] is None
+    print("✅ test_batch_tool_json: PASSOU")
+
+
+def test_pandas_accessor():
+    """Accessor .cagr em DataFrames (quando o pandas está instalado)."""
+    try:
+        import pandas as pd
+    except ImportError:
+        print("⚠️  test_pandas_accessor: pandas não instalado, ignorado")
+        return
+    from tools import register_pandas_accessor
+
+    register_pandas_accessor()
+    df = pd.DataFrame({"start": [100, 0], "end": [120, 120], "months": [6, 6]})
+    series = df.cagr()
+    assert abs(series.iloc[0] - 0.44) < 1e-9 and np.isnan(series.iloc[1])
+    assert df.cagr(invalid="mask").isna().tolist() == [False, True]
+    print("✅ test_pandas_accessor: PASSOU")
@@ -0,0 +1,152 @@
+"""
+Testes para o logger TAO em JSON lines (não bloqueante).
+"""
+import sys
+import os
+import io
+import json
+import asyncio
+import threading
+
+# Adicionar diretório pai ao path para importar callbacks
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from callbacks import JSONLEventLogger, TAOConsoleLogger, correlation_id, get_tao_logger
+
+
+def _lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def _run(logger, topic):
+    logger.on_chain_start({}, {"input": topic})
+    logger.on_tool_start({"name": "web_search"}, topic)
+    logger.on_tool_end("x" * 1000)
+    logger.on_chain_end({"output": f"relatório {topic}"})
+
+
+def test_jsonl_events_with_run_id():
+    """Eventos compactos, com o mesmo run_id na execução e textos truncados."""
+    out = io.StringIO()
+    logger = JSONLEventLogger(stream=out, max_text=50)
+    correlation_id.set("job-1")
+    _run(logger, "IoT")
+    assert logger.flush()
+    logger.close()
+
+    events = _lines(out)
+    assert [e["event"] for e in events] == ["run_start", "tool_start", "tool_end", "run_end"]
+    assert len({e["run_id"] for e in events}) == 1
+    assert all(e["correlation_id"] == "job-1" for e in events)
+    assert events[1]["tool"] == "web_search"
+    assert len(events[2]["output"]) == 50
+    assert ", " not in out.getvalue().splitlines()[0]
+    print("✅ test_jsonl_events_with_run_id: PASSOU")
+
+
+def test_concurrent_runs_do_not_mix():
+    """Execuções concorrentes (tasks asyncio) recebem run_ids distintos."""
+    out = io.StringIO()
+    logger = JSONLEventLogger(stream=out)
+
+    async def one(topic):
+        logger.on_chain_start({}, {"input": topic})
+        await asyncio.sleep(0)
+        logger.on_tool_start({"name": "web_search"}, topic)
+        await asyncio.sleep(0)
+        logger.on_chain_end({"output": topic})
+
+    async def main():
+        await asyncio.gather(*(one(f"tema {i}") for i in range(5)))
+
+    asyncio.run(main())
+    logger.close()
+    by_run = {}
+    for e in _lines(out):
+        by_run.setdefault(e["run_id"], []).append(e)
+    assert len(by_run) == 5
+    for events in by_run.values():
+        topics = {e.get("input") for e in events if "input" in e}
+        assert len(topics) == 1
+    print("✅ test_concurrent_runs_do_not_mix: PASSOU")
+
+
+class BlockedStream(io.StringIO):
+    """Destino que trava a escrita até ser liberado."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, s):
+        self.release.wait()
+        return super().write(s)
+
+
+def test_never_blocks_when_queue_full():
+    """Com o destino travado e a fila cheia, os eventos são descartados sem bloquear."""
+    out = BlockedStream()
+    logger = JSONLEventLogger(stream=out, max_queue=2)
+    for i in range(20):
+        _run(logger, f"tema {i}")
+    assert logger.dropped > 0
+    out.release.set()
+    logger.close()
+    assert logger.written + logger.dropped == 80
+    print("✅ test_never_blocks_when_queue_full: PASSOU")
+
+
+def test_sampling_keeps_errors():
+    """Com sample_rate=0 nada é registrado, exceto erros."""
+    out = io.StringIO()
+    logger = JSONLEventLogger(stream=out, sample_rate=0.0)
+    _run(logger, "IoT")
+    logger.on_tool_error(RuntimeError("falhou"))
+    logger.close()
+    events = _lines(out)
+    assert [e["event"] for e in events] == ["tool_error"]
+    assert "falhou" in events[0]["error"]
+    print("✅ test_sampling_keeps_errors: PASSOU")
+
+
+def test_get_tao_logger_modes(monkeypatch):
+    """console cria um TAOConsoleLogger; jsonl reutiliza um logger do processo."""
+    monkeypatch.delenv("TAO_LOG_MODE", raising=False)
+    assert isinstance(get_tao_logger(), TAOConsoleLogger)
+    assert get_tao_logger("jsonl") is get_tao_logger("jsonl")
+    try:
+        get_tao_logger("xml")
+        assert False, "Deveria ter lançado ValueError"
+    except ValueError:
+        pass
+    print("✅ test_get_tao_logger_modes: PASSOU")
+
+
+def test_from_env_owns_log_file(monkeypatch, tmp_path):
+    """from_env valida as variáveis antes de abrir TAO_LOG_PATH e close() fecha o arquivo."""
+    path = tmp_path / "tao.jsonl"
+    monkeypatch.setenv("TAO_LOG_PATH", str(path))
+    monkeypatch.setenv("TAO_LOG_SAMPLE_RATE", "muito")
+    try:
+        JSONLEventLogger.from_env()
+        assert False, "Deveria ter lançado ValueError"
+    except ValueError as e:
+        assert "TAO_LOG_SAMPLE_RATE" in str(e)
+    assert not path.exists()
+
+    monkeypatch.setenv("TAO_LOG_SAMPLE_RATE", "1")
+    monkeypatch.setenv("TAO_LOG_QUEUE_SIZE", "50")
+    logger = JSONLEventLogger.from_env()
+    assert logger._queue.maxsize == 50
+    stream = logger.stream
+    _run(logger, "IoT")
+    logger.close()
+    assert stream.closed
+    assert [json.loads(line)["event"] for line in path.read_text(encoding="utf-8").splitlines()][0] == "run_start"
+
+    out = io.StringIO()
+    logger = JSONLEventLogger(stream=out)
+    _run(logger, "IoT")
+    logger.close()
+    assert not out.closed
+    print("✅ test_from_env_owns_log_file: PASSOU")
@@ -0,0 +1,204 @@
+"""
+Testes para a cascata de modelos (agentes simulados, sem rede).
+"""
+import sys
+import os
+import asyncio
+import time
+
+# Adicionar diretório pai ao path para importar cascade
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from agent_market import (
+    AGENT_ERROR_PREFIX, arun_market_agent, astream_market_agent, run_market_agent, stream_market_agent,
+)
+from cascade import CascadeConfig, CascadeStats, ModelCascade, get_model_cascade, set_model_cascade
+from metrics import MetricsCollector
+
+
+# CAGR de (90, 120, 9) = 46,75%
+VALID = (
+    "Contexto do tema.\n\n"
+    "Fonte 1 (https://a.com/1, 2025-03-01) relata investimentos.\n\n"
+    "Fonte 2 (https://b.com/2, 2025-04-02) aponta crescimento.\n\n"
+    "CAGR de 46,75%: potencial elevado."
+)
+INVALID = "Relatório em um único parágrafo, sem fontes, com CAGR de 46,75%."
+
+
+class FakeAgent:
+    """Devolve um relatório fixo após `delay` segundos (ou levanta `error`)."""
+
+    def __init__(self, report=VALID, delay=0.0, error=None):
+        self.report = report
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    def run(self, topic, start_rev, end_rev, months, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.report
+
+    async def arun(self, topic, start_rev, end_rev, months, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return self.report
+
+    def stream(self, topic, start_rev, end_rev, months, **kwargs):
+        self.calls += 1
+        yield {"type": "final", "output": self.report}
+
+    async def astream(self, topic, start_rev, end_rev, months, **kwargs):
+        self.calls += 1
+        yield {"type": "final", "output": self.report}
+
+
+def _cascade(agents, race_after_s=None, stats=None):
+    config = CascadeConfig(models=tuple(agents), race_after_s=race_after_s)
+    return ModelCascade(config, agent_factory=lambda settings: agents[settings.model], stats=stats or CascadeStats())
+
+
+def test_config_from_env(monkeypatch):
+    """MODEL_CASCADE ativa a cascata; sem MODEL_CASCADE_RACE_AFTER_S, a escalada é sequencial."""
+    saved = get_model_cascade()
+    set_model_cascade(None)
+    try:
+        monkeypatch.delenv("MODEL_CASCADE", raising=False)
+        monkeypatch.delenv("MODEL_CASCADE_RACE_AFTER_S", raising=False)
+        assert get_model_cascade() is None
+        monkeypatch.setenv("MODEL_CASCADE", " lite , pro ,")
+        cascade = get_model_cascade()
+        assert cascade is get_model_cascade()
+        assert cascade.models == ("lite", "pro") and cascade.config.race_after_s is None
+        assert cascade.config.tier_settings("pro").max_output_tokens == 1500
+    finally:
+        set_model_cascade(saved)
+    monkeypatch.setenv("MODEL_CASCADE_RACE_AFTER_S", "0")
+    assert CascadeConfig.from_env().race_after_s == 0
+    with pytest.raises(ValueError):
+        CascadeConfig(models=())
+    print("✅ test_config_from_env: PASSOU")
+
+
+def test_sequential_escalation():
+    """O modelo mais forte só é chamado quando o relatório do mais barato é inválido."""
+    lite, pro = FakeAgent(INVALID), FakeAgent(VALID)
+    stats = CascadeStats()
+    cascade = _cascade({"lite": lite, "pro": pro}, stats=stats)
+
+    result = cascade.run_cascade("IoT", 90, 120, 9)
+    assert result.valid and result.model == "pro" and result.report == VALID
+    assert [(a.model, a.status) for a in result.attempts] == [("lite", "invalid"), ("pro", "accepted")]
+    assert "1 parágrafo(s), esperados 4" in result.attempts[0].check.problems
+
+    lite.report = VALID
+    assert cascade.run("IoT", 90, 120, 9) == VALID
+    assert lite.calls == 2 and pro.calls == 1
+
+    snapshot = stats.snapshot()
+    assert snapshot["lite"]["attempts"] == 2 and snapshot["lite"]["hit_rate"] == 0.5
+    assert snapshot["pro"]["accepted"] == 1 and snapshot["pro"]["hit_rate"] == 1.0
+    assert stats.runs == 2 and stats.unresolved == 0
+    print("✅ test_sequential_escalation: PASSOU")
+
+
+def test_no_valid_answer():
+    """Sem relatório válido, devolve o do nível mais forte; se todos falharam, levanta o erro."""
+    agents = {
+        "lite": FakeAgent(INVALID),
+        "pro": FakeAgent(f"{AGENT_ERROR_PREFIX}: cota excedida"),
+    }
+    stats = CascadeStats()
+    result = _cascade(agents, stats=stats).run_cascade("IoT", 90, 120, 9)
+    assert not result.valid and result.model == "lite" and result.report == INVALID
+    assert [a.status for a in result.attempts] == ["invalid", "error"]
+    assert stats.unresolved == 1
+
+    failing = {"lite": FakeAgent(error=RuntimeError("lite fora")), "pro": FakeAgent(error=RuntimeError("pro fora"))}
+    with pytest.raises(RuntimeError, match="pro fora"):
+        _cascade(failing).run("IoT", 90, 120, 9)
+    print("✅ test_no_valid_answer: PASSOU")
+
+
+def test_hedge_under_latency_slo():
+    """Com race_after_s, o nível seguinte dispara no prazo e a primeira resposta válida vence."""
+    lite, pro = FakeAgent(VALID, delay=0.6), FakeAgent(VALID, delay=0.05)
+    stats = CascadeStats()
+    cascade = _cascade({"lite": lite, "pro": pro}, race_after_s=0.1, stats=stats)
+
+    started = time.perf_counter()
+    result = cascade.run_cascade("IoT", 90, 120, 9)
+    assert time.perf_counter() - started < 0.4
+    assert result.model == "pro" and result.valid
+    assert [(a.model, a.status) for a in result.attempts] == [("pro", "accepted"), ("lite", "cancelled")]
+    assert stats.snapshot()["lite"]["cancelled"] == 1 and stats.snapshot()["lite"]["hit_rate"] == 0.0
+
+    # Resposta rápida do nível barato: o hedge não chega a disparar
+    lite.delay = 0.0
+    assert cascade.run_cascade("IoT", 90, 120, 9).model == "lite" and pro.calls == 1
+    print("✅ test_hedge_under_latency_slo: PASSOU")
+
+
+def test_async_race_cancels_loser():
+    """Na corrida assíncrona (race_after_s=0), o nível perdedor é cancelado."""
+    lite, pro = FakeAgent(VALID, delay=0.02), FakeAgent(VALID, delay=5.0)
+    cascade = _cascade({"lite": lite, "pro": pro}, race_after_s=0)
+
+    result = asyncio.run(cascade.arun_cascade("IoT", 90, 120, 9))
+    assert result.model == "lite" and result.latency_s < 1.0
+    assert pro.calls == 1 and pro.cancelled
+    assert [a.status for a in result.attempts] == ["accepted", "cancelled"]
+    print("✅ test_async_race_cancels_loser: PASSOU")
+
+
+def test_run_market_agent_uses_cascade():
+    """Sem settings explícito, run_market_agent/arun_market_agent passam pela cascata ativa."""
+    lite, pro = FakeAgent(INVALID), FakeAgent(VALID)
+    saved = get_model_cascade()
+    set_model_cascade(ModelCascade(
+        CascadeConfig(models=("lite-teste", "pro-teste")),
+        agent_factory=lambda settings: {"lite-teste": lite, "pro-teste": pro}[settings.model],
+    ))
+    try:
+        assert run_market_agent("IoT", 90, 120, 9) == VALID
+        assert asyncio.run(arun_market_agent("IoT", 90, 120, 9)) == VALID
+        text = MetricsCollector().prometheus_text()
+    finally:
+        set_model_cascade(saved)
+    assert lite.calls == 2 and pro.calls == 2
+    assert 'market_agent_cascade_attempts_total{model="lite-teste",result="invalid"} 2' in text
+    assert 'market_agent_cascade_latency_seconds{model="pro-teste",quantile="0.95"}' in text
+    print("✅ test_run_market_agent_uses_cascade: PASSOU")
+
+
+def test_stream_market_agent_uses_cascade():
+    """Sem settings explícito, o streaming usa o primeiro nível da cascata ativa."""
+    lite, pro = FakeAgent(INVALID), FakeAgent(VALID)
+    saved = get_model_cascade()
+    set_model_cascade(ModelCascade(
+        CascadeConfig(models=("lite-teste", "pro-teste")),
+        agent_factory=lambda settings: {"lite-teste": lite, "pro-teste": pro}[settings.model],
+    ))
+
+    async def collect():
+        return [event async for event in astream_market_agent("IoT", 90, 120, 9)]
+
+    try:
+        assert list(stream_market_agent("IoT", 90, 120, 9)) == [{"type": "final", "output": INVALID}]
+        assert asyncio.run(collect()) == [{"type": "final", "output": INVALID}]
+    finally:
+        set_model_cascade(saved)
+    assert lite.calls == 2 and pro.calls == 0
+    print("✅ test_stream_market_agent_uses_cascade: PASSOU")
@@ -0,0 +1,79 @@
+"""
+Testes para a compactação de resultados de busca.
+"""
+import sys
+import os
+import json
+
+# Adicionar diretório pai ao path para importar compaction
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compaction import CompactionConfig, compact_results, estimate_tokens, trim_to_tokens
+
+
+LONG = "Investimentos em blockchain logístico cresceram fortemente no último trimestre " * 10
+
+
+def test_trim_to_tokens():
+    """Texto é cortado em limite de palavra e respeita o orçamento."""
+    trimmed = trim_to_tokens(LONG, 20)
+    assert trimmed.endswith("…")
+    assert estimate_tokens(trimmed) <= 20
+    assert trim_to_tokens("curto", 20) == "curto"
+
+    # Contador injetado (1 token por palavra, reticências incluídas): o corte segue a contagem
+    words = lambda text: len(text.split())
+    assert trim_to_tokens(LONG, 5, words) == "Investimentos em blockchain logístico cresceram…"
+    assert words(trim_to_tokens(LONG, 5, words)) <= 5
+    print("✅ test_trim_to_tokens: PASSOU")
+
+
+def test_compact_removes_empty_fields_and_saves_tokens():
+    """Campos vazios saem, snippets são cortados e a economia é informada."""
+    results = [
+        {"title": "A", "link": "https://a.com", "snippet": LONG, "date": None},
+        {"title": "B", "link": "https://b.com", "snippet": "curto", "date": "2 days ago"},
+    ]
+    compacted = compact_results(results, CompactionConfig(source_tokens=30, total_tokens=500))
+    data = json.loads(compacted.payload)
+    assert "date" not in data[0]
+    assert data[1]["date"] == "2 days ago"
+    assert estimate_tokens(data[0]["title"] + data[0]["snippet"]) <= 30
+    assert "\n" not in compacted.payload
+    assert compacted.saved_tokens > 0
+    print("✅ test_compact_removes_empty_fields_and_saves_tokens: PASSOU")
+
+
+def test_compact_drops_near_duplicates():
+    """Mesma URL canônica ou texto quase igual é descartado."""
+    results = [
+        {"title": "Blockchain na logística", "link": "https://a.com/x", "snippet": "Aporte de 10 milhões em startup"},
+        {"title": "Blockchain na logística", "link": "https://www.a.com/x/?utm_source=t", "snippet": "outro"},
+        {"title": "Blockchain na logística", "link": "https://espelho.com/x", "snippet": "Aporte de 10 milhões em startup!"},
+        {"title": "Outro assunto", "link": "https://c.com", "snippet": "Mercado de IoT"},
+    ]
+    compacted = compact_results(results, CompactionConfig())
+    assert [r["link"] for r in compacted.results] == ["https://a.com/x", "https://c.com"]
+    assert compacted.dropped == 2
+    print("✅ test_compact_drops_near_duplicates: PASSOU")
+
+
+def test_compact_total_budget():
+    """O orçamento total limita quantas fontes entram no payload."""
+    results = [
+        {"title": f"Fonte {i}", "link": f"https://s{i}.com", "snippet": f"{i} " + LONG}
+        for i in range(10)
+    ]
+    compacted = compact_results(results, CompactionConfig(source_tokens=50, total_tokens=150))
+    assert 0 < len(compacted.results) < 10
+    assert compacted.compact_tokens <= 150
+    print("✅ test_compact_total_budget: PASSOU")
+
+
+def test_compact_disabled():
+    """Com enabled=False o JSON original é mantido."""
+    results = [{"title": "A", "link": "https://a.com", "snippet": "s", "date": None}]
+    compacted = compact_results(results, CompactionConfig(enabled=False))
+    assert compacted.payload == json.dumps(results, ensure_ascii=False, indent=2)
+    assert compacted.saved_tokens == 0
+    print("✅ test_compact_disabled: PASSOU")
@@ -0,0 +1,147 @@
+"""
+Testes para o prefixo estático dos prompts e o cache de contexto do Gemini (sem rede).
+"""
+import sys
+import os
+import json
+
+# Adicionar diretório pai ao path para importar context_cache
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+import context_cache
+import pipeline
+from agent_market import AGENT_INSTRUCTIONS, _build_prompt, _task_prompt
+from benchmark import measure_prompt_tokens
+from context_cache import ContextCacheConfig, GeminiContextCache, set_context_cache
+from metrics import MetricsCollector, _usage_from_response
+from pipeline import REPORT_INSTRUCTIONS, SELECTION_INSTRUCTIONS, run_pipeline
+from replay import Fixture
+from helpers import FakeGemini, SilentLogger
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def test_prompts_static_prefix_first():
+    """Tema e parâmetros ficam fora das instruções estáticas, no final do prompt."""
+    prompt = _build_prompt("IoT em Saúde", 100, 130, 12)
+    assert prompt.startswith(AGENT_INSTRUCTIONS)
+    assert prompt.endswith(_task_prompt("IoT em Saúde", 100, 130, 12))
+    assert "IoT em Saúde" not in AGENT_INSTRUCTIONS and "130" not in AGENT_INSTRUCTIONS
+    assert pipeline.selection_prompt("[]").startswith(SELECTION_INSTRUCTIONS)
+    assert pipeline.final_prompt("{}", 0.1).startswith(REPORT_INSTRUCTIONS)
+    print("✅ test_prompts_static_prefix_first: PASSOU")
+
+
+def test_context_cache_creation_and_failures():
+    """Cria uma vez por prefixo, ignora prefixos pequenos e lembra falhas."""
+    created = []
+
+    def create(api_key, model, text, ttl_s):
+        created.append((model, text))
+        if text == "falha":
+            raise RuntimeError("modelo sem suporte")
+        return f"cachedContents/{len(created)}"
+
+    cache = GeminiContextCache(ContextCacheConfig(enabled=True, min_tokens=0), create=create)
+    assert cache.name_for("gemini-x", "instruções", "k") == "cachedContents/1"
+    assert cache.name_for("models/gemini-x", "instruções", "k") == "cachedContents/1"
+    assert cache.name_for("gemini-x", "falha", "k") is None
+    assert cache.name_for("gemini-x", "falha", "k") is None
+    assert len(created) == 2 and cache.created == 1 and cache.failures == 1
+    assert created[0][0] == "gemini-x"
+
+    small = GeminiContextCache(ContextCacheConfig(enabled=True, min_tokens=1024), create=create)
+    assert small.name_for("gemini-x", "curto", "k") is None
+    assert len(created) == 2
+
+    # TTL menor que a margem de renovação: recria a cada uso
+    short = GeminiContextCache(ContextCacheConfig(enabled=True, ttl_s=1, min_tokens=0), create=create)
+    short.name_for("gemini-x", "instruções", "k")
+    short.name_for("gemini-x", "instruções", "k")
+    assert len(created) == 4
+    print("✅ test_context_cache_creation_and_failures: PASSOU")
+
+
+def test_static_prefixes_below_minimum(capsys):
+    """Com o mínimo padrão, as instruções atuais não viram CachedContent; o aviso sai uma vez por prefixo."""
+    created = []
+    cache = GeminiContextCache(
+        ContextCacheConfig(enabled=True), create=lambda *args: created.append(args) or "cachedContents/x",
+    )
+    for _ in range(2):
+        for text in (SELECTION_INSTRUCTIONS, REPORT_INSTRUCTIONS, AGENT_INSTRUCTIONS):
+            assert cache.name_for("gemini-x", text, "k") is None
+    assert created == []
+    assert capsys.readouterr().out.count("abaixo do mínimo do cache de contexto (1024)") == 3
+    print("✅ test_static_prefixes_below_minimum: PASSOU")
+
+
+def test_pipeline_sends_only_variable_part_with_cache(monkeypatch):
+    """Com cache explícito, o pipeline envia apenas a parte variável e o cached_content."""
+    results = [
+        {"title": "A", "link": "https://a.com/1", "snippet": "a", "date": None},
+        {"title": "B", "link": "https://b.com/2", "snippet": "b", "date": None},
+    ]
+    monkeypatch.setattr(pipeline, "web_search", lambda q, num=5, time_period=None: results)
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE", "1")
+    names = {SELECTION_INSTRUCTIONS: "cachedContents/sel", REPORT_INSTRUCTIONS: "cachedContents/rep"}
+    set_context_cache(GeminiContextCache(
+        ContextCacheConfig(enabled=True, min_tokens=0), create=lambda key, model, text, ttl: names[text],
+    ))
+    try:
+        selection = json.dumps({"fontes": [{"titulo": "A", "link": "https://a.com/1", "resumo": "ra"}]})
+        llm = FakeGemini([selection, "P1\n\nP2\n\nP3\n\nP4"])
+        run_pipeline(llm, "IoT", 100, 120, 6, logger=SilentLogger())
+    finally:
+        set_context_cache(None)
+
+    (sel_prompt, sel_kwargs), (rep_prompt, rep_kwargs) = llm.calls
+    assert sel_kwargs == {"cached_content": "cachedContents/sel"}
+    assert rep_kwargs == {"cached_content": "cachedContents/rep"}
+    assert sel_prompt.startswith("RESULTADOS:") and SELECTION_INSTRUCTIONS not in sel_prompt
+    assert rep_prompt.startswith("CAGR decimal:")
+
+    # Sem cache explícito (ou para modelos que não são Gemini), o prompt vai completo
+    monkeypatch.delenv("GEMINI_CONTEXT_CACHE")
+    llm = FakeGemini([selection, "P1\n\nP2\n\nP3\n\nP4"])
+    run_pipeline(llm, "IoT", 100, 120, 6, logger=SilentLogger())
+    assert llm.calls[0][0].startswith(SELECTION_INSTRUCTIONS) and llm.calls[0][1] == {}
+    assert context_cache.get_context_cache() is None
+    print("✅ test_pipeline_sends_only_variable_part_with_cache: PASSOU")
+
+
+def test_cached_tokens_in_metrics():
+    """Tokens lidos do cache (input_token_details.cache_read) entram nas métricas."""
+    message = AIMessage(content="ok", usage_metadata={
+        "input_tokens": 500, "output_tokens": 20, "total_tokens": 520,
+        "input_token_details": {"cache_read": 460},
+    })
+    response = LLMResult(generations=[[ChatGeneration(message=message)]])
+    assert _usage_from_response(response) == {"prompt_tokens": 500, "completion_tokens": 20, "cached_tokens": 460}
+    assert pipeline.message_usage(message)["cached_tokens"] == 460
+
+    metrics = MetricsCollector()
+    metrics.records = [{"kind": "llm", "name": "gemini", "duration_s": 1.0, "status": "ok",
+                        **_usage_from_response(response)}]
+    assert metrics.summary()["llm:gemini"]["cached_tokens"] == 460
+    assert 'market_agent_llm_tokens_total{type="cached"} 460' in metrics.prometheus_text()
+    print("✅ test_cached_tokens_in_metrics: PASSOU")
+
+
+def test_measure_prompt_tokens():
+    """Só prefixos acima do mínimo contam como cache, e com o desconto do token em cache (não de graça)."""
+    fixture = Fixture.load(os.path.join(FIXTURES, "replay_create_agent.json"))
+    rows = measure_prompt_tokens(fixture)
+    assert len(rows) == 3
+    assert all(r["static_tokens"] > 0 and r["cached_tokens"] == 0 for r in rows)
+    assert all(r["billed_after"] == r["billed_before"] for r in rows)
+
+    rows = measure_prompt_tokens(fixture, min_tokens=0)
+    for r in rows:
+        assert r["cached_tokens"] == r["static_tokens"]
+        assert r["billed_after"] == round(r["prompt_tokens"] - 0.75 * r["static_tokens"])
+    assert sum(r["billed_after"] for r in rows) < sum(r["billed_before"] for r in rows)
+    print("✅ test_measure_prompt_tokens: PASSOU")
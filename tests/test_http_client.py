@@ -0,0 +1,173 @@
+"""
+Testes para o retry/backoff da sessão HTTP compartilhada.
+"""
+import sys
+import os
+
+# Adicionar diretório pai ao path para importar http_client
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+from contextlib import contextmanager
+
+import httpx
+import requests
+
+from http_client import (
+    RetryConfig, arequest_with_retry, backoff_delay, get_retry_config, get_session, parse_retry_after,
+    request_with_retry, reset_session,
+)
+from providers import ProviderLimits
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Devolve respostas (ou levanta exceções) em sequência."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+CONFIG = RetryConfig(max_retries=3, backoff_base=1.0, backoff_max=8.0)
+
+
+def test_parse_retry_after():
+    """Retry-After aceita segundos; valores inválidos viram None."""
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after("") is None
+    assert parse_retry_after("abc") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # data no passado
+    print("✅ test_parse_retry_after: PASSOU")
+
+
+def test_backoff_delay_bounds():
+    """Jitter fica em [0, base * 2**attempt], limitado por backoff_max."""
+    for attempt in range(6):
+        delay = backoff_delay(attempt, CONFIG)
+        assert 0 <= delay <= min(8.0, 2 ** attempt)
+    assert backoff_delay(0, CONFIG, retry_after=100) == 8.0
+    print("✅ test_backoff_delay_bounds: PASSOU")
+
+
+def test_retries_until_success():
+    """429/503 são repetidos e Retry-After é respeitado."""
+    sleeps = []
+    session = FakeSession([
+        FakeResponse(429, {"Retry-After": "2"}),
+        FakeResponse(503),
+        FakeResponse(200),
+    ])
+    resp = request_with_retry("GET", "http://x", session=session, config=CONFIG, sleep=sleeps.append)
+    assert resp.status_code == 200
+    assert session.calls == 3
+    assert sleeps[0] == 2.0
+    print("✅ test_retries_until_success: PASSOU")
+
+
+def test_gives_up_after_max_retries():
+    """Após max_retries a última resposta é devolvida ao chamador."""
+    session = FakeSession([FakeResponse(500)] * 4)
+    resp = request_with_retry("GET", "http://x", session=session, config=CONFIG, sleep=lambda s: None)
+    assert resp.status_code == 500
+    assert session.calls == 4
+    print("✅ test_gives_up_after_max_retries: PASSOU")
+
+
+def test_non_retryable_status():
+    """Status não transitórios (ex.: 401) não são repetidos."""
+    session = FakeSession([FakeResponse(401)])
+    resp = request_with_retry("GET", "http://x", session=session, config=CONFIG, sleep=lambda s: None)
+    assert resp.status_code == 401 and session.calls == 1
+    print("✅ test_non_retryable_status: PASSOU")
+
+
+def test_connection_error_retried():
+    """Erros de conexão são repetidos e relançados ao esgotar as tentativas."""
+    session = FakeSession([requests.ConnectionError("boom"), FakeResponse(200)])
+    resp = request_with_retry("GET", "http://x", session=session, config=CONFIG, sleep=lambda s: None)
+    assert resp.status_code == 200
+
+    session = FakeSession([requests.Timeout("t")] * 4)
+    try:
+        request_with_retry("GET", "http://x", session=session, config=CONFIG, sleep=lambda s: None)
+        assert False, "Deveria ter lançado Timeout"
+    except requests.Timeout:
+        pass
+    print("✅ test_connection_error_retried: PASSOU")
+
+
+def test_async_retries_until_success():
+    """arequest_with_retry repete 503 e devolve a resposta final."""
+    statuses = [503, 429, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0))
+
+    async def run():
+        sleeps = []
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            resp = await arequest_with_retry("GET", "http://x", client=client, config=CONFIG, sleep=fake_sleep)
+        return resp, sleeps
+
+    resp, sleeps = asyncio.run(run())
+    assert resp.status_code == 200
+    assert len(sleeps) == 2
+    print("✅ test_async_retries_until_success: PASSOU")
+
+
+def test_session_per_config(monkeypatch):
+    """Cada RetryConfig tem sua própria sessão; sem config, vale a configuração padrão do ambiente."""
+    reset_session()
+    monkeypatch.setenv("HTTP_POOL_SIZE", "3")
+    try:
+        default = get_session()
+        assert get_retry_config().pool_size == 3
+        assert get_session() is default and get_session(get_retry_config()) is default
+        other = get_session(RetryConfig(pool_size=20))
+        assert other is not default
+        assert other.get_adapter("https://x")._pool_maxsize == 20
+        assert default.get_adapter("https://x")._pool_maxsize == 3
+    finally:
+        reset_session()
+    print("✅ test_session_per_config: PASSOU")
+
+
+def test_guard_covers_each_attempt_not_backoff():
+    """O guard (ex.: vaga do provedor) envolve cada tentativa e fica livre durante o backoff."""
+    limits = ProviderLimits({"serpapi": 1})
+    session = FakeSession([FakeResponse(503), FakeResponse(429), FakeResponse(200)])
+    in_request, in_backoff = [], []
+
+    @contextmanager
+    def guard():
+        with limits.slot("serpapi"):
+            in_request.append(limits.in_use("serpapi"))
+            yield
+
+    resp = request_with_retry(
+        "GET", "http://x", session=session, config=CONFIG, guard=guard,
+        sleep=lambda s: in_backoff.append(limits.in_use("serpapi")),
+    )
+    assert resp.status_code == 200
+    assert in_request == [1, 1, 1] and in_backoff == [0, 0]
+    print("✅ test_guard_covers_each_attempt_not_backoff: PASSOU")
@@ -0,0 +1,60 @@
+"""
+Testes para as importações sob demanda e a detecção da API de agente.
+"""
+import sys
+import os
+import subprocess
+
+# Adicionar diretório pai ao path para importar agent_market
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import agent_market
+from agent_market import _agent_api_objects, agent_api_available, detect_agent_api
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _loaded_after(statement):
+    code = (
+        f"import sys; {statement}; "
+        "print(','.join(m for m in ('langchain_google_genai', 'langchain.agents', 'langgraph') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return out.stdout.strip()
+
+
+def test_imports_do_not_load_heavy_dependencies():
+    """main e agent_market não carregam Gemini nem langchain.agents na importação."""
+    assert _loaded_after("import main") == ""
+    assert _loaded_after("import agent_market") == ""
+    print("✅ test_imports_do_not_load_heavy_dependencies: PASSOU")
+
+
+def test_detection_cached(monkeypatch):
+    """A API é detectada uma vez; MARKET_AGENT_API força a escolha."""
+    monkeypatch.delenv("MARKET_AGENT_API", raising=False)
+    api = detect_agent_api()
+    before = _agent_api_objects.cache_info().hits
+    assert detect_agent_api() == api
+    assert agent_api_available(api)
+    assert _agent_api_objects.cache_info().hits > before or api is None
+    assert agent_market._LC_AGENT_API == api
+
+    monkeypatch.setenv("MARKET_AGENT_API", "fallback")
+    assert detect_agent_api() is None
+    monkeypatch.setenv("MARKET_AGENT_API", "xpto")
+    with pytest.raises(ValueError):
+        detect_agent_api()
+    print("✅ test_detection_cached: PASSOU")
+
+
+def test_limited_llm_class_on_demand(monkeypatch):
+    """O modelo Gemini com limite de concorrência continua acessível pelo nome antigo."""
+    monkeypatch.setenv("GEMINI_API_KEY", "chave-de-teste")
+    cls = agent_market.LimitedChatGoogleGenerativeAI
+    assert cls is agent_market._limited_llm_class()
+    assert isinstance(agent_market._build_llm("chave-de-teste"), cls)
+    print("✅ test_limited_llm_class_on_demand: PASSOU")
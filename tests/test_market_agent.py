@@ -0,0 +1,64 @@
+"""
+Testes para a construção/reuso do MarketAgent (sem chamadas externas).
+"""
+import sys
+import os
+
+# Adicionar diretório pai ao path para importar agent_market
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agent_market import ModelSettings, clear_market_agents, get_market_agent
+
+
+def test_get_market_agent_memoized(monkeypatch):
+    """Mesmas configurações reutilizam o agente; configurações novas criam outro."""
+    monkeypatch.setenv("GEMINI_API_KEY", "chave-de-teste")
+    clear_market_agents()
+    try:
+        first = get_market_agent()
+        assert get_market_agent(ModelSettings()) is first
+        other = get_market_agent(ModelSettings(temperature=0.0))
+        assert other is not first
+        assert other.llm.temperature == 0.0
+    finally:
+        clear_market_agents()
+    print("✅ test_get_market_agent_memoized: PASSOU")
+
+
+def test_get_market_agent_requires_key(monkeypatch):
+    """Sem GEMINI_API_KEY, a construção falha com ValueError."""
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    try:
+        get_market_agent()
+        assert False, "Deveria ter lançado ValueError"
+    except ValueError as e:
+        assert "GEMINI_API_KEY" in str(e)
+    print("✅ test_get_market_agent_requires_key: PASSOU")
+
+
+def test_stream_releases_slot_after_first_chunk(monkeypatch):
+    """No streaming, a vaga do Gemini é liberada ao chegar o primeiro trecho, não ao fim do consumo."""
+    from langchain_core.messages import AIMessageChunk
+    from langchain_core.outputs import ChatGenerationChunk
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    import agent_market
+    from providers import GEMINI, get_provider_limits
+
+    limits = get_provider_limits()
+    seen = []
+
+    def fake_stream(self, *args, **kwargs):
+        for text in ("a", "b", "c"):
+            seen.append(limits.in_use(GEMINI))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    monkeypatch.setattr(ChatGoogleGenerativeAI, "_stream", fake_stream)
+    llm = agent_market._limited_llm_class()(model="gemini-flash-lite-latest", google_api_key="chave-de-teste")
+    chunks = llm._stream([])
+    assert next(chunks).text == "a"
+    # Consumidor parado entre trechos: nenhuma vaga presa
+    assert limits.in_use(GEMINI) == 0
+    assert [c.text for c in chunks] == ["b", "c"]
+    assert seen == [1, 0, 0]
+    print("✅ test_stream_releases_slot_after_first_chunk: PASSOU")
@@ -0,0 +1,147 @@
+"""
+Testes para as métricas de latência e tokens (modelo e busca simulados).
+"""
+import sys
+import os
+import io
+import json
+
+# Adicionar diretório pai ao path para importar metrics
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain.agents import create_agent
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import Tool
+
+import pipeline
+from agent_market import AGENT_RUN_NAME, AgentWrapper
+from metrics import MetricsCollector
+from pipeline import PIPELINE_RUN_NAME, run_pipeline
+from helpers import SilentLogger
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model que devolve respostas roteirizadas."""
+    replies: list
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self.replies.pop(0))])
+
+
+def _usage(tokens):
+    return {"input_tokens": tokens, "output_tokens": 5, "total_tokens": tokens + 5}
+
+
+def test_agent_metrics_recorded_live():
+    """Execução, LLM e ferramenta são medidos durante o grafo, com tokens por execução."""
+    model = ScriptedChatModel(replies=[
+        AIMessage(content="", tool_calls=[{"name": "echo", "args": {"__arg1": "oi"}, "id": "1"}],
+                  usage_metadata=_usage(100)),
+        AIMessage(content="Relatório", usage_metadata=_usage(40)),
+    ])
+    tool = Tool(name="echo", func=lambda s: "eco " + s, description="repete a entrada")
+    agent = AgentWrapper(create_agent(model=model, tools=[tool], system_prompt="s"), SilentLogger())
+
+    sink = io.StringIO()
+    metrics = MetricsCollector(sink=sink)
+    assert agent.invoke({"input": "tema"}, callbacks=[metrics]) == {"output": "Relatório"}
+
+    kinds = [(r["kind"], r["name"]) for r in metrics.records]
+    assert kinds.count(("tool", "echo")) == 1
+    assert sum(1 for kind, _ in kinds if kind == "llm") == 2
+    assert kinds[-1] == ("run", AGENT_RUN_NAME)
+
+    run = metrics.records[-1]
+    assert run["llm_calls"] == 2 and run["tool_calls"] == 1
+    assert run["prompt_tokens"] == 140 and run["completion_tokens"] == 10
+    assert all(r["root_run_id"] == run["run_id"] for r in metrics.records)
+    assert len(sink.getvalue().splitlines()) == len(metrics.records)
+    print("✅ test_agent_metrics_recorded_live: PASSOU")
+
+
+def test_pipeline_metrics(monkeypatch):
+    """O pipeline registra a busca, o CAGR e as 2 chamadas ao LLM."""
+    results = [
+        {"title": "A", "link": "https://a.com", "snippet": "a", "date": None},
+        {"title": "B", "link": "https://b.com", "snippet": "b", "date": None},
+    ]
+    monkeypatch.setattr(pipeline, "web_search", lambda q, num=5, time_period=None: results)
+    selection = json.dumps({"fontes": [
+        {"titulo": "A", "link": "https://a.com", "resumo": "ra"},
+        {"titulo": "B", "link": "https://b.com", "resumo": "rb"},
+    ]})
+    llm = ScriptedChatModel(replies=[
+        AIMessage(content=selection, usage_metadata=_usage(80)),
+        AIMessage(content="P1\n\nP2\n\nP3\n\nP4", usage_metadata=_usage(60)),
+    ])
+    metrics = MetricsCollector()
+    run_pipeline(llm, "IoT", 100, 120, 6, logger=SilentLogger(), callbacks=[metrics])
+
+    summary = metrics.summary()
+    assert summary["tool:web_search"]["count"] == 1
+    assert summary["tool:calc_cagr"]["count"] == 1
+    assert summary[f"run:{PIPELINE_RUN_NAME}"]["prompt_tokens"] == 140
+    assert metrics.records[-1]["llm_calls"] == 2
+    print("✅ test_pipeline_metrics: PASSOU")
+
+
+def test_pipeline_error_recorded(monkeypatch):
+    """Falhas na ferramenta são registradas na ferramenta e na execução."""
+    def failing_search(q, num=5, time_period=None):
+        raise RuntimeError("SerpAPI fora do ar")
+
+    monkeypatch.setattr(pipeline, "web_search", failing_search)
+    metrics = MetricsCollector()
+    try:
+        run_pipeline(ScriptedChatModel(replies=[]), "IoT", 100, 120, 6, logger=SilentLogger(), callbacks=[metrics])
+        assert False, "Deveria ter lançado RuntimeError"
+    except RuntimeError:
+        pass
+    assert [(r["kind"], r["status"]) for r in metrics.records] == [("tool", "error"), ("run", "error")]
+    assert "SerpAPI fora do ar" in metrics.records[0]["error"]
+    print("✅ test_pipeline_error_recorded: PASSOU")
+
+
+def test_prometheus_text():
+    """Histogramas acumulados por bucket e contadores de tokens/erros."""
+    metrics = MetricsCollector(buckets=(0.1, 1.0))
+    metrics.records = [
+        {"kind": "tool", "name": "web_search", "duration_s": 0.05, "status": "ok"},
+        {"kind": "tool", "name": "web_search", "duration_s": 0.5, "status": "error"},
+        {"kind": "llm", "name": "gemini", "duration_s": 2.0, "status": "ok",
+         "prompt_tokens": 30, "completion_tokens": 7},
+    ]
+    text = metrics.prometheus_text()
+    assert 'market_agent_tool_duration_seconds_bucket{tool="web_search",le="0.1"} 1' in text
+    assert 'market_agent_tool_duration_seconds_bucket{tool="web_search",le="1.0"} 2' in text
+    assert 'market_agent_tool_duration_seconds_count{tool="web_search"} 2' in text
+    assert 'market_agent_llm_duration_seconds_bucket{model="gemini",le="+Inf"} 1' in text
+    assert 'market_agent_llm_tokens_total{type="prompt"} 30' in text
+    assert 'market_agent_errors_total{kind="tool"} 1' in text
+    assert "# TYPE market_agent_search_compaction_tokens_saved_total counter" in text
+    print("✅ test_prometheus_text: PASSOU")
+
+
+def test_prometheus_text_does_not_create_storage(monkeypatch, tmp_path):
+    """Exportar métricas sem caches inicializados não cria arquivos SQLite."""
+    import cache
+    import report_cache
+    import source_store
+    for name in ("SEARCH_CACHE_PATH", "REPORT_CACHE_PATH", "SOURCE_STORE_PATH"):
+        monkeypatch.setenv(name, str(tmp_path / f"{name.lower()}.sqlite3"))
+    monkeypatch.setattr(cache, "_default_cache", None)
+    monkeypatch.setattr(report_cache, "_default_cache", None)
+    monkeypatch.setattr(source_store, "_default_store", None)
+    text = MetricsCollector().prometheus_text()
+    assert "search_cache_requests_total" not in text
+    assert list(tmp_path.iterdir()) == []
+    print("✅ test_prometheus_text_does_not_create_storage: PASSOU")
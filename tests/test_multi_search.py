@@ -0,0 +1,89 @@
+"""
+Testes para multi_search: paralelismo, deduplicação e ordenação por data.
+"""
+import sys
+import os
+import threading
+import time
+from datetime import datetime
+
+# Adicionar diretório pai ao path para importar tools
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tools
+from tools import canonical_url, merge_search_results, multi_search, parse_result_date, query_variants
+
+
+def test_canonical_url():
+    """Variações triviais da mesma URL têm a mesma forma canônica."""
+    a = canonical_url("http://www.Exemplo.com/noticia/?utm_source=x&id=1#topo")
+    b = canonical_url("https://exemplo.com/noticia?id=1")
+    assert a == b == "https://exemplo.com/noticia?id=1"
+    print("✅ test_canonical_url: PASSOU")
+
+
+def test_parse_result_date():
+    """Datas relativas (EN/PT) e absolutas são reconhecidas."""
+    now = datetime(2025, 6, 10, 12, 0)
+    assert parse_result_date("3 days ago", now) == datetime(2025, 6, 7, 12, 0)
+    assert parse_result_date("há 1 semana", now) == datetime(2025, 6, 3, 12, 0)
+    assert parse_result_date("Mar 5, 2025", now) == datetime(2025, 3, 5)
+    assert parse_result_date("05/03/2025", now) == datetime(2025, 3, 5)
+    assert parse_result_date(None, now) is None
+    assert parse_result_date("ontem à noite", now) is None
+    print("✅ test_parse_result_date: PASSOU")
+
+
+def test_merge_dedup_and_rank():
+    """Duplicados saem e os resultados ficam do mais recente ao sem data."""
+    merged = merge_search_results([
+        [
+            {"title": "antigo", "link": "https://a.com/1", "date": "Jan 1, 2024"},
+            {"title": "sem data", "link": "https://b.com/2", "date": None},
+        ],
+        [
+            {"title": "dup", "link": "http://www.a.com/1/", "date": "Jan 1, 2024"},
+            {"title": "novo", "link": "https://c.com/3", "date": "2 days ago"},
+        ],
+    ])
+    assert [r["title"] for r in merged] == ["novo", "antigo", "sem data"]
+    print("✅ test_merge_dedup_and_rank: PASSOU")
+
+
+def test_multi_search_parallel(monkeypatch):
+    """As consultas rodam em paralelo e falhas isoladas são ignoradas."""
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def fake_search(query, num=5, time_period=None):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        if query.endswith("mercado"):
+            raise RuntimeError("falha isolada")
+        return [{"title": query, "link": f"https://x.com/{query.split()[-1]}", "snippet": "", "date": None}]
+
+    monkeypatch.setattr(tools, "web_search", fake_search)
+    results = multi_search(query_variants("IoT"), time_period="m6")
+    assert peak == 3
+    assert [r["title"] for r in results] == ["IoT investimentos", "IoT crescimento"]
+    print("✅ test_multi_search_parallel: PASSOU")
+
+
+def test_multi_search_all_fail(monkeypatch):
+    """Se todas as consultas falham, lança RuntimeError."""
+    def fake_search(query, num=5, time_period=None):
+        raise RuntimeError("fora do ar")
+
+    monkeypatch.setattr(tools, "web_search", fake_search)
+    try:
+        multi_search(["a", "b"])
+        assert False, "Deveria ter lançado RuntimeError"
+    except RuntimeError as e:
+        assert "2 buscas" in str(e)
+    print("✅ test_multi_search_all_fail: PASSOU")
@@ -0,0 +1,84 @@
+"""
+Testes para o pipeline determinístico (LLM e busca simulados).
+"""
+import sys
+import os
+import json
+
+# Adicionar diretório pai ao path para importar pipeline
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pipeline
+from pipeline import SelectionError, parse_selection, run_pipeline, validate_selection
+from helpers import FakeLLM, SilentLogger
+
+
+RESULTS = [
+    {"title": "Fonte A", "link": "https://a.com/1", "snippet": "snippet A", "date": "2 days ago"},
+    {"title": "Fonte B", "link": "https://b.com/2", "snippet": "snippet B", "date": None},
+    {"title": "Fonte C", "link": "https://c.com/3", "snippet": "snippet C", "date": "Mar 5, 2025"},
+]
+
+
+def test_parse_selection_fenced():
+    """Aceita blocos ```json e texto ao redor."""
+    text = 'Segue:\n```json\n{"fontes": [{"titulo": "A", "link": "https://a.com/1"}]}\n```'
+    assert parse_selection(text) == [{"titulo": "A", "link": "https://a.com/1"}]
+    for bad in ("sem json", '{"outra": []}', "{quebrado"):
+        try:
+            parse_selection(bad)
+            assert False, "Deveria ter lançado SelectionError"
+        except SelectionError:
+            pass
+    print("✅ test_parse_selection_fenced: PASSOU")
+
+
+def test_validate_selection_rejects_unknown_links():
+    """Links fora dos resultados são descartados e completados com a busca."""
+    sources, repaired = validate_selection(
+        [
+            {"titulo": "Inventada", "link": "https://inventado.com", "data": "hoje", "resumo": "x"},
+            {"titulo": "C", "link": "http://www.c.com/3/", "resumo": "resumo C"},
+        ],
+        RESULTS,
+    )
+    assert repaired
+    assert [s["link"] for s in sources] == ["https://c.com/3", "https://a.com/1"]
+    assert sources[0]["data"] == "Mar 5, 2025"
+    assert sources[1]["resumo"] == "snippet A"
+    print("✅ test_validate_selection_rejects_unknown_links: PASSOU")
+
+
+def test_validate_selection_missing_date():
+    """Fontes sem data recebem 'data não informada'."""
+    sources, repaired = validate_selection(
+        [{"titulo": "B", "link": "https://b.com/2", "resumo": "r"},
+         {"titulo": "A", "link": "https://a.com/1", "data": "", "resumo": "r"}],
+        RESULTS,
+    )
+    assert not repaired
+    assert sources[0]["data"] == "data não informada"
+    assert sources[1]["data"] == "2 days ago"
+    print("✅ test_validate_selection_missing_date: PASSOU")
+
+
+def test_run_pipeline_two_llm_calls(monkeypatch):
+    """Exatamente 2 chamadas ao LLM, com tokens por etapa."""
+    monkeypatch.setattr(pipeline, "web_search", lambda q, num=5, time_period=None: RESULTS)
+    selection = json.dumps({"fontes": [
+        {"titulo": "A", "link": "https://a.com/1", "data": "2 days ago", "resumo": "ra"},
+        {"titulo": "B", "link": "https://b.com/2", "data": "data não informada", "resumo": "rb"},
+    ]})
+    llm = FakeLLM([(selection, 100), ("P1\n\nP2\n\nP3\n\nP4", 50)])
+    result = run_pipeline(llm, "IoT", 100, 120, 6, logger=SilentLogger())
+
+    assert len(llm.prompts) == 2
+    assert "https://a.com/1" in llm.prompts[1] and "https://c.com/3" not in llm.prompts[1]
+    assert result.report == "P1\n\nP2\n\nP3\n\nP4"
+    assert abs(result.cagr - 0.44) < 1e-9
+    assert result.usage["selection"]["input_tokens"] == 100
+    assert result.usage["report"]["total_tokens"] == 60
+    assert result.total_tokens == 170
+    assert not result.selection_repaired
+    assert result.compaction["saved_tokens"] >= 0
+    print("✅ test_run_pipeline_two_llm_calls: PASSOU")
@@ -0,0 +1,158 @@
+"""
+Testes para a busca antecipada do web_search (SerpAPI e Gemini simulados via replay).
+"""
+import sys
+import os
+import time
+import asyncio
+import threading
+
+# Adicionar diretório pai ao path para importar prefetch
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import prefetch
+from agent_market import MarketAgent
+from cache import SearchCache, set_search_cache
+from metrics import MetricsCollector
+from prefetch import (
+    PrefetchConfig, active_prefetch, claim_prefetched, prefetch_queries, prefetch_stats,
+    search_prefetch, wait_prefetched,
+)
+from replay import Fixture, ReplayChatModel, replay_environment
+from report_cache import ReportCache, set_report_cache
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+RESULTS = [{"title": "A", "link": "https://a.com", "snippet": "s", "date": None}]
+
+
+@pytest.fixture(autouse=True)
+def silent_tao_log(monkeypatch):
+    monkeypatch.setenv("TAO_LOG_MODE", "jsonl")
+    monkeypatch.setenv("TAO_LOG_PATH", os.devnull)
+
+
+def _agent(fixture, config, latency=0.0):
+    llm = ReplayChatModel(fixture=fixture, latency=latency)
+    return MarketAgent(llm=llm, api="create_agent", prefetch=config)
+
+
+def _args(fixture):
+    meta = fixture.meta
+    return meta["topic"], meta["start_rev"], meta["end_rev"], meta["months"]
+
+
+def test_prefetch_queries_and_config(monkeypatch):
+    """A primeira consulta antecipada é a do pipeline; as demais seguem as intenções do prompt."""
+    assert prefetch_queries("IoT", 3) == ["IoT investimentos crescimento", "IoT investimentos", "IoT crescimento"]
+    assert prefetch_queries("IoT") == ["IoT investimentos crescimento"]
+    assert prefetch_queries("IoT", 0) == []
+    monkeypatch.delenv("SEARCH_PREFETCH", raising=False)
+    assert PrefetchConfig.from_env() == PrefetchConfig()
+    monkeypatch.setenv("SEARCH_PREFETCH", "true")
+    monkeypatch.setenv("SEARCH_PREFETCH_QUERIES", "2")
+    assert PrefetchConfig.from_env() == PrefetchConfig(enabled=True, max_queries=2)
+    with search_prefetch("IoT", PrefetchConfig()) as disabled:
+        assert disabled is None and active_prefetch() is None
+    print("✅ test_prefetch_queries_and_config: PASSOU")
+
+
+def test_claim_hit_miss_and_discard(monkeypatch):
+    """Chamadas iguais (chave normalizada) recebem a busca em curso; sobras são descartadas."""
+    release = threading.Event()
+    calls = []
+
+    def fake_search(query, num=5, time_period=None):
+        calls.append(query)
+        release.wait(5)
+        return RESULTS
+
+    monkeypatch.setattr(prefetch, "web_search", fake_search)
+    before = prefetch_stats.snapshot()
+    with search_prefetch("IoT", PrefetchConfig(enabled=True, max_queries=2)) as pending:
+        assert active_prefetch() is pending
+        assert sorted(pending.queries) == ["iot investimentos", "iot investimentos crescimento"]
+        entry = claim_prefetched("  iot INVESTIMENTOS crescimento", num=5, time_period="qdr:m6")
+        assert not entry.done()
+        release.set()
+        assert asyncio.run(wait_prefetched(entry)) == RESULTS
+        # Cada busca é entregue uma vez; outra janela ou consulta não corresponde
+        assert claim_prefetched("IoT investimentos crescimento", num=5, time_period="m6") is None
+        assert claim_prefetched("IoT investimentos", num=5, time_period="w") is None
+    assert active_prefetch() is None and claim_prefetched("IoT investimentos", num=5, time_period="m6") is None
+    after = prefetch_stats.snapshot()
+    assert {k: after[k] - before[k] for k in after} == {"hit": 1, "miss": 2, "discarded": 1}
+    assert sorted(calls) == ["IoT investimentos", "IoT investimentos crescimento"]
+    print("✅ test_claim_hit_miss_and_discard: PASSOU")
+
+
+def test_agent_uses_prefetched_search():
+    """A busca do agente sai da busca antecipada: sem requisição duplicada e com latência sobreposta."""
+    fixture = Fixture.load(os.path.join(FIXTURES, "replay_create_agent.json"))
+    latency = 0.4
+    before = prefetch_stats.snapshot()
+    agent = _agent(fixture, PrefetchConfig(enabled=True), latency)
+    with replay_environment(fixture, search_latency=latency) as server:
+        t0 = time.perf_counter()
+        report = agent.run(*_args(fixture), use_cache=False)
+        elapsed = time.perf_counter() - t0
+        assert server.requests == 1
+    after = prefetch_stats.snapshot()
+
+    assert len(report.split("\n\n")) == 4
+    assert after["hit"] - before["hit"] == 1 and after["miss"] == before["miss"]
+    # Sem a busca antecipada: 3 turnos do LLM + a busca em sequência (1,6 s)
+    assert elapsed < fixture.meta["steps"] * latency + latency / 2
+    assert 'market_agent_search_prefetch_total{result="hit"}' in MetricsCollector().prometheus_text()
+    print("✅ test_agent_uses_prefetched_search: PASSOU")
+
+
+def test_agent_prefetch_with_caches_on():
+    """Com os caches de busca e de relatórios ativos, só a busca antecipada vai ao SerpAPI."""
+    fixture = Fixture.load(os.path.join(FIXTURES, "replay_create_agent.json"))
+    before = prefetch_stats.snapshot()
+    agent = _agent(fixture, PrefetchConfig(enabled=True))
+    with replay_environment(fixture) as server:
+        os.environ.pop("SEARCH_CACHE_DISABLED")
+        os.environ.pop("REPORT_CACHE_DISABLED")
+        search_cache, reports = SearchCache(), ReportCache()
+        set_search_cache(search_cache)
+        set_report_cache(reports)
+        try:
+            report = agent.run(*_args(fixture))
+            assert server.requests == 1
+            # A repetição sai do cache de relatórios, conferido contra a busca em cache
+            assert agent.run(*_args(fixture)) == report and server.requests == 1
+        finally:
+            set_search_cache(None)
+            set_report_cache(None)
+    after = prefetch_stats.snapshot()
+    assert after["hit"] - before["hit"] == 1 and after["miss"] == before["miss"]
+    assert len(search_cache) == 1 and reports.stats()["hits"] == 1
+    print("✅ test_agent_prefetch_with_caches_on: PASSOU")
+
+
+def test_async_agent_discards_mismatch():
+    """No modo assíncrono, buscas antecipadas sem correspondência são descartadas e contadas."""
+    fixture = Fixture.load(os.path.join(FIXTURES, "replay_create_agent.json"))
+    config = PrefetchConfig(enabled=True, max_queries=2)
+    before = prefetch_stats.snapshot()
+
+    async def main():
+        agent = _agent(fixture, config)
+        report = await agent.arun(*_args(fixture), use_cache=False)
+        from http_client import aclose_async_client
+        await aclose_async_client()
+        return report
+
+    with replay_environment(fixture) as server:
+        report = asyncio.run(main())
+        # Consulta não gravada ("<tema> investimentos") também foi disparada
+        assert server.requests == 2
+    after = prefetch_stats.snapshot()
+
+    assert len(report.split("\n\n")) == 4
+    assert after["hit"] - before["hit"] == 1 and after["discarded"] - before["discarded"] == 1
+    print("✅ test_async_agent_discards_mismatch: PASSOU")
@@ -0,0 +1,242 @@
+"""
+Testes para o limitador de vazão e o disjuntor por provedor (sem rede).
+"""
+import sys
+import os
+import time
+import asyncio
+
+# Adicionar diretório pai ao path para importar providers
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+
+import tools
+from cache import SearchCache, set_search_cache
+from metrics import MetricsCollector
+import httpx
+
+import providers
+from http_client import RetryConfig, request_with_retry
+from providers import (
+    CLOSED, HALF_OPEN, OPEN, SERPAPI, CircuitBreaker, ProviderHealth, ProviderPolicy,
+    ProviderUnavailableError, TokenBucket, get_provider_health, get_provider_limits, is_provider_failure,
+    provider_attempt, set_provider_health,
+)
+from helpers import FakeClock
+
+
+RESULTS = [{"title": "A", "link": "https://a.com", "snippet": "s", "date": None}]
+
+
+def _response(status):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = b"erro"
+    resp._content_consumed = True
+    resp.url = "https://serpapi.test/search.json"
+    return resp
+
+
+def test_token_bucket_burst_and_rate():
+    """A rajada sai sem espera; as seguintes ficam espaçadas em 1/qps."""
+    clock = FakeClock()
+    bucket = TokenBucket(qps=2.0, burst=3, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+    clock.now = 10.0  # ocioso: o balde volta a encher até a rajada
+    assert bucket.reserve() == 0.0
+    assert TokenBucket(qps=0).reserve() == 0.0
+
+    async def drain():
+        fast = TokenBucket(qps=50.0, burst=1)
+        t0 = time.perf_counter()
+        for _ in range(5):
+            await fast.aacquire()
+        return time.perf_counter() - t0
+
+    assert asyncio.run(drain()) >= 0.07
+    print("✅ test_token_bucket_burst_and_rate: PASSOU")
+
+
+def test_circuit_breaker_transitions():
+    """Fechado → aberto após falhas seguidas → meio-aberto com uma chamada de teste → fechado."""
+    clock = FakeClock()
+    breaker = CircuitBreaker("serpapi", failure_threshold=2, reset_timeout_s=30, clock=clock)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()  # sucesso zera a sequência
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == OPEN and breaker.opens == 1
+    try:
+        breaker.before_call()
+        assert False, "Deveria ter lançado ProviderUnavailableError"
+    except ProviderUnavailableError as e:
+        assert e.provider == "serpapi" and e.retry_in_s == 30
+
+    clock.now = 30.0
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()  # chamada de teste
+    try:
+        breaker.before_call()
+        assert False, "Só uma chamada de teste por vez"
+    except ProviderUnavailableError:
+        pass
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.opens == 2
+
+    clock.now = 60.0
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.rejected == 2
+    print("✅ test_circuit_breaker_transitions: PASSOU")
+
+
+def test_web_search_fails_fast_and_serves_stale(monkeypatch):
+    """Com 429 seguidos, o circuito abre, o SerpAPI deixa de ser chamado e o cache expirado é servido."""
+    monkeypatch.setenv("SERPAPI_API_KEY", "chave")
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append(kwargs["params"]["q"])
+        return _response(429)
+
+    monkeypatch.setattr(tools, "request_with_retry", fake_request)
+    cache = SearchCache(ttls={"m": 0.0}, stale_max_age=3600)
+    cache.set("iot", 5, "m6", RESULTS)
+    saved = get_provider_health()
+    set_provider_health(ProviderHealth({SERPAPI: ProviderPolicy(failure_threshold=2, reset_timeout_s=60)}))
+    set_search_cache(cache)
+    try:
+        time.sleep(0.01)
+        assert tools.web_search("iot", num=5, time_period="m6") == RESULTS
+        assert tools.web_search("iot", num=5, time_period="m6") == RESULTS
+        assert len(calls) == 2
+        # Circuito aberto: falha rápida, sem chamar o SerpAPI
+        assert tools.web_search("iot", num=5, time_period="m6") == RESULTS
+        assert len(calls) == 2
+        try:
+            tools.web_search("sem cache", num=5, time_period="m6")
+            assert False, "Deveria ter lançado RuntimeError"
+        except RuntimeError as e:
+            assert "indisponível" in str(e)
+        assert len(calls) == 2
+        text = MetricsCollector().prometheus_text()
+    finally:
+        set_provider_health(saved)
+        set_search_cache(None)
+
+    assert cache.stats()["stale_hits"] == 3
+    assert 'market_agent_provider_circuit_state{provider="serpapi"} 2' in text
+    assert 'market_agent_provider_rejected_total{provider="serpapi"} 2' in text
+    assert "market_agent_search_cache_stale_served_total 3" in text
+    print("✅ test_web_search_fails_fast_and_serves_stale: PASSOU")
+
+
+def test_client_errors_do_not_open_circuit(monkeypatch):
+    """Erros do cliente (ex.: 401) não contam como falha do provedor nem usam o cache expirado."""
+    monkeypatch.setenv("SERPAPI_API_KEY", "chave")
+    monkeypatch.setattr(tools, "request_with_retry", lambda method, url, **kwargs: _response(401))
+    saved = get_provider_health()
+    health = ProviderHealth({SERPAPI: ProviderPolicy(failure_threshold=1)})
+    set_provider_health(health)
+    try:
+        for _ in range(3):
+            try:
+                tools.web_search("iot", use_cache=False)
+                assert False, "Deveria ter lançado RuntimeError"
+            except RuntimeError as e:
+                assert "401" in str(e)
+    finally:
+        set_provider_health(saved)
+    assert health.snapshot()[SERPAPI]["state"] == CLOSED
+    print("✅ test_client_errors_do_not_open_circuit: PASSOU")
+
+
+def test_only_transient_errors_count_as_failures(monkeypatch):
+    """Timeouts, conexão, 429/5xx e circuito aberto contam; JSON inválido e validação não."""
+    assert is_provider_failure(requests.Timeout("t"))
+    assert is_provider_failure(requests.ConnectionError("c"))
+    assert is_provider_failure(httpx.ConnectTimeout("t"))
+    assert is_provider_failure(TimeoutError())
+    assert is_provider_failure(ProviderUnavailableError(SERPAPI, 1.0))
+    assert is_provider_failure(requests.HTTPError(response=_response(503)))
+    assert not is_provider_failure(requests.HTTPError(response=_response(404)))
+    assert not is_provider_failure(ValueError("JSON inválido"))
+    assert not is_provider_failure(KeyError("organic_results"))
+
+    # Resposta 200 com JSON inválido: nem abre o circuito nem serve o cache expirado
+    monkeypatch.setenv("SERPAPI_API_KEY", "chave")
+    monkeypatch.setattr(tools, "request_with_retry", lambda method, url, **kwargs: _response(200))
+    cache = SearchCache(ttls={"m": 0.0}, stale_max_age=3600)
+    cache.set("iot", 5, "m6", RESULTS)
+    saved = get_provider_health()
+    health = ProviderHealth({SERPAPI: ProviderPolicy(failure_threshold=1)})
+    set_provider_health(health)
+    set_search_cache(cache)
+    try:
+        time.sleep(0.01)
+        for _ in range(2):
+            try:
+                tools.web_search("iot", num=5, time_period="m6")
+                assert False, "Deveria ter lançado RuntimeError"
+            except RuntimeError:
+                pass
+    finally:
+        set_provider_health(saved)
+        set_search_cache(None)
+    assert health.snapshot()[SERPAPI]["state"] == CLOSED
+    assert cache.stats()["stale_hits"] == 0
+    print("✅ test_only_transient_errors_count_as_failures: PASSOU")
+
+
+def test_retries_pass_through_limiter(monkeypatch):
+    """Cada tentativa do retry consome uma ficha, esperada sem ocupar a vaga de concorrência."""
+    class Session:
+        def __init__(self):
+            self.statuses = [503, 503, 200]
+
+        def request(self, method, url, **kwargs):
+            return _response(self.statuses.pop(0))
+
+    saved = get_provider_health()
+    # Relógio parado: o balde não se recompõe entre as tentativas
+    health = ProviderHealth({"teste": ProviderPolicy(qps=1000.0, burst=1)}, clock=FakeClock())
+    set_provider_health(health)
+    limits = get_provider_limits()
+    limits.set_limit("teste", 1)
+    slots_while_throttled = []
+    real_sleep = time.sleep
+
+    def fake_sleep(seconds):
+        slots_while_throttled.append(limits.in_use("teste"))
+        real_sleep(seconds)
+
+    monkeypatch.setattr(providers.time, "sleep", fake_sleep)
+    try:
+        resp = request_with_retry(
+            "GET", "http://x", session=Session(), config=RetryConfig(max_retries=3, backoff_base=0.0),
+            sleep=lambda s: None, guard=lambda: provider_attempt("teste"),
+        )
+    finally:
+        set_provider_health(saved)
+        limits.set_limit("teste", None)
+    assert resp.status_code == 200
+    assert health.bucket("teste").waited_s > 0
+    # Rajada de 1: a 2ª e a 3ª tentativas esperam pela ficha, sem vaga ocupada
+    assert slots_while_throttled == [0, 0]
+    print("✅ test_retries_pass_through_limiter: PASSOU")
+
+
+def test_policy_from_env(monkeypatch):
+    """QPS, rajada e disjuntor lidos do ambiente por provedor."""
+    monkeypatch.setenv("SERPAPI_QPS", "2.5")
+    monkeypatch.setenv("SERPAPI_BREAKER_FAILURES", "0")
+    policy = ProviderPolicy.from_env("serpapi", ProviderPolicy(qps=5, burst=4))
+    assert policy == ProviderPolicy(qps=2.5, burst=4, failure_threshold=0, reset_timeout_s=30.0)
+    assert ProviderHealth.from_env().bucket("gemini").qps == 10.0
+    print("✅ test_policy_from_env: PASSOU")
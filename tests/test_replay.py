@@ -0,0 +1,62 @@
+"""
+Testes para o record/replay offline e o benchmark (sem rede).
+"""
+import sys
+import os
+
+# Adicionar diretório pai ao path para importar replay
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from benchmark import run_benchmark, run_suite
+from replay import Fixture, ReplayChatModel, replay_environment
+from tools import web_search
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _fixture(name):
+    return Fixture.load(os.path.join(FIXTURES, f"replay_{name}.json"))
+
+
+@pytest.fixture(autouse=True)
+def silent_tao_log(monkeypatch):
+    monkeypatch.setenv("TAO_LOG_MODE", "jsonl")
+    monkeypatch.setenv("TAO_LOG_PATH", os.devnull)
+
+
+def test_suite_replays_each_api():
+    """Cada fixture gravado é reproduzido sem rede, com o número de passos gravado."""
+    fixtures = [_fixture("create_agent"), _fixture("fallback")]
+    results = {r.api: r for r in run_suite(fixtures, runs=4, concurrency=2)}
+    for name, fixture in (("create_agent", fixtures[0]), ("fallback", fixtures[1])):
+        result = results[name]
+        assert result.skipped is None, result.skipped
+        assert result.succeeded == 4, result.errors
+        assert result.llm_calls_per_run == fixture.meta["steps"]
+    assert results["create_agent"].tool_calls_per_run == 2
+    assert all(r.skipped for api, r in results.items() if api not in ("create_agent", "fallback"))
+    print("✅ test_suite_replays_each_api: PASSOU")
+
+
+def test_injected_latency():
+    """A latência injetada no LLM e na busca aparece na latência ponta a ponta."""
+    fixture = _fixture("fallback")
+    result = run_benchmark(fixture, runs=1, concurrency=1, search_latency=0.05, llm_latency=0.05)
+    assert result.succeeded == 1
+    assert result.latency_p50_s >= 0.15
+    print("✅ test_injected_latency: PASSOU")
+
+
+def test_unrecorded_requests_fail():
+    """Buscas e conversas fora do fixture falham em vez de chamar a rede."""
+    fixture = _fixture("fallback")
+    with replay_environment(fixture) as server:
+        with pytest.raises(RuntimeError, match="404"):
+            web_search("consulta não gravada", num=5, time_period="m6")
+        assert server.requests == 1
+    with pytest.raises(KeyError):
+        ReplayChatModel(fixture=fixture).invoke("prompt não gravado")
+    print("✅ test_unrecorded_requests_fail: PASSOU")
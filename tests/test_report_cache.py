@@ -0,0 +1,220 @@
+"""
+Testes para o cache de relatórios (chave exata, similaridade e invalidação).
+"""
+import sys
+import os
+import time
+import sqlite3
+
+import numpy as np
+
+# Adicionar diretório pai ao path para importar report_cache
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import agent_market
+import report_cache
+from agent_market import MarketAgent
+from cache import SearchCache, set_search_cache
+from pipeline import search_query
+from report_cache import (
+    ReportCache, VectorIndex, hashing_embedding, normalize_topic, params_key,
+    results_fingerprint, set_report_cache,
+)
+
+
+PARAMS = params_key(90, 120, 9, "agent")
+RESULTS = [{"title": "A", "link": "https://a.com/x"}, {"title": "B", "link": "https://b.com/y"}]
+
+
+def test_exact_hit_and_freshness(monkeypatch):
+    """Mesma chave (acentos/caixa ignorados) é servida até expirar."""
+    cache = ReportCache(max_age=60)
+    cache.set("Blockchain em Logística", PARAMS, "relatório")
+    hit = cache.get("  blockchain em LOGISTICA ", PARAMS)
+    assert hit.report == "relatório" and hit.match == "exact"
+    assert cache.get("Blockchain em Logística", params_key(90, 120, 12, "agent")) is None
+
+    monkeypatch.setattr(report_cache.time, "time", lambda: hit.created_at + 61)
+    assert cache.get("Blockchain em Logística", PARAMS) is None
+    assert cache.stats()["invalidations"] == 1 and len(cache) == 0
+    print("✅ test_exact_hit_and_freshness: PASSOU")
+
+
+def test_fingerprint_change_invalidates():
+    """Se as fontes da busca mudam, o relatório antigo é descartado."""
+    cache = ReportCache()
+    cache.set("IoT", PARAMS, "relatório", fingerprint=results_fingerprint(RESULTS))
+    same = [{"link": "http://www.b.com/y/"}, {"link": "https://a.com/x?utm_source=t"}]
+    assert cache.get("IoT", PARAMS, fingerprint=results_fingerprint(same)) is not None
+    changed = RESULTS + [{"link": "https://c.com/novo"}]
+    assert cache.get("IoT", PARAMS, fingerprint=results_fingerprint(changed)) is None
+    assert len(cache) == 0
+    print("✅ test_fingerprint_change_invalidates: PASSOU")
+
+
+def test_similar_topic_hit():
+    """Com embeddings, temas parafraseados com os mesmos parâmetros reaproveitam o relatório."""
+    cache = ReportCache(embed=hashing_embedding, similarity=0.75)
+    cache.set("Blockchain em Logística", PARAMS, "relatório")
+    hit = cache.get("blockchain na logística", PARAMS)
+    assert hit is not None and hit.match == "similar" and hit.score >= 0.75
+    assert cache.get("blockchain na logística", params_key(1, 2, 3, "agent")) is None
+    assert cache.get("Computação quântica em finanças", PARAMS) is None
+    assert cache.stats()["similar_hits"] == 1
+    print("✅ test_similar_topic_hit: PASSOU")
+
+
+def test_similarity_default_threshold():
+    """Com o limiar padrão (0,92), o hash aceita outra ordem das palavras, mas não outro tema próximo."""
+    cache = ReportCache(embed=hashing_embedding)
+    assert cache.similarity == report_cache.DEFAULT_SIMILARITY == 0.92
+    cache.set("Blockchain em Logística", PARAMS, "relatório")
+    hit = cache.get("logística em blockchain", PARAMS)
+    assert hit is not None and hit.match == "similar" and hit.score >= 0.92
+    # Preposição trocada (~0,80) e tema mais específico (~0,87) ficam abaixo do limiar
+    assert cache.get("blockchain na logística", PARAMS) is None
+    assert cache.get("Blockchain em logística reversa", PARAMS) is None
+    print("✅ test_similarity_default_threshold: PASSOU")
+
+
+def test_embed_only_after_exact_miss():
+    """O embedding só é calculado quando a chave exata falha e há candidatos com os mesmos parâmetros."""
+    embedded = []
+
+    def embed(text):
+        embedded.append(text)
+        return hashing_embedding(text)
+
+    cache = ReportCache(embed=embed)
+    assert cache.get("IoT", PARAMS) is None and embedded == []
+    cache.set("IoT", PARAMS, "relatório")
+    embedded.clear()
+    assert cache.get("iot", PARAMS).match == "exact" and embedded == []
+    assert cache.get("IoT", params_key(1, 2, 3, "agent")) is None and embedded == []
+    assert cache.get("IoT na indústria", PARAMS) is None and embedded == ["iot na industria"]
+    print("✅ test_embed_only_after_exact_miss: PASSOU")
+
+
+def test_persistence_and_lru(tmp_path):
+    """Entradas (e embeddings) sobrevivem à reabertura; o limite despeja a menos usada."""
+    path = str(tmp_path / "reports.sqlite3")
+    cache = ReportCache(path=path, max_entries=2, embed=hashing_embedding, similarity=0.75)
+    cache.set("tema 1", PARAMS, "r1")
+    cache.set("tema 2", PARAMS, "r2")
+    cache.get("tema 1", PARAMS)
+    cache.set("tema 3", PARAMS, "r3")
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+    reopened = ReportCache(path=path, embed=hashing_embedding, similarity=0.75)
+    assert len(reopened) == 2
+    assert reopened.get("tema 1", PARAMS).report == "r1"
+    assert reopened.get("o tema 3", PARAMS).match == "similar"
+    assert reopened.invalidate("TEMA 1") == 1
+    print("✅ test_persistence_and_lru: PASSOU")
+
+
+def test_reopen_with_other_embedder(tmp_path):
+    """Vetores de outro embedder (ou outra dimensão) não entram no índice: sem erro em get()."""
+    path = str(tmp_path / "reports.sqlite3")
+    cache = ReportCache(path=path, embed=hashing_embedding)
+    cache.set("Blockchain em Logística", PARAMS, "relatório")
+    cache.close()
+
+    def wide(text):
+        vector = np.zeros(768, dtype=np.float32)
+        vector[:256] = hashing_embedding(text)
+        return vector
+
+    reopened = ReportCache(path=path, embed=wide, embed_name="teste:768")
+    assert reopened.get("logística em blockchain", PARAMS) is None
+    assert reopened.get("Blockchain em Logística", PARAMS).match == "exact"
+    reopened.set("IoT na indústria", PARAMS, "r2")
+    assert reopened.get("indústria na IoT", PARAMS).match == "similar"
+    reopened.close()
+
+    # Mesmo nome, dimensão diferente: o vetor antigo é ignorado ao carregar
+    again = ReportCache(path=path, embed=hashing_embedding, embed_name="teste:768")
+    assert again.get("logística em blockchain", PARAMS) is None
+    again.close()
+
+    # Arquivo anterior à coluna embedder: migrado, vetores antigos ignorados
+    legacy = str(tmp_path / "legacy.sqlite3")
+    conn = sqlite3.connect(legacy)
+    conn.execute(
+        "CREATE TABLE report_cache (key TEXT PRIMARY KEY, topic TEXT NOT NULL, params TEXT NOT NULL, "
+        "report TEXT NOT NULL, fingerprint TEXT, embedding BLOB, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO report_cache VALUES (?, ?, ?, ?, NULL, ?, ?, ?)", (
+        f"iot|{PARAMS}", "IoT", PARAMS, "antigo", hashing_embedding("iot").tobytes(), time.time(), time.time(),
+    ))
+    conn.commit()
+    conn.close()
+    migrated = ReportCache(path=legacy, embed=hashing_embedding)
+    assert migrated.get("IoT", PARAMS).report == "antigo"
+    migrated.close()
+    print("✅ test_reopen_with_other_embedder: PASSOU")
+
+
+def test_vector_index_remove():
+    """Remoção mantém o índice consistente."""
+    index = VectorIndex()
+    for i, v in enumerate(([1, 0], [0, 1], [1, 1])):
+        index.add(f"k{i}", v)
+    index.remove("k0")
+    assert index.search([1, 0.1])[0] == "k2"
+    assert index.search([1, 0], candidates={"k1"})[0] == "k1"
+    assert normalize_topic(" Logística  ÁGIL ") == "logistica agil"
+    print("✅ test_vector_index_remove: PASSOU")
+
+
+def test_market_agent_serves_cache(monkeypatch):
+    """run() executa o agente uma vez e serve a repetição do cache, sem buscar para conferir as fontes."""
+    monkeypatch.setenv("GEMINI_API_KEY", "chave-de-teste")
+    searches = []
+    monkeypatch.setattr(agent_market, "web_search", lambda *args, **kwargs: searches.append(args) or RESULTS)
+    set_report_cache(ReportCache())
+    try:
+        agent = MarketAgent()
+        calls = []
+        monkeypatch.setattr(agent, "_run", lambda *args: calls.append(args) or "relatório novo")
+        assert agent.run("IoT", 90, 120, 9) == "relatório novo"
+        assert agent.run("iot", 90, 120, 9) == "relatório novo"
+        assert len(calls) == 1 and searches == []
+        agent.run("IoT", 90, 120, 9, use_cache=False)
+        assert len(calls) == 2
+    finally:
+        set_report_cache(None)
+    print("✅ test_market_agent_serves_cache: PASSOU")
+
+
+def test_market_agent_fingerprint_from_run_sources(monkeypatch):
+    """No modo agente, a impressão digital é a das fontes que a execução consultou (BudgetGuard.sources)."""
+    monkeypatch.setenv("GEMINI_API_KEY", "chave-de-teste")
+    search_cache = SearchCache()
+    set_search_cache(search_cache)
+    cache = ReportCache()
+    set_report_cache(cache)
+    try:
+        agent = MarketAgent()
+        calls = []
+
+        def run(*args):
+            # Como as ferramentas de busca do agente: o guard (último argumento) coleta as fontes
+            args[-1].sources.extend(RESULTS)
+            calls.append(args)
+            return "relatório novo"
+
+        monkeypatch.setattr(agent, "_run", run)
+        agent.run("IoT", 90, 120, 9, mode="agent")
+        params = agent._cache_params(90, 120, 9, "agent")
+        assert cache.get("IoT", params, fingerprint=results_fingerprint(RESULTS)) is not None
+
+        # Sem como conferir as consultas do agente antes de rodar, vale a validade
+        search_cache.set(search_query("IoT"), 5, "m6", [{"title": "C", "link": "https://c.com/z"}])
+        assert agent.run("IoT", 90, 120, 9, mode="agent") == "relatório novo" and len(calls) == 1
+        assert search_cache.stats()["hits"] == 0
+    finally:
+        set_search_cache(None)
+        set_report_cache(None)
+    print("✅ test_market_agent_fingerprint_from_run_sources: PASSOU")
@@ -0,0 +1,67 @@
+"""
+Testes para a validação do formato do relatório (report_format.py).
+"""
+import sys
+import os
+
+# Adicionar diretório pai ao path para importar report_format
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from budget import degraded_report
+from report_format import format_cagr, report_urls, validate_report
+from tools import calc_cagr
+
+
+VALID = """Blockchain em logística ganha tração com rastreabilidade de cargas.
+
+A primeira fonte, "Investimentos em blockchain" (https://www.a.com/noticia?utm_source=x, 12/Mar/2025), relata aportes.
+
+A segunda fonte, [Mercado cresce](https://b.com/relatorio/), de 2025-04-02, aponta expansão.
+
+Com CAGR de 44,22%, o potencial de mercado é elevado."""
+
+
+def test_format_cagr():
+    """O CAGR decimal vira percentual com vírgula e 2 casas."""
+    assert format_cagr(0.4422) == "44,22%"
+    assert format_cagr(0.0) == "0,00%"
+    assert format_cagr(-0.031) == "-3,10%"
+    assert format_cagr(calc_cagr(90, 120, 9)) == "46,75%"
+    print("✅ test_format_cagr: PASSOU")
+
+
+def test_valid_report():
+    """Relatório com 4 parágrafos, 2 URLs e o CAGR esperado é válido."""
+    check = validate_report(VALID, cagr=0.4422)
+    assert check.valid and check.problems == []
+    assert check.paragraphs == 4 and check.cagr_values == ["44,22%"]
+    # Pontuação e parênteses de Markdown não fazem parte da URL
+    assert check.urls == ["https://www.a.com/noticia?utm_source=x", "https://b.com/relatorio/"]
+    print("✅ test_valid_report: PASSOU")
+
+
+def test_invalid_reports():
+    """Cada regra violada aparece em problems."""
+    three = VALID.replace("\n\nCom CAGR", " Com CAGR")
+    assert validate_report(three).problems == ["3 parágrafo(s), esperados 4"]
+
+    same_source = VALID.replace("https://b.com/relatorio/", "http://a.com/noticia")
+    assert report_urls(same_source) == ["https://www.a.com/noticia?utm_source=x"]
+    assert validate_report(same_source).problems == ["1 URL(s) citada(s), esperadas ao menos 2"]
+
+    assert validate_report(VALID.replace("44,22%", "44.22%")).problems == ["CAGR no formato XX,XX% ausente"]
+    assert validate_report(VALID, cagr=0.5).problems == ["CAGR 50,00% ausente (encontrado: 44,22%)"]
+
+    empty = validate_report(None)
+    assert not empty.valid and len(empty.problems) == 3
+    print("✅ test_invalid_reports: PASSOU")
+
+
+def test_degraded_report_format():
+    """O relatório parcial do orçamento segue o mesmo formato de CAGR."""
+    sources = [{"title": "A", "link": "https://a.com/1", "date": "2025-01-01"},
+               {"title": "B", "link": "https://b.com/2", "date": None}]
+    report = degraded_report("IoT", 90, 120, 9, sources, "deadline")
+    check = validate_report(report, cagr=calc_cagr(90, 120, 9))
+    assert "46,75%" in check.cagr_values and check.urls[:2] == ["https://a.com/1", "https://b.com/2"]
+    print("✅ test_degraded_report_format: PASSOU")
@@ -0,0 +1,101 @@
+"""
+Testes para o roteador multi-domínio (registro e índice de palavras-chave).
+"""
+import sys
+import os
+import re
+
+# Adicionar diretório pai ao path para importar router
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from router import DomainRegistry, _trie_pattern, normalize_text, pick_domain, registry
+
+
+def test_default_domains():
+    """Domínios padrão, sem acentos/caixa, e fallback para logística."""
+    assert pick_domain("Analisar o potencial de mercado da tecnologia Blockchain em Logística") == "logistica"
+    assert pick_domain("PAGAMENTOS INSTANTANEOS e credito para PMEs") == "financas"
+    assert pick_domain("Telemedicina e prontuário eletrônico") == "saude"
+    assert pick_domain("Computação em nuvem para IA") == "tecnologia"
+    assert pick_domain("tema sem palavras conhecidas") == "logistica"
+    assert set(registry.names) >= {"logistica", "financas", "saude", "tecnologia"}
+    print("✅ test_default_domains: PASSOU")
+
+
+def test_scoring_and_word_boundaries():
+    """Frases pesam pelo número de palavras; palavras-chave não casam dentro de outras palavras."""
+    routes = DomainRegistry(default="geral")
+    routes.register("a", ["carga"])
+    routes.register("b", ["cadeia de suprimentos", "ia"])
+
+    match = routes.route("Carga e cadeia de suprimentos")
+    assert match.domain == "b" and match.score == 3 and match.matches == ("carga", "cadeia de suprimentos")
+    # "ia" não casa em "cadeia"/"mania"; plural simples casa
+    assert routes.route("mania de cargas").domain == "a"
+    assert routes.route("nada").domain == "geral"
+    print("✅ test_scoring_and_word_boundaries: PASSOU")
+
+
+def test_ties_and_shared_keywords():
+    """Palavras-chave compartilhadas pontuam nos dois domínios; empate fica com o primeiro registrado."""
+    routes = DomainRegistry()
+    routes.register("financas", ["fintech", "banco"])
+    routes.register("tecnologia", ["fintech", "software"])
+    assert routes.route("fintech").domain == "financas"
+    assert routes.route("software de fintech").domain == "tecnologia"
+    print("✅ test_ties_and_shared_keywords: PASSOU")
+
+
+def test_register_replaces_and_recompiles():
+    """Registrar de novo substitui o domínio e invalida o índice."""
+    routes = DomainRegistry()
+    routes.register("x", ["alfa"])
+    assert routes.route("alfa").domain == "x"
+    routes.register("x", ["beta"], factory=lambda: "agente x")
+    assert routes.route("alfa").score == 0
+    assert routes.route("beta").domain == "x"
+    assert routes.agent("x") == "agente x"
+
+    routes.register("y", ["gama"])
+    try:
+        routes.agent("y")
+        assert False, "Deveria ter lançado NotImplementedError"
+    except NotImplementedError:
+        pass
+    try:
+        routes.register("z", ["", "  "])
+        assert False, "Deveria ter lançado ValueError"
+    except ValueError:
+        pass
+    print("✅ test_register_replaces_and_recompiles: PASSOU")
+
+
+def test_trie_pattern_matches_same_words():
+    """A regex em trie equivale à alternativa simples das palavras."""
+    words = ["car", "carga", "cargo", "banco", "bancario", "b"]
+    pattern = re.compile(rf"(?:{_trie_pattern(words)})\Z")
+    for word in words:
+        assert pattern.match(word), word
+    for word in ["ca", "carg", "banc", "bancari"]:
+        assert not pattern.match(word), word
+    assert normalize_text("  Saúde   Pública ") == "saude publica"
+    print("✅ test_trie_pattern_matches_same_words: PASSOU")
+
+
+def test_main_routes_on_topic(monkeypatch, capsys):
+    """main roteia pelo tema: sem palavra-chave conhecida vale o domínio padrão."""
+    import main
+
+    routed = []
+
+    class FakeAgent:
+        def run(self, topic, start_rev, end_rev, months, mode=None, callbacks=None):
+            return "relatório"
+
+    monkeypatch.setattr(registry, "agent", lambda name: routed.append(name) or FakeAgent())
+    main.main(["--topic", "Drones autônomos"])
+    main.main(["--topic", "Computação quântica"])
+    main.main(["--topic", "Drones autônomos", "--domain", "financas"])
+    assert routed == ["logistica", "tecnologia", "financas"]
+    assert "Domínio identificado: Logística" in capsys.readouterr().out
+    print("✅ test_main_routes_on_topic: PASSOU")
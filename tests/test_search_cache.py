@@ -0,0 +1,93 @@
+"""
+Testes para o cache persistente do web_search.
+"""
+import sys
+import os
+import time
+
+# Adicionar diretório pai ao path para importar cache
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import SearchCache, normalize_key, ttl_for_period
+
+
+RESULTS = [{"title": "A", "link": "https://a.com", "snippet": "s", "date": None}]
+
+
+def test_normalize_key():
+    """Consultas com caixa/espaços diferentes compartilham a chave."""
+    assert normalize_key("  Blockchain   Logística ", 5, "qdr:M6") == ("blockchain logística", 5, "m6")
+    assert normalize_key("x", 5, None) == ("x", 5, "")
+    print("✅ test_normalize_key: PASSOU")
+
+
+def test_ttl_for_period():
+    """TTL depende da unidade da janela qdr:."""
+    ttls = {"h": 1, "d": 2, "w": 3, "m": 4, "y": 5, "": 6}
+    assert ttl_for_period("h", ttls) == 1
+    assert ttl_for_period("m6", ttls) == 4
+    assert ttl_for_period("qdr:w", ttls) == 3
+    assert ttl_for_period(None, ttls) == 6
+    print("✅ test_ttl_for_period: PASSOU")
+
+
+def test_hit_and_miss():
+    """Segunda consulta normalizada igual é servida do cache."""
+    cache = SearchCache()
+    assert cache.get("Blockchain", 5, "m6") is None
+    cache.set("Blockchain", 5, "m6", RESULTS)
+    assert cache.get("  blockchain ", 5, "m6") == RESULTS
+    assert cache.get("blockchain", 3, "m6") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    print("✅ test_hit_and_miss: PASSOU")
+
+
+def test_peek_keeps_stats():
+    """peek() devolve só entradas válidas e não altera os contadores."""
+    cache = SearchCache(ttls={"d": 0.01})
+    assert cache.peek("q", 5, "m6") is None
+    cache.set("q", 5, "m6", RESULTS)
+    cache.set("q", 5, "d", RESULTS)
+    assert cache.peek(" Q ", 5, "m6") == RESULTS
+    time.sleep(0.02)
+    assert cache.peek("q", 5, "d") is None and len(cache) == 2
+    stats = cache.stats()
+    assert stats["hits"] == 0 and stats["misses"] == 0
+    print("✅ test_peek_keeps_stats: PASSOU")
+
+
+def test_ttl_expiry():
+    """Entradas expiradas contam como miss e são removidas."""
+    cache = SearchCache(ttls={"d": 0.01})
+    cache.set("q", 5, "d", RESULTS)
+    time.sleep(0.02)
+    assert cache.get("q", 5, "d") is None
+    assert len(cache) == 0
+    print("✅ test_ttl_expiry: PASSOU")
+
+
+def test_lru_eviction():
+    """Ao exceder max_entries, a entrada menos usada recentemente sai."""
+    cache = SearchCache(max_entries=2)
+    cache.set("a", 5, None, RESULTS)
+    time.sleep(0.001)
+    cache.set("b", 5, None, RESULTS)
+    time.sleep(0.001)
+    assert cache.get("a", 5, None) is not None  # "a" passa a ser a mais recente
+    time.sleep(0.001)
+    cache.set("c", 5, None, RESULTS)
+    assert cache.get("b", 5, None) is None
+    assert cache.get("a", 5, None) is not None
+    assert cache.stats()["evictions"] == 1
+    print("✅ test_lru_eviction: PASSOU")
+
+
+def test_persistence(tmp_path):
+    """Entradas sobrevivem à reabertura do arquivo SQLite."""
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SearchCache(path=path)
+    cache.set("q", 5, "m6", RESULTS)
+    cache.close()
+    assert SearchCache(path=path).get("q", 5, "m6") == RESULTS
+    print("✅ test_persistence: PASSOU")
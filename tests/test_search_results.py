@@ -0,0 +1,89 @@
+"""
+Testes para o lote de resultados com serialização única (search_results.py).
+"""
+import sys
+import os
+import json
+
+# Adicionar diretório pai ao path para importar search_results
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+
+import search_results
+import tools
+from benchmark import measure_serialization, synthetic_serp_response
+from cache import SearchCache, set_search_cache
+from compaction import CompactionConfig, compact_results
+from search_results import SearchResults, to_json, to_pretty_json
+
+
+RESULTS = [
+    {"title": "Logística “inteligente”", "link": "https://a.com/1?x=1&y=2", "snippet": "ação é", "date": None},
+    {"title": "B", "link": "https://b.com/2", "snippet": "s", "date": "2 days ago"},
+]
+
+
+def _no_encode(*args, **kwargs):
+    raise AssertionError("O JSON deveria ter sido reaproveitado")
+
+
+def test_same_format_as_stdlib():
+    """O JSON compacto e o indentado são idênticos aos do json (ensure_ascii=False)."""
+    batch = SearchResults(RESULTS)
+    assert batch == RESULTS and isinstance(batch + [], list)
+    assert batch.json == json.dumps(RESULTS, ensure_ascii=False, separators=(",", ":"))
+    assert batch.pretty == json.dumps(RESULTS, ensure_ascii=False, indent=2)
+    assert batch.json is batch.json and to_json(batch) is batch.json
+    assert to_json(RESULTS) == batch.json and to_pretty_json(RESULTS) == batch.pretty
+    assert SearchResults().json == "[]"
+    print("✅ test_same_format_as_stdlib: PASSOU")
+
+
+def test_cache_round_trip_reuses_json(monkeypatch):
+    """O cache grava o JSON já serializado e devolve um lote que o reaproveita."""
+    batch = SearchResults(RESULTS)
+    payload = batch.json
+    monkeypatch.setattr(search_results, "dumps", _no_encode)
+    cache = SearchCache()
+    cache.set("iot", 5, "m6", batch)
+    cached = cache.get("IoT", 5, "m6")
+    assert isinstance(cached, SearchResults) and cached == RESULTS
+    assert cached.json == payload and to_json(cached) == payload
+    print("✅ test_cache_round_trip_reuses_json: PASSOU")
+
+
+def test_web_search_returns_batch(monkeypatch):
+    """O web_search devolve um SearchResults; a compactação desativada usa o JSON indentado memorizado."""
+    monkeypatch.setenv("SERPAPI_API_KEY", "chave")
+
+    def fake_request(method, url, **kwargs):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps(synthetic_serp_response(3)).encode("utf-8")
+        return resp
+
+    monkeypatch.setattr(tools, "request_with_retry", fake_request)
+    set_search_cache(SearchCache())
+    try:
+        first = tools.web_search("iot", num=3, time_period="m6")
+        second = tools.web_search("iot", num=3, time_period="m6")
+    finally:
+        set_search_cache(None)
+    assert isinstance(first, SearchResults) and len(first) == 3 and set(first[0]) == {"title", "link", "snippet", "date"}
+    assert isinstance(second, SearchResults) and second == first and second.json == first.json
+
+    pretty = second.pretty
+    monkeypatch.setattr(search_results, "dumps", _no_encode)
+    assert compact_results(second, CompactionConfig(enabled=False)).payload is pretty
+    print("✅ test_web_search_returns_batch: PASSOU")
+
+
+def test_serialization_microbenchmark():
+    """O microbenchmark mostra metade das serializações e do JSON gerado por busca."""
+    results = measure_serialization(rounds=20, num=10)
+    legacy, current = results["legacy"], results["current"]
+    assert legacy["encodes"] == 4 and current["encodes"] == 2
+    assert current["encoded_kib"] < 0.6 * legacy["encoded_kib"]
+    assert current["cpu_us"] > 0 and legacy["cpu_us"] > 0
+    print("✅ test_serialization_microbenchmark: PASSOU")
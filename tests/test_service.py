@@ -0,0 +1,286 @@
+"""
+Testes para o serviço HTTP de relatórios (SerpAPI e Gemini simulados via replay).
+"""
+import sys
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Adicionar diretório pai ao path para importar service
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+
+from agent_market import AGENT_ERROR_PREFIX, MarketAgent
+from replay import Fixture, ReplayChatModel, replay_environment
+from service import AgentFailed, Flight, ReportRequest, ReportServer, ReportService, ServiceConfig, ServiceOverloaded
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class BlockingAgent:
+    """Agente simulado que só termina quando `release` é sinalizado."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def run(self, topic, start_rev, end_rev, months, mode=None):
+        self.calls.append(topic)
+        self.started.set()
+        self.release.wait(5)
+        return f"Relatório sobre {topic}"
+
+    def stream(self, topic, start_rev, end_rev, months, mode=None):
+        yield {"type": "token", "text": "Rel"}
+        yield {"type": "final", "output": self.run(topic, start_rev, end_rev, months, mode)}
+
+
+class running_server:
+    """Sobe um ReportServer em porta livre durante o bloco."""
+
+    def __init__(self, service):
+        self.server = ReportServer(service, quiet=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self.server.url
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _body(topic="IoT", **extra):
+    return {"topic": topic, "start_rev": 100, "end_rev": 130, "months": 12, "mode": "agent", **extra}
+
+
+def _count_coalesced(service):
+    """Semáforo liberado a cada requisição que se junta a uma execução em andamento."""
+    joined = threading.Semaphore(0)
+    submit = service.submit
+
+    def counting_submit(*args, **kwargs):
+        flight, coalesced = submit(*args, **kwargs)
+        if coalesced:
+            joined.release()
+        return flight, coalesced
+
+    service.submit = counting_submit
+    return joined
+
+
+def test_identical_requests_share_one_execution():
+    """Requisições idênticas e simultâneas recebem o mesmo relatório de uma única execução."""
+    fixture = Fixture.load(os.path.join(FIXTURES, "replay_create_agent.json"))
+    meta = fixture.meta
+    started, release = threading.Event(), threading.Event()
+
+    class GatedAgent(MarketAgent):
+        # A execução só avança depois que as outras requisições se juntaram a ela
+        def run(self, *args, **kwargs):
+            started.set()
+            release.wait(5)
+            return super().run(*args, **kwargs)
+
+    def factory():
+        return GatedAgent(llm=ReplayChatModel(fixture=fixture), api="create_agent")
+
+    body = {k: meta[k] for k in ("topic", "start_rev", "end_rev", "months")}
+    with replay_environment(fixture):
+        service = ReportService(ServiceConfig(port=0, workers=2, max_queue=2), agent_factory=factory)
+        joined = _count_coalesced(service)
+        with running_server(service) as url:
+            def post(i):
+                return httpx.post(f"{url}/reports", json=body, timeout=30).json()
+
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                first = pool.submit(post, 0)
+                assert started.wait(5)
+                followers = [pool.submit(post, i) for i in range(1, 4)]
+                assert all(joined.acquire(timeout=5) for _ in followers)
+                release.set()
+                responses = [first.result()] + [f.result() for f in followers]
+            health = httpx.get(f"{url}/healthz").json()
+            metrics = httpx.get(f"{url}/metrics").text
+        service.shutdown()
+
+    reports = {r["report"] for r in responses}
+    assert len(reports) == 1 and len(reports.pop().split("\n\n")) == 4
+    assert [r["coalesced"] for r in responses] == [False, True, True, True]
+    assert health["executions"] == 1 and health["coalesced"] == 3 and health["running"] == 0
+    assert 'market_agent_service_requests_total{result="coalesced"} 3' in metrics
+    print("✅ test_identical_requests_share_one_execution: PASSOU")
+
+
+def test_stream_and_report_requests_coalesce():
+    """Com e sem streaming, a mesma análise roda uma vez e entrega o mesmo relatório."""
+    agent = BlockingAgent()
+    service = ReportService(ServiceConfig(port=0, workers=2, max_queue=0), agent_factory=lambda: agent)
+    joined = _count_coalesced(service)
+    with running_server(service) as url:
+        def stream():
+            with httpx.stream("POST", f"{url}/reports/stream", json=_body("A"), timeout=10) as resp:
+                return resp.headers["X-Coalesced"], [json.loads(line) for line in resp.iter_lines() if line]
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            streamed = pool.submit(stream)
+            assert agent.started.wait(5)
+            report = pool.submit(httpx.post, f"{url}/reports", json=_body(" a "), timeout=10)
+            assert joined.acquire(timeout=5)
+            agent.release.set()
+            coalesced_header, events = streamed.result()
+            body = report.result().json()
+
+    service.shutdown()
+    assert agent.calls == ["A"] and coalesced_header == "0"
+    assert [e["type"] for e in events] == ["token", "final"]
+    assert body["coalesced"] is True and body["report"] == events[-1]["output"] == "Relatório sobre A"
+    print("✅ test_stream_and_report_requests_coalesce: PASSOU")
+
+
+def test_timeout_is_total_deadline():
+    """Eventos chegando sem parar não estendem a espera além de request_timeout_s."""
+    flight = Flight()
+    stop = threading.Event()
+
+    def publish():
+        while not stop.is_set():
+            flight.publish({"type": "token", "text": "."})
+            stop.wait(0.01)
+
+    publisher = threading.Thread(target=publish, daemon=True)
+    publisher.start()
+    received = 0
+    try:
+        for _ in flight.iter_events(timeout=0.2):
+            received += 1
+        assert False, "Deveria ter lançado TimeoutError"
+    except TimeoutError:
+        pass
+    finally:
+        stop.set()
+        publisher.join()
+        flight.finish()
+    assert received > 0
+    print("✅ test_timeout_is_total_deadline: PASSOU")
+
+
+def test_stream_endpoint():
+    """O endpoint de streaming devolve um evento JSON por linha, terminando no final."""
+    fixture = Fixture.load(os.path.join(FIXTURES, "replay_create_agent.json"))
+    meta = fixture.meta
+    body = {k: meta[k] for k in ("topic", "start_rev", "end_rev", "months")}
+    with replay_environment(fixture):
+        service = ReportService(
+            ServiceConfig(port=0, workers=1, max_queue=0),
+            agent_factory=lambda: MarketAgent(llm=ReplayChatModel(fixture=fixture), api="create_agent"),
+        )
+        with running_server(service) as url:
+            with httpx.stream("POST", f"{url}/reports/stream", json=body, timeout=30) as resp:
+                assert resp.headers["content-type"].startswith("application/x-ndjson")
+                events = [json.loads(line) for line in resp.iter_lines() if line]
+        service.shutdown()
+
+    types = [e["type"] for e in events]
+    assert "tool_start" in types and "tool_end" in types
+    assert types[-1] == "final" and len(events[-1]["output"].split("\n\n")) == 4
+    print("✅ test_stream_endpoint: PASSOU")
+
+
+def test_admission_control():
+    """Com o pool e a fila cheios, requisições novas recebem 503; idênticas se juntam à execução."""
+    agent = BlockingAgent()
+    service = ReportService(ServiceConfig(port=0, workers=1, max_queue=0), agent_factory=lambda: agent)
+    joined = _count_coalesced(service)
+    with running_server(service) as url:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(httpx.post, f"{url}/reports", json=_body("A"), timeout=10)
+            assert agent.started.wait(5)
+            follower = pool.submit(httpx.post, f"{url}/reports", json=_body("a"), timeout=10)
+
+            rejected = httpx.post(f"{url}/reports", json=_body("B"), timeout=10)
+            assert rejected.status_code == 503 and rejected.headers["Retry-After"] == "1"
+            invalid = httpx.post(f"{url}/reports", json={"topic": "C", "start_rev": "x"}, timeout=10)
+            assert invalid.status_code == 400
+
+            assert joined.acquire(timeout=5)
+            agent.release.set()
+            assert first.result().json()["report"] == "Relatório sobre A"
+            assert follower.result().json()["coalesced"] is True
+
+    assert agent.calls == ["A"]
+    assert service.stats()["rejected"] == 1
+    # Depois de liberada a vaga, novas requisições são aceitas
+    report, coalesced = service.run(ReportRequest.from_json(_body("B")))
+    assert report == "Relatório sobre B" and not coalesced
+    service.shutdown()
+    print("✅ test_admission_control: PASSOU")
+
+
+def test_request_validation_and_errors():
+    """Campos ausentes, modo inválido e erros do agente chegam a quem espera."""
+    for data in ({"topic": "x"}, _body(mode="outro"), [1, 2], _body("   "), _body(months=" ")):
+        try:
+            ReportRequest.from_json(data)
+            assert False, "Deveria ter lançado ValueError"
+        except ValueError:
+            pass
+    assert ReportRequest.from_json(_body(" IoT ")).topic == "IoT"
+    assert ReportRequest.from_json(_body(" IoT ")).key() == ReportRequest.from_json(_body("iot")).key()
+    assert ReportRequest.from_json(_body()).key() != ReportRequest.from_json(_body(mode="pipeline")).key()
+
+    class FailingAgent(BlockingAgent):
+        def run(self, *args, **kwargs):
+            raise RuntimeError("falha simulada")
+
+    service = ReportService(ServiceConfig(workers=1, max_queue=0), agent_factory=FailingAgent)
+    try:
+        service.run(ReportRequest.from_json(_body()))
+        assert False, "Deveria ter lançado RuntimeError"
+    except RuntimeError as e:
+        assert "falha simulada" in str(e)
+    assert service.stats()["failed"] == 1
+    service.shutdown()
+
+    try:
+        ReportService(ServiceConfig(workers=0), agent_factory=BlockingAgent)
+        assert False, "Deveria ter lançado ValueError"
+    except ValueError:
+        pass
+    assert issubclass(ServiceOverloaded, RuntimeError)
+    print("✅ test_request_validation_and_errors: PASSOU")
+
+
+def test_agent_error_report_is_a_failure():
+    """O relatório de erro do MarketAgent vira 502 (ou evento com error) e conta como falha."""
+    class ErrorReportAgent(BlockingAgent):
+        def run(self, *args, **kwargs):
+            return f"{AGENT_ERROR_PREFIX}: cota esgotada"
+
+    service = ReportService(ServiceConfig(workers=1, max_queue=0), agent_factory=ErrorReportAgent)
+    try:
+        with running_server(service) as url:
+            response = httpx.post(f"{url}/reports", json=_body(), timeout=5)
+            assert response.status_code == 502
+            assert response.json()["error"] == f"{AGENT_ERROR_PREFIX}: cota esgotada"
+
+            response = httpx.post(f"{url}/reports/stream", json=_body(), timeout=5)
+            events = [json.loads(line) for line in response.text.splitlines()]
+            assert events[-1]["type"] == "final" and events[-1]["output"] == ""
+            assert events[-1]["error"] == f"{AGENT_ERROR_PREFIX}: cota esgotada"
+
+            metrics = httpx.get(f"{url}/metrics", timeout=5).text
+            assert 'market_agent_service_requests_total{result="failed"} 2' in metrics
+        try:
+            service.run(ReportRequest.from_json(_body()))
+            assert False, "Deveria ter lançado AgentFailed"
+        except AgentFailed:
+            pass
+        assert service.stats()["failed"] == 3
+    finally:
+        service.shutdown()
+    print("✅ test_agent_error_report_is_a_failure: PASSOU")
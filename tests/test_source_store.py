@@ -0,0 +1,181 @@
+"""
+Testes para o armazém de fontes incremental (busca e LLM simulados).
+"""
+import sys
+import os
+import json
+from types import SimpleNamespace
+
+# Adicionar diretório pai ao path para importar source_store
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pipeline
+import report_cache
+from agent_market import MarketAgent
+from metrics import MetricsCollector
+from pipeline import run_pipeline
+from report_cache import ReportCache, set_report_cache
+from source_store import FULL_WINDOW, SourceStore, delta_window, get_source_store, set_source_store
+from helpers import FakeClock, FakeLLM, SilentLogger
+
+
+DAY = 24 * 60 * 60
+
+A = {"title": "Fonte A", "link": "https://a.com/1", "snippet": "snippet A", "date": "2 days ago"}
+B = {"title": "Fonte B", "link": "https://b.com/2", "snippet": "snippet B", "date": None}
+C = {"title": "Fonte C", "link": "https://c.com/3", "snippet": "snippet C", "date": "Mar 5, 2025"}
+D = {"title": "Fonte D", "link": "https://d.com/4", "snippet": "snippet D", "date": "1 day ago"}
+
+
+def _selection(*pairs):
+    return json.dumps({"fontes": [
+        {"titulo": r["title"], "link": r["link"], "data": r["date"] or "", "resumo": summary}
+        for r, summary in pairs
+    ]})
+
+
+def test_delta_window():
+    """A janela da busca cobre o intervalo desde a última execução; sem histórico, a completa."""
+    assert delta_window(None) == FULL_WINDOW
+    assert delta_window(3600) == "d"
+    assert delta_window(2 * DAY) == "w"
+    assert delta_window(20 * DAY) == "m"
+    assert delta_window(90 * DAY) == FULL_WINDOW
+    assert delta_window(400 * DAY) == FULL_WINDOW
+    assert delta_window(-1) == FULL_WINDOW
+    print("✅ test_delta_window: PASSOU")
+
+
+def test_merge_separates_new_and_known():
+    """URLs já armazenadas (mesmo conteúdo) são conhecidas; conteúdo alterado volta a ser novo."""
+    clock = FakeClock(1_000_000.0)
+    store = SourceStore(clock=clock)
+    assert store.window("IoT") == FULL_WINDOW
+    delta = store.merge("IoT", [A, B, dict(A, link="http://www.a.com/1/")])
+    assert delta.new == [A, B] and delta.known == []
+    store.finish_run("IoT", [{"link": A["link"], "resumo": "resumo A"},
+                             {"link": B["link"], "resumo": B["snippet"]}], delta)
+    # Só o resumo escrito pelo LLM é armazenado (o snippet de reparo não)
+    assert store.summaries(" iot ") == {"https://a.com/1": "resumo A"}
+
+    clock.now += 2 * DAY
+    assert store.window("iot") == "w"
+    delta = store.merge("iot", [A, dict(B, snippet="snippet B atualizado"), C])
+    assert [r["link"] for r in delta.new] == [B["link"], C["link"]]
+    assert delta.known == [{"title": "Fonte A", "link": A["link"], "snippet": "snippet A",
+                            "date": "2 days ago", "resumo": "resumo A"}]
+
+    # Fontes que não aparecem em buscas há mais de max_age são descartadas
+    clock.now += 200 * DAY
+    assert store.merge("iot", [D]).known == []
+    assert store.stats()["full_searches"] == 1 and store.stats()["delta_searches"] == 1
+    assert store.forget("IoT") == 1 and len(store) == 0 and store.last_run("IoT") is None
+    print("✅ test_merge_separates_new_and_known: PASSOU")
+
+
+def test_pipeline_incremental_runs(monkeypatch):
+    """Execuções seguintes buscam só o delta, resumem só URLs novas e reaproveitam os resumos."""
+    clock = FakeClock(1_000_000.0)
+    store = SourceStore(clock=clock)
+    searches = []
+    responses = [[A, B, C], [A, D], [A]]
+
+    def fake_search(q, num=5, time_period=None):
+        searches.append(time_period)
+        return responses[len(searches) - 1]
+
+    monkeypatch.setattr(pipeline, "web_search", fake_search)
+    saved = get_source_store()
+    set_source_store(store)
+    try:
+        first = FakeLLM([_selection((A, "resumo A"), (B, "resumo B")), "P1\n\nP2\n\nP3\n\nP4"])
+        run_pipeline(first, "IoT", 100, 120, 6, logger=SilentLogger())
+
+        # Dois dias depois: só D é novo; A reaproveita o resumo armazenado
+        clock.now += 2 * DAY
+        second = FakeLLM([_selection((D, "resumo D")), "P1\n\nP2\n\nP3\n\nP4"])
+        result = run_pipeline(second, "IoT", 100, 120, 6, logger=SilentLogger())
+        assert "https://d.com/4" in second.prompts[0] and "https://a.com/1" not in second.prompts[0]
+        assert [(s["link"], s["resumo"]) for s in result.sources] == [
+            ("https://d.com/4", "resumo D"), ("https://a.com/1", "resumo A"),
+        ]
+
+        # No dia seguinte, sem fontes novas: a seleção não chama o LLM
+        clock.now += 3600
+        third = FakeLLM(["P1\n\nP2\n\nP3\n\nP4"])
+        result = run_pipeline(third, "IoT", 100, 120, 6, logger=SilentLogger())
+        text = MetricsCollector().prometheus_text()
+    finally:
+        set_source_store(saved)
+
+    assert searches == ["m6", "w", "d"]
+    assert len(third.prompts) == 1 and not result.selection_repaired
+    assert {s["resumo"] for s in result.sources} == {"resumo A", "resumo D"}
+    assert result.usage["selection"]["total_tokens"] == 0
+    stats = store.stats()
+    assert stats["summaries_stored"] == 3 and stats["summaries_reused"] == 3
+    assert 'market_agent_source_store_searches_total{window="delta"} 2' in text
+    assert "market_agent_source_store_summaries_reused_total 3" in text
+    print("✅ test_pipeline_incremental_runs: PASSOU")
+
+
+def test_report_cache_daily_refresh_searches_only_delta(monkeypatch):
+    """Com cache de relatórios e armazém ativos, cada execução faz no máximo uma busca (a do delta)."""
+    monkeypatch.setenv("GEMINI_API_KEY", "chave-de-teste")
+    clock = FakeClock(1_000_000.0)
+    monkeypatch.setattr(report_cache, "time", SimpleNamespace(time=clock))
+    searches = []
+    responses = [[A, B], [A, D]]
+
+    def fake_search(q, num=5, time_period=None):
+        searches.append(time_period)
+        return responses[len(searches) - 1]
+
+    monkeypatch.setattr(pipeline, "web_search", fake_search)
+    saved = get_source_store()
+    set_source_store(SourceStore(clock=clock))
+    set_report_cache(ReportCache(max_age=12 * 3600))
+    try:
+        llm = FakeLLM([
+            _selection((A, "resumo A"), (B, "resumo B")), "P1\n\nP2\n\nP3\n\nP4",
+            _selection((D, "resumo D")), "Q1\n\nQ2\n\nQ3\n\nQ4",
+        ])
+        agent = MarketAgent(llm=llm, api=None)
+        assert agent.run("IoT", 100, 120, 6) == "P1\n\nP2\n\nP3\n\nP4"
+        assert agent.run("IoT", 100, 120, 6) == "P1\n\nP2\n\nP3\n\nP4"
+        assert searches == ["m6"] and len(llm.prompts) == 2
+
+        # No dia seguinte o relatório expirou: só a busca delta vai ao SerpAPI
+        clock.now += DAY - 60
+        assert agent.run("IoT", 100, 120, 6) == "Q1\n\nQ2\n\nQ3\n\nQ4"
+    finally:
+        set_source_store(saved)
+        set_report_cache(None)
+
+    assert searches == ["m6", "d"]
+    print("✅ test_report_cache_daily_refresh_searches_only_delta: PASSOU")
+
+
+def test_store_from_env(monkeypatch, tmp_path):
+    """O armazém é opcional (SOURCE_STORE_ENABLED) e persiste em SOURCE_STORE_PATH."""
+    saved = get_source_store()
+    set_source_store(None)
+    try:
+        monkeypatch.delenv("SOURCE_STORE_ENABLED", raising=False)
+        assert get_source_store() is None
+        path = str(tmp_path / "fontes" / "sources.sqlite3")
+        monkeypatch.setenv("SOURCE_STORE_ENABLED", "1")
+        monkeypatch.setenv("SOURCE_STORE_PATH", path)
+        monkeypatch.setenv("SOURCE_STORE_MAX_KNOWN", "3")
+        store = get_source_store()
+        assert store is get_source_store() and store.max_known == 3
+        store.finish_run("IoT", [], store.merge("IoT", [A]))
+        store.close()
+    finally:
+        set_source_store(saved)
+
+    reopened = SourceStore(path)
+    assert reopened.last_run("iot") is not None and reopened.window("IoT") == "d"
+    assert len(reopened) == 1
+    reopened.close()
+    print("✅ test_store_from_env: PASSOU")
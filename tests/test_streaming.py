@@ -0,0 +1,107 @@
+"""
+Testes para o streaming de eventos (modelo e busca simulados).
+"""
+import sys
+import os
+import asyncio
+import json
+
+# Adicionar diretório pai ao path para importar agent_market
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain.agents import create_agent
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import Tool
+
+import pipeline
+from agent_market import AgentWrapper
+from pipeline import stream_pipeline
+from streaming import acollect_report, collect_report
+from helpers import SilentLogger
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model que devolve respostas roteirizadas, com streaming palavra a palavra."""
+    replies: list
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self.replies.pop(0))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        msg = self.replies.pop(0)
+        if msg.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc["id"], "index": i}
+                for i, tc in enumerate(msg.tool_calls)
+            ]))
+            return
+        for word in msg.content.split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def _agent(replies):
+    model = ScriptedChatModel(replies=replies)
+    tool = Tool(name="echo", func=lambda s: "eco " + s, description="repete a entrada")
+    return AgentWrapper(create_agent(model=model, tools=[tool], system_prompt="s"), SilentLogger())
+
+
+def _replies():
+    return [
+        AIMessage(content="", tool_calls=[{"name": "echo", "args": {"__arg1": "oi"}, "id": "1"}]),
+        AIMessage(content="Relatório em quatro partes"),
+    ]
+
+
+def test_agent_stream_events_in_order():
+    """Eventos de ferramenta chegam antes dos tokens e o final traz o relatório."""
+    events = list(_agent(_replies()).stream({"input": "tema"}))
+    types = [e["type"] for e in events]
+    assert types[0] == "tool_start" and events[0]["name"] == "echo"
+    assert types[1] == "tool_end" and events[1]["output"] == "eco oi"
+    tokens = "".join(e["text"] for e in events if e["type"] == "token")
+    assert tokens.strip() == "Relatório em quatro partes"
+    assert types[-1] == "final"
+    assert events[-1]["output"].strip() == "Relatório em quatro partes"
+    print("✅ test_agent_stream_events_in_order: PASSOU")
+
+
+def test_agent_astream():
+    """A versão assíncrona produz o mesmo relatório final."""
+    report = asyncio.run(acollect_report(_agent(_replies()).astream({"input": "tema"})))
+    assert report.strip() == "Relatório em quatro partes"
+    print("✅ test_agent_astream: PASSOU")
+
+
+def test_stream_pipeline(monkeypatch):
+    """O pipeline emite tool events, tokens do relatório e o resultado final."""
+    results = [
+        {"title": "A", "link": "https://a.com", "snippet": "a", "date": None},
+        {"title": "B", "link": "https://b.com", "snippet": "b", "date": None},
+    ]
+    monkeypatch.setattr(pipeline, "web_search", lambda q, num=5, time_period=None: results)
+    selection = json.dumps({"fontes": [
+        {"titulo": "A", "link": "https://a.com", "resumo": "ra"},
+        {"titulo": "B", "link": "https://b.com", "resumo": "rb"},
+    ]})
+    llm = ScriptedChatModel(replies=[AIMessage(content=selection), AIMessage(content="P1 P2 P3 P4")])
+
+    events = list(stream_pipeline(llm, "IoT", 100, 120, 6, logger=SilentLogger()))
+    names = [(e["type"], e.get("name")) for e in events if e["type"].startswith("tool")]
+    assert names == [("tool_start", "web_search"), ("tool_end", "web_search"),
+                     ("tool_start", "calc_cagr"), ("tool_end", "calc_cagr")]
+    assert sum(1 for e in events if e["type"] == "token") == 4
+    assert collect_report(events) == "P1 P2 P3 P4"
+    assert events[-1]["result"].sources[0]["link"] == "https://a.com"
+    print("✅ test_stream_pipeline: PASSOU")
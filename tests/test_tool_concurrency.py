@@ -0,0 +1,141 @@
+"""
+Testes para a execução concorrente das ferramentas de um mesmo turno (modelo e busca simulados).
+"""
+import sys
+import os
+import time
+import asyncio
+import threading
+
+# Adicionar diretório pai ao path para importar tool_concurrency
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import agent_market
+from agent_market import MarketAgent
+from budget import RunBudget
+from tool_concurrency import configure_tool_concurrency, get_tool_limits, resolve_tool_execution, tool_limits_from_env
+
+
+class FanOutChatModel(BaseChatModel):
+    """Pede várias buscas em uma única resposta e guarda as mensagens recebidas depois."""
+    queries: list
+    received: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fan-out"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _reply(self, messages):
+        if not any(isinstance(m, ToolMessage) for m in messages):
+            calls = [{"name": "web_search", "args": {"__arg1": q}, "id": str(i)} for i, q in enumerate(self.queries)]
+            return AIMessage(content="", tool_calls=calls)
+        self.received.extend(m for m in messages if isinstance(m, ToolMessage))
+        return AIMessage(content="Relatório")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+
+class SlowSearch:
+    """web_search simulado: a primeira consulta é a mais lenta; registra o pico de chamadas simultâneas."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, q, num=5, time_period=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delays[q])
+        with self._lock:
+            self.active -= 1
+        return [{"title": q, "link": f"https://{q}.com/", "snippet": q, "date": None}]
+
+    async def acall(self, q, num=5, time_period=None):
+        return await asyncio.to_thread(self, q, num, time_period)
+
+
+DELAYS = {"a": 0.4, "b": 0.2, "c": 0.1, "d": 0.1}
+
+
+def _run(monkeypatch, tool_execution=None, use_async=False):
+    search = SlowSearch(DELAYS)
+    monkeypatch.setattr(agent_market, "web_search", search)
+    monkeypatch.setattr(agent_market, "aweb_search", search.acall)
+    model = FanOutChatModel(queries=list(DELAYS), received=[])
+    agent = MarketAgent(llm=model, api="create_agent", budget=RunBudget(max_tool_calls=0),
+                        tool_execution=tool_execution)
+    t0 = time.perf_counter()
+    if use_async:
+        report = asyncio.run(agent.arun("IoT", 100, 120, 6, mode="agent", use_cache=False))
+    else:
+        report = agent.run("IoT", 100, 120, 6, mode="agent", use_cache=False)
+    assert report == "Relatório"
+    return time.perf_counter() - t0, search.peak, [m.tool_call_id for m in model.received]
+
+
+def test_parallel_keeps_call_order(monkeypatch):
+    """As buscas de um turno rodam juntas e voltam ao modelo na ordem das chamadas."""
+    configure_tool_concurrency(web_search=0)
+    try:
+        elapsed, peak, order = _run(monkeypatch)
+    finally:
+        configure_tool_concurrency(web_search=4)
+    assert order == ["0", "1", "2", "3"]
+    assert peak == 4
+    assert elapsed < sum(DELAYS.values())
+    print("✅ test_parallel_keeps_call_order: PASSOU")
+
+
+def test_per_tool_cap(monkeypatch):
+    """O limite da ferramenta vale também dentro de um turno (síncrono e assíncrono)."""
+    configure_tool_concurrency(web_search=2)
+    try:
+        _, peak, order = _run(monkeypatch)
+        assert peak == 2 and order == ["0", "1", "2", "3"]
+        _, peak, order = _run(monkeypatch, use_async=True)
+        assert peak == 2 and order == ["0", "1", "2", "3"]
+    finally:
+        configure_tool_concurrency(web_search=4)
+    print("✅ test_per_tool_cap: PASSOU")
+
+
+def test_sequential_mode(monkeypatch):
+    """Com TOOL_EXECUTION=sequential, as ferramentas rodam uma de cada vez."""
+    monkeypatch.setenv("TOOL_EXECUTION", "sequential")
+    elapsed, peak, order = _run(monkeypatch)
+    assert peak == 1 and order == ["0", "1", "2", "3"]
+    assert elapsed >= sum(DELAYS.values())
+    print("✅ test_sequential_mode: PASSOU")
+
+
+def test_tool_execution_from_env(monkeypatch):
+    """Limites por ferramenta e modo lidos do ambiente; valores inválidos são rejeitados."""
+    monkeypatch.setenv("TOOL_MAX_CONCURRENCY_WEB_SEARCH", "2")
+    monkeypatch.setenv("TOOL_MAX_CONCURRENCY_CALC_CAGR", "1")
+    limits = tool_limits_from_env()
+    assert limits.limit("web_search") == 2 and limits.limit("calc_cagr") == 1
+    assert limits.limit("multi_search") == get_tool_limits().limit("multi_search")
+    assert resolve_tool_execution("SEQUENTIAL") == "sequential"
+
+    monkeypatch.setenv("TOOL_MAX_CONCURRENCY_WEB_SEARCH", "muitas")
+    for call in (tool_limits_from_env, lambda: resolve_tool_execution("aleatorio")):
+        try:
+            call()
+            assert False, "Deveria ter lançado ValueError"
+        except ValueError:
+            pass
+    print("✅ test_tool_execution_from_env: PASSOU")
@@ -0,0 +1,94 @@
+"""
+Execução concorrente das chamadas de ferramentas de um mesmo turno do modelo.
+
+Quando o modelo pede várias ferramentas em uma única resposta (ex.: web_search
+para duas consultas e calc_cagr), o grafo do create_agent despacha cada chamada
+como uma tarefa do mesmo passo: no código síncrono elas rodam no pool de
+threads do LangGraph e, no assíncrono, no event loop. As ToolMessages voltam
+na ordem em que o modelo pediu as chamadas, qualquer que seja a ordem de
+término.
+
+Este módulo define o modo de execução (TOOL_EXECUTION=parallel | sequential)
+e o limite de chamadas simultâneas por ferramenta (ex.: web_search, que
+consome a cota da SerpAPI), aplicado pelo envoltório limit_tool.
+"""
+import functools
+import os
+
+from providers import ProviderLimits
+
+
+TOOL_EXECUTION_MODES = ("parallel", "sequential")
+
+# Limites padrão de chamadas simultâneas por ferramenta (0 = sem limite).
+# multi_search já dispara várias buscas por chamada (ver tools.py).
+DEFAULT_TOOL_CONCURRENCY: dict[str, int] = {
+    "web_search": 4,
+    "multi_search": 1,
+}
+
+_ENV_PREFIX = "TOOL_MAX_CONCURRENCY_"
+
+
+def resolve_tool_execution(mode: str | None = None) -> str:
+    """Valida o modo informado (padrão: variável TOOL_EXECUTION ou 'parallel')."""
+    mode = (mode or os.getenv("TOOL_EXECUTION") or "parallel").lower()
+    if mode not in TOOL_EXECUTION_MODES:
+        raise ValueError(f"Modo de execução de ferramentas inválido: {mode!r} (use um de {TOOL_EXECUTION_MODES})")
+    return mode
+
+
+def tool_limits_from_env() -> ProviderLimits:
+    """
+    Lê TOOL_MAX_CONCURRENCY_<FERRAMENTA> (ex.: TOOL_MAX_CONCURRENCY_WEB_SEARCH=2);
+    ferramentas não configuradas usam DEFAULT_TOOL_CONCURRENCY.
+    """
+    limits = dict(DEFAULT_TOOL_CONCURRENCY)
+    for key, value in os.environ.items():
+        if not key.startswith(_ENV_PREFIX) or not value:
+            continue
+        try:
+            limits[key[len(_ENV_PREFIX):].lower()] = int(value)
+        except ValueError:
+            raise ValueError(f"Variável {key} deve ser inteira (recebido: {value!r})")
+    return ProviderLimits(limits)
+
+
+_tool_limits = tool_limits_from_env()
+
+
+def get_tool_limits() -> ProviderLimits:
+    """Retorna os limites de concorrência por ferramenta do processo."""
+    return _tool_limits
+
+
+def configure_tool_concurrency(**limits: int | None) -> None:
+    """
+    Ajusta limites por ferramenta (ex.: configure_tool_concurrency(web_search=2); None ou 0 remove o limite).
+    """
+    for name, limit in limits.items():
+        _tool_limits.set_limit(name, limit)
+
+
+def limit_tool(tool):
+    """
+    Devolve uma cópia do Tool cujas func/coroutine ocupam uma vaga da
+    ferramenta (pelo nome) durante a chamada. Nome, descrição e esquema de
+    entrada não mudam.
+    """
+    name, func, coroutine = tool.name, tool.func, tool.coroutine
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        with _tool_limits.slot(name):
+            return func(*args, **kwargs)
+
+    update = {"func": run}
+    if coroutine is not None:
+        @functools.wraps(coroutine)
+        async def arun(*args, **kwargs):
+            async with _tool_limits.aslot(name):
+                return await coroutine(*args, **kwargs)
+
+        update["coroutine"] = arun
+    return tool.model_copy(update=update)
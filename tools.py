@@ -1,60 +1,362 @@
 """
 Ferramentas para o agente de análise de mercado.
 """
+import asyncio
 import json
-from typing import Any
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Iterable
 import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import httpx
+import numpy as np
 import requests
 
+from cache import get_search_cache
+from http_client import arequest_with_retry, request_with_retry
+from providers import (
+    SERPAPI, aprovider_attempt, aprovider_breaker, is_provider_failure, provider_attempt, provider_breaker,
+)
+from search_results import SearchResults
 
-def web_search(query: str, num: int = 5, time_period: str | None = None) -> list[dict[str, Any]]:
+
+SERPAPI_URL = "https://serpapi.com/search.json"
+
+
+def _serpapi_url() -> str:
+    # SERPAPI_URL permite apontar para um servidor local (ex.: replay.SerpAPIStubServer)
+    return os.getenv("SERPAPI_URL") or SERPAPI_URL
+
+
+def _serpapi_api_key() -> str:
+    api_key = os.getenv("SERPAPI_API_KEY")
+    if not api_key:
+        raise ValueError("SERPAPI_API_KEY não encontrada. Configure no arquivo .env")
+    return api_key
+
+
+def _serpapi_params(query: str, num: int, time_period: str | None, api_key: str) -> dict[str, Any]:
+    params = {
+        "engine": "google",
+        "q": query,
+        "num": num,
+        "api_key": api_key,
+    }
+    # Filtro temporal opcional (tbs=qdr:<time>)
+    if time_period:
+        params["tbs"] = f"qdr:{time_period}"
+    return params
+
+
+def _normalize_results(results: dict[str, Any], num: int) -> SearchResults:
+    # Normalizar retorno - extrair apenas campos essenciais; o lote guarda o
+    # próprio JSON, serializado uma vez para cache, logs e prompt (search_results.py)
+    organic_results = results.get("organic_results", [])
+    return SearchResults(
+        {
+            "title": item.get("title", ""),
+            "link": item.get("link", ""),
+            "snippet": item.get("snippet", ""),
+            "date": item.get("date", None),  # Pode ser None se não disponível
+        }
+        for item in organic_results[:num]
+    )
+
+
+def _stale_fallback(cache, query: str, num: int, time_period: str | None, error: Exception):
+    """Resultados antigos do cache quando o SerpAPI falha (429/5xx/circuito aberto), ou None."""
+    if cache is None or not is_provider_failure(error):
+        return None
+    # Contado em search_cache_stale_served_total (ver metrics.py)
+    return cache.get_stale(query, num, time_period)
+
+
+def web_search(
+    query: str,
+    num: int = 5,
+    time_period: str | None = None,
+    use_cache: bool = True,
+) -> list[dict[str, Any]]:
     """
     Busca notícias/relatórios usando SerpAPI.
     
     Args:
         query: Consulta de busca
         num: Número máximo de resultados (padrão: 5)
+        time_period: Janela temporal qdr: opcional (ex.: 'd', 'w', 'm6')
+        use_cache: Consulta/popula o cache persistente (ver cache.py); com o
+            SerpAPI degradado, entradas expiradas do cache são usadas como fallback
     
     Returns:
         Lista de dicionários com title, link, snippet, date
     """
-    api_key = os.getenv("SERPAPI_API_KEY")
-    if not api_key:
-        raise ValueError("SERPAPI_API_KEY não encontrada. Configure no arquivo .env")
+    api_key = _serpapi_api_key()
+    
+    cache = get_search_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(query, num, time_period)
+        if cached is not None:
+            return cached
     
     try:
-        params = {
-            "engine": "google",
-            "q": query,
-            "num": num,
-            "api_key": api_key,
-        }
-        # Filtro temporal opcional (tbs=qdr:<time>)
-        if time_period:
-            params["tbs"] = f"qdr:{time_period}"
-
-        resp = requests.get("https://serpapi.com/search.json", params=params, timeout=20)
-        resp.raise_for_status()
-        results = resp.json()
-        
-        # Normalizar retorno - extrair apenas campos essenciais
-        organic_results = results.get("organic_results", [])
-        normalized = []
-        
-        for item in organic_results[:num]:
-            normalized.append({
-                "title": item.get("title", ""),
-                "link": item.get("link", ""),
-                "snippet": item.get("snippet", ""),
-                "date": item.get("date", None)  # Pode ser None se não disponível
-            })
-        
-        return normalized
-    
-    except requests.HTTPError as e:
-        raise RuntimeError(f"Erro HTTP no SerpAPI: {e.response.status_code} {e.response.text[:200]}")
+        params = _serpapi_params(query, num, time_period, api_key)
+        # Sessão compartilhada (keep-alive) com retry/backoff em 429/5xx; o disjuntor
+        # do SerpAPI cobre a busca e cada tentativa ocupa sua vaga e ficha (ver providers.py)
+        with provider_breaker(SERPAPI):
+            resp = request_with_retry(
+                "GET", _serpapi_url(), params=params, guard=lambda: provider_attempt(SERPAPI)
+            )
+            resp.raise_for_status()
+        normalized = _normalize_results(resp.json(), num)
+    
+    except Exception as e:
+        stale = _stale_fallback(cache, query, num, time_period, e)
+        if stale is not None:
+            return stale
+        if isinstance(e, requests.HTTPError):
+            raise RuntimeError(f"Erro HTTP no SerpAPI: {e.response.status_code} {e.response.text[:200]}")
+        raise RuntimeError(f"Erro ao buscar no SerpAPI: {str(e)}")
+    
+    if cache is not None:
+        cache.set(query, num, time_period, normalized)
+    return normalized
+
+
+async def aweb_search(
+    query: str,
+    num: int = 5,
+    time_period: str | None = None,
+    use_cache: bool = True,
+) -> list[dict[str, Any]]:
+    """
+    Versão assíncrona de web_search (httpx), com o mesmo cache e política de retry.
+    
+    Args:
+        query: Consulta de busca
+        num: Número máximo de resultados (padrão: 5)
+        time_period: Janela temporal qdr: opcional (ex.: 'd', 'w', 'm6')
+        use_cache: Consulta/popula o cache persistente (ver cache.py); com o
+            SerpAPI degradado, entradas expiradas do cache são usadas como fallback
+    
+    Returns:
+        Lista de dicionários com title, link, snippet, date
+    """
+    api_key = _serpapi_api_key()
+    
+    cache = get_search_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(query, num, time_period)
+        if cached is not None:
+            return cached
+    
+    try:
+        params = _serpapi_params(query, num, time_period, api_key)
+        async with aprovider_breaker(SERPAPI):
+            resp = await arequest_with_retry(
+                "GET", _serpapi_url(), params=params, guard=lambda: aprovider_attempt(SERPAPI)
+            )
+            resp.raise_for_status()
+        normalized = _normalize_results(resp.json(), num)
+    
     except Exception as e:
+        stale = _stale_fallback(cache, query, num, time_period, e)
+        if stale is not None:
+            return stale
+        if isinstance(e, httpx.HTTPStatusError):
+            raise RuntimeError(f"Erro HTTP no SerpAPI: {e.response.status_code} {e.response.text[:200]}")
         raise RuntimeError(f"Erro ao buscar no SerpAPI: {str(e)}")
+    
+    if cache is not None:
+        cache.set(query, num, time_period, normalized)
+    return normalized
+
+
+# Intenções usadas para gerar variantes de consulta a partir de um tema
+SEARCH_INTENTS = ("investimentos", "crescimento", "mercado")
+
+# Parâmetros de rastreamento removidos na canonicalização de URLs
+_TRACKING_PARAMS = {"gclid", "fbclid", "mc_cid", "mc_eid", "ref", "ref_src", "igshid"}
+
+_RELATIVE_DATE_RE = re.compile(
+    r"^(?:há\s+)?(\d+|an?|um|uma)\s+"
+    r"(minutes?|mins?|minutos?|hours?|horas?|days?|dias?|weeks?|semanas?|months?|meses|mês|years?|anos?)"
+    r"(?:\s+ago)?$"
+)
+_RELATIVE_UNITS = {
+    "min": timedelta(minutes=1),
+    "hou": timedelta(hours=1),
+    "hor": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "dia": timedelta(days=1),
+    "wee": timedelta(weeks=1),
+    "sem": timedelta(weeks=1),
+    "mon": timedelta(days=30),
+    "mes": timedelta(days=30),
+    "mês": timedelta(days=30),
+    "yea": timedelta(days=365),
+    "ano": timedelta(days=365),
+}
+_DATE_FORMATS = ("%b %d, %Y", "%B %d, %Y", "%d %b %Y", "%d %B %Y", "%Y-%m-%d", "%d/%m/%Y")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Canonicaliza uma URL para deduplicação: esquema/host em minúsculas, sem 'www.',
+    sem fragmento, sem parâmetros de rastreamento (utm_*, gclid...) e sem barra final.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/")
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme, host, path, urlencode(query), ""))
+
+
+def parse_result_date(value: str | None, now: datetime | None = None) -> datetime | None:
+    """
+    Interpreta o campo `date` do SerpAPI ("3 days ago", "há 2 semanas", "Mar 5, 2025",
+    "2025-03-05", "05/03/2025").
+    
+    Returns:
+        datetime correspondente, ou None se ausente/não reconhecido
+    """
+    if not value:
+        return None
+    text = value.strip().lower()
+    now = now or datetime.now()
+    match = _RELATIVE_DATE_RE.match(text)
+    if match:
+        amount, unit = match.groups()
+        count = int(amount) if amount.isdigit() else 1
+        return now - count * _RELATIVE_UNITS[unit[:3]]
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def query_variants(topic: str, intents: Iterable[str] = SEARCH_INTENTS) -> list[str]:
+    """Gera as variantes de consulta tema × intenção (ex.: 'IoT investimentos')."""
+    return [f"{topic} {intent}" for intent in intents]
+
+
+def merge_search_results(result_lists: Iterable[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """
+    Mescla listas de resultados, remove duplicados pela URL canônica e ordena
+    pela data (mais recentes primeiro; sem data ao final, na ordem original).
+    """
+    seen: set[str] = set()
+    merged: list[dict[str, Any]] = []
+    for results in result_lists:
+        for item in results:
+            key = canonical_url(item.get("link") or "") or item.get("title", "")
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    
+    now = datetime.now()
+    dated = [(parse_result_date(item.get("date"), now), i) for i, item in enumerate(merged)]
+    order = sorted(dated, key=lambda d: (d[0] is None, -(d[0].timestamp()) if d[0] else 0, d[1]))
+    return [merged[i] for _, i in order]
+
+
+def _merge_or_raise(queries: list[str], outcomes: list) -> list[dict[str, Any]]:
+    errors = [o for o in outcomes if isinstance(o, Exception)]
+    if errors and len(errors) == len(outcomes):
+        # Erros de configuração (ex.: chave ausente) mantêm o tipo original
+        if isinstance(errors[0], ValueError):
+            raise errors[0]
+        raise RuntimeError(f"Todas as {len(queries)} buscas falharam: {errors[0]}")
+    return merge_search_results(o for o in outcomes if not isinstance(o, Exception))
+
+
+def multi_search(
+    queries: list[str],
+    num: int = 5,
+    time_period: str | None = None,
+    max_workers: int | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Executa várias consultas em paralelo e mescla os resultados.
+    
+    Falhas isoladas são ignoradas; só há erro se todas as consultas falharem.
+    
+    Args:
+        queries: Consultas (ex.: query_variants(topic))
+        num: Máximo de resultados por consulta
+        time_period: Janela temporal qdr: opcional
+        max_workers: Threads simultâneas (padrão: uma por consulta)
+    
+    Returns:
+        Resultados deduplicados por URL canônica, dos mais recentes aos mais antigos
+    """
+    if not queries:
+        return []
+
+    def run(query: str):
+        try:
+            return web_search(query, num=num, time_period=time_period)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(queries)) as pool:
+        outcomes = list(pool.map(run, queries))
+    return _merge_or_raise(queries, outcomes)
+
+
+async def amulti_search(
+    queries: list[str],
+    num: int = 5,
+    time_period: str | None = None,
+) -> list[dict[str, Any]]:
+    """Versão assíncrona de multi_search (usa aweb_search)."""
+    if not queries:
+        return []
+    outcomes = await asyncio.gather(
+        *(aweb_search(q, num=num, time_period=time_period) for q in queries),
+        return_exceptions=True,
+    )
+    return _merge_or_raise(queries, list(outcomes))
+
+
+def _multi_search_queries(input_str: str) -> list[str]:
+    """Entrada da ferramenta: lista JSON de consultas ou um tema (gera as variantes)."""
+    text = input_str.strip()
+    if text.startswith("["):
+        queries = json.loads(text)
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise ValueError("Entrada deve ser uma lista JSON de strings ou um tema.")
+        return queries
+    return query_variants(text)
+
+
+def multi_search_tool(input_str: str, time_period: str | None = "m6") -> str:
+    """
+    Entrada da ferramenta multi_search: tema ou lista JSON de consultas.
+    
+    Returns:
+        JSON compacto com os resultados mesclados (ver compaction.py)
+    """
+    from compaction import compact_results
+
+    results = multi_search(_multi_search_queries(input_str), num=5, time_period=time_period)
+    return compact_results(results).payload
+
+
+async def amulti_search_tool(input_str: str, time_period: str | None = "m6") -> str:
+    """Versão assíncrona de multi_search_tool."""
+    from compaction import compact_results
+
+    results = await amulti_search(_multi_search_queries(input_str), num=5, time_period=time_period)
+    return compact_results(results).payload
 
 
 def calc_cagr(start: float, end: float, months: float) -> float:
@@ -70,11 +372,15 @@ def calc_cagr(start: float, end: float, months: float) -> float:
         CAGR como decimal (ex.: 0.44 para 44%)
     
     Raises:
-        ValueError: Se start <= 0 ou months <= 0
+        ValueError: Se start <= 0, end < 0 ou months <= 0 (mesmas regras de calc_cagr_many)
     """
     if start <= 0:
         raise ValueError("O valor inicial (start) deve ser maior que zero.")
     
+    if end < 0:
+        # Base negativa com expoente fracionário não tem CAGR real
+        raise ValueError("O valor final (end) não pode ser negativo.")
+    
     if months <= 0:
         raise ValueError("O período (months) deve ser maior que zero.")
     
@@ -84,6 +390,117 @@ def calc_cagr(start: float, end: float, months: float) -> float:
     return cagr
 
 
+CAGR_INVALID_MODES = ("nan", "mask", "raise")
+
+
+def calc_cagr_many(start, end, months, invalid: str = "nan"):
+    """
+    Versão vetorizada (NumPy) de calc_cagr para arrays de (start, end, months).
+    
+    Os argumentos seguem as regras de broadcasting do NumPy (escalares são
+    repetidos). Linhas inválidas (start <= 0, months <= 0, end < 0 ou valores
+    não finitos) são tratadas conforme `invalid`.
+    
+    Args:
+        start: Valores iniciais
+        end: Valores finais
+        months: Períodos em meses
+        invalid: 'nan' (padrão) devolve NaN nas linhas inválidas; 'mask' devolve
+            um np.ma.MaskedArray com essas linhas mascaradas; 'raise' lança ValueError
+    
+    Returns:
+        Array de CAGRs como decimais (ex.: 0.44 para 44%)
+    
+    Raises:
+        ValueError: Se invalid='raise' e houver linhas inválidas, ou se `invalid` for desconhecido
+    """
+    if invalid not in CAGR_INVALID_MODES:
+        raise ValueError(f"invalid deve ser um de {CAGR_INVALID_MODES} (recebido: {invalid!r})")
+    
+    start, end, months = np.broadcast_arrays(
+        np.asarray(start, dtype=float),
+        np.asarray(end, dtype=float),
+        np.asarray(months, dtype=float),
+    )
+    bad = (
+        ~np.isfinite(start) | ~np.isfinite(end) | ~np.isfinite(months)
+        | (start <= 0) | (months <= 0) | (end < 0)
+    )
+    if invalid == "raise" and bad.any():
+        rows = np.flatnonzero(bad)
+        shown = ", ".join(str(i) for i in rows[:10])
+        more = f" (+{len(rows) - 10})" if len(rows) > 10 else ""
+        raise ValueError(
+            f"{len(rows)} linha(s) inválida(s) para CAGR (start e months devem ser > 0, "
+            f"end >= 0): índices {shown}{more}"
+        )
+    
+    # Substitui linhas inválidas por valores neutros para evitar avisos do NumPy
+    safe_start = np.where(bad, 1.0, start)
+    safe_end = np.where(bad, 1.0, end)
+    safe_years = np.where(bad, 12.0, months) / 12.0
+    cagr = (safe_end / safe_start) ** (1 / safe_years) - 1
+    
+    if invalid == "mask":
+        return np.ma.masked_array(cagr, mask=bad)
+    return np.where(bad, np.nan, cagr)
+
+
+def calc_cagr_batch_tool(js: str) -> str:
+    """
+    Entrada da ferramenta calc_cagr_many: JSON com lista de {"start", "end", "months"}.
+    
+    Returns:
+        JSON com a lista de CAGRs (null nas linhas inválidas)
+    """
+    rows = json.loads(js)
+    if isinstance(rows, dict):
+        rows = rows.get("items", [rows])
+    if not isinstance(rows, list):
+        raise ValueError("Entrada deve ser uma lista JSON de objetos {start, end, months}.")
+    try:
+        start = [float(r["start"]) for r in rows]
+        end = [float(r["end"]) for r in rows]
+        months = [float(r["months"]) for r in rows]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Cada item deve conter start, end e months numéricos.")
+    values = calc_cagr_many(start, end, months, invalid="nan")
+    return json.dumps([None if np.isnan(v) else float(v) for v in values])
+
+
+def register_pandas_accessor() -> None:
+    """
+    Registra o accessor `.cagr` em DataFrames do pandas (dependência opcional).
+    
+    Exemplo:
+        register_pandas_accessor()
+        df["cagr"] = df.cagr(start="receita_ini", end="receita_fim", months="meses")
+    
+    Raises:
+        ImportError: Se o pandas não estiver instalado
+    """
+    import pandas as pd
+
+    if "cagr" in getattr(pd.DataFrame, "_accessors", set()):
+        return
+
+    @pd.api.extensions.register_dataframe_accessor("cagr")
+    class CagrAccessor:
+        def __init__(self, df):
+            self._df = df
+
+        def __call__(self, start: str = "start", end: str = "end", months: str = "months", invalid: str = "nan"):
+            values = calc_cagr_many(
+                self._df[start].to_numpy(dtype=float),
+                self._df[end].to_numpy(dtype=float),
+                self._df[months].to_numpy(dtype=float),
+                invalid="nan" if invalid == "mask" else invalid,
+            )
+            series = pd.Series(values, index=self._df.index, name="cagr")
+            # 'mask' no pandas: linhas inválidas viram NA (o mascaramento nativo do pandas)
+            return series.astype("Float64") if invalid == "mask" else series
+
+
 def report_refine(texto: str) -> str:
     """
     Limpeza leve do texto: trim e normalização de espaços.